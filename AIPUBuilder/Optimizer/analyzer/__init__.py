@@ -3,3 +3,4 @@
 
 from . cosine import *
 from . running_time import *
+from . memory import *
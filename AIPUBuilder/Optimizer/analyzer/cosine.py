@@ -2,10 +2,11 @@
 # Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
 
 
-def check_nodes_similarity(float_graph, quant_graph, inputs, keep_tensors=False):
+def check_nodes_similarity(float_graph, quant_graph, inputs, keep_tensors=False, analyzer=None):
     """
     use one input to test the network
     check each node's similarity between float graph and quant graph
+    the results are accumulated into analyzer (a SimilarityAnalyzer) if given, otherwise appended to each tensor
     """
     from AIPUBuilder.Optimizer.logger import OPT_DEBUG, OPT_WARN, OPT_ERROR
     from AIPUBuilder.Optimizer.utils.quant_tool_utils import (
@@ -43,8 +44,11 @@ def check_nodes_similarity(float_graph, quant_graph, inputs, keep_tensors=False)
             de_quant_output = linear_dequantize(
                 t.betensor, t.scale, t.zerop, t.key_axis
             )
-            sim = cosine_distance(float_output, de_quant_output)
-            mse = MSE(float_output, de_quant_output).item()
+            if analyzer is not None:
+                sim, mse, _, _ = analyzer.update(t.name, float_output, de_quant_output)
+            else:
+                sim = cosine_distance(float_output, de_quant_output)
+                mse = MSE(float_output, de_quant_output).item()
             if sim < 0.9 or mse > 0.1:
                 if qn.type not in [OpType.Reshape, OpType.Transpose]:
                     OPT_DEBUG(
@@ -63,12 +67,13 @@ def check_nodes_similarity(float_graph, quant_graph, inputs, keep_tensors=False)
                 # plt.title('diff')
                 # plt.plot(tar.reshape(-1).cpu()[:10000]/t.scale-ref.reshape(-1).cpu()[:10000])
                 # plt.show()
-            if t.similarity is None:
-                t.similarity = [sim]
-                t.mse = [mse]
-            else:
-                t.similarity.append(sim)
-                t.mse.append(mse)
+            if analyzer is None:
+                if t.similarity is None:
+                    t.similarity = [sim]
+                    t.mse = [mse]
+                else:
+                    t.similarity.append(sim)
+                    t.mse.append(mse)
 
     if keep_tensors:
         pass
@@ -87,7 +92,7 @@ def check_nodes_similarity(float_graph, quant_graph, inputs, keep_tensors=False)
     float_graph.disable_fit_dtype()
 
 
-def show_similarity(quant_graph):
+def show_similarity(quant_graph, analyzer=None):
     from AIPUBuilder.Optimizer.logger import OPT_DEBUG
 
     type_max_len = (
@@ -106,7 +111,13 @@ def show_similarity(quant_graph):
             )
             msg += "tensor_name={: <}".format(t.name)
 
-            if t.similarity is not None and t.mse is not None:
+            if analyzer is not None and t.name in analyzer.index and analyzer.mean(t.name) is not None:
+                t.similarity = analyzer.mean(t.name, 'cosine')
+                t.mse = analyzer.mean(t.name, 'mse')
+                msg += "  cos_dist={: <8.6f} ".format(t.similarity)
+                msg += f" mse={t.mse}    "
+                msg += f" sqnr={analyzer.mean(t.name, 'sqnr'):.2f}dB    "
+            elif t.similarity is not None and t.mse is not None:
                 t.similarity = sum(t.similarity) / len(t.similarity)
                 t.mse = sum(t.mse) / len(t.mse)
                 msg += "  cos_dist={: <8.6f} ".format(t.similarity)
@@ -139,3 +150,115 @@ def show_similarity(quant_graph):
         f"graph output_tensors MSE (align with the order of "
         f"'output_tensors' in IR header):{str(out_mse)}"
     )
+
+
+class SimilarityAnalyzer(object):
+    """
+    streaming per-tensor similarity statistics between float graph and quant graph.
+    each batch only updates preallocated running aggregates (count, sum, min, max) and a fixed size reservoir of
+    per-batch values for the percentiles, so the memory is constant however many batches are analyzed.
+    """
+    METRICS = ['cosine', 'mse', 'sqnr', 'max_abs_error']
+    PERCENTILES = [1, 5, 50, 95, 99]
+
+    def __init__(self, quant_graph, reservoir_size=256, max_elements=0, seed=0):
+        import torch
+        self.layers = []
+        for n in quant_graph.nodes:
+            for t in n.outputs:
+                self.layers.append((t.name, n.name, str(n.type), n.attrs.get('layer_id', '')))
+        self.index = {name: i for i, (name, _, _, _) in enumerate(self.layers)}
+        self.reservoir_size = max(1, reservoir_size)
+        self.max_elements = max_elements
+        tnum, mnum = len(self.layers), len(self.METRICS)
+        self.count = torch.zeros(tnum, dtype=torch.int64)
+        self.sum = torch.zeros(tnum, mnum, dtype=torch.float64)
+        self.min = torch.full((tnum, mnum), float('inf'), dtype=torch.float64)
+        self.max = torch.full((tnum, mnum), float('-inf'), dtype=torch.float64)
+        self.samples = torch.zeros(tnum, mnum, self.reservoir_size, dtype=torch.float64)
+        self.generator = torch.Generator().manual_seed(seed)
+
+    def subsample(self, x):
+        # evenly strided elements of huge tensors
+        import torch
+        x = x.flatten()
+        if self.max_elements > 0 and x.numel() > self.max_elements:
+            step = (x.numel() + self.max_elements - 1) // self.max_elements
+            x = x[::step]
+        return x.double()
+
+    def update(self, name, float_output, de_quant_output):
+        """
+        accumulate one batch of tensor `name`, returns the batch's values of METRICS
+        """
+        import torch
+        import math
+        from AIPUBuilder.Optimizer.utils.quant_tool_utils import cosine_distance
+        x = self.subsample(float_output)
+        y = self.subsample(de_quant_output).to(x.device)
+        diff = x - y
+        noise = diff.square().sum().item()
+        signal = x.square().sum().item()
+        eps = torch.finfo(torch.float64).tiny
+        values = [cosine_distance(x, y),
+                  noise / max(1, x.numel()),
+                  10.0 * math.log10(max(signal, eps) / max(noise, eps)),
+                  diff.abs().max().item() if x.numel() > 0 else 0.0]
+        if name not in self.index:
+            return values
+        i = self.index[name]
+        v = torch.tensor(values, dtype=torch.float64)
+        c = int(self.count[i])
+        self.sum[i] += v
+        self.min[i] = torch.minimum(self.min[i], v)
+        self.max[i] = torch.maximum(self.max[i], v)
+        # reservoir sampling keeps a uniform sample of all the batches' values
+        j = c if c < self.reservoir_size else int(torch.randint(0, c + 1, (1,), generator=self.generator))
+        if j < self.reservoir_size:
+            self.samples[i, :, j] = v
+        self.count[i] += 1
+        return values
+
+    def mean(self, name, metric='cosine'):
+        i = self.index[name]
+        if self.count[i] < 1:
+            return None
+        return (self.sum[i, self.METRICS.index(metric)] / self.count[i]).item()
+
+    def summary(self):
+        import torch
+        qs = torch.tensor([p / 100. for p in self.PERCENTILES], dtype=torch.float64)
+        rows = []
+        for i, (tname, lname, ltype, lid) in enumerate(self.layers):
+            c = int(self.count[i])
+            if c < 1:
+                continue
+            row = {'layer_id': lid, 'layer_type': ltype, 'layer_name': lname, 'tensor_name': tname, 'batches': c}
+            pcts = torch.quantile(self.samples[i, :, :min(c, self.reservoir_size)], qs, dim=1)
+            for k, metric in enumerate(self.METRICS):
+                row[metric] = {'mean': (self.sum[i, k] / c).item(),
+                               'min': self.min[i, k].item(),
+                               'max': self.max[i, k].item()}
+                for p, pv in zip(self.PERCENTILES, pcts[:, k].tolist()):
+                    row[metric][f'p{p}'] = pv
+            rows.append(row)
+        return rows
+
+    def save(self, path):
+        """
+        write summary() to a json file, or a csv file (one column per metric and statistic) if path ends with .csv
+        """
+        import json
+        import csv
+        rows = self.summary()
+        if path.lower().endswith('.csv'):
+            stats = ['mean', 'min', 'max'] + [f'p{p}' for p in self.PERCENTILES]
+            head = ['layer_id', 'layer_type', 'layer_name', 'tensor_name', 'batches']
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(head + [f'{m}_{s}' for m in self.METRICS for s in stats])
+                for row in rows:
+                    writer.writerow([row[h] for h in head] + [row[m][s] for m in self.METRICS for s in stats])
+        else:
+            with open(path, 'w') as f:
+                json.dump(rows, f, indent=2)
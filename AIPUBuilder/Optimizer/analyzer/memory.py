@@ -0,0 +1,261 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+__all__ = [
+    'MemoryProfiler',
+]
+
+
+class _GraphMemory(object):
+    # the live tensors of one graph, refreshed node by node. it refers to the graph's nodes and tensors by id only
+    # (they keep their graph alive through node.graph and tensor.pnode, see MemoryProfiler.graphs)
+
+    def __init__(self, label):
+        self.label = label
+        # a full rescan is needed before the next record (a new forward pass)
+        self.stale = True
+        # id(node) -> position in graph.nodes, and the position of the last recorded node
+        self.positions = {}
+        self.last = -1
+        # storage key -> [reference count, (bytes, category, name, shape, dtype)]
+        self.static_refs = {}
+        # id(node) -> [(storage key, item)] of the node's static tensors
+        self.node_static = {}
+        self.static_bytes = {'constant': 0, 'statistic': 0, 'kept': 0}
+        # the largest static items, None when it has to be recomputed
+        self.static_top = []
+        # id(tensor) -> storage key and storage key -> [reference count, item] of the featuremaps
+        self.fm_tensors = {}
+        self.fm_refs = {}
+        self.fm_bytes = 0
+
+
+class MemoryProfiler(object):
+    """
+    records the live tensor bytes of a graph after each node's forward (before its inputs are released):
+    featuremaps (nodes' outputs and placeholders), constants, statistics kept on tensors (min/max per channel,
+    histograms, scales, ...) and tensors kept in nodes' attrs and params (e.g. the original weights kept by quantize).
+    tensors sharing the same storage are counted once. it keeps the per-node timeline (max over forwards) and the
+    largest live tensors at the peak.
+    the first recorded node of each pass (PyGraph.forward, QuantizeGraph.statistic, the layerwise calibration
+    engine, ...) rescans the whole graph, then each record only refreshes the recorded node and the previous one
+    (whose statistics are gathered after its forward and whose inputs are released after the record).
+    usage:
+        with MemoryProfiler() as profiler:
+            graph.forward(inputs)
+        profiler.save('memory.txt')
+    """
+
+    CATEGORIES = ['featuremap', 'constant', 'statistic', 'kept']
+
+    def __init__(self, topk=20):
+        import weakref
+        self.topk = topk
+        self.prev = None
+        # graph -> _GraphMemory, which does not keep the graph alive
+        self.graphs = weakref.WeakKeyDictionary()
+        self.count = 0
+        # (label, node name) -> [node type, layer_id, max featuremap bytes, max live bytes, max cuda allocated bytes]
+        self.timeline = {}
+        self.peak = 0
+        self.peak_node = None
+        self.peak_bytes = {}
+        self.peak_tensors = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        from AIPUBuilder.Optimizer.framework.pycore.pygraph import set_memory_profiler
+        self.prev = set_memory_profiler(self)
+        return self
+
+    def stop(self):
+        from AIPUBuilder.Optimizer.framework.pycore.pygraph import set_memory_profiler
+        set_memory_profiler(self.prev)
+        self.prev = None
+
+    @staticmethod
+    def _storage(v):
+        # (key, bytes) of the storage behind tensor v
+        s = v.untyped_storage()
+        return (str(v.device), s.data_ptr()), s.nbytes()
+
+    @staticmethod
+    def _tensors_in(v):
+        import torch
+        if isinstance(v, torch.Tensor):
+            return [('', v)]
+        if isinstance(v, dict):
+            return [(f"[{k}]", x) for k, x in v.items() if isinstance(x, torch.Tensor)]
+        if isinstance(v, (list, tuple)):
+            return [(f"[{k}]", x) for k, x in enumerate(v) if isinstance(x, torch.Tensor)]
+        return []
+
+    def _static_tensors(self, n):
+        # the tensors of node n which do not change during its forward
+        tensors = []
+        for k, t in n.constants.items():
+            tensors.append(('constant', f"{n.name}/{k}", t.betensor))
+        for t in list(n.outputs) + list(n.placeholders) + list(n.constants.values()):
+            for k in t.__slots__:
+                if k == 'betensor':
+                    continue
+                for sk, x in self._tensors_in(getattr(t, k, None)):
+                    tensors.append(('statistic', f"{t.name}.{k}{sk}", x))
+        for src, d in [('attrs', n.attrs), ('params', n.params)]:
+            for k, v in d.items():
+                for sk, x in self._tensors_in(v):
+                    tensors.append(('kept', f"{n.name}.{src}[{k}]{sk}", x))
+        return tensors
+
+    def _refresh_static(self, st, n):
+        import heapq
+        entries = []
+        keys = set()
+        for category, name, v in self._static_tensors(n):
+            if v.numel() < 1:
+                continue
+            key, size = self._storage(v)
+            if key in keys:
+                continue
+            keys.add(key)
+            entries.append((key, (size, category, name, tuple(v.shape), str(v.dtype))))
+        old = st.node_static.get(id(n), [])
+        if old == entries:
+            return
+        for key, item in old:
+            ref = st.static_refs[key]
+            ref[0] -= 1
+            if ref[0] < 1:
+                del st.static_refs[key]
+                st.static_bytes[ref[1][1]] -= ref[1][0]
+                if st.static_top is not None and ref[1] in st.static_top:
+                    st.static_top = None
+        for key, item in entries:
+            if key in st.static_refs:
+                st.static_refs[key][0] += 1
+                continue
+            st.static_refs[key] = [1, item]
+            st.static_bytes[item[1]] += item[0]
+            if st.static_top is not None:
+                st.static_top = heapq.nlargest(self.topk, st.static_top + [item], key=lambda x: x[0])
+        st.node_static[id(n)] = entries
+
+    def _track(self, st, t):
+        # update the featuremap t in the live set, it is dropped once released (or kept by a static tensor)
+        import torch
+        v = t.betensor
+        key = None
+        # the released tensors hold a 'null' scalar
+        if isinstance(v, torch.Tensor) and v.dim() > 0 and v.numel() > 0:
+            key, size = self._storage(v)
+            if key in st.static_refs:
+                key = None
+        old = st.fm_tensors.get(id(t))
+        if key == old:
+            return
+        if old is not None:
+            ref = st.fm_refs[old]
+            ref[0] -= 1
+            if ref[0] < 1:
+                del st.fm_refs[old]
+                st.fm_bytes -= ref[1][0]
+        if key is None:
+            st.fm_tensors.pop(id(t), None)
+            return
+        st.fm_tensors[id(t)] = key
+        if key in st.fm_refs:
+            st.fm_refs[key][0] += 1
+        else:
+            st.fm_refs[key] = [1, (size, 'featuremap', t.name, tuple(v.shape), str(v.dtype))]
+            st.fm_bytes += size
+
+    def _state(self, g):
+        st = self.graphs.get(g)
+        if st is None:
+            st = _GraphMemory(f"{g.name}#{self.count}")
+            self.count += 1
+            self.graphs[g] = st
+        return st
+
+    def _rescan(self, g):
+        st = _GraphMemory(self.graphs[g].label)
+        st.stale = False
+        for i, n in enumerate(g.nodes):
+            st.positions[id(n)] = i
+            self._refresh_static(st, n)
+        for n in g.nodes:
+            for t in list(n.outputs) + list(n.placeholders):
+                self._track(st, t)
+        self.graphs[g] = st
+        return st
+
+    def begin(self, g):
+        # a new forward pass of g, the static tensors may be changed since the last one (e.g. by statistic or quantize)
+        self._state(g).stale = True
+
+    def record(self, node):
+        import heapq
+        import torch
+        g = node.graph
+        st = self._state(g)
+        pos = st.positions.get(id(node), -1)
+        if st.stale or pos <= st.last or pos >= len(g.nodes) or g.nodes[pos] is not node:
+            # the first node of a pass, or the graph was changed
+            st = self._rescan(g)
+            pos = st.positions.get(id(node), -1)
+        else:
+            changed = [node]
+            if 0 <= st.last < len(g.nodes):
+                changed.insert(0, g.nodes[st.last])
+            for n in changed:
+                self._refresh_static(st, n)
+                for t in list(n.inputs) + list(n.outputs) + list(n.placeholders):
+                    self._track(st, t)
+        st.last = pos
+        fm_bytes = st.fm_bytes
+        static_bytes = st.static_bytes
+        live = fm_bytes + sum(static_bytes.values())
+        cuda_bytes = torch.cuda.memory_allocated() if torch.cuda.is_available() else 0
+        entry = self.timeline.setdefault((st.label, node.name),
+                                         [str(node.type)[7:], node.attrs.get('layer_id', ''), 0, 0, 0])
+        entry[2] = max(entry[2], fm_bytes)
+        entry[3] = max(entry[3], live)
+        entry[4] = max(entry[4], cuda_bytes)
+        if live > self.peak:
+            if st.static_top is None:
+                st.static_top = heapq.nlargest(self.topk, [ref[1] for ref in st.static_refs.values()],
+                                               key=lambda x: x[0])
+            fm_items = heapq.nlargest(self.topk, [ref[1] for ref in st.fm_refs.values()], key=lambda x: x[0])
+            self.peak = live
+            self.peak_node = (st.label, node.name, str(node.type)[7:], node.attrs.get('layer_id', ''))
+            self.peak_bytes = dict(static_bytes)
+            self.peak_bytes['featuremap'] = fm_bytes
+            self.peak_tensors = sorted(st.static_top + fm_items, key=lambda x: -x[0])[:self.topk]
+
+    def summary(self):
+        mb = 2**20
+        lines = []
+        if self.peak_node is not None:
+            label, nname, ntype, lid = self.peak_node
+            lines.append(f"peak live tensors: {self.peak / mb:.2f} MB after layer_id={lid} {ntype} {nname} of graph {label}, "
+                         + ', '.join([f"{c}={self.peak_bytes.get(c, 0) / mb:.2f} MB" for c in self.CATEGORIES]))
+            lines.append(f"the largest live tensors at the peak:")
+            lines.append(f"{'MB':>12}  {'category':<12}{'shape':<28}{'dtype':<16}name")
+            for size, category, name, shape, dtype in self.peak_tensors:
+                lines.append(f"{size / mb:>12.3f}  {category:<12}{str(shape):<28}{dtype:<16}{name}")
+        lines.append(f"timeline (max over forwards):")
+        lines.append(f"{'graph':<20}{'layer_id':<10}{'op_type':<24}{'featuremap MB':>14}{'live MB':>12}"
+                     f"{'cuda MB':>12}  layer_name")
+        for (label, nname), (ntype, lid, fm_bytes, live, cuda_bytes) in self.timeline.items():
+            lines.append(f"{label:<20}{str(lid):<10}{ntype:<24}{fm_bytes / mb:>14.3f}{live / mb:>12.3f}"
+                         f"{cuda_bytes / mb:>12.3f}  {nname}")
+        return '\n'.join(lines)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            f.write(self.summary() + '\n')
@@ -34,3 +34,138 @@ def calculate_op_running_time(f_graph, q_graph):
         n.attrs['calculate_running_time'] = False
     for n in q_graph.nodes:
         n.attrs['calculate_running_time'] = False
+
+
+class OpProfiler(object):
+    """
+    records each op's forward and quantize (through op_register and quant_register) with time.perf_counter.
+    calls, self time (excluding the nested ops' calls) and bytes moved (inputs, outputs and constants) are aggregated
+    by op type and by layer, and the first max_trace_events calls are kept for a chrome trace (chrome://tracing or
+    perfetto).
+    usage:
+        with OpProfiler() as profiler:
+            graph.forward(inputs)
+        profiler.save_summary('profile.txt')
+        profiler.save_trace('trace.json')
+    """
+
+    def __init__(self, max_trace_events=100000):
+        self.max_trace_events = max_trace_events
+        self.by_type = {}
+        self.by_layer = {}
+        self.trace_events = []
+        self.dropped_events = 0
+        # the nested ops' time of each open call
+        self.stack = []
+        self.prev = None
+        self.t0 = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        import time
+        from AIPUBuilder.Optimizer.framework.opt_register import set_op_profiler
+        self.t0 = time.perf_counter() if self.t0 is None else self.t0
+        self.prev = set_op_profiler(self)
+        return self
+
+    def stop(self):
+        from AIPUBuilder.Optimizer.framework.opt_register import set_op_profiler
+        set_op_profiler(self.prev)
+        self.prev = None
+
+    @staticmethod
+    def _sync(node):
+        import torch
+        if torch.cuda.is_available() and len(node.outputs) > 0 and node.outputs[0].betensor.is_cuda:
+            torch.cuda.synchronize()
+
+    @staticmethod
+    def _nbytes(tensors):
+        import torch
+        return sum([t.betensor.numel() * t.betensor.element_size() for t in tensors
+                    if isinstance(t.betensor, torch.Tensor)])
+
+    def begin(self, node, phase):
+        import time
+        self._sync(node)
+        # the featuremaps are not fed when quantizing
+        shapes = [tuple(t.betensor.shape) if phase == 'forward' else tuple(t.ir_shape) for t in node.inputs]
+        self.stack.append(0.0)
+        return (node, phase, shapes, len(self.stack), time.perf_counter())
+
+    def end(self, event):
+        import time
+        from AIPUBuilder.Optimizer.logger.opt_log_management import opt_log_manager
+        node, phase, shapes, depth, start = event
+        self._sync(node)
+        cost = time.perf_counter() - start
+        # an interrupted call may have left its nested calls open
+        self_cost = cost - self.stack[depth - 1]
+        del self.stack[depth - 1:]
+        if len(self.stack) > 0:
+            self.stack[-1] += cost
+        nbytes = self._nbytes(node.inputs) + self._nbytes(node.outputs) + self._nbytes(node.constants.values())
+        otype = str(node.type)[7:]
+        stage = opt_log_manager.opt_workflow_footprint_ if opt_log_manager.opt_workflow_footprint_ else 'prepare'
+        tagg = self.by_type.setdefault((phase, otype), [0, 0.0, float('inf'), 0.0, 0])
+        tagg[0] += 1
+        tagg[1] += self_cost
+        tagg[2] = min(tagg[2], self_cost)
+        tagg[3] = max(tagg[3], self_cost)
+        tagg[4] += nbytes
+        lagg = self.by_layer.setdefault((phase, node.name), [otype, node.attrs.get('layer_id', ''), 0, 0.0, 0, shapes])
+        lagg[2] += 1
+        lagg[3] += self_cost
+        lagg[4] += nbytes
+        lagg[5] = shapes
+        if len(self.trace_events) < self.max_trace_events:
+            self.trace_events.append({'name': f"{otype} {node.name}", 'cat': f"{stage},{phase}", 'ph': 'X',
+                                      'ts': (start - self.t0) * 1e6, 'dur': cost * 1e6, 'pid': stage, 'tid': phase,
+                                      'args': {'layer_id': lagg[1], 'input_shapes': str(shapes), 'bytes': nbytes,
+                                               'self_us': self_cost * 1e6}})
+        else:
+            self.dropped_events += 1
+        return cost
+
+    def summary(self, top=0):
+        """
+        the tables of op types and layers sorted by total time, top > 0 only keeps the first top layers of each phase
+        """
+        lines = []
+        for phase in ['forward', 'quantize']:
+            types = sorted([(k[1], v) for k, v in self.by_type.items() if k[0] == phase], key=lambda x: -x[1][1])
+            if len(types) < 1:
+                continue
+            all_time = max(sum([v[1] for _, v in types]), 1e-12)
+            lines.append(f"[{phase}] by op type: total {all_time:.6f}s")
+            lines.append(f"{'op_type':<32}{'calls':>10}{'total(s)':>14}{'percent':>10}{'avg(ms)':>12}"
+                         f"{'min(ms)':>12}{'max(ms)':>12}{'MB moved':>12}")
+            for otype, (calls, total, tmin, tmax, nbytes) in types:
+                lines.append(f"{otype:<32}{calls:>10}{total:>14.6f}{total / all_time * 100:>9.2f}%"
+                             f"{total / calls * 1e3:>12.4f}{tmin * 1e3:>12.4f}{tmax * 1e3:>12.4f}{nbytes / 2**20:>12.2f}")
+            layers = sorted([(k[1], v) for k, v in self.by_layer.items() if k[0] == phase], key=lambda x: -x[1][3])
+            if top > 0:
+                layers = layers[:top]
+            lines.append(f"[{phase}] by layer:")
+            lines.append(f"{'layer_id':<10}{'op_type':<24}{'calls':>8}{'total(s)':>14}{'percent':>10}{'MB moved':>12}"
+                         f"  {'input_shapes':<40}layer_name")
+            for lname, (otype, lid, calls, total, nbytes, shapes) in layers:
+                lines.append(f"{str(lid):<10}{otype:<24}{calls:>8}{total:>14.6f}{total / all_time * 100:>9.2f}%"
+                             f"{nbytes / 2**20:>12.2f}  {str(shapes):<40}{lname}")
+        if self.dropped_events > 0:
+            lines.append(f"{self.dropped_events} calls are not in the trace (max_trace_events={self.max_trace_events})")
+        return '\n'.join(lines)
+
+    def save_summary(self, path, top=0):
+        with open(path, 'w') as f:
+            f.write(self.summary(top) + '\n')
+
+    def save_trace(self, path):
+        import json
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events, 'displayTimeUnit': 'ms'}, f)
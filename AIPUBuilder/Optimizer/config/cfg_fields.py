@@ -696,6 +696,51 @@ class DumpField(BaseField):
         return f"Whether enable to dump all tensors and other data."
 
 
+@field_register('op_profile', 'hidden')
+class OpProfileField(BaseField):
+    # whether profile each op's forward and quantize
+    @staticmethod
+    def default():
+        return 'False'
+
+    @staticmethod
+    def parse(op):
+        return isinstance(op, bool), op
+
+    @staticmethod
+    def error(op):
+        return f"Require the 'op_profile' field must be in bool type, now is {type(op)} type. default value=False."
+
+    @staticmethod
+    def message():
+        return (f"Whether profile the forward and quantize of each op during the whole optimization. The summary "
+                f"(calls, time and bytes moved by op type and by layer) is saved to "
+                f"<output_dir>/<model_name>_op_profile.txt and the chrome trace (for chrome://tracing or perfetto) "
+                f"to <output_dir>/<model_name>_op_trace.json.")
+
+
+@field_register('memory_profile', 'hidden')
+class MemoryProfileField(BaseField):
+    # whether record the live tensors after each node's forward
+    @staticmethod
+    def default():
+        return 'False'
+
+    @staticmethod
+    def parse(mp):
+        return isinstance(mp, bool), mp
+
+    @staticmethod
+    def error(mp):
+        return f"Require the 'memory_profile' field must be in bool type, now is {type(mp)} type. default value=False."
+
+    @staticmethod
+    def message():
+        return (f"Whether record the live tensor bytes (featuremaps, constants, statistics and the tensors kept in "
+                f"layers) after each layer's forward during the whole optimization. The peak layer, the largest live "
+                f"tensors at the peak and the per-layer timeline are saved to <output_dir>/<model_name>_memory.txt.")
+
+
 @field_register('dump_dir', 'default')
 class DumpDirField(BaseField):
     # the directory to dump
@@ -939,20 +984,20 @@ class GlobalCalibrationParamField(BaseField):
             'svd_quant[mode, alpha, beta, nsteps, thresh][(layer_i, layer_j), (layer_k, layer_l), ...]'.
             'svd_quant[mode, alpha, beta, nsteps, thresh]{node_name_regex_str}',
             'smooth_quant_zy' (refer to https://arxiv.org/pdf/2211.10438.pdf)
-            'smooth_quant_zy[default_alpha, auto_tune, alpha_min, alpha_max, nsteps, insert_norm_if_none]'
-            'smooth_quant_zy[default_alpha, auto_tune, alpha_min, alpha_max, nsteps, insert_norm_if_none][(layer_i, layer_j), (layer_k, layer_l), ...]'
-            'smooth_quant_zy[default_alpha, auto_tune, alpha_min, alpha_max, nsteps, insert_norm_if_none]{node_name_regex_str}'
+            'smooth_quant_zy[default_alpha, auto_tune, alpha_min, alpha_max, nsteps, insert_norm_if_none, workers]'
+            'smooth_quant_zy[default_alpha, auto_tune, alpha_min, alpha_max, nsteps, insert_norm_if_none, workers][(layer_i, layer_j), (layer_k, layer_l), ...]'
+            'smooth_quant_zy[default_alpha, auto_tune, alpha_min, alpha_max, nsteps, insert_norm_if_none, workers]{node_name_regex_str}'
             'awq_zy' (refer to https://arxiv.org/pdf/2306.00978)
-            'awq_zy[n_grid, max_shrink, insert_norm_if_none]'
-            'awq_zy[n_grid, max_shrink, insert_norm_if_none][(layer_i, layer_j), (layer_k, layer_l), ...]'
-            'awq_zy[n_grid, max_shrink, insert_norm_if_none]{node_name_regex_str}'
+            'awq_zy[n_grid, max_shrink, insert_norm_if_none, workers]'
+            'awq_zy[n_grid, max_shrink, insert_norm_if_none, workers][(layer_i, layer_j), (layer_k, layer_l), ...]'
+            'awq_zy[n_grid, max_shrink, insert_norm_if_none, workers]{node_name_regex_str}'
             'gptq_zy' (refer to https://arxiv.org/pdf/2210.17323.pdf)
-            'gptq_zy[batches, use_act_order, perc_damp, block_size]'
-            'gptq_zy[batches, use_act_order, perc_damp, block_size][operator_type1, operator_type2, ...]'
-            'gptq_zy[batches, use_act_order, perc_damp, block_size][(layer_i, layer_j), (layer_k, layer_l), ...]'
-            'gptq_zy[batches, use_act_order, perc_damp, block_size]{node_name_regex_str}'
+            'gptq_zy[batches, use_act_order, perc_damp, block_size, workers]'
+            'gptq_zy[batches, use_act_order, perc_damp, block_size, workers][operator_type1, operator_type2, ...]'
+            'gptq_zy[batches, use_act_order, perc_damp, block_size, workers][(layer_i, layer_j), (layer_k, layer_l), ...]'
+            'gptq_zy[batches, use_act_order, perc_damp, block_size, workers]{node_name_regex_str}'
             Where 'operator_type1' and 'operator_type2' are valid operator type names that specify the operators which will be applied, 'layer_i', 'layer_j', 'layer_k' and ''layer_l' stand for layer_id in input IR and '(layer_i, layer_j), (layer_k, layer_l)' specify the layers which will be applied,  'node_name_regex_str' stands for regex string patterns to config per-layer params,
-            'batches' means how many (calibartion) data batches will be used, 'epochs' means the maximum epochs if not convergence, 'lr' means the learning rate, 'ngroups' means groups which will be divided into when meeting per-channel quantization parameters to speed up (0 means no speed up), and the 'alpha', 'beta', 'nsteps', etc are the float type configurable inner hyper-parameters for corresponding methods,
+            'batches' means how many (calibartion) data batches will be used, 'epochs' means the maximum epochs if not convergence, 'lr' means the learning rate, 'ngroups' means groups which will be divided into when meeting per-channel quantization parameters to speed up (0 means no speed up), 'workers' means how many independent layers (or Norm - FC groups) will be processed concurrently, and the 'alpha', 'beta', 'nsteps', etc are the float type configurable inner hyper-parameters for corresponding methods,
             'none' means do nothing, default to 'none'.
             You can also apply multiple methods sequentially ('adaround', 'adaquant_zy', 'gptq_zy' can only appear at the end) with `&`, e.g. `easy_quant & adaround[10, 3, 32]`. '''
 
@@ -961,6 +1006,95 @@ class GlobalCalibrationParamField(BaseField):
         return GlobalCalibrationParamField.message() + f" now is {gc}"
 
 
+@field_register('global_calibration_cache_size', 'hidden')
+class GlobalCalibrationCacheSizeField(BaseField):
+    # the memory budget (MB) of featuremaps captured for global calibration methods
+    @staticmethod
+    def default():
+        return '2048'
+
+    @staticmethod
+    def parse(gccs):
+        return isinstance(gccs, int) and gccs >= 0, gccs
+
+    @staticmethod
+    def error(gccs):
+        msg = gccs if isinstance(gccs, int) else type(gccs)
+        return f"Required the non-negative integer(>=0) 'global_calibration_cache_size' field, now is {msg}. default value=2048."
+
+    @staticmethod
+    def message():
+        return (f"The memory budget (in MB) of featuremaps which are captured once and shared by the global calibration methods, "
+                f"the rest will be spilled to a temporary directory on disk.")
+
+
+@field_register('float_reference_cache_size', 'hidden')
+class FloatReferenceCacheSizeField(BaseField):
+    # the memory budget (MB) of float graph's outputs which are reused by metrics and comparisons
+    @staticmethod
+    def default():
+        return '1024'
+
+    @staticmethod
+    def parse(frcs):
+        return isinstance(frcs, int) and frcs >= 0, frcs
+
+    @staticmethod
+    def error(frcs):
+        msg = frcs if isinstance(frcs, int) else type(frcs)
+        return f"Required the non-negative integer(>=0) 'float_reference_cache_size' field, now is {msg}. default value=1024."
+
+    @staticmethod
+    def message():
+        return (f"The memory budget (in MB) of float graph's outputs which are computed once and reused by the float metric, "
+                f"mixed precision auto search and easy_quant, the rest will be spilled to a temporary directory on disk.")
+
+
+@field_register('conv_tiling_memory_budget', 'hidden')
+class ConvTilingMemoryBudgetField(BaseField):
+    # the memory budget (MB) of the intermediate tensors of one quantized or winograd convolution forward
+    @staticmethod
+    def default():
+        return '512'
+
+    @staticmethod
+    def parse(ctmb):
+        return isinstance(ctmb, int) and ctmb > 0, ctmb
+
+    @staticmethod
+    def error(ctmb):
+        msg = ctmb if isinstance(ctmb, int) else type(ctmb)
+        return f"Required the positive integer(>0) 'conv_tiling_memory_budget' field, now is {msg}. default value=512."
+
+    @staticmethod
+    def message():
+        return (f"The memory budget (in MB) of the intermediate tensors of one quantized or winograd convolution forward, "
+                f"bigger quantized convolutions (such as 1x1 convolutions on huge featuremaps) are computed tile by tile "
+                f"along the output rows, columns and channels, and winograd convolutions chunk by chunk of channels.")
+
+
+@field_register('global_calibration_checkpoint', 'default')
+class GlobalCalibrationCheckpointField(BaseField):
+    # directory to persist the finished layers of global calibration methods
+    @staticmethod
+    def default():
+        return ''
+
+    @staticmethod
+    def parse(gcc):
+        return isinstance(gcc, str), gcc
+
+    @staticmethod
+    def error(gcc):
+        return f"Required the directory path 'global_calibration_checkpoint' field, now is {gcc}. default value=''(disabled)."
+
+    @staticmethod
+    def message():
+        return (f"A directory to persist the results of global calibration methods layer by layer (together with a fingerprint of the "
+                f"graph, config and calibration data), a rerun with the same inputs skips the finished layers and continues from "
+                f"the last one. Default value is '' which disables checkpointing.")
+
+
 @field_register('calibration_data', 'default')
 class CalibrationDataField(BaseField):
     # the npy data file for the calibration dataset
@@ -1666,6 +1800,68 @@ class MixedPrecisionAutoSearchField(BaseField):
                 f"default value='0,0.,L'.")
 
 
+@field_register('mixed_precision_auto_search_strategy', 'default')
+class MixedPrecisionAutoSearchStrategyField(BaseField):
+    # how 'mixed_precision_auto_search' searches the layers' bits
+    @staticmethod
+    def default():
+        return 'naive'
+
+    @staticmethod
+    def parse(mpass):
+        mpass = str(mpass).lower().strip()
+        if 'naive' == mpass:
+            return True, ('naive', 1.0)
+        m = re.match(r'^sensitivity\s*(,\s*([0-9]*\.?[0-9]+)\s*)?$', mpass)
+        if m:
+            budget = float(m.group(2)) if m.group(2) is not None else 0.25
+            return 0.0 <= budget <= 1.0, ('sensitivity', budget)
+        return False, mpass
+
+    @staticmethod
+    def error(mpass):
+        return (f"Required 'mixed_precision_auto_search_strategy' field be set as 'naive' or 'sensitivity,budget' "
+                f"(0 <= budget <= 1), now is {mpass}. default value='naive'.")
+
+    @staticmethod
+    def message():
+        return (f"The strategy of 'mixed_precision_auto_search'. 'naive' bisects on a layer_id cut point, layers after it "
+                f"are quantized to 16bits (or not quantized), each probe costs a validation on the given batches. "
+                f"'sensitivity,budget' scores each layer's quantization sensitivity (alone and at the boundaries of "
+                f"its 16bits neighbours) on the given batches, then promotes the layers (or segments of adjacent layers) "
+                f"with the best degradation reduction per extra bit to 16bits until 'budget' (the fraction of the "
+                f"extra weights and featuremaps bits if all the layers were 16bits, default 0.25) is used up, "
+                f"validates the assignment against the unpromoted graph (promotions which make the score worse are "
+                f"dropped) and against the threshold. default value='naive'.")
+
+
+@field_register('mixed_precision_auto_search_workers', 'default')
+class MixedPrecisionAutoSearchWorkersField(BaseField):
+    # number of processes evaluating the candidates of 'mixed_precision_auto_search'
+    @staticmethod
+    def default():
+        return '1'
+
+    @staticmethod
+    def parse(aw):
+        return isinstance(aw, int) and aw >= 1, aw
+
+    @staticmethod
+    def error(aw):
+        msg = aw if isinstance(aw, int) else type(aw)
+        return (f"Required the positive integer(>= 1) 'mixed_precision_auto_search_workers' field, now is {msg}. "
+                f"default value=1 (means the candidates are evaluated one after another).")
+
+    @staticmethod
+    def message():
+        return (f"Worker processes of 'mixed_precision_auto_search'. With n > 1 workers, the naive strategy probes the "
+                f"next n candidates of its search in one round, and the sensitivity strategy validates its candidate "
+                f"assignments, each on a forked process which shares the parsed graph and statistics with the main "
+                f"process. The searched result is the same as with 1 worker. Only works "
+                f"where the 'fork' start method is supported (not on Windows) and the cuda device is not used, "
+                f"otherwise the candidates are evaluated one after another. default value=1.")
+
+
 @field_register('featuremap_tiling_param', 'hidden')
 class FeaturemapTilingParamField(BaseField):
     # check featuremap split parameter by end user
@@ -1932,6 +2128,50 @@ class SimilarityDataNumField(BaseField):
         return f"The batches amount for checking similarity."
 
 
+@field_register('similarity_report', 'hidden')
+class SimilarityReportField(BaseField):
+    # the machine-readable file of per-layer similarity
+    @staticmethod
+    def default():
+        return ''
+
+    @staticmethod
+    def parse(sr):
+        sr = str(sr).lower().strip()
+        return sr in ['', 'json', 'csv'], sr
+
+    @staticmethod
+    def error(sr):
+        return f"Required the 'similarity_report' field be one of ['', 'json', 'csv'], now is {sr}. default value=''."
+
+    @staticmethod
+    def message():
+        return (f"Save the per-layer similarity statistics (mean, min, max and percentiles of cosine, mse, sqnr and max "
+                f"absolute error over 'similarity_data_num' batches) to <output_dir>/<model_name>_similarity.json(csv). "
+                f"default value='' (means not saved).")
+
+
+@field_register('similarity_max_elements', 'hidden')
+class SimilarityMaxElementsField(BaseField):
+    @staticmethod
+    def default():
+        return '0'
+
+    @staticmethod
+    def parse(sme):
+        return isinstance(sme, int) and sme >= 0, sme
+
+    @staticmethod
+    def error(sme):
+        return (f"Required the nonnegative integer(>=0) 'similarity_max_elements' field, now is {sme}. "
+                f"default value=0 (means all the elements are compared).")
+
+    @staticmethod
+    def message():
+        return (f"When checking per-layer similarity, tensors with more elements are compared on this number of "
+                f"evenly strided elements.")
+
+
 @field_register('write_similarity_to_ir', 'hidden')
 class WriteSimilarityField(BaseField):
     @staticmethod
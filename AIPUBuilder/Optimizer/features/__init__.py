@@ -1,6 +1,6 @@
 # SPDX-License-Identifier: Apache-2.0
 # Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
 
-from AIPUBuilder.Optimizer.features.autosearch import NaiveAutoSearchMixedPrecision
+from AIPUBuilder.Optimizer.features.autosearch import NaiveAutoSearchMixedPrecision, SensitivityAutoSearchMixedPrecision
 from AIPUBuilder.Optimizer.features.calibration import apply_calibration_strategy, apply_global_calibration, statistic_and_calibration
 from AIPUBuilder.Optimizer.features.imagetiling import *
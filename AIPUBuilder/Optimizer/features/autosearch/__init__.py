@@ -2,3 +2,4 @@
 # Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
 
 from . mixed_precision_naive_search import NaiveAutoSearchMixedPrecision
+from . mixed_precision_sensitivity_search import SensitivityAutoSearchMixedPrecision
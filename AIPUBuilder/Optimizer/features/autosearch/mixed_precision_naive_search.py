@@ -1,34 +1,44 @@
 # SPDX-License-Identifier: Apache-2.0
 # Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
 
-from AIPUBuilder.Optimizer.framework import graph_inference
+from AIPUBuilder.Optimizer.framework import graph_inference, QuantizationCache
 from AIPUBuilder.Optimizer.passes import InsertCastOp, insert_op_pass
-from AIPUBuilder.Optimizer.logger import OPT_INFO
+from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_DEBUG, OPT_WARN
+from . trial_executor import AutoSearchTrialExecutor
+import itertools
 import copy
 
 
 class NaiveAutoSearchMixedPrecision(object):
 
-    def __init__(self, g, val_dataloader, fmetrics, qmetrics, hparams):
+    def __init__(self, g, val_dataloader, fmetrics, qmetrics, hparams, reference_cache=None):
 
         self.g = g
         self.validation_dataloader = val_dataloader
         self.fmetrics = fmetrics
         self.qmetrics = qmetrics
         self.hparams = hparams
+        self.reference_cache = reference_cache
 
         self.search_times = 0
         self.abatches = 0
         self.athres = 0
         self.aless = 0
         self.fscore = 0.0
+        # neighboring trials only change the bits of a part of layers, so the quantization results of the other layers
+        # (and the layers whose inputs are not affected) are reused across trials
+        self.qcache = QuantizationCache()
+        # scores of the evaluated candidates (pid, bits), with several workers the candidates which the search may
+        # probe next are evaluated in the same round
+        self.trials = {}
+        self.executor = None
 
     #################################################################
     # to speedup the search progress, we assume that the deeper layer are more sensitive
     # to quantization, so we just search a partion layer that subsequent layers are all
     # quantized by higher bits (16) or not quantized.
 
-    def qinference_simulation(self, pid, bits):
+    def qinference_score(self, pid, bits):
         vdataloader = copy.deepcopy(self.validation_dataloader)
         qmetrics = copy.deepcopy(self.qmetrics)
         for qm in qmetrics:
@@ -49,7 +59,9 @@ class NaiveAutoSearchMixedPrecision(object):
         if bits > 0:
             insert_obj = [InsertCastOp]
             insert_op_pass(self.g.quantgraph, self.hparams, insert_obj)
-        self.g.quantize()
+        self.g.quantize(self.qcache)
+        OPT_DEBUG(f"mixed_precision_auto_search: {self.qcache.hits} layers were reused and {self.qcache.misses} layers "
+                  f"were quantized so far.")
         graph_inference(self.g.quantgraph,
                         self.g.qforward,
                         vdataloader,
@@ -60,14 +72,49 @@ class NaiveAutoSearchMixedPrecision(object):
         qscore = qmetrics[0].compute()
         for qm in qmetrics:
             qm.reset()
-        self.search_times += 1
-        OPT_INFO('mixed_precision_auto_search (on %d batches of validation dataset): searched %d times, with score [%s], original score [%s].' % (
-            self.abatches, self.search_times, str(qscore), str(self.fscore)))
         return qscore
 
+    def trial_score(self, candidate):
+        # the score of one candidate, evaluated by the trial executor's workers
+        pid, bits = candidate
+        return self.qinference_score(pid, bits)
+
+    def qinference_simulations(self, candidates):
+        if self.executor is not None and len(candidates) > 1:
+            qscores = self.executor.map(candidates)
+        else:
+            qscores = [self.qinference_score(pid, bits) for pid, bits in candidates]
+        for qscore in qscores:
+            self.search_times += 1
+            OPT_INFO('mixed_precision_auto_search (on %d batches of validation dataset): searched %d times, with score [%s], original score [%s].' % (
+                self.abatches, self.search_times, str(qscore), str(self.fscore)))
+        return qscores
+
+    def qinference_simulation(self, pid, bits, following=()):
+        # following are the candidates which the search would probe next, the first of them are evaluated in the
+        # same round as pid when there are several workers
+        if (pid, bits) not in self.trials:
+            rsize = self.executor.workers if self.executor is not None else 1
+            candidates = [(pid, bits)]
+            for p in following:
+                if len(candidates) >= rsize:
+                    break
+                if (p, bits) not in self.trials and (p, bits) not in candidates:
+                    candidates.append((p, bits))
+            for c, qscore in zip(candidates, self.qinference_simulations(candidates)):
+                self.trials[c] = qscore
+        return self.trials[(pid, bits)]
+
     def satisfy_acc_drop(self, acc_drop):
         return (self.aless and (acc_drop <= self.athres)) or ((not self.aless) and (acc_drop >= self.athres))
 
+    def need_simulation(self, pid, pbits):
+        flag = False
+        for n in self.g.nodes:
+            if int(n.attrs['layer_id']) >= pid and (int(n.attrs['q_bits_activation']) < pbits or int(n.attrs['q_bits_weight']) < pbits or pbits < 1):
+                flag = True
+        return flag
+
     def search_pid(self, pbits, init_acc_drop):
         acc_drop = init_acc_drop
         pid = max(0, len(self.g.nodes))
@@ -77,12 +124,13 @@ class NaiveAutoSearchMixedPrecision(object):
             pid = pid // 2
             if pid >= pid_pre:
                 break
-            flag = False
-            for n in self.g.nodes:
-                if int(n.attrs['layer_id']) >= pid and (int(n.attrs['q_bits_activation']) < pbits or int(n.attrs['q_bits_weight']) < pbits or pbits < 1):
-                    flag = True
-            if flag:
-                qscore = self.qinference_simulation(pid, pbits)
+            if self.need_simulation(pid, pbits):
+                # the next probes if the current one does not satisfy
+                following = [p for p in itertools.takewhile(lambda x: x > 0, (pid >> (k + 1) for k in itertools.count()))
+                             if self.need_simulation(p, pbits)]
+                if pid > 0:
+                    following += [0] if self.need_simulation(0, pbits) else []
+                qscore = self.qinference_simulation(pid, pbits, following)
                 acc_drop = self.fscore - qscore
         t0 = pid
         t = 0
@@ -92,7 +140,9 @@ class NaiveAutoSearchMixedPrecision(object):
             t += 1
             if qid >= pid_pre:
                 break
-            qscore = self.qinference_simulation(qid, pbits)
+            # the next probes if the current one satisfies
+            following = list(itertools.takewhile(lambda x: x < pid_pre, (t0 + 2**k for k in itertools.count(t))))
+            qscore = self.qinference_simulation(qid, pbits, following)
             acc_drop = self.fscore - qscore
             if not self.satisfy_acc_drop(acc_drop):
                 break
@@ -124,13 +174,22 @@ class NaiveAutoSearchMixedPrecision(object):
                         fmetrics,
                         with_float=True,
                         max_batches=self.abatches,
-                        disable_tqdm=True)
+                        disable_tqdm=True,
+                        reference_cache=self.reference_cache)
         self.fscore = fmetrics[0].compute()
         for fm in fmetrics:
             fm.reset()
 
         gnodes = len(self.g.nodes)
         pbits = 16
+        self.trials = {}
+        workers = self.hparams.mixed_precision_auto_search_workers
+        if workers > 1:
+            if AutoSearchTrialExecutor.available():
+                self.executor = AutoSearchTrialExecutor(self, workers)
+            else:
+                OPT_WARN(f"mixed_precision_auto_search: can not fork worker processes (or the cuda device is used), "
+                         f"the {workers} 'mixed_precision_auto_search_workers' are ignored.")
         qscore = self.qinference_simulation(gnodes, pbits)
         pid, acc_drop1 = self.search_pid(pbits, self.fscore - qscore)
         smsg = 'mixed_precision_auto_search (on %d batches of validation dataset): layers(layer_id aligned to input float IR) will be optimized as follow:\n' % (
@@ -173,4 +232,8 @@ class NaiveAutoSearchMixedPrecision(object):
                          f"when running on AIPU device with float type.")
 
         OPT_INFO(smsg)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
         self.g.quantgraph = None
+        self.qcache.clear()
@@ -0,0 +1,393 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+from AIPUBuilder.Optimizer.framework import graph_inference, OpType
+from AIPUBuilder.Optimizer.passes import InsertCastOp, insert_op_pass
+from AIPUBuilder.Optimizer.utils import linear_quantize_clip, linear_dequantize, cosine_distance
+from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_DEBUG, OPT_WARN, tqdm
+from . mixed_precision_naive_search import NaiveAutoSearchMixedPrecision
+from . trial_executor import AutoSearchTrialExecutor
+import copy
+import sys
+
+
+class SensitivityAutoSearchMixedPrecision(NaiveAutoSearchMixedPrecision):
+    '''
+    Instead of bisecting on a cut point with a full validation per probe, score each layer's quantization
+    sensitivity in a few passes over a few batches: every layer is fed with the float inputs and quantized alone with
+    its current bits, with 16 bits, and at the boundaries of a 16 bits neighbour (a 16 bits layer after 8 bits
+    producers, an 8 bits layer after a 16 bits producer), the cosine degradation of its outputs is its sensitivity.
+    Then layers (alone or together with their neighbours) are promoted to 16 bits by the best reduction of the
+    modeled degradation per extra bit until the bits budget is used up. The assignment is validated in one round
+    (one pass over the validation batches, or one round of the workers) against the unpromoted graph and against
+    the assignment without each of its least paying segments, the best of them is kept.
+    '''
+
+    # the most segments whose drop is validated, so that the validation is one round of a bounded size
+    segment_probes = 3
+
+    def __init__(self, g, val_dataloader, fmetrics, qmetrics, hparams, reference_cache=None):
+        super().__init__(g, val_dataloader, fmetrics, qmetrics, hparams, reference_cache)
+        _, self.budget = hparams.mixed_precision_auto_search_strategy
+        self.assignment = {}
+
+    @staticmethod
+    def promote(n):
+        n.attrs['q_bits_activation'] = 16
+        n.attrs['q_bits_weight'] = 16
+        n.attrs['q_bits_bias'] = 48
+        n.attrs['lut_items_in_bits'] = 10
+
+    def quantized_graph(self, bits, promoted=None):
+        # a quantized copy of the graph with all the layers in current bits (bits < 1) or in the given bits, or with
+        # only the promoted layers in 16 bits (the casts between 8 bits and 16 bits layers are inserted)
+        self.g.quantgraph = self.g.clone()
+        for n in self.g.quantgraph.nodes:
+            n.attrs['debug_fake_quantize'] = False
+            if bits > 8 or (promoted is not None and n.name in promoted):
+                self.promote(n)
+        if promoted is not None:
+            insert_op_pass(self.g.quantgraph, self.hparams, [InsertCastOp])
+        self.g.quantize(self.qcache)
+        qg = self.g.quantgraph
+        self.g.quantgraph = None
+        return qg
+
+    @staticmethod
+    def _quantize_input(t, x):
+        if t.qinvariant or (t.pnode is not None and t.pnode.get_param('unquantifiable', optional=True, default_value=False)):
+            return x
+        return linear_quantize_clip(x, t.scale, t.zerop, t.qmin, t.qmax, t.key_axis)
+
+    @staticmethod
+    def _dequantize_output(t, x):
+        if t.qinvariant:
+            return x
+        return linear_dequantize(x, t.scale, t.zerop, t.key_axis)
+
+    def layer_similarity(self, n, qn, batch_idx, batch_size):
+        # cosine similarity between n's float outputs and qn's outputs, when qn is fed with n's float inputs
+        if qn.get_param('unquantifiable', optional=True, default_value=False):
+            return [1.0 for _ in n.outputs]
+        if len(n.inputs) < 1:
+            # the quantization error of the graph inputs and constants
+            return [cosine_distance(t.betensor, self._dequantize_output(qt, self._quantize_input(qt, t.betensor)))
+                    for t, qt in zip(n.outputs, qn.outputs)]
+        for t, qt in zip(n.inputs, qn.inputs):
+            qt.betensor = self._quantize_input(qt, t.betensor)
+        qn.current_batch_idx = batch_idx
+        qn.current_batch_size = batch_size
+        qn.forward()
+        return [cosine_distance(t.betensor, self._dequantize_output(qt, qt.betensor)) for t, qt in zip(n.outputs, qn.outputs)]
+
+    def layer_degradations(self, qgraphs, desc):
+        # one forward pass of the float graph, the given layers of each quantized graph ([(qg, layer names), ...]) are
+        # evaluated in isolation, returns their mean degradations [{layer name: degradation}, ...]
+        qnodes = [({qn.name: qn for qn in qg.nodes}, names) for qg, names in qgraphs]
+        sims = [{name: 0.0 for name in names} for _, names in qgraphs]
+        vdataloader = copy.deepcopy(self.validation_dataloader)
+        fingerprint = self.reference_cache.fingerprint(self.g) if self.reference_cache is not None else None
+        batches = 0
+        with tqdm(total=self.abatches * sum([len(names) for _, names in qgraphs]), desc=desc,
+                  file=sys.stdout, leave=True, consumer=self.g) as pbar:
+            for i, sample in enumerate(vdataloader):
+                if i >= self.abatches:
+                    break
+                inp, _ = sample
+                batch_size = vdataloader.batch_size
+                if (i + 1) * batch_size > len(vdataloader.dataset):
+                    batch_size = len(vdataloader.dataset) - i * batch_size
+                self.g.current_batch_idx = i
+                self.g.current_batch_size = batch_size
+                if self.reference_cache is not None:
+                    self.reference_cache.forward(self.g, inp, i, fingerprint, per_layer=True)
+                else:
+                    self.g.forward(inp, keep_tensors=True)
+                for n in self.g.nodes:
+                    for (nodes, _), sim in zip(qnodes, sims):
+                        if n.name in sim:
+                            sim[n.name] += min(self.layer_similarity(n, nodes[n.name], i, batch_size))
+                            pbar.update(1)
+                batches += 1
+            pbar.refresh()
+        batches = max(1, batches)
+        return [{name: 1.0 - s / batches for name, s in sim.items()} for sim in sims]
+
+    def neighbour_groups(self):
+        # the layers which are promoted together to measure the boundaries: layers of a group are neither adjacent nor
+        # consumed by a same layer, so each boundary in a group's graph is between one 16 bits layer and 8 bits ones
+        groups = []
+        group_of = {}
+        for n in self.g.nodes:
+            conflicts = set([p.name for p in n.parents] + [c.name for c in n.children])
+            for c in n.children:
+                conflicts.update([p.name for p in c.parents])
+            used = set([group_of[name] for name in conflicts if name in group_of])
+            k = 0
+            while k in used:
+                k += 1
+            if k == len(groups):
+                groups.append([])
+            groups[k].append(n.name)
+            group_of[n.name] = k
+        return groups, group_of
+
+    def sensitivity(self):
+        # the degradations of each layer: {'d8', 'd16', 'd16_in8': 16 bits after 8 bits producers,
+        # 'd8_in16': {producer name: 8 bits after this 16 bits producer}}
+        all_names = [n.name for n in self.g.nodes]
+        d8, d16 = self.layer_degradations([(self.quantized_graph(0), all_names), (self.quantized_graph(16), all_names)],
+                                          'mixed_precision_auto_search: sensitivity')
+        self.search_times += 1
+        groups, group_of = self.neighbour_groups()
+        d16_in8 = {}
+        d8_in16 = {name: {} for name in all_names}
+        for k, group in enumerate(groups):
+            # the group's layers and their consumers, one graph per group is held at a time
+            names = set(group)
+            for n in self.g.nodes:
+                if n.name not in names and any([group_of[p.name] == k for p in n.parents]):
+                    names.add(n.name)
+            names = [name for name in all_names if name in names]
+            degradations, = self.layer_degradations([(self.quantized_graph(0, group), names)],
+                                                    f'mixed_precision_auto_search: boundaries {k + 1}/{len(groups)}')
+            self.search_times += 1
+            for n in self.g.nodes:
+                if n.name in group:
+                    d16_in8[n.name] = degradations[n.name]
+                elif n.name in degradations:
+                    for p in n.parents:
+                        if group_of[p.name] == k:
+                            d8_in16[n.name][p.name] = degradations[n.name]
+        return [{'d8': d8[name], 'd16': d16[name], 'd16_in8': d16_in8[name], 'd8_in16': d8_in16[name]}
+                for name in all_names]
+
+    @staticmethod
+    def modeled_degradation(n, degradation, promoted):
+        # n's degradation when the promoted layers are in 16 bits
+        if n.name in promoted:
+            if all([p.name in promoted for p in n.parents]):
+                return degradation['d16']
+            return degradation['d16_in8']
+        d = degradation['d8']
+        for p in n.parents:
+            if p.name in promoted and p.name in degradation['d8_in16']:
+                d += degradation['d8_in16'][p.name] - degradation['d8']
+        return d
+
+    def promotion_cost(self, n):
+        # extra bits of the layer's weights and output featuremaps (per sample) when quantized to 16 bits
+        cost = 0
+        if 'weights' in n.constants and n.type not in [OpType.Input, OpType.Constant]:
+            cost += max(0, 16 - int(n.attrs['q_bits_weight'])) * n.constants['weights'].betensor.numel()
+        for t in n.outputs:
+            numel = 1
+            for s in t.ir_shape[1:] if len(t.ir_shape) > 1 else t.ir_shape:
+                numel *= s
+            cost += max(0, 16 - int(n.attrs['q_bits_activation'])) * numel
+        return cost
+
+    def assign(self, degradations):
+        # greedy budgeted assignment on the modeled degradation: a layer alone, or together with its unpromoted
+        # consumers (or producers) to start or grow a 16 bits segment, with the best degradation reduction per extra
+        # bit is promoted first
+        nodes = {n.name: n for n in self.g.nodes}
+        index = {n.name: k for k, n in enumerate(self.g.nodes)}
+        costs = {n.name: self.promotion_cost(n) for n in self.g.nodes}
+        total_cost = sum(costs.values())
+        budget = self.budget * total_cost
+        used = 0
+        promoted = set()
+
+        def affected_degradation(names, promoted):
+            return sum([self.modeled_degradation(nodes[name], degradations[index[name]], promoted) for name in names])
+
+        while True:
+            best = None
+            for n in self.g.nodes:
+                if n.name in promoted or costs[n.name] <= 0:
+                    continue
+                candidates = [[n.name],
+                              [n.name] + [c.name for c in n.children if c.name not in promoted and costs[c.name] > 0],
+                              [n.name] + [p.name for p in n.parents if p.name not in promoted and costs[p.name] > 0]]
+                for candidate in candidates:
+                    cost = sum([costs[name] for name in candidate])
+                    if used + cost > budget:
+                        continue
+                    # only the candidate's layers and their consumers are affected
+                    affected = set(candidate)
+                    for name in candidate:
+                        affected.update([c.name for c in nodes[name].children])
+                    gain = (affected_degradation(affected, promoted) -
+                            affected_degradation(affected, promoted.union(candidate)))
+                    if gain > 0 and (best is None or gain / cost > best[0]):
+                        best = (gain / cost, gain, cost, candidate)
+            if best is None:
+                break
+            _, gain, cost, candidate = best
+            used += cost
+            promoted.update(candidate)
+            OPT_DEBUG(f"mixed_precision_auto_search: promote {', '.join([str(nodes[name]) for name in candidate])} to "
+                      f"16bits, degradation reduction={gain}, extra bits={cost}")
+        assignment = {n.name: 16 for n in self.g.nodes if n.name in promoted}
+        return assignment, used, total_cost
+
+    def segments(self, assignment):
+        # the connected segments of the promoted layers
+        segments = []
+        visited = set()
+        for n in self.g.nodes:
+            if n.name not in assignment or n.name in visited:
+                continue
+            segment = []
+            stack = [n]
+            visited.add(n.name)
+            while len(stack):
+                m = stack.pop()
+                segment.append(m.name)
+                for k in list(m.parents) + list(m.children):
+                    if k.name in assignment and k.name not in visited:
+                        visited.add(k.name)
+                        stack.append(k)
+            segments.append(segment)
+        return segments
+
+    def better(self, score, other):
+        # whether score is strictly better than other, the metric is the larger the better when aless
+        return score > other if self.aless else score < other
+
+    def qinference_scores(self, assignments):
+        # the scores of the assignments in one pass over the validation batches: each batch is fed to all their
+        # quantized graphs, the first graph is driven by graph_inference and the others are scored alongside
+        qgraphs = [self.quantized_graph(0, assignment) for assignment in assignments]
+        qmetrics = [copy.deepcopy(self.qmetrics) for _ in qgraphs]
+        for qms in qmetrics:
+            for qm in qms:
+                qm.reset()
+        outputs = []
+
+        def qforward(inp):
+            outputs.clear()
+            for qg in qgraphs[1:]:
+                qg.current_batch_idx = qgraphs[0].current_batch_idx
+                qg.current_batch_size = qgraphs[0].current_batch_size
+                outputs.append([self._dequantize_prediction(t) for t in qg.forward(inp)])
+            return qgraphs[0].forward(inp)
+
+        def other_metrics(prediction, target):
+            for out, qms in zip(outputs, qmetrics[1:]):
+                for qm in qms:
+                    qm(out, target)
+
+        graph_inference(qgraphs[0],
+                        qforward,
+                        copy.deepcopy(self.validation_dataloader),
+                        qmetrics[0] + [other_metrics],
+                        with_float=False,
+                        max_batches=self.abatches,
+                        disable_tqdm=True)
+        qscores = [qms[0].compute() for qms in qmetrics]
+        for qms in qmetrics:
+            for qm in qms:
+                qm.reset()
+        self.search_times += len(assignments)
+        return qscores
+
+    @staticmethod
+    def _dequantize_prediction(t):
+        # as graph_inference does for the quantized outputs
+        if t.debug_flag or (t.pnode is not None and t.pnode.get_param('unquantifiable', optional=True, default_value=False)):
+            return t.betensor
+        return linear_dequantize(t.betensor, t.scale, t.zerop)
+
+    def trial_score(self, candidate):
+        # the score of one candidate (the promoted layers' names), evaluated by the trial executor's workers
+        return self.qinference_scores([{name: 16 for name in candidate}])[0]
+
+    def trial_scores(self, assignments):
+        if self.executor is not None and len(assignments) > 1:
+            self.search_times += len(assignments)
+            return self.executor.map([tuple(sorted(assignment.keys())) for assignment in assignments])
+        return self.qinference_scores(assignments)
+
+    def qinference(self, assignment):
+        return self.qinference_scores([assignment])[0]
+
+    def validate(self, assignment, degradations):
+        # one round of validations, whatever the number of promoted segments: the assignment, the assignment without
+        # each of the segment_probes segments of the least modeled gain, and no promotion. the best one is kept.
+        candidates = [assignment]
+        if len(assignment) > 0:
+            index = {n.name: k for k, n in enumerate(self.g.nodes)}
+
+            def modeled_gain(segment):
+                rest = set([name for name in assignment if name not in segment])
+                return sum([self.modeled_degradation(n, degradations[index[n.name]], rest) -
+                            self.modeled_degradation(n, degradations[index[n.name]], assignment) for n in self.g.nodes])
+
+            segments = self.segments(assignment)
+            if len(segments) > 1:
+                for segment in sorted(segments, key=modeled_gain)[:self.segment_probes]:
+                    candidates.append({name: bits for name, bits in assignment.items() if name not in segment})
+            candidates.append({})
+        qscores = self.trial_scores(candidates)
+        best = 0
+        for k in range(1, len(candidates)):
+            if self.better(qscores[k], qscores[best]):
+                best = k
+        if best > 0:
+            nodes = {n.name: n for n in self.g.nodes}
+            dropped = [str(nodes[name]) for name in assignment if name not in candidates[best]]
+            OPT_WARN(f"mixed_precision_auto_search: the promotion of {', '.join(dropped)} makes the score worse "
+                     f"({qscores[0]} vs {qscores[best]} without it), it is dropped.")
+        return candidates[best], qscores[best]
+
+    def auto_search(self):
+        self.abatches, self.athres, self.aless = self.hparams.mixed_precision_auto_search
+        vdataloader = copy.deepcopy(self.validation_dataloader)
+        fmetrics = copy.deepcopy(self.fmetrics)
+        for fm in fmetrics:
+            fm.reset()
+        graph_inference(self.g,
+                        self.g.forward,
+                        vdataloader,
+                        fmetrics,
+                        with_float=True,
+                        max_batches=self.abatches,
+                        disable_tqdm=True,
+                        reference_cache=self.reference_cache)
+        self.fscore = fmetrics[0].compute()
+        for fm in fmetrics:
+            fm.reset()
+
+        degradations = self.sensitivity()
+        assignment, _, total_cost = self.assign(degradations)
+        workers = self.hparams.mixed_precision_auto_search_workers
+        if workers > 1:
+            # the validation candidates are evaluated on the workers
+            if AutoSearchTrialExecutor.available():
+                self.executor = AutoSearchTrialExecutor(self, workers)
+            else:
+                OPT_WARN(f"mixed_precision_auto_search: can not fork worker processes (or the cuda device is used), "
+                         f"the {workers} 'mixed_precision_auto_search_workers' are ignored.")
+        self.assignment, qscore = self.validate(assignment, degradations)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.qcache.clear()
+        used = sum([self.promotion_cost(n) for n in self.g.nodes if n.name in self.assignment])
+        for n in self.g.nodes:
+            if n.name in self.assignment:
+                self.promote(n)
+        smsg = (f"mixed_precision_auto_search (on {self.abatches} batches of validation dataset) with sensitivity strategy: "
+                f"searched {self.search_times} times, {len(self.assignment)} layers are quantized to 16bits using "
+                f"{used}/{total_cost} of the extra bits, with score [{qscore}], "
+                f"original score [{self.fscore}].\n")
+        if len(self.assignment):
+            smsg += 'quantized to 16bits: layer ' + ', '.join([str(n.attrs['layer_id'])
+                                                             for n in self.g.nodes if n.name in self.assignment])
+        OPT_INFO(smsg)
+        if not self.satisfy_acc_drop(self.fscore - qscore):
+            OPT_WARN(f"mixed_precision_auto_search: the accuracy threshold {self.athres} is not satisfied under the "
+                     f"budget {self.budget}, please consider a larger budget in 'mixed_precision_auto_search_strategy'.")
+        return self.assignment
@@ -0,0 +1,55 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+from AIPUBuilder.Optimizer.framework.pycore.pytensor import opt_use_cuda
+from AIPUBuilder.Optimizer.logger import OPT_DEBUG
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import torch
+
+# the search engine of a worker process, set by the initializer in the worker only
+_SEARCH = None
+
+
+def _init_worker(search, threads):
+    # with the fork start method, the initializer's args are inherited by the worker instead of being pickled
+    global _SEARCH
+    _SEARCH = search
+    torch.set_num_threads(threads)
+
+
+def _evaluate(candidate):
+    return _SEARCH.trial_score(candidate)
+
+
+class AutoSearchTrialExecutor(object):
+    '''
+    Evaluates the candidates of an autosearch round on a pool of forked worker processes. The workers inherit the
+    search engine (the parsed graph, its statistics and the validation dataloader) from the main process as
+    copy-on-write memory, only the candidates and their scores are transferred.
+
+    The search engine is not picklable (graphs, dataloaders and metric plugins), so the 'fork' start method is
+    required whatever the default start method of the platform is: check available() first, the search falls back
+    to evaluating the candidates serially where fork is not supported (e.g. Windows) or the cuda device is used.
+    The workers are forked when the first candidates are submitted, they evaluate the search as it is at that time.
+    '''
+
+    def __init__(self, search, workers):
+        if not self.available():
+            raise RuntimeError("AutoSearchTrialExecutor requires the 'fork' start method and the cpu device.")
+        self.workers = workers
+        threads = max(1, torch.get_num_threads() // workers)
+        self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                                        initializer=_init_worker, initargs=(search, threads))
+        OPT_DEBUG(f"mixed_precision_auto_search: evaluate candidates on {workers} processes with {threads} threads each.")
+
+    @staticmethod
+    def available():
+        # cuda can not be reinitialized in forked processes
+        return 'fork' in multiprocessing.get_all_start_methods() and not opt_use_cuda()
+
+    def map(self, candidates):
+        return list(self.pool.map(_evaluate, candidates))
+
+    def shutdown(self):
+        self.pool.shutdown()
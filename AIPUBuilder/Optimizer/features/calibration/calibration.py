@@ -44,31 +44,64 @@ def apply_calibration_strategy(t, strategy, quantize_method):
         t.max_key_axis = torch.max(t.max_key_axis, torch.zeros_like(t.max_key_axis))
 
 
-def apply_global_calibration(g, cdataloader, strategy):
+def apply_global_calibration(g, cdataloader, strategy, cache_size=2048, checkpoint='', reference_cache=None):
     methods = strategy
     OPT_INFO('applying global calibration strategy: ')
-    for method in methods:
+    ckpt = None
+    if checkpoint:
+        # finished layers are persisted along the way, a rerun with the same graph, config and data resumes from them
+        ckpt = GlobalCalibrationCheckpoint(checkpoint, g, cdataloader, strategy)
+    # methods share the forward sweeps and the captured featuremaps, so declare their requests firstly
+    engine = LayerwiseCalibrationEngine(g, cdataloader, cache_size)
+    requests = {
+        'adaround': adaround_global_calibration_requests,
+        'adaquant_zy': adaquant_zy_global_calibration_requests,
+        'gptq_zy': gptq_zy_global_calibration_requests,
+        'smooth_quant_zy': smooth_quant_zy_global_calibration_requests,
+        'awq_zy': awq_zy_global_calibration_requests,
+    }
+    # methods whose results are fully recorded, the others are rerun and restore their finished layers
+    resumable = ['easy_quant', 'adaround', 'adaquant_zy', 'gptq_zy', 'svd_quant']
+    for midx, method in enumerate(methods):
+        if ckpt is not None and method[0] in resumable and ckpt.method_done(midx):
+            continue
+        if method[0] in requests:
+            requests[method[0]](engine, method[1], method[2])
+    for midx, method in enumerate(methods):
         mname = method[0]
         mparams = method[1]
         mscopes = method[2]
+        if ckpt is not None:
+            if mname in resumable and ckpt.method_done(midx):
+                OPT_INFO(f"{mname} was finished by a previous run, restore its results from checkpoint")
+                ckpt.restore_method(midx, g)
+                # the captured featuremaps may not match the restored graph
+                engine.invalidate()
+                continue
+            ckpt.begin(midx)
         if 'easy_quant' == mname:
-            easy_quant_global_calibration(g, cdataloader, mparams, mscopes)
+            easy_quant_global_calibration(g, cdataloader, mparams, mscopes, reference_cache)
         elif 'adaround' == mname:
-            adaround_global_calibration(g, cdataloader, mparams, mscopes)
+            adaround_global_calibration(g, cdataloader, mparams, mscopes, engine, ckpt)
         elif 'adaquant_zy' == mname:
-            adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes)
+            adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes, engine, ckpt)
         elif 'gptq_zy' == mname:
-            gptq_zy_global_calibration(g, cdataloader, mparams, mscopes)
+            gptq_zy_global_calibration(g, cdataloader, mparams, mscopes, engine, ckpt)
         elif 'smooth_quant_zy' == mname:
-            smooth_quant_zy_global_calibration(g, cdataloader, mparams, mscopes)
+            smooth_quant_zy_global_calibration(g, cdataloader, mparams, mscopes, engine, ckpt)
         elif 'awq_zy' == mname:
-            awq_zy_global_calibration(g, cdataloader, mparams, mscopes)
+            awq_zy_global_calibration(g, cdataloader, mparams, mscopes, engine, ckpt)
         elif 'svd_quant' == mname:
-            svd_based_quant_global_calibration(g, cdataloader, mparams, mscopes)
+            svd_based_quant_global_calibration(g, cdataloader, mparams, mscopes, engine)
         elif 'mvn_correction' == mname:
             mvn_correction_global_calibration(g, cdataloader, mparams, mscopes)
         else:
             pass
+        if ckpt is not None:
+            # easy_quant and svd_quant do not record their layers, so the whole graph's statistics are recorded
+            ckpt.end(g, with_state=mname in ['easy_quant', 'svd_quant'])
+    OPT_DEBUG(f"global calibration forwarded the calibration dataset {engine.sweeps} times")
+    engine.clear()
 
 
 def statistic_and_calibration(t: PyTensor, node_attrs: dict, is_constant_tensor: bool):
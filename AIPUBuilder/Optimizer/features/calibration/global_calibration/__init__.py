@@ -1,11 +1,13 @@
 # SPDX-License-Identifier: Apache-2.0
 # Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
 
+from . layerwise_engine import LayerwiseCalibrationEngine
+from . checkpoint import GlobalCalibrationCheckpoint
 from . easy_quant import easy_quant_global_calibration
-from . adaround import adaround_global_calibration
-from . adaquant_zy import adaquant_zy_global_calibration
+from . adaround import adaround_global_calibration, adaround_global_calibration_requests
+from . adaquant_zy import adaquant_zy_global_calibration, adaquant_zy_global_calibration_requests
 from . svd_based_quant import svd_based_quant_global_calibration
-from . gptq_zy import gptq_zy_global_calibration
-from . smooth_quant_zy import smooth_quant_zy_global_calibration
-from . awq_zy import awq_zy_global_calibration
+from . gptq_zy import gptq_zy_global_calibration, gptq_zy_global_calibration_requests
+from . smooth_quant_zy import smooth_quant_zy_global_calibration, smooth_quant_zy_global_calibration_requests
+from . awq_zy import awq_zy_global_calibration, awq_zy_global_calibration_requests
 from . mvn_correction import mvn_correction_global_calibration
@@ -3,11 +3,12 @@
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_DEBUG, OPT_WARN
+from . layerwise_engine import LayerwiseCalibrationEngine
 import torch
 import sys
 
 
-def adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes):
+def adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes, engine=None, ckpt=None):
     vec = mparams
     batches = int(vec[0] if len(vec) > 0 else 1)
     epochs = int(vec[1] if len(vec) > 1 else 1)
@@ -19,10 +20,15 @@ def adaquant_zy_global_calibration(g, cdataloader, mparams, mscopes):
     msg = (f"adaquant_zy with batches={batches}, epochs={epochs}, batch_size={batch_size}, "
            f"lr_weight={lr_w}, lr_bias={lr_b}, lr_qp_wht={lr_qpw}, lr_qp_act={lr_qpa}")
     OPT_INFO(msg)
-    _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw, lr_qpa, mscopes)
+    _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw, lr_qpa, mscopes, engine, ckpt)
 
 
-def _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw, lr_qpa, mscopes):
+def adaquant_zy_global_calibration_requests(engine, mparams, mscopes):
+    batches = int(mparams[0] if len(mparams) > 0 else 1)
+    engine.request_graph_inputs(batches)
+
+
+def _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw, lr_qpa, mscopes, engine=None, ckpt=None):
 
     class QNodeModule (torch.nn.Module):
         def __init__(self, n, qn, lr_w, lr_b, lr_qpw, lr_qpa, only_optim_inp):
@@ -153,9 +159,6 @@ def _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw
                 return fmin, fmax
             else:
                 return fmin.item(), fmax.item()
-    # prevent deleting intermediate tensors
-    g.ref_count_tensors = {}
-
     qg = g.clone()
     qg.clear_tensor_quantization_attrs()
     for n in qg.nodes:
@@ -164,73 +167,25 @@ def _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw
             n.quantized = True
     qg.quantized = True
 
-    import copy
-    import math
     from AIPUBuilder.Optimizer.logger import tqdm
-    vdataloader = copy.deepcopy(cdataloader)
-    cached_float_tensors = {}
+    if engine is None:
+        engine = LayerwiseCalibrationEngine(g, cdataloader)
     # collect all inputs tensors into cached dict firstly
-    for i, sample in enumerate(vdataloader):
-        if i >= max(1, batches):
-            break
-        inp_data, _ = sample
-        g.feed_inputs_data(inp_data)
-        for inp in g.input_tensors:
-            t = inp.betensor.clone().detach()
-            if inp.name not in cached_float_tensors.keys():
-                cached_float_tensors[inp.name] = t
-            else:
-                cached_float_tensors[inp.name] = torch.cat((cached_float_tensors[inp.name], t), dim=0)
-    sample_num = 0
-    for key, val in cached_float_tensors.items():
-        psize = int(math.ceil(val.shape[0] * 1.0 / batch_size) * batch_size - val.shape[0])
-        if psize < val.shape[0]:
-            cached_float_tensors[key] = torch.cat((val, val[:psize]), dim=0)
-        else:
-            t = torch.cat((val, val), dim=0)
-            while t.shape[0] < batch_size:
-                t = torch.cat((t, t), dim=0)
-            cached_float_tensors[key] = t[:batch_size]
-        sample_num = cached_float_tensors[key].shape[0]
-    # count each tensor's reference count
-    ref_count_float_tensors = {}
-    for n in g.nodes:
-        for inp in n.inputs:
-            if inp.name not in ref_count_float_tensors.keys():
-                ref_count_float_tensors[inp.name] = 1
-            else:
-                ref_count_float_tensors[inp.name] += 1
+    samples, sample_num = engine.calibration_samples(batches, batch_size)
     # optimize each node
     iterations = sample_num // batch_size
-    abnormal_tensors = {}
-    for it in g.input_tensors:
-        it.betensor = cached_float_tensors[it.name].to(it.betensor.device)
-    for it in qg.input_tensors:
-        it.betensor = cached_float_tensors[it.name].to(it.betensor.device)
-    cached_float_tensors = {}
     with tqdm(total=iterations*epochs*len(g.nodes), desc='adaquant_zy', file=sys.stdout, leave=True) as pbar:
-        for k, n in enumerate(g.nodes):
+        for k, (n, _, cached_float_tensors, _, abnormal_tensors) in enumerate(engine.layerwise(samples, sample_num)):
+            # only the quantization params of qg are used, so it is not propagated
             qn = qg.nodes[k]
-            # move inputs to device
-            for it in n.inputs:
-                cached_float_tensors[it.name] = cached_float_tensors[it.name].to(it.betensor.device)
-            # forward featuremaps on float graph
-            for it in n.inputs:
-                it.betensor = cached_float_tensors[it.name]
-            n.current_batch_size = sample_num
-            n.current_batch_idx = 0
-            n.forward()
-            for ot in n.outputs:
-                if len(ot.betensor.shape) < 1 or ot.betensor.shape[0] != sample_num:
-                    # no batch dim
-                    abnormal_tensors[ot.name] = True
-                    OPT_WARN(f"{n.name} type={n.type} layer_id={n.attrs['layer_id']} batch dim is abnormal: expect batch_dim=0 and batches={sample_num}, but got shape={ot.betensor.shape}."
-                             f"you may try to set batch_size = calibration_batch_size x batches or batch_size=calibration_batch_size=batches=1", log_once=True)
-                if ot.name not in cached_float_tensors.keys():
-                    cached_float_tensors[ot.name] = ot.betensor
             # apply adaround on current layer
             unquantifiable = n.get_param('unquantifiable', optional=True, default_value=False)
             if n.type != OpType.Input and not unquantifiable and mscopes.get(n):
+                if ckpt is not None and ckpt.has(n.name):
+                    # finished by a previous run
+                    torch.set_rng_state(ckpt.restore(n.name, [n]))
+                    pbar.update(iterations*epochs)
+                    continue
                 only_optim_inp = True
                 if 'weights' in n.constants and n.type not in [OpType.GRUv3, OpType.GRUv1]:
                     only_optim_inp = False
@@ -313,49 +268,7 @@ def _adaquant_zy(g, cdataloader, batches, epochs, batch_size, lr_w, lr_b, lr_qpw
                     if 'biases' in n.constants:
                         n.attrs['adaquant_biases'] = {
                             qn.attrs['q_bits_bias']: qmodule.get_optimized_biases().clone().detach()}
+                if ckpt is not None:
+                    ckpt.save(n.name, [n], with_data=False, extra=torch.get_rng_state())
             else:
                 pbar.update(iterations*epochs)
-
-            # reduce tensor's reference count
-            for it in n.inputs:
-                ref_count_float_tensors[it.name] -= 1
-            # clear useless tensors out of cache for memory saving
-            useless_tnames = []
-            for rkey, rval in ref_count_float_tensors.items():
-                if rval < 1:
-                    useless_tnames.append(rkey)
-            for rkey in useless_tnames:
-                if rkey in cached_float_tensors.keys():
-                    rval = cached_float_tensors.pop(rkey)
-                    del rval
-            # move tensors back to cpu
-            for t in n.inputs:
-                if t.name in cached_float_tensors.keys():
-                    cached_float_tensors[t.name] = cached_float_tensors[t.name].cpu()
-            for t in n.outputs:
-                if t.name in cached_float_tensors.keys():
-                    cached_float_tensors[t.name] = cached_float_tensors[t.name].cpu()
-
-            def reset_layer_tensors(n):
-                for t in n.inputs:
-                    ss = None
-                    try:
-                        ss = list(t.ir_shape)
-                    except:
-                        ss = list(t.shape)
-                    t.betensor = torch.zeros(ss, device=t.betensor.device)
-                for t in n.outputs:
-                    ss = None
-                    try:
-                        ss = list(t.ir_shape)
-                    except:
-                        ss = list(t.shape)
-                    t.betensor = torch.zeros(ss, device=t.betensor.device)
-                for t in n.placeholders:
-                    ss = None
-                    try:
-                        ss = list(t.ir_shape)
-                    except:
-                        ss = list(t.shape)
-                    t.betensor = torch.zeros(ss, device=t.betensor.device)
-            reset_layer_tensors(n)
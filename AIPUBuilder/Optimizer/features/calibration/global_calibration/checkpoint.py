@@ -0,0 +1,188 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_DEBUG, OPT_WARN
+import torch
+import os
+import copy
+import hashlib
+import threading
+
+# the results of global calibration methods recorded in node's attrs
+_RESULT_ATTRS = ['adaround_weights', 'adaquant_weights', 'adaquant_biases', 'gptq_weights']
+# the quantization statistics which global calibration methods may change
+_TENSOR_FIELDS = ['min', 'max', 'min_key_axis', 'max_key_axis', 'key_axis',
+                  'scale', 'zerop', 'qmin', 'qmax', 'qbits', 'dtype', 'qinvariant']
+
+
+def _cpu(v):
+    if isinstance(v, torch.Tensor):
+        return v.detach().cpu().clone()
+    if isinstance(v, dict):
+        return {k: _cpu(x) for k, x in v.items()}
+    return copy.deepcopy(v)
+
+
+def _tensor_state(t, with_data):
+    state = {}
+    for f in _TENSOR_FIELDS:
+        state[f] = _cpu(getattr(t, f))
+    if with_data:
+        state['betensor'] = _cpu(t.betensor)
+    return state
+
+
+def _set_tensor_state(t, state):
+    for f, v in state.items():
+        if isinstance(v, torch.Tensor):
+            v = v.to(t.device)
+        elif isinstance(v, dict):
+            v = {k: x.to(t.device) if isinstance(x, torch.Tensor) else x for k, x in v.items()}
+        setattr(t, f, v)
+
+
+def _node_state(n, with_data):
+    return {
+        'inputs': [_tensor_state(t, False) for t in n.inputs],
+        'outputs': [_tensor_state(t, False) for t in n.outputs],
+        'constants': {k: _tensor_state(t, with_data) for k, t in n.constants.items()},
+        'attrs': {k: _cpu(n.attrs[k]) for k in _RESULT_ATTRS if k in n.attrs},
+    }
+
+
+def _set_node_state(n, state):
+    for t, ts in zip(n.inputs, state['inputs']):
+        _set_tensor_state(t, ts)
+    for t, ts in zip(n.outputs, state['outputs']):
+        _set_tensor_state(t, ts)
+    for k, ts in state['constants'].items():
+        if k in n.constants:
+            _set_tensor_state(n.constants[k], ts)
+    for k, v in state['attrs'].items():
+        dev = n.outputs[0].device if len(n.outputs) else None
+        n.attrs[k] = {b: w.to(dev) if isinstance(w, torch.Tensor) else w for b, w in v.items()}
+
+
+def global_calibration_fingerprint(g, cdataloader, strategy):
+    '''
+    Digest of everything the global calibration results depend on: the graph (structure, params, quantization attrs,
+    constants and the initial calibration statistics), the global calibration config and the calibration data.
+    '''
+    h = hashlib.sha256()
+
+    def update(v):
+        h.update(str(v).encode('utf-8'))
+
+    def update_tensor(t):
+        if isinstance(t, torch.Tensor):
+            h.update(t.detach().cpu().contiguous().numpy().tobytes())
+        else:
+            update(t)
+
+    for n in g.nodes:
+        update((n.name, str(n.type), sorted([(k, str(v)) for k, v in n.params.items()])))
+        update(sorted([(k, v) for k, v in n.attrs.items() if isinstance(v, (int, float, str, bool))]))
+        update([t.name for t in n.inputs] + [t.name for t in n.outputs])
+        for t in list(n.outputs) + list(n.placeholders):
+            for f in ['min', 'max', 'min_key_axis', 'max_key_axis']:
+                update_tensor(getattr(t, f))
+        for k, t in sorted(n.constants.items()):
+            update(k)
+            update_tensor(t.betensor)
+    for mname, mparams, mscopes in strategy:
+        update((mname, mparams, [n.name for n in g.nodes if mscopes.get(n)]))
+    vdataloader = copy.deepcopy(cdataloader)
+    update((len(vdataloader.dataset), vdataloader.batch_size))
+    # every batch is hashed, the results depend on all the calibration data
+    for sample in vdataloader:
+        inp_data, _ = sample
+        for t in (inp_data if isinstance(inp_data, (list, tuple)) else [inp_data]):
+            t = torch.as_tensor(t)
+            update((tuple(t.shape), str(t.dtype)))
+            update_tensor(t)
+    return h.hexdigest()
+
+
+class GlobalCalibrationCheckpoint(object):
+    '''
+    Persists the per-layer results of global calibration methods under `path`, one file per finished layer (or
+    group of layers), so that a rerun with the same graph, config and calibration data restores the finished layers
+    instead of calibrating them again. Each record is keyed by the method's position in the strategy and a layer key.
+    '''
+
+    def __init__(self, path, g, cdataloader, strategy):
+        self.fingerprint = global_calibration_fingerprint(g, cdataloader, strategy)
+        self.dir = os.path.join(path, self.fingerprint[:16])
+        os.makedirs(self.dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.midx = -1
+        self.records = {}
+        self.seq = 0
+        for fname in sorted(os.listdir(self.dir)):
+            if not fname.endswith('.pt'):
+                continue
+            try:
+                # records are written by this class only, they also pickle the quantization types
+                rec = torch.load(os.path.join(self.dir, fname), weights_only=False)
+            except Exception as e:
+                OPT_WARN(f"global calibration checkpoint {fname} is broken and will be ignored: {e}")
+                continue
+            if rec.get('fingerprint') != self.fingerprint:
+                continue
+            self.records[(rec['midx'], rec['key'])] = rec
+            self.seq = max(self.seq, rec['seq'] + 1)
+        if len(self.records) > 0:
+            OPT_INFO(f"resume global calibration from {len(self.records)} records in {self.dir}")
+
+    def begin(self, midx):
+        self.midx = midx
+
+    def has(self, key, midx=None):
+        return ((self.midx if midx is None else midx), key) in self.records
+
+    def method_done(self, midx):
+        return self.has(None, midx)
+
+    def save(self, key, nodes, qnodes=None, with_data=True, extra=None):
+        # record the state of nodes (and qnodes of the quantized graph) after the layer `key` was finished
+        rec = {
+            'fingerprint': self.fingerprint,
+            'midx': self.midx,
+            'key': key,
+            'nodes': {n.name: _node_state(n, with_data) for n in nodes},
+            'qnodes': {n.name: _node_state(n, True) for n in (qnodes if qnodes is not None else [])},
+            'extra': _cpu(extra),
+        }
+        with self.lock:
+            rec['seq'] = self.seq
+            self.seq += 1
+            fpath = os.path.join(self.dir, f"{rec['seq']:08d}.pt")
+            # write then rename, so that a killed process never leaves a truncated record
+            torch.save(rec, fpath + '.tmp')
+            os.replace(fpath + '.tmp', fpath)
+            self.records[(self.midx, key)] = rec
+
+    def restore(self, key, nodes, qnodes=None, midx=None):
+        # put the recorded state back to nodes (and qnodes), return the extra info
+        rec = self.records[((self.midx if midx is None else midx), key)]
+        ndict = {n.name: n for n in nodes}
+        qdict = {n.name: n for n in (qnodes if qnodes is not None else [])}
+        for name, state in rec['nodes'].items():
+            if name in ndict:
+                _set_node_state(ndict[name], state)
+        for name, state in rec['qnodes'].items():
+            if name in qdict:
+                _set_node_state(qdict[name], state)
+        OPT_DEBUG(f"global calibration restored {key} of method {rec['midx']} from checkpoint")
+        return rec['extra']
+
+    def end(self, g, with_state=False):
+        # mark the current method as finished, with_state records the whole graph's statistics for methods
+        # which do not record their layers
+        self.save(None, g.nodes if with_state else [], with_data=False)
+
+    def restore_method(self, midx, g):
+        # replay all the records of a finished method
+        recs = sorted([r for (m, _), r in self.records.items() if m == midx], key=lambda r: r['seq'])
+        for rec in recs:
+            self.restore(rec['key'], g.nodes, midx=midx)
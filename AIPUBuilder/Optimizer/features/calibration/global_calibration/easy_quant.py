@@ -6,7 +6,7 @@ import torch
 import sys
 
 
-def easy_quant_global_calibration(g, cdataloader, mparams, mscopes):
+def easy_quant_global_calibration(g, cdataloader, mparams, mscopes, reference_cache=None):
     vec = mparams
     batches = int(vec[0] if len(vec) > 0 else 1)
     epochs = int(vec[1] if len(vec) > 1 else 1)
@@ -17,10 +17,10 @@ def easy_quant_global_calibration(g, cdataloader, mparams, mscopes):
     msg = (f"easy_quant with batches={batches}, epochs={epochs}, alpha={alpha}, "
            f"beta={beta}, nsteps={nsteps}, ngroups={ngroups}")
     OPT_INFO(msg)
-    _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, mscopes)
+    _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, mscopes, reference_cache)
 
 
-def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, mscopes):
+def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, mscopes, reference_cache=None):
     import copy
     from AIPUBuilder.Optimizer.logger import tqdm
 
@@ -33,11 +33,14 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
     # prevent deleting intermediate tensors
     g.ref_count_tensors = {}
     vdataloader = copy.deepcopy(cdataloader)
+    # only the quantization params are searched, the float featuremaps are the same in each epoch
+    fingerprint = reference_cache.fingerprint(g) if reference_cache is not None else None
     with tqdm(total=batches*epochs*len(g.nodes)*2, desc='easy_quant', file=sys.stdout, leave=True) as pbar:
         for i, sample in enumerate(vdataloader):
             if i >= max(1, batches):  # to save forward times, move batches loop outside instead of calculating mean cos similarity of batches
                 break
             inp_data, _ = sample
+            bkey = reference_cache.batch_key(fingerprint, i, inp_data) if reference_cache is not None else None
             for _ in range(epochs):
                 g.feed_inputs_data(inp_data)
                 # apply scales of last iter
@@ -60,7 +63,10 @@ def _easy_quant(g, cdataloader, batches, epochs, alpha, beta, nsteps, ngroups, m
                 for k, n in enumerate(g.nodes):
                     unquantifiable = n.get_param('unquantifiable', optional=True, default_value=False)
                     qn = qg.nodes[k]
-                    n.forward()
+                    if reference_cache is not None:
+                        reference_cache.forward_node(n, bkey, g.input_tensors[0].betensor.device)
+                    else:
+                        n.forward()
                     qn.forward()
                     initial_similarity = layer_similarity(n, qn)
                     q_mode_weight = n.attrs["q_mode_weight"]
@@ -3,13 +3,13 @@
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_DEBUG, OPT_WARN
+from . layerwise_engine import LayerwiseCalibrationEngine
 import torch
 import sys
 import math
-import copy
 
 
-def gptq_zy_global_calibration(g, cdataloader, mparams, mscopes):
+def gptq_zy_global_calibration(g, cdataloader, mparams, mscopes, engine=None, ckpt=None):
     vec = mparams
     batches = int(vec[0] if len(vec) > 0 else 1)
     # whether to apply the activation order GPTQ heuristic
@@ -17,131 +17,204 @@ def gptq_zy_global_calibration(g, cdataloader, mparams, mscopes):
     # percent of the average Hessian diagonal to use for dampening
     perc_damp = float(vec[2] if len(vec) > 2 else 0.01)
     block_size = int(vec[3] if len(vec) > 3 else 128)
+    # how many layers will be quantized concurrently
+    workers = int(vec[4] if len(vec) > 4 else 1)
 
     msg = (
-        f"gptq_zy with batches={batches}, use_act_order={use_act_order}, perc_damp={perc_damp}, block_size={block_size}")
+        f"gptq_zy with batches={batches}, use_act_order={use_act_order}, perc_damp={perc_damp}, block_size={block_size}, "
+        f"workers={workers}")
     OPT_INFO(msg)
-    _gptq_zy(g, cdataloader, batches, use_act_order, perc_damp, block_size, mscopes)
+    _gptq_zy(g, cdataloader, batches, use_act_order, perc_damp, block_size, workers, mscopes, engine, ckpt)
 
 
-def _gptq_zy(g, cdataloader, batches, use_act_order, perc_damp, block_size, mscopes):
+def _gptq_hessian_key(n):
+    # layers which consume the same input with the same receptive field share one Hessian matrix (and its inverse)
+    if OpType.FullyConnected == n.type:
+        return (n.inputs[0].name, )
+    return (n.inputs[0].name, n.get_param("kernel_y"), n.get_param("kernel_x"), n.get_param("stride_y"), n.get_param("stride_x"),
+            n.get_param('dilation_y'), n.get_param('dilation_x'), n.get_param('pad_left'), n.get_param('pad_right'),
+            n.get_param('pad_top'), n.get_param('pad_bottom'))
+
+
+def _gptq_hessian_input(n, inp):
+    if len(inp.shape) == 2:
+        inp = inp.unsqueeze(0)
+    if OpType.FullyConnected == n.type:
+        # rows are samples, columns are input channels
+        return inp.reshape((-1, inp.shape[-1])).float()
+    inp = nhwc2nchw(inp)
+    inp = torch.nn.functional.pad(inp, (n.get_param('pad_left'), n.get_param(
+        'pad_right'), n.get_param('pad_top'), n.get_param('pad_bottom')))
+    unfold_func = torch.nn.Unfold((n.get_param("kernel_y"), n.get_param("kernel_x")),
+                                  dilation=(n.get_param('dilation_y'), n.get_param('dilation_x')),
+                                  padding=0,
+                                  stride=(n.get_param("stride_y"), n.get_param("stride_x"))
+                                  )
+    inp = unfold_func(inp.float())
+    return inp.transpose(1, 2).reshape(-1, inp.shape[1])
+
+
+def _gptq_prepare_hessian(H, use_act_order, perc_damp):
+    # returns everything that only depends on H, so that it can be reused by all the layers sharing H
+    H = H.clone()
+    Hcolumns = H.shape[1]
+    dead = torch.diag(H) == 0
+    H[dead, dead] = 1
+    perm = None
+    invperm = None
+    if use_act_order:
+        perm = torch.argsort(torch.diag(H), descending=True)
+        H = H[perm][:, perm]
+        invperm = torch.argsort(perm)
+    damp = perc_damp * torch.mean(torch.diag(H))
+    diag = torch.arange(Hcolumns, device=H.device)
+    H[diag, diag] += damp
+    H = torch.linalg.cholesky(H)
+    H = torch.cholesky_inverse(H)
+    Hinv = torch.linalg.cholesky(H, upper=True)
+    return dead, perm, invperm, Hinv
+
+
+def _gptq_quantize_weights(w, w_scale, w_zerop, w_qmin, w_qmax, dead, perm, invperm, Hinv, block_size, sub_block_size=16):
+    # the quantization params are scalars or per row (output channel) ones
+    w = w.clone()
+    w[:, dead] = 0
+    if perm is not None:
+        w = w[:, perm]
+    dev = w.device
+    rows = w.shape[0]
+    scale, zerop, qmin, qmax = [t.reshape(-1).to(w.dtype).expand(rows) for t in batch_construct_torch_tensor(
+        [w_scale, w_zerop, w_qmin, w_qmax], device=dev)]
+    qw = torch.zeros_like(w)
+    # rows without a finite scale are dequantized to zeros, as linear_dequantize(linear_quantize_clip(...)) does
+    finite = torch.isfinite(scale)
+    if not finite.all():
+        w, scale, zerop, qmin, qmax = w[finite], scale[finite], zerop[finite], qmin[finite], qmax[finite]
+    # work in the quantized domain u = scale * w - zerop, on the transposed weights (each column is a contiguous
+    # row): rows are scaled independently, so the error feedback is the same, and each column then only costs a
+    # round, a clamp, a sub and a rank-1 update. the Hinv rows are normalized by their diagonal for the same reason.
+    # the columns are inherently sequential (each one is rounded after the errors of all the previous ones), so what
+    # remains is the O(rows * cols^2) error feedback in matmuls, within about 3x the time of a rows x cols x cols/2
+    # matmul (the flops it has to do). further speedups only come from the shared Hessians and the workers. the
+    # levels are the per-column GPTQ's up to the float summation order: a few (< 0.1%) levels on rounding ties differ
+    # by one step.
+    ut = (w.t() * scale - zerop).contiguous()
+    qt = torch.empty_like(ut)
+    Hs = Hinv / torch.diag(Hinv).reshape(-1, 1)
+    Hcolumns = ut.shape[0]
+    for i1 in range(0, Hcolumns, block_size):
+        i2 = min(i1 + block_size, Hcolumns)
+        u1 = ut[i1:i2]
+        q1 = qt[i1:i2]
+        err1 = torch.empty_like(u1)
+        Hs1 = Hs[i1:i2, i1:i2]
+        # lazy batch updates inside the block as well: columns only update their own sub block one by one,
+        # the rest of the block is updated by one matmul after each sub block
+        for j1 in range(0, i2 - i1, sub_block_size):
+            j2 = min(j1 + sub_block_size, i2 - i1)
+            for i in range(j1, j2):
+                torch.round(u1[i], out=q1[i])
+                q1[i].clamp_(qmin, qmax)
+                torch.sub(u1[i], q1[i], out=err1[i])
+                if i + 1 < j2:
+                    u1[i + 1:j2].addr_(Hs1[i, i + 1:j2], err1[i], alpha=-1)
+            if j2 < i2 - i1:
+                u1[j2:].addmm_(Hs1[j1:j2, j2:].t(), err1[j1:j2], alpha=-1)
+        if i2 < Hcolumns:
+            ut[i2:].addmm_(Hs[i1:i2, i2:].t(), err1, alpha=-1)
+    qw[finite] = ((torch.nan_to_num(qt, nan=0.0) + zerop) * (1.0 / scale)).t()
+    if invperm is not None:
+        qw = qw[:, invperm]
+    return qw.contiguous()
+
+
+def _gptq_zy_nodes(g, mscopes):
+    return [n for n in g.nodes if n.type in [OpType.FullyConnected, OpType.DepthwiseConv, OpType.Convolution] and mscopes.get(n)]
+
+
+def gptq_zy_global_calibration_requests(engine, mparams, mscopes):
+    batches = int(mparams[0] if len(mparams) > 0 else 1)
+    engine.request_tensors([n.inputs[0].name for n in _gptq_zy_nodes(engine.g, mscopes)], batches, owner='gptq_zy')
+
+
+def _gptq_zy(g, cdataloader, batches, use_act_order, perc_damp, block_size, workers, mscopes, engine=None, ckpt=None):
     Hdict = {}
-    vdataloader = copy.deepcopy(cdataloader)
-    with tqdm(total=batches*len(g.nodes), desc='gptq_zy: compute Hessian matrix', file=sys.stdout, consumer=g) as pbar:
-        for i, sample in enumerate(vdataloader):
-            if i >= max(1, batches):
-                break
-            g.current_batch_idx = i
-            if (i+1) * vdataloader.batch_size > len(vdataloader.dataset):
-                g.current_batch_size = len(vdataloader.dataset) - i * vdataloader.batch_size
-            else:
-                g.current_batch_size = vdataloader.batch_size
-            cur_samples = i * vdataloader.batch_size
-            inp_data, _ = sample
-            g.feed_inputs_data(inp_data)
-            g.reset_edge_tensors_ref_count()
-            for k, n in enumerate(g.nodes):
-                if n.type in [OpType.FullyConnected, OpType.DepthwiseConv, OpType.Convolution] and mscopes.get(n):
-                    inp = n.inputs[0].betensor.clone()
-                    w = n.constants['weights'].betensor
-                    if len(inp.shape) == 2:
-                        inp = inp.unsqueeze(0)
-                    if OpType.FullyConnected == n.type:
-                        inp = inp.reshape((-1, inp.shape[-1]))
-                        inp = inp.t()
-                    else:
-                        inp = nhwc2nchw(inp)
-                        inp = torch.nn.functional.pad(inp, (n.get_param('pad_left'), n.get_param(
-                            'pad_right'), n.get_param('pad_top'), n.get_param('pad_bottom')))
-                        unfold_func = torch.nn.Unfold((n.get_param("kernel_y"), n.get_param("kernel_x")),
-                                                      dilation=(n.get_param('dilation_y'), n.get_param('dilation_x')),
-                                                      padding=0,
-                                                      stride=(n.get_param("stride_y"), n.get_param("stride_x"))
-                                                      )
-                        inp = unfold_func(inp)
-                        inp = inp.permute([1, 0, 2])
-                        inp = inp.flatten(1)
-                    Hcolumns = inp.shape[0]
-                    if n not in Hdict:
-                        Hdict[n] = torch.zeros(Hcolumns, Hcolumns, device=w.device)
-                    H = Hdict[n].to(w.device)
-                    H *= cur_samples / (cur_samples + g.current_batch_size)
-                    inp = math.sqrt(2.0 / (cur_samples + g.current_batch_size)) * inp.float()
-                    H += inp.matmul(inp.t())
-                    Hdict[n] = H.cpu()
-                n.forward()
-                pbar.update(1)
-            tz = PyTensor('null').betensor
-            for n in g.nodes:
-                for pld in n.placeholders:
-                    del pld.betensor
-                    pld.betensor = tz
-                for t in n.outputs:
-                    if t not in g.output_tensors:
-                        del t.betensor
-                        t.betensor = tz
-            g.reset_edge_tensors_ref_count()
-        pbar.refresh()
-    with tqdm(total=len(Hdict), desc='gptq_zy: quantize weights', file=sys.stdout, leave=True) as pbar:
-        ll = 0
-        for n, v in Hdict.items():
-            w_scale, w_zerop, w_qmin, w_qmax, w_dtype = get_linear_quant_params_from_tensor(n.constants['weights'],
-                                                                                            n.attrs["q_mode_weight"],
-                                                                                            n.attrs["q_bits_weight"],
-                                                                                            is_signed=True)
-            w = n.constants['weights'].betensor.clone().float()
-            if OpType.FullyConnected == n.type:
-                pass
-            else:
-                w = w.flatten(1)
-            H = v.to(w.device)
-            Hcolumns = H.shape[1]
-            dead = torch.diag(H) == 0
-            H[dead, dead] = 1
-            w[:, dead] = 0
-
-            if use_act_order:
-                perm = torch.argsort(torch.diag(H), descending=True)
-                w = w[:, perm]
-                H = H[perm][:, perm]
-                invperm = torch.argsort(perm)
-            losses = torch.zeros_like(w)
-            qw = torch.zeros_like(w)
-            damp = perc_damp * torch.mean(torch.diag(H))
-            diag = torch.arange(Hcolumns, device=w.device)
-            H[diag, diag] += damp
-            H = torch.linalg.cholesky(H)
-            H = torch.cholesky_inverse(H)
-            H = torch.linalg.cholesky(H, upper=True)
-            Hinv = H
-            for i1 in range(0, Hcolumns, block_size):
-                i2 = min(i1 + block_size, Hcolumns)
-                count = i2 - i1
-                w1 = w[:, i1:i2].clone()
-                qw1 = torch.zeros_like(w1)
-                err1 = torch.zeros_like(w1)
-                losses1 = torch.zeros_like(w1)
-                Hinv1 = Hinv[i1:i2, i1:i2]
-                for i in range(count):
-                    w2 = w1[:, i]
-                    d = Hinv1[i, i]
-                    w2_scale = w_scale
-                    w2_zerop = w_zerop
-                    qw2 = linear_dequantize(linear_quantize_clip(w2, w2_scale, w2_zerop, w_qmin,
-                                            w_qmax), w2_scale, w2_zerop).flatten().to(w2.dtype)
-                    qw1[:, i] = qw2
-                    losses1[:, i] = (w2 - qw2) ** 2 / d ** 2
-                    err2 = (w2 - qw2) / d
-                    w1[:, i:] -= err2.unsqueeze(1).matmul(Hinv1[i, i:].unsqueeze(0))
-                    err1[:, i] = err2
-                qw[:, i1:i2] = qw1
-                losses[:, i1:i2] = losses1 / 2
-                w[:, i2:] -= err1.matmul(Hinv[i1:i2, i2:])
-            if torch.cuda.is_available():
-                torch.cuda.synchronize()
-            if use_act_order:
-                qw = qw[:, invperm]
-            n.attrs['gptq_weights'] = {n.attrs['q_bits_weight']: qw.reshape(n.constants['weights'].betensor.shape)}
+    Hkeys = {}
+    for n in _gptq_zy_nodes(g, mscopes):
+        if ckpt is not None and ckpt.has(n.name):
+            # quantized by a previous run, no Hessian matrix is needed
+            ckpt.restore(n.name, [n])
+            continue
+        Hkeys[n] = _gptq_hessian_key(n)
+    if engine is None:
+        engine = LayerwiseCalibrationEngine(g, cdataloader)
+    tnames = [n.inputs[0].name for n in Hkeys.keys()]
+    engine.request_tensors(tnames, batches, owner='gptq_zy')
+    engine.run()
+    with tqdm(total=len(Hkeys), desc='gptq_zy: compute Hessian matrix', file=sys.stdout, consumer=g) as pbar:
+        for n, hkey in Hkeys.items():
+            if hkey not in Hdict:
+                w = n.constants['weights'].betensor
+                cur_samples = 0
+                # stream the captured inputs batch by batch and accumulate the Hessian matrix on device in place:
+                # H = 2/N * sum(x * x^T)
+                for i, t in enumerate(engine.tensor_batches(n.inputs[0].name, max(1, batches))):
+                    cur_batch_size = engine.batch_sizes[i]
+                    inp = _gptq_hessian_input(n, t.to(w.device))
+                    if hkey not in Hdict:
+                        Hdict[hkey] = torch.zeros(inp.shape[1], inp.shape[1], device=w.device)
+                    H = Hdict[hkey]
+                    H.mul_(cur_samples / (cur_samples + cur_batch_size))
+                    inp = math.sqrt(2.0 / (cur_samples + cur_batch_size)) * inp
+                    H.addmm_(inp.t(), inp)
+                    cur_samples += cur_batch_size
+                    del inp
             pbar.update(1)
-            ll += 1
+        pbar.refresh()
+    # also drop the inputs which were requested for the layers restored from checkpoint
+    engine.release([n.inputs[0].name for n in _gptq_zy_nodes(g, mscopes)], owner='gptq_zy')
+
+    Hinvdict = {}
+
+    def quantize_layer(n):
+        hkey = Hkeys[n]
+        dead, perm, invperm, Hinv = Hinvdict[hkey]
+        w_scale, w_zerop, w_qmin, w_qmax, w_dtype = get_linear_quant_params_from_tensor(n.constants['weights'],
+                                                                                        n.attrs["q_mode_weight"],
+                                                                                        n.attrs["q_bits_weight"],
+                                                                                        is_signed=True)
+        w = n.constants['weights'].betensor.float()
+        if OpType.FullyConnected != n.type:
+            w = w.flatten(1)
+        if w.shape[1] != Hinv.shape[0]:
+            OPT_WARN(f"{n} was skipped by gptq_zy, as its weights' shape {list(w.shape)} does not match the "
+                     f"Hessian matrix's shape {list(Hinv.shape)}.")
+            return
+        w_dev = Hinv.device
+        qw = _gptq_quantize_weights(w.to(w_dev), w_scale, w_zerop, w_qmin, w_qmax, dead, perm, invperm, Hinv, block_size)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        n.attrs['gptq_weights'] = {n.attrs['q_bits_weight']: qw.reshape(n.constants['weights'].betensor.shape)}
+
+    nodes = [n for n in g.nodes if n in Hkeys and Hkeys[n] in Hdict]
+    with tqdm(total=len(nodes), desc='gptq_zy: quantize weights', file=sys.stdout, leave=True) as pbar:
+        for hkey, H in Hdict.items():
+            # the Cholesky-based inverse is computed once and reused by all the layers sharing this Hessian
+            Hinvdict[hkey] = _gptq_prepare_hessian(H, use_act_order, perc_damp)
+        Hdict.clear()
+        if workers > 1:
+            # independent layers are quantized concurrently, torch releases the GIL inside its kernels. the checkpoint
+            # is only written by the main thread, in the layers' order, as each of them is done
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for n, _ in zip(nodes, executor.map(quantize_layer, nodes)):
+                    if ckpt is not None:
+                        ckpt.save(n.name, [n], with_data=False)
+                    pbar.update(1)
+        else:
+            for n in nodes:
+                quantize_layer(n)
+                if ckpt is not None:
+                    ckpt.save(n.name, [n], with_data=False)
+                pbar.update(1)
         pbar.refresh()
@@ -0,0 +1,341 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+from AIPUBuilder.Optimizer.framework import *
+from AIPUBuilder.Optimizer.logger import OPT_INFO, OPT_DEBUG, OPT_WARN, tqdm
+from AIPUBuilder.Optimizer.utils import TensorCache
+import torch
+import sys
+import os
+import copy
+
+
+class LayerwiseCalibrationEngine(object):
+    '''
+    Shares forward sweeps over the calibration dataset among global calibration methods.
+
+    Each method declares what it needs before the sweep (graph inputs, per batch tensors, or hooks called after
+    each node's forward), then `run` forwards the float graph once for all of the pending requests and the methods
+    read the captured tensors layer by layer afterwards. Methods which change the float graph must report it by
+    `rescale_tensors` (cached tensors are rescaled in place) or `invalidate` (requests will be swept again on demand).
+    '''
+
+    def __init__(self, g, cdataloader, cache_size=2048):
+        self.g = g
+        self.cdataloader = cdataloader
+        # in MB
+        self.cache = TensorCache(int(cache_size * 1024 * 1024), prefix='opt_global_calibration_')
+        self.version = 0
+        self.tensor_requests = {}
+        self.hook_requests = []
+        self.input_batches = 0
+        self.captured_input_batches = 0
+        # batch_idx -> current_batch_size of the swept batches
+        self.batch_sizes = {}
+        self.sweeps = 0
+
+    @staticmethod
+    def _max_batches(a, b):
+        # None means all batches of the dataset
+        if a is None or b is None:
+            return None
+        return max(a, b)
+
+    def request_graph_inputs(self, batches):
+        batches = max(1, batches)
+        if self.input_batches < batches:
+            self.input_batches = batches
+
+    def request_tensors(self, tnames, batches, owner=''):
+        # batches=None means all batches of the dataset
+        batches = None if batches is None else max(1, batches)
+        for tname in tnames:
+            if tname not in self.tensor_requests:
+                self.tensor_requests[tname] = {'batches': batches, 'owners': set(), 'version': -1}
+            req = self.tensor_requests[tname]
+            if req['batches'] != self._max_batches(req['batches'], batches):
+                req['batches'] = self._max_batches(req['batches'], batches)
+                req['version'] = -1
+            req['owners'].add(owner)
+
+    def request_hook(self, hook, batches):
+        # hook(node, batch_idx) will be called after each node's forward, batches=None means all batches
+        req = {'hook': hook, 'batches': batches, 'version': -1}
+        self.hook_requests.append(req)
+        return req
+
+    def remove_hook(self, req):
+        if req in self.hook_requests:
+            self.hook_requests.remove(req)
+
+    def invalidate(self):
+        # the float graph was changed, all the captured tensors are out of date (graph inputs are still valid)
+        self.version += 1
+
+    def rescale_tensors(self, tnames, factor):
+        # the float graph was changed so that tnames were multiplied by factor (broadcast from the last axis)
+        # and the other tensors were kept, update the cached tensors instead of forwarding again
+        factor = torch.as_tensor(factor).flatten().cpu()
+        fresh = [req for req in self.tensor_requests.values() if req['version'] == self.version]
+        updates = []
+        for tname in set(tnames):
+            if tname in self.tensor_requests and self.tensor_requests[tname]['version'] == self.version:
+                for key in self.cache.keys():
+                    if key[0] == tname:
+                        updates.append(key)
+        for key in updates:
+            t = self.cache.get(key)
+            if factor.numel() > 1 and (t.dim() < 1 or t.shape[-1] != factor.numel()):
+                # can not be rescaled, capture them again
+                self.invalidate()
+                return
+        for key in updates:
+            t = self.cache.get(key)
+            self.cache.update(key, t * factor.to(t.dtype))
+        # hooks have to see the new graph
+        self.version += 1
+        for req in fresh:
+            req['version'] = self.version
+
+    def _pending(self):
+        tensors = {k: v for k, v in self.tensor_requests.items() if v['version'] != self.version}
+        hooks = [r for r in self.hook_requests if r['version'] != self.version]
+        inputs = self.input_batches if self.input_batches > self.captured_input_batches else 0
+        return tensors, hooks, inputs
+
+    def run(self):
+        tensors, hooks, inputs = self._pending()
+        if len(tensors) < 1 and len(hooks) < 1 and inputs == 0:
+            return
+        batches = inputs
+        for req in list(tensors.values()) + hooks:
+            batches = self._max_batches(batches, req['batches'])
+        g = self.g
+        for tname in tensors.keys():
+            for key in self.cache.keys():
+                if key[0] == tname:
+                    self.cache.pop(key)
+        if inputs != 0:
+            for key in self.cache.keys():
+                if key[0] == '':
+                    self.cache.pop(key)
+        # no need to forward the nodes behind the last requested tensor
+        last = 0
+        if len(hooks) > 0:
+            last = len(g.nodes)
+        else:
+            for k, n in enumerate(g.nodes):
+                for t in n.outputs:
+                    if t.name in tensors:
+                        last = k + 1
+        self.sweeps += 1
+        OPT_DEBUG(f"global calibration engine forwards {'all' if batches is None else batches} batches for "
+                  f"{len(tensors)} tensors, {len(hooks)} hooks and {inputs} batches of graph inputs")
+        vdataloader = copy.deepcopy(self.cdataloader)
+        total = len(vdataloader) if batches is None else min(batches, len(vdataloader))
+        with tqdm(total=total*max(1, last), desc='global calibration: forward', file=sys.stdout, consumer=g) as pbar:
+            for i, sample in enumerate(vdataloader):
+                if batches is not None and i >= batches:
+                    break
+                g.current_batch_idx = i
+                if (i+1) * vdataloader.batch_size > len(vdataloader.dataset):
+                    g.current_batch_size = len(vdataloader.dataset) - i * vdataloader.batch_size
+                else:
+                    g.current_batch_size = vdataloader.batch_size
+                self.batch_sizes[i] = g.current_batch_size
+                inp_data, _ = sample
+                g.feed_inputs_data(inp_data)
+                if i < inputs:
+                    for k, inp in enumerate(g.input_tensors):
+                        self.cache.put(('', i, k), inp.betensor)
+                g.reset_edge_tensors_ref_count()
+                for n in g.nodes[:last]:
+                    n.forward()
+                    for t in n.outputs:
+                        if t.name in tensors:
+                            tb = tensors[t.name]['batches']
+                            if tb is None or i < tb:
+                                self.cache.put((t.name, i), t.betensor)
+                    for req in hooks:
+                        if req['batches'] is None or i < req['batches']:
+                            req['hook'](n, i)
+                    pbar.update(1)
+                if last < 1:
+                    pbar.update(1)
+                tz = PyTensor('null').betensor
+                for n in g.nodes:
+                    for pld in n.placeholders:
+                        del pld.betensor
+                        pld.betensor = tz
+                    for t in n.outputs:
+                        if t not in g.output_tensors:
+                            del t.betensor
+                            t.betensor = tz
+                g.reset_edge_tensors_ref_count()
+            pbar.refresh()
+        for req in list(tensors.values()) + hooks:
+            req['version'] = self.version
+        if inputs != 0:
+            self.captured_input_batches = inputs
+
+    def graph_inputs(self, batches):
+        # concatenate the first batches of graph inputs along the batch dim
+        self.request_graph_inputs(batches)
+        self.run()
+        ret = {}
+        for k, inp in enumerate(self.g.input_tensors):
+            tlist = []
+            for i in range(max(1, batches)):
+                if ('', i, k) in self.cache.items:
+                    tlist.append(self.cache.get(('', i, k)))
+            ret[inp.name] = torch.cat(tlist, dim=0)
+        return ret
+
+    def tensor_batches(self, tname, batches=None):
+        # yield the captured tensor batch by batch
+        self.run()
+        i = 0
+        while (batches is None or i < batches) and (tname, i) in self.cache.items:
+            yield self.cache.get((tname, i))
+            i += 1
+
+    def restore_tensors(self, tnames, batch_idx=0):
+        # put the captured batch back to the graph's tensors
+        self.run()
+        tdict = {}
+        for n in self.g.nodes:
+            for t in n.outputs:
+                tdict[t.name] = t
+        for tname in tnames:
+            key = (tname, batch_idx)
+            if tname in tdict and key in self.cache.items:
+                t = tdict[tname]
+                t.betensor = self.cache.get(key).to(t.device)
+
+    def release(self, tnames, owner=''):
+        # owner no longer needs these tensors, drop them once nobody needs them
+        for tname in tnames:
+            if tname in self.tensor_requests:
+                req = self.tensor_requests[tname]
+                req['owners'].discard(owner)
+                if len(req['owners']) < 1:
+                    self.tensor_requests.pop(tname)
+                    for key in self.cache.keys():
+                        if key[0] == tname:
+                            self.cache.pop(key)
+
+    def clear(self):
+        self.cache.clear()
+        self.tensor_requests.clear()
+        self.hook_requests.clear()
+        self.input_batches = 0
+        self.captured_input_batches = 0
+
+    def calibration_samples(self, batches, batch_size):
+        # graph inputs of the first batches, padded to be divisible by batch_size
+        import math
+        samples = self.graph_inputs(batches)
+        sample_num = 0
+        for key, val in samples.items():
+            psize = int(math.ceil(val.shape[0] * 1.0 / batch_size) * batch_size - val.shape[0])
+            if psize < val.shape[0]:
+                samples[key] = torch.cat((val, val[:psize]), dim=0)
+            else:
+                t = torch.cat((val, val), dim=0)
+                while t.shape[0] < batch_size:
+                    t = torch.cat((t, t), dim=0)
+                samples[key] = t[:batch_size]
+            sample_num = samples[key].shape[0]
+        return samples, sample_num
+
+    def layerwise(self, samples, sample_num, qg=None):
+        '''
+        Forward all the samples through the float graph (and the quantized graph qg if given) node by node.
+        Yield (n, qn, float_tensors, quant_tensors, abnormal_tensors) after the float outputs of n were computed,
+        then forward qn on the outputs of its quantized predecessors (quantized prefix propagation) when the
+        consumer asks for the next node. Tensors are kept on cpu and dropped as soon as no node needs them.
+        '''
+        g = self.g
+        # prevent deleting intermediate tensors
+        g.ref_count_tensors = {}
+        if qg is not None:
+            qg.ref_count_tensors = {}
+        # count each tensor's reference count
+        ref_count_float_tensors = {}
+        for n in g.nodes:
+            for inp in n.inputs:
+                if inp.name not in ref_count_float_tensors.keys():
+                    ref_count_float_tensors[inp.name] = 1
+                else:
+                    ref_count_float_tensors[inp.name] += 1
+        abnormal_tensors = {}
+        for it in g.input_tensors:
+            it.betensor = samples[it.name].to(it.betensor.device)
+        if qg is not None:
+            for it in qg.input_tensors:
+                it.betensor = samples[it.name].to(it.betensor.device)
+        cached_float_tensors = {}
+        cached_quant_tensors = {}
+
+        def reset_layer_tensors(n):
+            for t in list(n.inputs) + list(n.outputs) + list(n.placeholders):
+                ss = None
+                try:
+                    ss = list(t.ir_shape)
+                except:
+                    ss = list(t.shape)
+                t.betensor = torch.zeros(ss, device=t.betensor.device)
+
+        for k, n in enumerate(g.nodes):
+            qn = qg.nodes[k] if qg is not None else None
+            # move inputs to device
+            for it in n.inputs:
+                cached_float_tensors[it.name] = cached_float_tensors[it.name].to(it.betensor.device)
+                if qn is not None:
+                    cached_quant_tensors[it.name] = cached_quant_tensors[it.name].to(it.betensor.device)
+            # forward featuremaps on float graph
+            for it in n.inputs:
+                it.betensor = cached_float_tensors[it.name]
+            n.current_batch_size = sample_num
+            n.current_batch_idx = 0
+            n.forward()
+            for ot in n.outputs:
+                if len(ot.betensor.shape) < 1 or ot.betensor.shape[0] != sample_num:
+                    # no batch dim
+                    abnormal_tensors[ot.name] = True
+                    OPT_WARN(f"{n.name} type={n.type} layer_id={n.attrs['layer_id']} batch dim is abnormal: expect batch_dim=0 and batches={sample_num}, but got shape={ot.betensor.shape}."
+                             f"you may try to set batch_size = calibration_batch_size x batches or batch_size=calibration_batch_size=batches=1", log_once=True)
+                if ot.name not in cached_float_tensors.keys():
+                    cached_float_tensors[ot.name] = ot.betensor
+            yield n, qn, cached_float_tensors, cached_quant_tensors, abnormal_tensors
+            # forward featuremaps on quant graph
+            if qn is not None:
+                for it in qn.inputs:
+                    it.betensor = cached_quant_tensors[it.name]
+                qn.current_batch_size = sample_num
+                qn.current_batch_idx = 0
+                qn.forward()
+                for ot in qn.outputs:
+                    if ot.name not in cached_quant_tensors.keys():
+                        cached_quant_tensors[ot.name] = ot.betensor
+            # reduce tensor's reference count
+            for it in n.inputs:
+                ref_count_float_tensors[it.name] -= 1
+            # clear useless tensors out of cache for memory saving
+            useless_tnames = []
+            for rkey, rval in ref_count_float_tensors.items():
+                if rval < 1:
+                    useless_tnames.append(rkey)
+            for rkey in useless_tnames:
+                for cached_tensors in (cached_float_tensors, cached_quant_tensors):
+                    if rkey in cached_tensors.keys():
+                        rval = cached_tensors.pop(rkey)
+                        del rval
+            # move tensors back to cpu
+            for t in list(n.inputs) + list(n.outputs):
+                for cached_tensors in (cached_float_tensors, cached_quant_tensors):
+                    if t.name in cached_tensors.keys():
+                        cached_tensors[t.name] = cached_tensors[t.name].cpu()
+            reset_layer_tensors(n)
+            if qn is not None:
+                reset_layer_tensors(qn)
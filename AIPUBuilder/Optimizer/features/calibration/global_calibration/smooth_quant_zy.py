@@ -2,9 +2,10 @@
 # Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
 
 from AIPUBuilder.Optimizer.utils import *
+from . layerwise_engine import LayerwiseCalibrationEngine
 
 
-def smooth_quant_zy_global_calibration(g, cdataloader, mparams, mscopes):
+def smooth_quant_zy_global_calibration(g, cdataloader, mparams, mscopes, engine=None, ckpt=None):
     vec = mparams
     default_alpha = float(vec[0] if len(vec) > 0 else 0.5)
     auto_tune = bool(vec[1] if len(vec) > 1 else False)
@@ -12,18 +13,284 @@ def smooth_quant_zy_global_calibration(g, cdataloader, mparams, mscopes):
     alpha_max = float(vec[3] if len(vec) > 3 else 1.0)
     nsteps = int(vec[4] if len(vec) > 4 else 10)
     insert_norm_if_none = bool(vec[5] if len(vec) > 5 else False)
+    # how many independent Norm - FC groups will be searched concurrently
+    workers = int(vec[6] if len(vec) > 6 else 1)
     msg = (f"smooth_quant_zy with default_alpha={default_alpha}, auto_tune={auto_tune}, alpha_min={alpha_min}, "
-           f"alpha_max={alpha_max}, nsteps={nsteps}, insert_norm_if_none={insert_norm_if_none}")
+           f"alpha_max={alpha_max}, nsteps={nsteps}, insert_norm_if_none={insert_norm_if_none}, workers={workers}")
     OPT_INFO(msg)
     _smooth_quant_zy(g, cdataloader, default_alpha, auto_tune, alpha_min,
-                     alpha_max, nsteps, insert_norm_if_none, mscopes)
+                     alpha_max, nsteps, insert_norm_if_none, workers, mscopes, engine, ckpt)
 
 
-def _smooth_quant_zy(g, cdataloader, default_alpha, auto_tune, alpha_min, alpha_max, nsteps, insert_norm_if_none, mscopes):
+def _find_norm_fc_pairs(g, optypes, pbar=None):
+    # find Norm - FC pairs (the Norm's output may pass through Reshape/Transpose nodes before reaching the FC)
+    nfdict = {}
+    flist = []
+    for n in g.nodes:
+        if n.type in optypes:
+            st = [n, ]
+            visited = {n.name: True, }
+            while(len(st)):
+                current_node = st.pop()
+                for nchild in current_node.children:
+                    if nchild.name not in visited:
+                        visited[nchild.name] = True
+                        if nchild.type in [OpType.Reshape, OpType.Transpose, OpType.Permute, OpType.Squeeze] and nchild.outputs[0].ir_shape[-1] == n.outputs[0].ir_shape[-1]:
+                            st.append(nchild)
+                        elif nchild.type in [OpType.FullyConnected, ]:
+                            if n not in nfdict:
+                                nfdict[n] = []
+                            nfdict[n].append(nchild)
+                            flist.append(nchild)
+                        else:
+                            pass
+        if pbar is not None:
+            pbar.update(1)
+    return nfdict, flist
+
+
+def _rebalance_subgraph(g, n, v):
+    # nodes between the Norm node n and its last FC consumer in v
+    last_fc_idx = 0
+    for nf in v:
+        fidx = g.nodes.index(nf)
+        if fidx > last_fc_idx:
+            last_fc_idx = fidx
+    sg_nodes = []
+    for nc in n.get_descendants()[0]:
+        if g.nodes.index(nc) <= last_fc_idx:
+            sg_nodes.append(nc)
+    return last_fc_idx, sg_nodes
+
+
+def _rebalance_tensor_names(g, nfdict, mscopes):
+    # the featuremaps the candidates are scored on
+    tnames = []
+    for n, v in nfdict.items():
+        if mscopes.get(n):
+            tlist = []
+            for vn in v:
+                tlist.extend([vn.inputs[0], vn.outputs[0]])
+                if n.type == OpType.FullyConnected and vn.inputs[0].name == n.outputs[0].name:
+                    # the error of n's quantized weights is propagated from n's inputs
+                    tlist.append(n.inputs[0])
+            for t in tlist:
+                if t.name not in tnames:
+                    tnames.append(t.name)
+    return tnames
+
+
+def _rebalanced_nodes(n, v, sg_nodes):
+    # all the nodes whose weights or quantization statistics are changed by rebalancing the (n, v) group
+    nodes = {}
+    for x in [n] + list(v) + list(sg_nodes):
+        nodes[x.name] = x
+    return list(nodes.values())
+
+
+def _rebalanced_tensor_names(v, sg_nodes):
+    # featuremaps which are divided by sigma after rebalancing n and v
+    f_vname_list = [vn.name for vn in v]
+    return [st.name for sn in sg_nodes if sn.name not in f_vname_list for st in sn.outputs]
+
+
+class _QTensor:
+    # the statistics get_linear_quant_params_from_tensor needs
+    pass
+
+
+def _rebalance_fake_quantize_weights(w, q_mode, q_bits, ratios):
+    '''
+    Quantize and dequantize the weights w[k] ([rows, cols]) of each candidate k, the same as extrema calibration
+    with zero included, the range of w[k] is multiplied by ratios[k].
+    '''
+    scales, zerops = [], []
+    for k in range(w.shape[0]):
+        t = _QTensor()
+        t.betensor = w[k]
+        t.max_key_axis = w[k].max(dim=-1).values.clamp(min=0) * ratios[k]
+        t.min_key_axis = w[k].min(dim=-1).values.clamp(max=0) * ratios[k]
+        t.max = t.max_key_axis.max()
+        t.min = t.min_key_axis.min()
+        scale, zerop, qmin, qmax, _ = get_linear_quant_params_from_tensor(t, q_mode, q_bits, True)
+        scales.append(scale.reshape(-1, 1) * torch.ones_like(w[k][:, :1]))
+        zerops.append(zerop.reshape(-1, 1) * torch.ones_like(w[k][:, :1]))
+    scales = torch.stack(scales)
+    zerops = torch.stack(zerops)
+    return linear_dequantize(linear_quantize_clip(w, scales, zerops, qmin, qmax), scales, zerops)
+
+
+def _rebalance_fake_quantize_output(vn, y):
+    # quantize and dequantize the outputs of v, their statistics are not changed by rebalancing
+    out = vn.outputs[0]
+    t = _QTensor()
+    t.betensor = y
+    t.max_key_axis = out.max_key_axis
+    t.min_key_axis = out.min_key_axis
+    t.max = out.max
+    t.min = out.min
+    signed = bool(out.min < 0) if out.dtype is None else is_signed(out.dtype)
+    scale, zerop, qmin, qmax, _ = get_linear_quant_params_from_tensor(t, vn.attrs['q_mode_activation'],
+                                                                      vn.attrs['q_bits_activation'], signed)
+    if scale.numel() > 1:
+        scale = scale.reshape(-1)
+        zerop = zerop.reshape(-1)
+    return linear_dequantize(linear_quantize_clip(y, scale, zerop, qmin, qmax), scale, zerop)
+
+
+def _rebalance_n_outputs(n, vn, x, sig):
+    '''
+    The inputs of vn ([1, N, C], the float outputs of n passed through Reshape/Transpose nodes) of each candidate,
+    when the weights of n are divided by sig[k] and quantized. Returns x / sig if the error can not be modeled.
+    '''
+    xk = x / sig.unsqueeze(1)
+    if 'weights' not in n.constants:
+        return xk
+    dev = x.device
+    w = n.constants['weights'].betensor.float().to(dev)
+    q_mode = n.attrs['q_mode_weight']
+    q_bits = n.attrs['q_bits_weight']
+    ones = [1.0] * sig.shape[0]
+    if n.type == OpType.FullyConnected:
+        if vn.inputs[0].name != n.outputs[0].name or n.inputs[0].betensor.shape[-1] != w.shape[-1]:
+            return xk
+        # n's outputs are x @ w.T + b, the rows of w are divided by sigma
+        w = w.unsqueeze(0) / sig.unsqueeze(2)
+        qw = _rebalance_fake_quantize_weights(w, q_mode, q_bits, ones)
+        xn = n.inputs[0].betensor.float().to(dev).reshape(1, -1, w.shape[-1])
+        return xk + torch.matmul(xn, (qw - w).transpose(1, 2))
+    if w.numel() != x.shape[-1]:
+        return xk
+    # Norm's outputs are z * w + b (per channel on the last axis), w and b are divided by sigma
+    b = n.constants['biases'].betensor.float().to(dev).flatten() if 'biases' in n.constants else torch.zeros_like(w)
+    w = w.flatten()
+    z = torch.where(w != 0, (x - b) / torch.where(w != 0, w, torch.ones_like(w)), torch.zeros_like(x))
+    w = w.unsqueeze(0) / sig
+    qw = _rebalance_fake_quantize_weights(w.unsqueeze(2), q_mode, q_bits, ones).squeeze(2)
+    return xk + z * (qw - w).unsqueeze(1)
+
+
+# max elements of the featuremaps (of all candidates) evaluated at once when scoring candidates
+_REBALANCE_MAX_NUMEL = 1 << 24
+
+
+def _rebalance_candidates_scores(n, v, fc_inp_t, sigmas, score_func, ratios=None):
+    '''
+    Score the candidates of rebalancing n -> v on the captured inputs of v, all the candidates are evaluated as
+    batched tensor operations instead of quantizing and forwarding a copy of the subgraph: the weights of n are
+    divided by sigma and quantized (their error is propagated to the inputs of v), the inputs of v are divided by
+    sigma and quantized, the weights of v are multiplied by sigma (and their range is multiplied by the clipping
+    ratio) and quantized, the outputs of v are quantized, then they are compared with the float outputs by
+    score_func(gt, pt).
+    '''
+    from AIPUBuilder.Optimizer.ops.activation import apply_with_activation
+    vlist = sorted(v, key=lambda x: x.name)
+    ncands = sigmas.shape[0]
+    if ratios is None:
+        ratios = [1.0] * ncands
+    dev = vlist[0].outputs[0].betensor.device
+    sigmas = sigmas.float().to(dev)
+    gt = torch.cat([vn.outputs[0].betensor.flatten().float() for vn in vlist])
+    # activation quantization params of each candidate (the statistics are divided by sigma)
+    a_mode = n.attrs['q_mode_activation']
+    a_bits = n.attrs['q_bits_activation']
+    a_signed = bool(fc_inp_t.min < 0) if fc_inp_t.dtype is None else is_signed(fc_inp_t.dtype)
+    a_scales, a_zerops = [], []
+    for k in range(ncands):
+        t = _QTensor()
+        t.betensor = sigmas[k]
+        t.max_key_axis = fc_inp_t.max_key_axis.to(dev) / sigmas[k]
+        t.min_key_axis = fc_inp_t.min_key_axis.to(dev) / sigmas[k]
+        t.max = t.max_key_axis.max()
+        t.min = t.min_key_axis.min()
+        scale, zerop, a_qmin, a_qmax, _ = get_linear_quant_params_from_tensor(t, a_mode, a_bits, a_signed)
+        a_scales.append(scale.reshape(-1))
+        a_zerops.append(zerop.reshape(-1))
+    a_scales = torch.stack(a_scales).unsqueeze(1)
+    a_zerops = torch.stack(a_zerops).unsqueeze(1)
+    numel = 0
+    for vn in vlist:
+        numel += vn.inputs[0].betensor.numel() + vn.constants['weights'].betensor.numel() + vn.outputs[0].betensor.numel()
+    chunk = max(1, _REBALANCE_MAX_NUMEL // max(1, numel))
+    scores = []
+    for c0 in range(0, ncands, chunk):
+        c1 = min(c0 + chunk, ncands)
+        sig = sigmas[c0:c1]
+        pts = []
+        for vn in vlist:
+            x = vn.inputs[0].betensor.float().to(dev)
+            x = _rebalance_n_outputs(n, vn, x.reshape(1, -1, x.shape[-1]), sig)
+            x = linear_dequantize(linear_quantize_clip(x, a_scales[c0:c1], a_zerops[c0:c1], a_qmin, a_qmax),
+                                  a_scales[c0:c1], a_zerops[c0:c1])
+            w = vn.constants['weights'].betensor.float().to(dev)
+            w = _rebalance_fake_quantize_weights(w.unsqueeze(0) * sig.unsqueeze(1), vn.attrs['q_mode_weight'],
+                                                 vn.attrs['q_bits_weight'], ratios[c0:c1])
+            y = torch.matmul(x, w.transpose(1, 2))
+            if 'biases' in vn.constants:
+                y = y + vn.constants['biases'].betensor.float().to(dev)
+            if vn.get_param('with_activation', optional=True, default_value='none').lower() != 'none':
+                y = apply_with_activation(vn, y)
+            y = _rebalance_fake_quantize_output(vn, y)
+            pts.append(y.reshape(c1 - c0, -1))
+        pt = torch.cat(pts, dim=1)
+        for k in range(c1 - c0):
+            scores.append(float(score_func(gt, pt[k])))
+    return scores
+
+
+def _rebalance_groups(groups, search_func, apply_func, workers, pbar=None):
+    '''
+    Call search_func on (n, v) groups concurrently and apply_func on the results in order. A group is searched
+    after all the previous groups which share nodes with it were applied.
+    '''
+    waves = []
+    wave_of = {}
+    for k, (n, v) in enumerate(groups):
+        w = 0
+        nodes = set([n.name] + [vn.name for vn in v])
+        for j in range(k):
+            pn, pv = groups[j]
+            if len(nodes & set([pn.name] + [vn.name for vn in pv])) > 0:
+                w = max(w, wave_of[j] + 1)
+        wave_of[k] = w
+        while len(waves) <= w:
+            waves.append([])
+        waves[w].append(k)
+    executor = None
+    if workers > 1 and len(groups) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for wave in waves:
+            if executor is not None:
+                # torch releases the GIL inside its kernels
+                results = list(executor.map(lambda k: search_func(*groups[k]), wave))
+            else:
+                results = [search_func(*groups[k]) for k in wave]
+            for k, ret in zip(wave, results):
+                apply_func(groups[k][0], groups[k][1], ret)
+                if pbar is not None:
+                    pbar.update(1)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+_smooth_quant_norm_types = [OpType.RMSNorm, OpType.LayerNorm, OpType.GroupNorm, OpType.InstanceNorm, OpType.BatchNorm, ]
+
+
+def smooth_quant_zy_global_calibration_requests(engine, mparams, mscopes):
+    auto_tune = bool(mparams[1] if len(mparams) > 1 else False)
+    if auto_tune:
+        nfdict, _ = _find_norm_fc_pairs(engine.g, _smooth_quant_norm_types)
+        engine.request_tensors(_rebalance_tensor_names(engine.g, nfdict, mscopes), 1, owner='smooth_quant_zy')
+
+
+def _smooth_quant_zy(g, cdataloader, default_alpha, auto_tune, alpha_min, alpha_max, nsteps, insert_norm_if_none, workers,
+                     mscopes, engine=None, ckpt=None):
     from AIPUBuilder.Optimizer.logger import tqdm
     from AIPUBuilder.Optimizer.features import statistic_and_calibration
     import sys
-    import copy
 
     def filter_sigma(sx):
         sx = torch.where(torch.isnan(sx), torch.ones_like(sx), sx)
@@ -32,28 +299,8 @@ def _smooth_quant_zy(g, cdataloader, default_alpha, auto_tune, alpha_min, alpha_
         return sx
 
     # find norm-fc pairs
-    nfdict = {}
-    flist = []
     with tqdm(total=len(g.nodes), desc='smooth_quant_zy: find Norm - FC nodes', file=sys.stdout, leave=True) as pbar:
-        for n in g.nodes:
-            if n.type in [OpType.RMSNorm, OpType.LayerNorm, OpType.GroupNorm, OpType.InstanceNorm, OpType.BatchNorm, ]:
-                st = [n, ]
-                visited = {n.name: True, }
-                while(len(st)):
-                    current_node = st.pop()
-                    for nchild in current_node.children:
-                        if nchild.name not in visited:
-                            visited[nchild.name] = True
-                            if nchild.type in [OpType.Reshape, OpType.Transpose, OpType.Permute, OpType.Squeeze] and nchild.outputs[0].ir_shape[-1] == n.outputs[0].ir_shape[-1]:
-                                st.append(nchild)
-                            elif nchild.type in [OpType.FullyConnected, ]:
-                                if n not in nfdict:
-                                    nfdict[n] = []
-                                nfdict[n].append(nchild)
-                                flist.append(nchild)
-                            else:
-                                pass
-            pbar.update(1)
+        nfdict, flist = _find_norm_fc_pairs(g, _smooth_quant_norm_types, pbar)
         pbar.refresh()
     if insert_norm_if_none:
         inserted_nodes = []
@@ -80,125 +327,85 @@ def _smooth_quant_zy(g, cdataloader, default_alpha, auto_tune, alpha_min, alpha_
             pbar.refresh()
         for bn in inserted_nodes:
             g.add_node(bn)
+        if engine is not None and len(inserted_nodes) > 0:
+            # the captured featuremaps do not know the inserted nodes
+            engine.invalidate()
 
     if auto_tune:
-        # prevent deleting intermediate tensors
-        g.ref_count_tensors = {}
-        vdataloader = copy.deepcopy(cdataloader)
-        # forward on batch of samples for searching alpha params
-        for i, sample in enumerate(vdataloader):
-            if i >= 1:
-                break
-            inp_data, _ = sample
-            g.feed_inputs_data(inp_data)
-            g.current_batch_idx = i
-            if (i+1) * vdataloader.batch_size > len(vdataloader.dataset):
-                g.current_batch_size = len(vdataloader.dataset) - i * vdataloader.batch_size
-            else:
-                g.current_batch_size = vdataloader.batch_size
-            for n in g.nodes:
-                n.forward()
+        if engine is None:
+            engine = LayerwiseCalibrationEngine(g, cdataloader)
+        # featuremaps of one batch of samples for searching alpha params
+        tnames = _rebalance_tensor_names(g, nfdict, mscopes)
+        engine.request_tensors(tnames, 1, owner='smooth_quant_zy')
+        engine.restore_tensors(tnames)
 
-    with tqdm(total=len(nfdict), desc='smooth_quant_zy: rebalance', file=sys.stdout, leave=True) as pbar:
-        for n, v in nfdict.items():
-            skip = False
-            for nf in v:
-                if not mscopes.get(n):
-                    skip = True
-            if skip:
-                pbar.update(1)
-                continue
-            best_alpha = default_alpha
-            best_mse = torch.finfo(torch.float32).max
-            best_cos = 0.0
-            best_diff = torch.finfo(torch.float32).max
+    def search(n, v):
+        if ckpt is not None and ckpt.has(n.name):
+            return None
+        last_fc_idx, sg_nodes = _rebalance_subgraph(g, n, v)
+        fc_inp_t = g.nodes[last_fc_idx].inputs[0].clone()
+        f_inp_max = torch.max(fc_inp_t.max_key_axis.abs().flatten(), fc_inp_t.min_key_axis.abs().flatten())
+        f_wgt_max = torch.zeros_like(f_inp_max)
+        for vn in v:
+            f_wgt_max = torch.max(f_wgt_max, vn.constants['weights'].betensor.abs().max(0).values.flatten())
+        best_alpha = default_alpha
+        if auto_tune:
+            alphas = torch.linspace(alpha_min, alpha_max, nsteps)
+            sigmas = torch.stack([filter_sigma((f_inp_max ** alpha) / (f_wgt_max ** (1.0-alpha))) for alpha in alphas])
+            scores = _rebalance_candidates_scores(n, v, fc_inp_t, sigmas, calc_SQNR)
             best_sqnr = torch.finfo(torch.float32).min
-            last_fc_idx = 0
-            for nf in v:
-                fidx = g.nodes.index(nf)
-                if fidx > last_fc_idx:
-                    last_fc_idx = fidx
-            fc_inp_t = g.nodes[last_fc_idx].inputs[0].clone()
-            sg_nodes = []
-            for nc in n.get_descendants()[0]:
-                if g.nodes.index(nc) <= last_fc_idx:
-                    sg_nodes.append(nc)
-            f_inp_max = torch.max(fc_inp_t.max_key_axis.abs().flatten(), fc_inp_t.min_key_axis.abs().flatten())
-            f_wgt_max = torch.zeros_like(f_inp_max)
-            f_vname_list = []
-            gtdict = {}
-            for vn in v:
-                f_wgt_max = torch.max(f_wgt_max, vn.constants['weights'].betensor.abs().max(0).values.flatten())
-                f_vname_list.append(vn.name)
-                gtdict[vn.name] = vn.outputs[0].betensor.flatten().float()
-            if auto_tune:
-                gt = torch.cat([ft for _, ft in sorted(gtdict.items())])
-                for alpha in torch.linspace(alpha_min, alpha_max, nsteps):
-                    sigma = (f_inp_max ** alpha) / (f_wgt_max ** (1.0-alpha))
-                    sigma = filter_sigma(sigma)
-                    sg = g.copy_subgraph(sg_nodes)
-                    # prevent deleting intermediate tensors
-                    sg.ref_count_tensors = {}
-                    for sn in sg.nodes:
-                        if sn.name == n.name:
-                            sn.constants['weights'].betensor /= sigma
-                            if "biases" in sn.constants:
-                                sn.constants['biases'].betensor /= sigma
-                        if sn.name in f_vname_list:
-                            sn.constants['weights'].betensor *= sigma
-                    # sg.nodes' input betensors are all existed and copyed as we have forwarded one batch samples on g
-                    for sn in sg.nodes:
-                        if sn.name not in f_vname_list:
-                            for st in sn.outputs:
-                                st.key_axis = fc_inp_t.key_axis
-                                st.max_key_axis = fc_inp_t.max_key_axis / sigma
-                                st.min_key_axis = fc_inp_t.min_key_axis / sigma
-                                st.max = st.max_key_axis.max()
-                                st.min = st.min_key_axis.min()
-                        for _, st in sn.constants.items():
-                            statistic_and_calibration(st, sn.attrs, is_constant_tensor=True)
-                        sn.params['unquantifiable'] = False
-                        sn.quantize()
-                    ptdict = {}
-                    for sn in sg.nodes:
-                        sn.forward()
-                        if sn.name in f_vname_list:
-                            ptdict[sn.name] = linear_dequantize(
-                                sn.outputs[0].betensor, sn.outputs[0].scale, sn.outputs[0].zerop).flatten().float()
-                    pt = torch.cat([ft for _, ft in sorted(ptdict.items())])
-                    # mse = torch.nn.functional.mse_loss(gt, pt)
-                    # sim = torch.nn.functional.cosine_similarity(gt, pt, dim=0)
-                    # diff = (gt - pt).abs().max()
-                    sqnr = calc_SQNR(gt, pt)
-                    # if mse < best_mse:
-                    #     best_mse = mse
-                    #     best_alpha = alpha
-                    # if sim > best_cos:
-                    #     best_cos = sim
-                    #     best_alpha = alpha
-                    # if diff < best_diff:
-                    #     best_diff = diff
-                    #     best_alpha = alpha
-                    if sqnr > best_sqnr:
-                        best_sqnr = sqnr
-                        best_alpha = alpha
-            OPT_DEBUG(f"{n} apply smooth_quant with alpha={best_alpha}")
-            sigma = (f_inp_max ** best_alpha) / (f_wgt_max ** (1.0-best_alpha))
-            sigma = filter_sigma(sigma)
-            n.constants['weights'].betensor /= sigma
-            if "biases" in n.constants:
-                n.constants['biases'].betensor /= sigma
-            for vn in v:
-                vn.constants['weights'].betensor *= sigma
-            for sn in sg_nodes:
-                if sn.name not in f_vname_list:
-                    for st in sn.outputs:
-                        st.key_axis = fc_inp_t.key_axis
-                        st.max_key_axis = fc_inp_t.max_key_axis / sigma
-                        st.min_key_axis = fc_inp_t.min_key_axis / sigma
-                        st.max = st.max_key_axis.max()
-                        st.min = st.min_key_axis.min()
-                for _, st in sn.constants.items():
-                    statistic_and_calibration(st, sn.attrs, is_constant_tensor=True)
-            pbar.update(1)
+            for alpha, sqnr in zip(alphas, scores):
+                if sqnr > best_sqnr:
+                    best_sqnr = sqnr
+                    best_alpha = alpha
+        sigma = (f_inp_max ** best_alpha) / (f_wgt_max ** (1.0-best_alpha))
+        sigma = filter_sigma(sigma)
+        return best_alpha, sigma, fc_inp_t, sg_nodes
+
+    def apply(n, v, ret):
+        if ret is None:
+            # rebalanced by a previous run
+            _, sg_nodes = _rebalance_subgraph(g, n, v)
+            sigma = ckpt.restore(n.name, g.nodes)
+            if engine is not None:
+                engine.rescale_tensors(_rebalanced_tensor_names(v, sg_nodes), 1.0 / sigma)
+            return
+        best_alpha, sigma, fc_inp_t, sg_nodes = ret
+        OPT_DEBUG(f"{n} apply smooth_quant with alpha={best_alpha}")
+        f_vname_list = [vn.name for vn in v]
+        n.constants['weights'].betensor /= sigma
+        if "biases" in n.constants:
+            n.constants['biases'].betensor /= sigma
+        for vn in v:
+            vn.constants['weights'].betensor *= sigma
+        for sn in sg_nodes:
+            if sn.name not in f_vname_list:
+                for st in sn.outputs:
+                    st.key_axis = fc_inp_t.key_axis
+                    st.max_key_axis = fc_inp_t.max_key_axis / sigma
+                    st.min_key_axis = fc_inp_t.min_key_axis / sigma
+                    st.max = st.max_key_axis.max()
+                    st.min = st.min_key_axis.min()
+            for _, st in sn.constants.items():
+                statistic_and_calibration(st, sn.attrs, is_constant_tensor=True)
+        if engine is not None:
+            # float outputs of v are kept, only the featuremaps in between are rescaled
+            engine.rescale_tensors(_rebalanced_tensor_names(v, sg_nodes), 1.0 / sigma)
+        if ckpt is not None:
+            ckpt.save(n.name, _rebalanced_nodes(n, v, sg_nodes), extra=sigma)
+
+    groups = []
+    for n, v in nfdict.items():
+        skip = False
+        for nf in v:
+            if not mscopes.get(n):
+                skip = True
+        if not skip:
+            groups.append((n, v))
+    with tqdm(total=len(nfdict), desc='smooth_quant_zy: rebalance', file=sys.stdout, leave=True) as pbar:
+        pbar.update(len(nfdict) - len(groups))
+        # independent Norm - FC groups are searched concurrently
+        _rebalance_groups(groups, search, apply, workers, pbar)
         pbar.refresh()
+    if auto_tune:
+        engine.release(tnames, owner='smooth_quant_zy')
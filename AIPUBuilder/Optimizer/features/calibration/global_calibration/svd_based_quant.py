@@ -8,9 +8,10 @@ import sys
 from torch.nn import MSELoss as mseloss
 import torch.nn as nn
 from AIPUBuilder.Optimizer.ops.activation import with_activation_out_is_signed
+from . layerwise_engine import LayerwiseCalibrationEngine
 
 
-def svd_based_quant_global_calibration(g, cdataloader, mparams, mscopes):
+def svd_based_quant_global_calibration(g, cdataloader, mparams, mscopes, engine=None):
     vec = mparams
     mode = float(vec[0] if len(vec) > 0 else 0)
     alpha = float(vec[1] if len(vec) > 1 else 0.5)
@@ -31,11 +32,10 @@ def svd_based_quant_global_calibration(g, cdataloader, mparams, mscopes):
         oplist = (dpdict, dpdict, mscopes, dpdict)
     elif int(mode) >= 3:
         oplist = (dpdict, dpdict, dpdict, mscopes)
-    _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, oplist)
+    _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, oplist, engine)
 
 
-def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, oplist):
-    import copy
+def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, oplist, engine=None):
 
     def get_qmin_qmax(outsign, qbits):
         q_max, q_min = 2 ** qbits - 1, 0
@@ -244,63 +244,69 @@ def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, o
             yn_1 = yout
         return yout.item()
 
-    # prevent deleting intermediate tensors
-    g.ref_count_tensors = {}
-
-    vdataloader = copy.deepcopy(cdataloader)
+    if engine is None:
+        engine = LayerwiseCalibrationEngine(g, cdataloader)
+    vdataloader = cdataloader
     dataset_len = len(vdataloader.dataset)
     start = 0
     end = dataset_len
-    with tqdm(total=dataset_len, desc='svd_based_search_scale', file=sys.stdout, leave=True) as pbar:
-        # need adjust min max by denoise
-        # calibraton_min_max_op = ['eltwise','pooling','convolution']
-        # need adjust scale according calibrated min max
-        # calibration_scale_op = ['mul']
-        # do nothing
-        # bypass_op = []
-        # group_norm_op = [OpType.LayerNorm,OpType.InstanceNorm,OpType.GroupNorm]
-        tscale = torch.ones(dataset_len, len(g.nodes), 2)*-1
-        need_adjust_nodes = []
-        MSE = mseloss()
-        # cos_sim = nn.CosineSimilarity(eps=1e-8)
-        # prevent deleting intermediate tensors
-        g.ref_count_tensors = {}
-        for i, sample in enumerate(vdataloader):
-            if i >= start and i < end:
-                inp_data, _ = sample
+    # need adjust min max by denoise
+    # calibraton_min_max_op = ['eltwise','pooling','convolution']
+    # need adjust scale according calibrated min max
+    # calibration_scale_op = ['mul']
+    # do nothing
+    # bypass_op = []
+    # group_norm_op = [OpType.LayerNorm,OpType.InstanceNorm,OpType.GroupNorm]
+    tscale = torch.ones(dataset_len, len(g.nodes), 2)*-1
+    need_adjust_nodes = []
+    MSE = mseloss()
+    # cos_sim = nn.CosineSimilarity(eps=1e-8)
+    node_idx = {n: k for k, n in enumerate(g.nodes)}
+    # outputs of the last batch are used by the following searching
+    last_outputs = {}
+    quant_mode = None
+
+    def statistic_hook(n, i):
+        nonlocal quant_mode
+        if i >= start and i < end:
+            k = node_idx[n]
+            if k == 0:
                 need_adjust_nodes.clear()
-                g.feed_inputs_data(inp_data)
-
-                for k, n in enumerate(g.nodes):
-                    n.forward()
-                    # if n.outputs[0].betensor.ndim<=1 or str(n.type)[7:].lower() in oplist[2]:
-                    # mode 2 is only denoise op which not in oplist[2]
-                    # mode 1 denoise and search scale then update fmin, fmax
-                    # mode 0 assume min max,search scale again
-                    optimized_flag = check_node_if_optimization(k, g.nodes, oplist[int(mode)])
-                    if n.outputs[0].betensor.ndim <= 1:
-                        continue
-                    statistic_momentum = n.attrs["running_statistic_momentum"]
-                    if i == start:
-                        statistic_momentum = 0
-                    q_bits_activation = n.attrs["q_bits_activation"]
-                    quant_mode = n.attrs["q_mode_activation"]
-
-                    out = n.outputs[0]
+            last_outputs[k] = n.outputs[0].betensor
+            # if n.outputs[0].betensor.ndim<=1 or str(n.type)[7:].lower() in oplist[2]:
+            # mode 2 is only denoise op which not in oplist[2]
+            # mode 1 denoise and search scale then update fmin, fmax
+            # mode 0 assume min max,search scale again
+            optimized_flag = check_node_if_optimization(k, g.nodes, oplist[int(mode)])
+            if n.outputs[0].betensor.ndim <= 1:
+                return
+            statistic_momentum = n.attrs["running_statistic_momentum"]
+            if i == start:
+                statistic_momentum = 0
+            q_bits_activation = n.attrs["q_bits_activation"]
+            quant_mode = n.attrs["q_mode_activation"]
 
-                    if optimized_flag and mode > 0 and mode < 3:
-                        omin, omax = get_denoise_max_min(out)
-                        if mode == 1:
-                            omin, omax = get_best_scale(out, omin, omax, quant_mode, optimized_flag)
-                            # symmetric = QuantMode.is_symmetric(quant_mode)
+            out = n.outputs[0]
 
-                            # out_signed = is_signed(n.outputs[0].dtype)
-                            # fmin,fmax = scale2minmax(best_s, zerop,out_signed, q_bits_activation,symmetric)
-                        tscale[i, k, 0] = omin
-                        tscale[i, k, 1] = omax
-                        need_adjust_nodes.append(k)
-            pbar.update(1)
+            if optimized_flag and mode > 0 and mode < 3:
+                omin, omax = get_denoise_max_min(out)
+                if mode == 1:
+                    omin, omax = get_best_scale(out, omin, omax, quant_mode, optimized_flag)
+                    # symmetric = QuantMode.is_symmetric(quant_mode)
 
+                    # out_signed = is_signed(n.outputs[0].dtype)
+                    # fmin,fmax = scale2minmax(best_s, zerop,out_signed, q_bits_activation,symmetric)
+                tscale[i, k, 0] = omin
+                tscale[i, k, 1] = omax
+                need_adjust_nodes.append(k)
+
+    # forward the whole dataset
+    hreq = engine.request_hook(statistic_hook, None)
+    engine.run()
+    engine.remove_hook(hreq)
+    for k, t in last_outputs.items():
+        g.nodes[k].outputs[0].betensor = t
+    with tqdm(total=len(g.nodes), desc='svd_based_search_scale', file=sys.stdout, leave=True) as pbar:
         for i in range(len(need_adjust_nodes)):
             k = need_adjust_nodes[i]
             tfmin = tscale[start:end, k, 0]
@@ -346,4 +352,5 @@ def _svd_based_search_scale(g, cdataloader, alpha, beta, nsteps, thresh, mode, o
             for k, n in enumerate(g.nodes):
                 if check_node_if_optimization(k, g.nodes, oplist[3]):
                     linear_op_quantize_param_search(n, alpha, beta, nsteps)
+        pbar.update(len(g.nodes))
         pbar.refresh()
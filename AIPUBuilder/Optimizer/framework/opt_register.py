@@ -21,6 +21,8 @@ __all__ = [
     'register_plugin',
     'traverse_opt_plugins',
     'OptBaseMetric',
+    'set_op_profiler',
+    'get_op_profiler',
 ]
 
 OP_DICT = dict()
@@ -36,6 +38,20 @@ QUANTIZE_METRIC_DICT = dict()
 QUANTIZE_CONFIG_DICT = dict()
 TRAIN_PLUGIN_DICT = dict()
 
+# the active profiler (see analyzer.OpProfiler) which records each op's forward and quantize
+OP_PROFILER = None
+
+
+def set_op_profiler(profiler):
+    global OP_PROFILER
+    prev = OP_PROFILER
+    OP_PROFILER = profiler
+    return prev
+
+
+def get_op_profiler():
+    return OP_PROFILER
+
 
 class OptBaseMetric(object):
     def __init__(self, *args):
@@ -143,12 +159,19 @@ def op_register(optypes, version=1., *args):
                 # set readonly keys
                 # self.readonly_keys_set()
                 # self.disable_keys_set()
-                if 'calculate_running_time' not in self.attrs or not self.attrs['calculate_running_time']:
+                profiler = OP_PROFILER
+                if profiler is not None:
+                    event = profiler.begin(self, 'forward')
+                    ret = func(self)
+                    cost_time = profiler.end(event)
+                    if self.attrs.get('calculate_running_time', False):
+                        self.attrs['cost_time'] = cost_time
+                elif 'calculate_running_time' not in self.attrs or not self.attrs['calculate_running_time']:
                     ret = func(self)
                 else:
-                    start_t = time.time()
+                    start_t = time.perf_counter()
                     ret = func(self)
-                    self.attrs['cost_time'] = time.time() - start_t
+                    self.attrs['cost_time'] = time.perf_counter() - start_t
 
                 # free readonly keys
                 # self.disable_keys_free()
@@ -181,7 +204,13 @@ def quant_register(optypes, version=1.0, *args):
                     return
                 # set readonly keys
                 # self.readonly_keys_set()
-                ret = func(self, *args, **kwargs)
+                profiler = OP_PROFILER
+                if profiler is not None:
+                    event = profiler.begin(self, 'quantize')
+                    ret = func(self, *args, **kwargs)
+                    profiler.end(event)
+                else:
+                    ret = func(self, *args, **kwargs)
                 # free readonly keys
                 # self.readonly_keys_free()
                 self.quantized = True
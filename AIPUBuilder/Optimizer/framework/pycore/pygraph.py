@@ -8,8 +8,24 @@
 import torch
 __all__ = [
     "PyGraph",
+    "set_memory_profiler",
+    "get_memory_profiler",
 ]
 
+# the active profiler (see analyzer.MemoryProfiler) which records the live tensors after each node's forward
+MEMORY_PROFILER = None
+
+
+def set_memory_profiler(profiler):
+    global MEMORY_PROFILER
+    prev = MEMORY_PROFILER
+    MEMORY_PROFILER = profiler
+    return prev
+
+
+def get_memory_profiler():
+    return MEMORY_PROFILER
+
 
 class PyGraphView:
     def __init__(self):
@@ -463,6 +479,8 @@ class PyGraph:
             data = [feed_data, ]
         for inp, d in zip(self.input_tensors, data):
             inp.betensor = PyTensor('tmp', d).betensor
+        if MEMORY_PROFILER is not None:
+            MEMORY_PROFILER.begin(self)
 
         import sys
         from AIPUBuilder.Optimizer.logger import tqdm
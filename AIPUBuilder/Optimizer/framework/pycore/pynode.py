@@ -460,6 +460,11 @@ class PyNode:
         if self.forward_hook is not None:
             self.forward_hook(self)
 
+        from AIPUBuilder.Optimizer.framework.pycore import pygraph
+        if pygraph.MEMORY_PROFILER is not None and self.graph:
+            # before the inputs are released, when both the inputs and the outputs are alive
+            pygraph.MEMORY_PROFILER.record(self)
+
         if self.graph:
             tz = PyTensor('null').betensor
             # reduce tensor's reference count
@@ -8,11 +8,18 @@ from AIPUBuilder.Optimizer.framework.pycore.pygraph import PyGraph
 
 __all__ = [
     'graph_inference',
-    'QuantizeGraph'
+    'QuantizeGraph',
+    'QuantizationCache',
+    'FloatReferenceCache',
 ]
 
 
-def graph_inference(graph, g_forward, dataloader, metrics, with_float=False, max_batches=0, disable_tqdm=False):
+def graph_inference(graph, g_forward, dataloader, metrics, with_float=False, max_batches=0, disable_tqdm=False,
+                    reference_cache=None):
+    '''
+    reference_cache: an optional FloatReferenceCache, when given with with_float=True the float outputs of the batches
+    which were inferred before (on the same graph and data) are reused instead of calling g_forward.
+    '''
     import sys
     import torch
     from AIPUBuilder.Optimizer.framework.pycore.pytensor import opt_use_cuda
@@ -21,6 +28,9 @@ def graph_inference(graph, g_forward, dataloader, metrics, with_float=False, max
     desc = 'float metric batch' if with_float else 'quant metric batch'
     graph.current_batch_size = dataloader.batch_size
     current_batch_idx = 0
+    fingerprint = None
+    if with_float and reference_cache is not None:
+        fingerprint = reference_cache.fingerprint(graph)
     with tqdm(dataloader, desc=desc, file=sys.stdout, disable=disable_tqdm, consumer=graph) as pbar:
         for i, sample in enumerate(pbar):
             graph.current_batch_idx = current_batch_idx
@@ -43,7 +53,10 @@ def graph_inference(graph, g_forward, dataloader, metrics, with_float=False, max
                     inp = [ii.cuda() for ii in inp]
                 else:
                     inp = inp.cuda()
-            out = g_forward(inp)
+            if fingerprint is not None:
+                out = reference_cache.forward(graph, inp, graph.current_batch_idx, fingerprint)
+            else:
+                out = g_forward(inp)
             # dequantize quantized forward's output tensors for consistently call metirc functions
             prediction = []
             for t in out:
@@ -64,6 +77,241 @@ def graph_inference(graph, g_forward, dataloader, metrics, with_float=False, max
         torch.cuda.empty_cache()
 
 
+def _hashable(v):
+    import torch
+    if isinstance(v, torch.Tensor):
+        return (tuple(v.shape), tuple(v.flatten().tolist()))
+    if isinstance(v, (list, tuple)):
+        return tuple(_hashable(x) for x in v)
+    return v
+
+
+def _get_qinfo(t):
+    return (t.scale, t.zerop, t.qbits, t.dtype, t.qmin, t.qmax, t.qinvariant)
+
+
+def _set_qinfo(t, qinfo):
+    t.scale, t.zerop, t.qbits, t.dtype, t.qmin, t.qmax, t.qinvariant = qinfo
+
+
+# attrs which refer to the float graph (its nodes or their constants), they are shared instead of copied
+_SHARED_ATTRS = ['map_to_original_node', 'constants_betensor_original']
+
+
+def _copy_attr(v):
+    # copy the containers and tensors, other objects (e.g. nodes) are shared as AttrDict::clone does
+    import torch
+    if isinstance(v, torch.Tensor):
+        return v.clone()
+    if isinstance(v, dict):
+        return {k: _copy_attr(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple, set)):
+        return v.__class__(_copy_attr(x) for x in v)
+    return v
+
+
+def _copy_attrs(attrs):
+    return {k: v if k in _SHARED_ATTRS else _copy_attr(v) for k, v in attrs.items()}
+
+
+class QuantizationCache(object):
+    '''
+    Memorizes the quantization results of nodes, keyed by the node's own params/attrs and the quantization infos of its
+    input tensors. When the same float graph is cloned and quantized again with only a few nodes changed (e.g. their
+    bits), the unchanged nodes whose inputs are not affected by the changed ones are restored instead of quantized.
+    '''
+
+    def __init__(self):
+        self.qinfos = {}
+        self.nodes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, n, with_own_tensors=False):
+        import torch
+
+        def qinfo(t):
+            return (t.name, ) + tuple(_hashable(x) for x in _get_qinfo(t))
+        attrs = [(k, str(v)) for k, v in n.attrs.items() if not isinstance(v, (dict, torch.Tensor))]
+        key = (n.name, str(n.type), str(n.params), str(attrs), tuple(qinfo(t) for t in n.inputs))
+        if with_own_tensors:
+            # unquantifiable nodes keep the quantization infos set by QuantizeGraph::set_tensor_quantization_attrs
+            key += (tuple(qinfo(t) for t in list(n.outputs) + list(n.placeholders) + list(n.constants.values())), )
+        return key
+
+    def restore_qinfo(self, key, n):
+        # results of QuantizeGraph::set_tensor_quantization_attrs
+        if key not in self.qinfos:
+            return False
+        outputs, placeholders, constants = self.qinfos[key]
+        for t, q in zip(n.outputs, outputs):
+            _set_qinfo(t, q)
+        for t, q in zip(n.placeholders, placeholders):
+            _set_qinfo(t, q)
+        for k, q in constants.items():
+            _set_qinfo(n.constants[k], q)
+        return True
+
+    def store_qinfo(self, key, n):
+        self.qinfos[key] = ([_get_qinfo(t) for t in n.outputs],
+                            [_get_qinfo(t) for t in n.placeholders],
+                            {k: _get_qinfo(t) for k, t in n.constants.items()})
+
+    def restore_node(self, key, n):
+        # results of PyNode::quantize
+        if key not in self.nodes:
+            self.misses += 1
+            return False
+        state = self.nodes[key]
+        n.params.clear()
+        n.params.update(state['params'].clone())
+        # attrs, constants and placeholders are handed out as copies, so that the cached ones are never touched by
+        # the live node (e.g. by its forward), which keeps its own map to the float graph
+        qnmap = n.attrs.get('map_to_original_node', None)
+        n.attrs.clear()
+        n.attrs.update(_copy_attrs(state['attrs']))
+        if qnmap is not None:
+            n.attrs['map_to_original_node'] = qnmap
+        n.constants = {k: t.clone(t.name) for k, t in state['constants'].items()}
+        n.placeholders = [t.clone(t.name) for t in state['placeholders']]
+        # some ops also adjust their inputs' quantization infos
+        for t, q in zip(n.inputs, state['inputs']):
+            _set_qinfo(t, q)
+        for t, q in zip(n.outputs, state['outputs']):
+            _set_qinfo(t, q)
+        n.quantized = state['quantized']
+        self.hits += 1
+        return True
+
+    def store_node(self, key, n):
+        self.nodes[key] = {
+            'params': n.params.clone(),
+            'attrs': _copy_attrs(n.attrs),
+            'constants': {k: t.clone(t.name) for k, t in n.constants.items()},
+            'placeholders': [t.clone(t.name) for t in n.placeholders],
+            'inputs': [_get_qinfo(t) for t in n.inputs],
+            'outputs': [_get_qinfo(t) for t in n.outputs],
+            'quantized': n.quantized,
+        }
+
+    def clear(self):
+        self.qinfos.clear()
+        self.nodes.clear()
+
+
+class FloatReferenceCache(object):
+    '''
+    Float outputs (or all the featuremaps) of a graph per batch, keyed by the graph's fingerprint, the batch index and
+    the batch's data. They are kept in memory up to `max_bytes` and spilled to disk beyond, so that the float graph
+    is inferred once per session and the following metrics and comparisons only run the quantized graph.
+    '''
+
+    def __init__(self, max_bytes):
+        from AIPUBuilder.Optimizer.utils import TensorCache
+        self.cache = TensorCache(max_bytes, prefix='opt_float_reference_')
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(h, v):
+        import torch
+        if isinstance(v, dict):
+            for k in sorted(v.keys()):
+                h.update(str(k).encode('utf-8'))
+                FloatReferenceCache._digest(h, v[k])
+        elif isinstance(v, (list, tuple)):
+            for x in v:
+                FloatReferenceCache._digest(h, x)
+        elif isinstance(v, torch.Tensor):
+            h.update(str((v.dtype, tuple(v.shape))).encode('utf-8'))
+            h.update(v.detach().cpu().contiguous().flatten().view(torch.uint8).numpy().tobytes())
+        else:
+            h.update(str(v).encode('utf-8'))
+
+    def fingerprint(self, g):
+        # everything the float outputs depend on: structure, params, constants and the fit_dtype switch
+        import hashlib
+        h = hashlib.sha1()
+        for n in g.nodes:
+            h.update(str((n.name, str(n.type), [t.name for t in n.inputs], [t.name for t in n.outputs],
+                          sorted([(k, str(v)) for k, v in n.params.items()]),
+                          getattr(n, 'fit_dtype_enabled', False))).encode('utf-8'))
+            for k, t in sorted(n.constants.items()):
+                h.update(k.encode('utf-8'))
+                self._digest(h, t.betensor)
+        return h.hexdigest()
+
+    def batch_key(self, fingerprint, batch_idx, inputs):
+        import hashlib
+        h = hashlib.sha1()
+        self._digest(h, inputs)
+        return (fingerprint, batch_idx, h.hexdigest())
+
+    @staticmethod
+    def _feed(g, inputs):
+        # the same as PyGraph::forward
+        from AIPUBuilder.Optimizer.framework.pycore.pytensor import PyTensor
+        data = inputs
+        if len(g.input_tensors) == 1 and not isinstance(inputs, list):
+            data = [inputs, ]
+        for inp, d in zip(g.input_tensors, data):
+            inp.betensor = PyTensor('tmp', d).betensor
+
+    def forward_node(self, n, bkey, dev=None):
+        # float forward of one node, or restore its outputs (to device dev), returns whether they were restored
+        if len(n.inputs) < 1:
+            # graph inputs and constants are cheap, and they follow the way the caller fed the data
+            n.forward()
+            return True
+        keys = [(bkey, t.name) for t in n.outputs]
+        if len(keys) > 0 and all([k in self.cache for k in keys]):
+            for k, t in zip(keys, n.outputs):
+                v = self.cache.get(k)
+                t.betensor = v.to(dev) if dev is not None else v
+            return True
+        n.forward()
+        for k, t in zip(keys, n.outputs):
+            self.cache.put(k, t.betensor)
+        return False
+
+    def forward(self, g, inputs, batch_idx, fingerprint=None, per_layer=False):
+        '''
+        Float forward of g on inputs, returns g's output tensors. With per_layer all the nodes' outputs are cached and
+        kept on the graph as keep_tensors of PyGraph::forward does, otherwise only the graph's outputs are cached.
+        '''
+        fingerprint = self.fingerprint(g) if fingerprint is None else fingerprint
+        bkey = self.batch_key(fingerprint, batch_idx, inputs)
+        if per_layer:
+            self._feed(g, inputs)
+            # prevent deleting intermediate tensors
+            g.ref_count_tensors = {}
+            dev = g.input_tensors[0].betensor.device if len(g.input_tensors) > 0 else None
+            hit = True
+            for n in g.nodes:
+                hit = self.forward_node(n, bkey, dev) and hit
+        else:
+            keys = [(bkey, t.name) for t in g.output_tensors]
+            hit = all([k in self.cache for k in keys])
+            if hit:
+                self._feed(g, inputs)
+                dev = g.input_tensors[0].betensor.device if len(g.input_tensors) > 0 else None
+                for k, t in zip(keys, g.output_tensors):
+                    v = self.cache.get(k)
+                    t.betensor = v.to(dev) if dev is not None else v
+            else:
+                g.forward(inputs)
+                for k, t in zip(keys, g.output_tensors):
+                    self.cache.put(k, t.betensor)
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return list(g.output_tensors)
+
+    def clear(self):
+        self.cache.clear()
+
+
 class QuantizeGraph(PyGraph):
     def __init__(self, name="unamed"):
         super().__init__(name)
@@ -356,11 +604,17 @@ class QuantizeGraph(PyGraph):
                 pbar.update(1)
             pbar.refresh()
 
-    def set_tensor_quantization_attrs(self):
+    def set_tensor_quantization_attrs(self, cache=None):
         import sys
         from AIPUBuilder.Optimizer.logger import tqdm
         with tqdm(total=len(self.nodes), desc='update_tensor_quantization_attrs', file=sys.stdout, leave=False) as pbar:
             for n in self.nodes:
+                key = None
+                if cache is not None:
+                    key = cache.key(n)
+                    if cache.restore_qinfo(key, n):
+                        pbar.update(1)
+                        continue
                 qn = n.clone(n.name+"_clone_")
                 qn.params['unquantifiable'] = False
                 qn.quantize()
@@ -374,6 +628,8 @@ class QuantizeGraph(PyGraph):
                     if k in qn.constants.keys():
                         tc = qn.constants[k]
                         t.clone_qinfo(tc)
+                if cache is not None:
+                    cache.store_qinfo(key, n)
                 pbar.update(1)
             pbar.refresh()
 
@@ -405,7 +661,11 @@ class QuantizeGraph(PyGraph):
                 t.qmax = None
                 t.qinvariant = None
 
-    def quantize(self):
+    def quantize(self, cache=None):
+        '''
+        cache: an optional QuantizationCache shared by successive quantizations of this graph, nodes whose params,
+        attrs and inputs' quantization infos are unchanged since a previous quantization are restored from it.
+        '''
         import sys
         from AIPUBuilder.Optimizer.logger import tqdm, OPT_WARN, OPT_DEBUG
         from AIPUBuilder.Optimizer.framework import OpType, Dtype, PyTensor
@@ -417,7 +677,7 @@ class QuantizeGraph(PyGraph):
         if self.quantgraph is None:
             self.quantgraph = self.clone()
 
-        self.quantgraph.set_tensor_quantization_attrs()  # pylint: disable=no-member
+        self.quantgraph.set_tensor_quantization_attrs(cache)  # pylint: disable=no-member
 
         # record the map between quantized node's name and source node object pointer
         qnmap = {}
@@ -429,7 +689,13 @@ class QuantizeGraph(PyGraph):
         with tqdm(total=len(self.quantgraph.nodes), desc='quantize each layer', file=sys.stdout, leave=True) as pbar:
             for n in self.quantgraph.nodes:
                 if not n.quantized:
-                    n.quantize()
+                    if cache is None:
+                        n.quantize()
+                    else:
+                        key = cache.key(n, with_own_tensors=True)
+                        if not cache.restore_node(key, n):
+                            n.quantize()
+                            cache.store_node(key, n)
                     # n.quantized = True
                 pbar.update(1)
             pbar.refresh()
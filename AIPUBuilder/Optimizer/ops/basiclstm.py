@@ -33,7 +33,8 @@ def qat_basiclstm_forward(self):
     w = self.constants["weights"].betensor.clone()
     bias = self.constants['biases'].betensor.clone().float()
 
-    weights = w.permute(1, 0).float()
+    # accumulate the integer products in double, which is exact and does not depend on the batch size
+    weights = w.permute(1, 0).double()
     wx_q = weights[0:input_size, :]
     wh_q = weights[input_size:, :]
 
@@ -52,61 +53,59 @@ def qat_basiclstm_forward(self):
     output = torch.zeros([batch_size, time_step, cell_size]).to(dev)
     output2 = torch.zeros_like(output)
 
-    for batch, data_batch in enumerate(input_seq):
-        c_prev = c_prev_s[batch, :]
-        hm1_q = hm1_q_s[batch, :]
-        for ts in range(time_step):
-            scale = scales[ts]
-            shift = shifts[ts]
-            zerop = zerops[ts]
-
-            x_q = data_batch[ts:ts+1].reshape(1, input_size)
-            c_prev_zerop = self.inputs[2].zerop if ts == 0 else zerops[ts-1][6]
-            c_prev = c_prev + c_prev_zerop
-
-            hw_do_scale, hw_do_shift = scale[0], shift[0]
-            fc_do_scale, fc_do_shift = scale[1], shift[1]
-            hout_do_scale, hout_do_shift = scale[2], shift[2]
-
-            x_by_w = torch.matmul(x_q, wx_q)
-            h_by_w = torch.matmul(hm1_q, wh_q)
-
-            MIN_INT32, MAX_INT32 = -2**31, 2**31-1
-            MIN_INT8, MAX_INT8 = -128, 127
-            req_h_by_w = linear_requantize(h_by_w, hw_do_scale, hw_do_shift, 0, MIN_INT32, MAX_INT32)
-            mat_sum = linear_requantize(x_by_w + bias + req_h_by_w, 1.0, 0, 0, MIN_INT32, MAX_INT32)
-            rescaled_mat_sum = linear_requantize(mat_sum, fc_do_scale, fc_do_shift, zerop[0], MIN_INT8, MAX_INT8)
-            i_in, g_in, f_in, o_in = torch.chunk(rescaled_mat_sum, 4, dim=1)
-
-            f = lookup_lut_powerof2(f_in.reshape(-1), ft_table[ts], lut_in_bits, True, lut_out_bits, True)
-            i = lookup_lut_powerof2(i_in.reshape(-1), it_table[ts], lut_in_bits, True, lut_out_bits, True)
-            g = lookup_lut_powerof2(g_in.reshape(-1), gt_table[ts], lut_in_bits, True, lut_out_bits, True)
-            o = lookup_lut_powerof2(o_in.reshape(-1), ot_table[ts], lut_in_bits, True, lut_out_bits, True)
-
-            f_times_c_prev = (f + zerop[2]) * c_prev
-            i_times_g = (i + zerop[3]) * (g + zerop[5])
-            ig_b_do_scale, fcprev_b_do_scale, scale0, scale1, ts_b_do_scale = scale[scale_start: scale_start + 5]
-            ig_b_do_shift, fcprev_b_do_shift, ts_b_do_shift = shift[shift_start: shift_start + 3]
-
-            res_i_times_g = linear_requantize(i_times_g, ig_b_do_scale, ig_b_do_shift, 0, MIN_INT32, MAX_INT32)
-            res_i_times_g_times_scale0 = linear_requantize(res_i_times_g, scale0, 0, 0, MIN_INT32, MAX_INT32)
-            res_f_times_c_prev = linear_requantize(f_times_c_prev, fcprev_b_do_scale, fcprev_b_do_shift, zerop[10],
-                                                   MIN_INT8, MAX_INT8)
-            c_tmp = linear_requantize((res_i_times_g_times_scale0 + (res_f_times_c_prev + zerop[10]) * scale1),
-                                      ts_b_do_scale, ts_b_do_shift, 0, MIN_INT32, MAX_INT32)
-
-            re_scaled_c_tmp = linear_requantize(c_tmp, 1., 0, zerop[6], MIN_INT8, MAX_INT8)  # c_lut no need consider zp
-            c_prev = re_scaled_c_tmp
-
-            c_lut_out = lookup_lut_powerof2(re_scaled_c_tmp.reshape(-1),
-                                            h_table[ts], lut_in_bits, True, lut_out_bits, True)
-
-            hm1_q_tmp = (o + zerop[4]) * (c_lut_out + zerop[7])
-            h_prev_new = linear_requantize(hm1_q_tmp, hout_do_scale, hout_do_shift, zerop[8], MIN_INT8, MAX_INT8)
-            hm1_q = h_prev_new
-
-            output[batch][ts] = h_prev_new
-            output2[batch][ts] = re_scaled_c_tmp
+    c_prev = c_prev_s[:batch_size]
+    hm1_q = hm1_q_s[:batch_size]
+    for ts in range(time_step):
+        scale = scales[ts]
+        shift = shifts[ts]
+        zerop = zerops[ts]
+
+        x_q = input_seq[:, ts, :]
+        c_prev_zerop = self.inputs[2].zerop if ts == 0 else zerops[ts-1][6]
+        c_prev = c_prev + c_prev_zerop
+
+        hw_do_scale, hw_do_shift = scale[0], shift[0]
+        fc_do_scale, fc_do_shift = scale[1], shift[1]
+        hout_do_scale, hout_do_shift = scale[2], shift[2]
+
+        x_by_w = torch.matmul(x_q.double(), wx_q).float()
+        h_by_w = torch.matmul(hm1_q.double(), wh_q).float()
+
+        MIN_INT32, MAX_INT32 = -2**31, 2**31-1
+        MIN_INT8, MAX_INT8 = -128, 127
+        req_h_by_w = linear_requantize(h_by_w, hw_do_scale, hw_do_shift, 0, MIN_INT32, MAX_INT32)
+        mat_sum = linear_requantize(x_by_w + bias + req_h_by_w, 1.0, 0, 0, MIN_INT32, MAX_INT32)
+        rescaled_mat_sum = linear_requantize(mat_sum, fc_do_scale, fc_do_shift, zerop[0], MIN_INT8, MAX_INT8)
+        i_in, g_in, f_in, o_in = torch.chunk(rescaled_mat_sum, 4, dim=1)
+
+        f = lookup_lut_powerof2(f_in, ft_table[ts], lut_in_bits, True, lut_out_bits, True)
+        i = lookup_lut_powerof2(i_in, it_table[ts], lut_in_bits, True, lut_out_bits, True)
+        g = lookup_lut_powerof2(g_in, gt_table[ts], lut_in_bits, True, lut_out_bits, True)
+        o = lookup_lut_powerof2(o_in, ot_table[ts], lut_in_bits, True, lut_out_bits, True)
+
+        f_times_c_prev = (f + zerop[2]) * c_prev
+        i_times_g = (i + zerop[3]) * (g + zerop[5])
+        ig_b_do_scale, fcprev_b_do_scale, scale0, scale1, ts_b_do_scale = scale[scale_start: scale_start + 5]
+        ig_b_do_shift, fcprev_b_do_shift, ts_b_do_shift = shift[shift_start: shift_start + 3]
+
+        res_i_times_g = linear_requantize(i_times_g, ig_b_do_scale, ig_b_do_shift, 0, MIN_INT32, MAX_INT32)
+        res_i_times_g_times_scale0 = linear_requantize(res_i_times_g, scale0, 0, 0, MIN_INT32, MAX_INT32)
+        res_f_times_c_prev = linear_requantize(f_times_c_prev, fcprev_b_do_scale, fcprev_b_do_shift, zerop[10],
+                                               MIN_INT8, MAX_INT8)
+        c_tmp = linear_requantize((res_i_times_g_times_scale0 + (res_f_times_c_prev + zerop[10]) * scale1),
+                                  ts_b_do_scale, ts_b_do_shift, 0, MIN_INT32, MAX_INT32)
+
+        re_scaled_c_tmp = linear_requantize(c_tmp, 1., 0, zerop[6], MIN_INT8, MAX_INT8)  # c_lut no need consider zp
+        c_prev = re_scaled_c_tmp
+
+        c_lut_out = lookup_lut_powerof2(re_scaled_c_tmp, h_table[ts], lut_in_bits, True, lut_out_bits, True)
+
+        hm1_q_tmp = (o + zerop[4]) * (c_lut_out + zerop[7])
+        h_prev_new = linear_requantize(hm1_q_tmp, hout_do_scale, hout_do_shift, zerop[8], MIN_INT8, MAX_INT8)
+        hm1_q = h_prev_new
+
+        output[:, ts] = h_prev_new
+        output2[:, ts] = re_scaled_c_tmp
 
     if direction.lower() == 'reverse':
         output = torch.flip(output, [1])
@@ -139,16 +138,9 @@ def lstm(self, *args):
         input_seq = torch.flip(input_seq, [1])
 
     start_data_idx = self.current_batch_idx * batch_size
-    start_h_initial_idx = start_data_idx % h_initial_batch
-    start_c_initial_idx = start_data_idx % c_initial_batch
-
-    h_initial = h_cell[start_h_initial_idx: start_h_initial_idx + 1]
-    c_initial = c_cell[start_c_initial_idx: start_c_initial_idx + 1]
-    for initial_idx in range(1, batch_size):
-        current_h_initial_idx = (start_data_idx + initial_idx) % h_initial_batch
-        current_c_initial_idx = (start_data_idx + initial_idx) % c_initial_batch
-        h_initial = torch.cat((h_initial, h_cell[current_h_initial_idx: current_h_initial_idx + 1]), dim=0)
-        c_initial = torch.cat((c_initial, c_cell[current_c_initial_idx: current_c_initial_idx + 1]), dim=0)
+    data_idx = start_data_idx + torch.arange(batch_size, device=h_cell.device)
+    h_initial = h_cell[data_idx % h_initial_batch]
+    c_initial = c_cell[data_idx % c_initial_batch]
 
     w = self.constants["weights"].betensor.clone()
     bias = self.constants['biases'].betensor.clone().double()
@@ -178,53 +170,45 @@ def lstm(self, *args):
         h_lut_in = torch.zeros([batch_size, time_step, cell_size], device=dev)
         h_lut_out = torch.zeros([batch_size, time_step, cell_size], device=dev)
 
-        for b in range(batch_size):
-            h_all = torch.zeros([1, cell_size], device=dev, dtype=torch.float)
-            c_all = torch.zeros([1, cell_size], device=dev, dtype=torch.float)
-            h_prev = torch.unsqueeze(h_initial[b], dim=0)
-            c_prev = torch.unsqueeze(c_initial[b], dim=0)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size))
-                inputs = torch.cat((in_ts, h_prev), dim=1)
-                sum0 = torch.add(torch.matmul(inputs, weights), torch.unsqueeze(bias, 0))
-                i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(sum0, 4, dim=1)
-                i_tmp = torch.clamp(i_tmp, -threshold, threshold)
-                g_tmp = torch.clamp(g_tmp, -threshold, threshold)
-                f_tmp = torch.clamp(f_tmp + forget_bias, -threshold, threshold)
-                o_tmp = torch.clamp(o_tmp, -threshold, threshold)
-
-                f_lut_in[b, ts, :] = torch.squeeze(torch.cat((i_tmp, f_tmp, o_tmp), dim=1), 0)
-                g_lut_in[b, ts, :] = torch.squeeze(g_tmp, 0)
-
-                i = g_rnn_activation_func[activations_list[0]][1](i_tmp)
-                g = g_rnn_activation_func[activations_list[1]][1](g_tmp)
-                f = g_rnn_activation_func[activations_list[0]][1](f_tmp)
-                o = g_rnn_activation_func[activations_list[0]][1](o_tmp)
-
-                f_lut_out[b, ts, :] = torch.squeeze(torch.cat((i, f, o), dim=1), 0)
-                g_lut_out[b, ts, :] = torch.squeeze(g, 0)
-
-                c_prev = torch.multiply(f, c_prev) + torch.multiply(i, g)
-                c_prev = torch.clamp(c_prev, -cell_clip, cell_clip)
-                h_lut_in[b, ts, :] = torch.squeeze(c_prev, 0)
-                c_lut = g_rnn_activation_func[activations_list[2]][1](c_prev)
-                h_lut_out[b, ts, :] = torch.squeeze(c_lut, 0)
-                h_prev = torch.multiply(o, c_lut)
-
-                h_all = h_prev if ts == 0 else torch.cat((h_all, h_prev), dim=0)
-                c_all = c_prev if ts == 0 else torch.cat((c_all, c_prev), dim=0)
-
-            # h_expd = torch.unsqueeze(h_prev, dim = 0)
-            h_last = h_prev if b == 0 else torch.cat((h_last, h_prev), dim=0)
-
-            h_all = torch.unsqueeze(h_all, dim=0)
-            h_batch = h_all if b == 0 else torch.cat((h_batch, h_all), dim=0)
-
-            # c_expd = torch.unsqueeze(c_prev, dim = 0)
-            c_last = c_prev if b == 0 else torch.cat((c_last, c_prev), dim=0)
-
-            c_all = torch.unsqueeze(c_all, dim=0)
-            c_batch = c_all if b == 0 else torch.cat((c_batch, c_all), dim=0)
+        # the whole batch steps forward together, only the timesteps are sequential
+        h_prev = h_initial
+        c_prev = c_initial
+        h_all = []
+        c_all = []
+        for ts in range(time_step):
+            inputs = torch.cat((input_seq[:, ts, :], h_prev), dim=1)
+            sum0 = torch.add(torch.matmul(inputs, weights), torch.unsqueeze(bias, 0))
+            i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(sum0, 4, dim=1)
+            i_tmp = torch.clamp(i_tmp, -threshold, threshold)
+            g_tmp = torch.clamp(g_tmp, -threshold, threshold)
+            f_tmp = torch.clamp(f_tmp + forget_bias, -threshold, threshold)
+            o_tmp = torch.clamp(o_tmp, -threshold, threshold)
+
+            f_lut_in[:, ts, :] = torch.cat((i_tmp, f_tmp, o_tmp), dim=1)
+            g_lut_in[:, ts, :] = g_tmp
+
+            i = g_rnn_activation_func[activations_list[0]][1](i_tmp)
+            g = g_rnn_activation_func[activations_list[1]][1](g_tmp)
+            f = g_rnn_activation_func[activations_list[0]][1](f_tmp)
+            o = g_rnn_activation_func[activations_list[0]][1](o_tmp)
+
+            f_lut_out[:, ts, :] = torch.cat((i, f, o), dim=1)
+            g_lut_out[:, ts, :] = g
+
+            c_prev = torch.multiply(f, c_prev) + torch.multiply(i, g)
+            c_prev = torch.clamp(c_prev, -cell_clip, cell_clip)
+            h_lut_in[:, ts, :] = c_prev
+            c_lut = g_rnn_activation_func[activations_list[2]][1](c_prev)
+            h_lut_out[:, ts, :] = c_lut
+            h_prev = torch.multiply(o, c_lut)
+
+            h_all.append(h_prev)
+            c_all.append(c_prev)
+
+        h_last = h_prev
+        c_last = c_prev
+        h_batch = torch.stack(h_all, dim=1)
+        c_batch = torch.stack(c_all, dim=1)
 
         # currently AIFF only use two activation lut
         if activations_list[0] == activations_list[1]:
@@ -311,89 +295,82 @@ def lstm(self, *args):
 
         act_qmax = 2 ** 31 - 1
         act_qmin = -2 ** 31
-        for b in range(batch_size):
-            h_all = torch.zeros([1, cell_size], device=dev, dtype=torch.double)
-            c_all = torch.zeros([1, cell_size], device=dev, dtype=torch.double)
-            h_prev = torch.unsqueeze(h_initial[b], dim=0).double()
-            c_prev = torch.unsqueeze(c_initial[b], dim=0).double()
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size)).double()
-                x_by_wx = torch.matmul(in_ts, wx_q)
-                h_by_wh = torch.matmul(h_prev.to(wh_q.dtype), wh_q)
-                if dtype == 'int8':
-                    re_scaled_h_by_wh = linear_requantize(h_by_wh, scale_[0], shift_[0], 0, act_qmin, act_qmax)
-                    mat_sum = x_by_wx + re_scaled_h_by_wh + bias
-                    i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(mat_sum, 4, dim=1)
-
-                    f_in = linear_requantize(f_tmp, ft_scale, ft_shift, 0, qmin, qmax)
-                    i_in = linear_requantize(i_tmp, it_scale, it_shift, 0, qmin, qmax)
-                    g_in = linear_requantize(g_tmp, ct_scale, ct_shift, 0, qmin, qmax)
-                    o_in = linear_requantize(o_tmp, ot_scale, ot_shift, 0, qmin, qmax)
-
-                    # g_rnn_activation_func[activations_list[0]][2](f_in, ft_table).float()
-                    f = lookup_lut_powerof2(f_in, ft_table, lut_in_bits, True, lut_out_bits, True)
-                    # g_rnn_activation_func[activations_list[0]][2](i_in, it_table).float()
-                    i = lookup_lut_powerof2(i_in, it_table, lut_in_bits, True, lut_out_bits, True)
-                    # g_rnn_activation_func[activations_list[1]][2](g_in, ct_table).float()
-                    g = lookup_lut_powerof2(g_in, ct_table, lut_in_bits, True, lut_out_bits, True)
-                    # g_rnn_activation_func[activations_list[0]][2](o_in, ot_table).float()
-                    o = lookup_lut_powerof2(o_in, ot_table, lut_in_bits, True, lut_out_bits, True)
-
-                elif dtype == 'int16':
-                    m_shift = self.get_param('lut_shift_value')
-                    h_by_wh_s = linear_requantize(h_by_wh, 1, shift_[0] - m_shift, 0, act_qmin, act_qmax)
-                    re_scaled_h_by_wh_s = linear_requantize(h_by_wh_s, scale_[0], shift_[1], 0, act_qmin, act_qmax)
-                    x_by_wx_s = linear_requantize(x_by_wx, 1, shift_[1] - m_shift, 0, act_qmin, act_qmax)
-                    bias_s = linear_requantize(bias, 1, shift_[1] - m_shift, 0, act_qmin, act_qmax)
-                    mat_sum = x_by_wx_s + re_scaled_h_by_wh_s + bias_s
-                    mat_sum = torch.clamp(torch.round(mat_sum), act_qmin, act_qmax)
-                    i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(mat_sum, 4, dim=1)
-
-                    f_in = linear_requantize(f_tmp, ft_scale, m_shift, 0, qmin, qmax)
-                    i_in = linear_requantize(i_tmp, it_scale, m_shift, 0, qmin, qmax)
-                    g_in = linear_requantize(g_tmp, ct_scale, ct_shift - it_shift + m_shift, 0, qmin, qmax)
-                    o_in = linear_requantize(o_tmp, ot_scale, m_shift, 0, qmin, qmax)
-
-                    # g_rnn_activation_func[activations_list[0]][3](f_in, ft_table).float()
-                    f = lookup_lut_powerof2(f_in, ft_table, lut_in_bits, True, lut_out_bits, True).double()
-                    # g_rnn_activation_func[activations_list[0]][3](i_in, it_table).float()
-                    i = lookup_lut_powerof2(i_in, it_table, lut_in_bits, True, lut_out_bits, True).double()
-                    # g_rnn_activation_func[activations_list[1]][3](g_in, ct_table).float()
-                    g = lookup_lut_powerof2(g_in, ct_table, lut_in_bits, True, lut_out_bits, True).double()
-                    # g_rnn_activation_func[activations_list[0]][3](o_in, ot_table).float()
-                    o = lookup_lut_powerof2(o_in, ot_table, lut_in_bits, True, lut_out_bits, True).double()
-
-                diff_shift = diff_shifts_[ts]
-                i_times_g = torch.multiply(i, g)
-                i_times_g = linear_requantize(i_times_g, 1, diff_shift, 0, act_qmin, act_qmax)
-                f_times_c_prev = torch.multiply(f, c_prev + c_zerop[2 * ts])
-                rescaled_f_times_c_prev = linear_requantize(f_times_c_prev, scale_[5 + 2 * ts], shift_[5 + 2 * ts]+diff_shift, 0,
-                                                            act_qmin, act_qmax)
-                c_tmp = i_times_g + rescaled_f_times_c_prev
-
-                c_tmp = torch.clamp(c_tmp, act_qmin, act_qmax)
-
-                re_scaled_c_tmp = linear_requantize(c_tmp, scale_[3], shift_[3]-diff_shift, 0, qmin+1, qmax)
-                ctmp_lut_out = lookup_lut_powerof2(re_scaled_c_tmp, h_table, lut_in_bits, True, lut_out_bits, True)
-                h_prev = torch.multiply(o, ctmp_lut_out).double()
-                h_prev = linear_requantize(h_prev, scale_[4], shift_[4], 0, qmin+1, qmax)
-                c_prev = linear_requantize(c_tmp, scale_[5 + 2 * ts + 1], shift_[5 + 2 * ts + 1]-diff_shift,
-                                           c_zerop[2 * ts + 1], qmin+1, qmax)
-
-                h_all = h_prev if ts == 0 else torch.cat((h_all, h_prev), dim=0)
-                c_all = c_prev if ts == 0 else torch.cat((c_all, c_prev), dim=0)
-
-            # h_expd = torch.unsqueeze(h_prev, dim = 0) #[1,1,512]
-            h_last = h_prev if b == 0 else torch.cat((h_last, h_prev), dim=0)
-
-            h_all = torch.unsqueeze(h_all, dim=0)  # [1,40,512]
-            h_batch = h_all if b == 0 else torch.cat((h_batch, h_all), dim=0)
-
-            # c_expd = torch.unsqueeze(c_prev, dim = 0) #[1,1,512]
-            c_last = c_prev if b == 0 else torch.cat((c_last, c_prev), dim=0)
-
-            c_all = torch.unsqueeze(c_all, dim=0)  # [1,40,512]
-            c_batch = c_all if b == 0 else torch.cat((c_batch, c_all), dim=0)
+        # the operands are integers, so the double matmuls are exact whatever the batch size is
+        h_prev = h_initial.double()
+        c_prev = c_initial.double()
+        h_all = []
+        c_all = []
+        for ts in range(time_step):
+            in_ts = input_seq[:, ts, :].double()
+            x_by_wx = torch.matmul(in_ts, wx_q)
+            h_by_wh = torch.matmul(h_prev.to(wh_q.dtype), wh_q)
+            if dtype == 'int8':
+                re_scaled_h_by_wh = linear_requantize(h_by_wh, scale_[0], shift_[0], 0, act_qmin, act_qmax)
+                mat_sum = x_by_wx + re_scaled_h_by_wh + bias
+                i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(mat_sum, 4, dim=1)
+
+                f_in = linear_requantize(f_tmp, ft_scale, ft_shift, 0, qmin, qmax)
+                i_in = linear_requantize(i_tmp, it_scale, it_shift, 0, qmin, qmax)
+                g_in = linear_requantize(g_tmp, ct_scale, ct_shift, 0, qmin, qmax)
+                o_in = linear_requantize(o_tmp, ot_scale, ot_shift, 0, qmin, qmax)
+
+                # g_rnn_activation_func[activations_list[0]][2](f_in, ft_table).float()
+                f = lookup_lut_powerof2(f_in, ft_table, lut_in_bits, True, lut_out_bits, True)
+                # g_rnn_activation_func[activations_list[0]][2](i_in, it_table).float()
+                i = lookup_lut_powerof2(i_in, it_table, lut_in_bits, True, lut_out_bits, True)
+                # g_rnn_activation_func[activations_list[1]][2](g_in, ct_table).float()
+                g = lookup_lut_powerof2(g_in, ct_table, lut_in_bits, True, lut_out_bits, True)
+                # g_rnn_activation_func[activations_list[0]][2](o_in, ot_table).float()
+                o = lookup_lut_powerof2(o_in, ot_table, lut_in_bits, True, lut_out_bits, True)
+
+            elif dtype == 'int16':
+                m_shift = self.get_param('lut_shift_value')
+                h_by_wh_s = linear_requantize(h_by_wh, 1, shift_[0] - m_shift, 0, act_qmin, act_qmax)
+                re_scaled_h_by_wh_s = linear_requantize(h_by_wh_s, scale_[0], shift_[1], 0, act_qmin, act_qmax)
+                x_by_wx_s = linear_requantize(x_by_wx, 1, shift_[1] - m_shift, 0, act_qmin, act_qmax)
+                bias_s = linear_requantize(bias, 1, shift_[1] - m_shift, 0, act_qmin, act_qmax)
+                mat_sum = x_by_wx_s + re_scaled_h_by_wh_s + bias_s
+                mat_sum = torch.clamp(torch.round(mat_sum), act_qmin, act_qmax)
+                i_tmp, g_tmp, f_tmp, o_tmp = torch.chunk(mat_sum, 4, dim=1)
+
+                f_in = linear_requantize(f_tmp, ft_scale, m_shift, 0, qmin, qmax)
+                i_in = linear_requantize(i_tmp, it_scale, m_shift, 0, qmin, qmax)
+                g_in = linear_requantize(g_tmp, ct_scale, ct_shift - it_shift + m_shift, 0, qmin, qmax)
+                o_in = linear_requantize(o_tmp, ot_scale, m_shift, 0, qmin, qmax)
+
+                # g_rnn_activation_func[activations_list[0]][3](f_in, ft_table).float()
+                f = lookup_lut_powerof2(f_in, ft_table, lut_in_bits, True, lut_out_bits, True).double()
+                # g_rnn_activation_func[activations_list[0]][3](i_in, it_table).float()
+                i = lookup_lut_powerof2(i_in, it_table, lut_in_bits, True, lut_out_bits, True).double()
+                # g_rnn_activation_func[activations_list[1]][3](g_in, ct_table).float()
+                g = lookup_lut_powerof2(g_in, ct_table, lut_in_bits, True, lut_out_bits, True).double()
+                # g_rnn_activation_func[activations_list[0]][3](o_in, ot_table).float()
+                o = lookup_lut_powerof2(o_in, ot_table, lut_in_bits, True, lut_out_bits, True).double()
+
+            diff_shift = diff_shifts_[ts]
+            i_times_g = torch.multiply(i, g)
+            i_times_g = linear_requantize(i_times_g, 1, diff_shift, 0, act_qmin, act_qmax)
+            f_times_c_prev = torch.multiply(f, c_prev + c_zerop[2 * ts])
+            rescaled_f_times_c_prev = linear_requantize(f_times_c_prev, scale_[5 + 2 * ts], shift_[5 + 2 * ts]+diff_shift, 0,
+                                                        act_qmin, act_qmax)
+            c_tmp = i_times_g + rescaled_f_times_c_prev
+
+            c_tmp = torch.clamp(c_tmp, act_qmin, act_qmax)
+
+            re_scaled_c_tmp = linear_requantize(c_tmp, scale_[3], shift_[3]-diff_shift, 0, qmin+1, qmax)
+            ctmp_lut_out = lookup_lut_powerof2(re_scaled_c_tmp, h_table, lut_in_bits, True, lut_out_bits, True)
+            h_prev = torch.multiply(o, ctmp_lut_out).double()
+            h_prev = linear_requantize(h_prev, scale_[4], shift_[4], 0, qmin+1, qmax)
+            c_prev = linear_requantize(c_tmp, scale_[5 + 2 * ts + 1], shift_[5 + 2 * ts + 1]-diff_shift,
+                                       c_zerop[2 * ts + 1], qmin+1, qmax)
+
+            h_all.append(h_prev)
+            c_all.append(c_prev)
+
+        h_last = h_prev
+        c_last = c_prev
+        h_batch = torch.stack(h_all, dim=1)  # [batch, time_step, cell_size]
+        c_batch = torch.stack(c_all, dim=1)
 
     results = []
     for idx, sequence in enumerate(out_sequence):
@@ -62,8 +62,8 @@ def col2im2D(node, inp, image_dims, kernel_dims):
     idx = idx.reshape(1, 1, -1).long().expand(batch_size, in_channels, -1)
 
     mask = idx == -32767
-    inp[mask] = 0
-    idx[mask] = 0
+    inp = inp.masked_fill(mask, 0)
+    idx = idx.masked_fill(mask, 0)
 
     out = torch.zeros(
         batch_size, in_channels, output_size_numel, dtype=inp.dtype, device=inp.device)
@@ -102,55 +102,42 @@ def col2imND(node, inp, image_dims, kernel_dims):
     adjusted_image_shape_dims = image_dims - adjusted_kernel_shape + 1
     batched_image_shape_dims = batched_image_shape_dims.long().tolist()
 
+    dev = inp.device
+    im_shape = image_dims.long().tolist()
+    output_shape = adjusted_image_shape_dims.long().tolist()
+    kernel_shape = adjusted_kernel_shape.long().tolist()
+    channels_col = int(kernel_shape_size) * C
+    kernel_size = int(torch.prod(adjusted_kernel_shape))
+    output_size = int(torch.prod(adjusted_image_shape_dims))
+
+    # the kernel offsets of every column channel, [rank, channels_col]
+    c_col = torch.arange(channels_col, device=dev)
+    d_offset = [None] * rank
+    offset = c_col
+    for di in range(rank - 1, -1, -1):
+        if di < (rank - 1):
+            offset = torch.div(offset, kernel_shape[di + 1], rounding_mode='floor')
+        d_offset[di] = offset % kernel_shape[di]
+    # the output positions, [rank, output_size]
+    d_iter = torch.stack(torch.meshgrid(*[torch.arange(o, device=dev) for o in output_shape], indexing='ij')
+                         ).reshape(rank, -1)
+    # [channels_col, output_size] indexes of the column data and of the image data in one batch
+    index_col = c_col.unsqueeze(-1) * output_size + torch.arange(output_size, device=dev)
+    index_im = torch.div(c_col, kernel_size, rounding_mode='floor').unsqueeze(-1)
+    is_padding = torch.zeros([channels_col, output_size], dtype=torch.bool, device=dev)
+    for d_i in range(rank):
+        d_im = d_iter[d_i] * strides[d_i] - padding[d_i] + d_offset[d_i].unsqueeze(-1) * dilations[d_i]
+        is_padding |= (d_im < 0) | (d_im >= im_shape[d_i])
+        index_im = index_im * im_shape[d_i] + d_im
+
     inp_flatten = inp.flatten()
     image_data = torch.zeros(batched_image_shape_dims, device=inp.device).flatten()
-    for b in range(N):
-        data_im = inp_flatten[b * col_data_stride:]
-        im_shape = image_dims
-        output_shape = adjusted_image_shape_dims
-        channels_col = kernel_shape_size * C
-        kernel_shape = adjusted_kernel_shape
-        data_col = image_data[b * col_stride:]
-        kernel_size = torch.prod(kernel_shape)
-        d_offset = [0] * rank
-        d_iter = [0] * rank
-        for c_col in range(channels_col):
-            offset = c_col
-            for di in range(rank - 1, -1, -1):
-                if di < (rank - 1):
-                    offset = offset // kernel_shape[di + 1]
-                d_offset[di] = int(offset) % kernel_shape[di]
-            while True:
-                index_col = c_col
-                index_im = c_col // kernel_size
-                is_padding = False
-                for d_i in range(rank):
-                    d = d_iter[d_i]
-                    d_im = d * strides[d_i] - padding[d_i] + d_offset[d_i] * dilations[d_i]
-                    is_padding = is_padding or (not (d_im >= 0 and d_im < im_shape[d_i]))
-                    index_col *= output_shape[d_i]
-                    index_col += d
-                    index_im *= im_shape[d_i]
-                    index_im += d_im
-                if not is_padding:
-                    if index_col < data_im.shape[0] and index_im < data_col.shape[0]:
-                        data_col[index_im] += data_im[index_col]
-
-                def NextPosition(shape, d_iter):
-                    has_next_output = False
-                    for d_x in range(rank - 1, -1, -1):
-                        d_max = shape[d_x]
-                        if d_iter[d_x] == (d_max - 1):
-                            d_iter[d_x] = 0
-                        else:
-                            d_iter[d_x] += 1
-                            has_next_output = True
-                            break
-                    return has_next_output, d_iter
-
-                has_next_output, d_iter = NextPosition(output_shape, d_iter)
-                if not has_next_output:
-                    break
+    # [N, channels_col, output_size], the columns are accumulated in the order of batch, column channel and position
+    batch_offset = torch.arange(N, device=dev).reshape(-1, 1, 1)
+    index_col = batch_offset * col_data_stride + index_col
+    index_im = batch_offset * int(col_stride) + index_im
+    valid = ~is_padding & (index_col < inp_flatten.numel()) & (index_im < image_data.numel())
+    image_data.index_put_((index_im[valid],), inp_flatten[index_col[valid]].to(image_data.dtype), accumulate=True)
 
     output = torch.reshape(image_data, batched_image_shape_dims)
 
@@ -12,7 +12,79 @@ from AIPUBuilder.Optimizer.ops.activation import (apply_with_activation,
                                                   with_activation_allow_merge_out_zerop_to_bias)
 import torch
 import math
-import importlib
+
+
+def _conv2d_tile_shape(inp_shape, w_shape, stride, dilation, group, budget):
+    # halve the output rows, then the output columns, then the channel blocks until the working set of
+    # exact_integer_conv2d on a tile fits in the budget
+    n, cin, _, _ = inp_shape
+    cout, cin_per_group, kh, kw = w_shape
+    oh, ow = _conv2d_out_hw(inp_shape, w_shape, stride, dilation)
+    blocks = cout if group == 1 else group
+
+    def _tile_bytes(th, tw, cb):
+        tile_cin = cin if group == 1 else cb * cin_per_group
+        tile_cout = cb if group == 1 else cb * cout // group
+        ih = (th - 1) * stride[0] + (kh - 1) * dilation[0] + 1
+        iw = (tw - 1) * stride[1] + (kw - 1) * dilation[1] + 1
+        # the input copy and the im2col buffer (double when the float32 sums would not be exact),
+        # the float32 partial output and the double output
+        return n * (8 * tile_cin * kh * kw * th * tw + 8 * tile_cin * ih * iw + 12 * tile_cout * th * tw)
+
+    th, tw, cb = oh, ow, blocks
+    while _tile_bytes(th, tw, cb) > budget:
+        if th > 1:
+            th = (th + 1) // 2
+        elif tw > 1:
+            tw = (tw + 1) // 2
+        elif cb > 1:
+            cb = (cb + 1) // 2
+        else:
+            break
+    return th, tw, cb
+
+
+def _conv2d_out_hw(inp_shape, w_shape, stride, dilation):
+    oh = (inp_shape[2] - (w_shape[2] - 1) * dilation[0] - 1) // stride[0] + 1
+    ow = (inp_shape[3] - (w_shape[3] - 1) * dilation[1] - 1) // stride[1] + 1
+    return oh, ow
+
+
+def tiled_conv2d(inp, weights, bias, stride, dilation, group, budget):
+    """
+    exact_integer_conv2d (integer valued double tensors, without padding) on tiles of output rows, columns and
+    channel blocks when the working set of the whole convolution exceeds budget bytes. the integer sums are exact,
+    so the result is the same whatever the tiles are.
+    """
+    th, tw, cb = _conv2d_tile_shape(inp.shape, weights.shape, stride, dilation, group, budget)
+    oh, ow = _conv2d_out_hw(inp.shape, weights.shape, stride, dilation)
+    cout, cin_per_group, kh, kw = weights.shape
+    blocks = cout if group == 1 else group
+    if th >= oh and tw >= ow and cb >= blocks:
+        return exact_integer_conv2d(inp, weights, bias, stride=stride, dilation=dilation, groups=group)
+
+    out = None
+    for b0 in range(0, blocks, cb):
+        b1 = min(b0 + cb, blocks)
+        if group == 1:
+            c0, c1, ci0, ci1, tile_group = b0, b1, 0, inp.shape[1], 1
+        else:
+            c0, c1 = b0 * cout // group, b1 * cout // group
+            ci0, ci1, tile_group = b0 * cin_per_group, b1 * cin_per_group, b1 - b0
+        w_tile = weights[c0:c1]
+        b_tile = bias[c0:c1] if bias is not None else None
+        for h0 in range(0, oh, th):
+            h1 = min(h0 + th, oh)
+            ih0, ih1 = h0 * stride[0], (h1 - 1) * stride[0] + (kh - 1) * dilation[0] + 1
+            for w0 in range(0, ow, tw):
+                w1 = min(w0 + tw, ow)
+                iw0, iw1 = w0 * stride[1], (w1 - 1) * stride[1] + (kw - 1) * dilation[1] + 1
+                y = exact_integer_conv2d(inp[:, ci0:ci1, ih0:ih1, iw0:iw1], w_tile, b_tile,
+                                         stride=stride, dilation=dilation, groups=tile_group)
+                if out is None:
+                    out = torch.empty([inp.shape[0], cout, oh, ow], dtype=y.dtype, device=y.device)
+                out[:, c0:c1, h0:h1, w0:w1] = y
+    return out
 
 
 def _conv2d_torch_impl(self, *args):
@@ -40,32 +112,22 @@ def _conv2d_torch_impl(self, *args):
         if self.aasrb is not None:
             bias = None
         inp = torch.nn.functional.pad(inp, padding, value=pad_val)
-        x = torch.nn.functional.conv2d(inp,
-                                       weights,
-                                       bias,
-                                       stride=stride,
-                                       padding=0,
-                                       dilation=dilation,
-                                       groups=group)
+        if self.quantized:
+            # big quantized convolutions (such as 1x1 convolutions on huge featuremaps) are computed tile by tile
+            budget = self.get_attrs('conv_tiling_memory_budget', optional=True, default_value=512) * 1024 * 1024
+            x = tiled_conv2d(inp, weights, bias, stride, dilation, group, budget)
+        else:
+            x = torch.nn.functional.conv2d(inp, weights, bias, stride=stride, padding=0, dilation=dilation,
+                                           groups=group)
     x = nchw2nhwc(x)
     return x
 
 
 @op_register(OpType.Convolution)
 def conv2d(self, *args):
-    in_shape = self.inputs[0].shape
-    ih, iw = in_shape[1], in_shape[2]
-    ky = self.get_param('kernel_y')
-    kx = self.get_param('kernel_x')
-
     self.aasrb = self.get_param('remain_shift', optional=True, default_value=None)
 
-    if not torch.cuda.is_available() and (ih >= 2048 and iw >= 2048) and (ky == 1 and kx == 1):
-        OPT_DEBUG(f"when ih>=2048, iw>=2048 and ky==1, kw==1 with cpu device forward, we will use tf.nn.conv2d to execute.")
-        conv2d_tf = importlib.import_module('AIPUBuilder.Optimizer.ops.tf_ops.conv2d')
-        x = conv2d_tf.conv2d_tf_impl(self, *args)
-    else:
-        x = _conv2d_torch_impl(self, *args)
+    x = _conv2d_torch_impl(self, *args)
 
     shift_bk = None
     if self.quantized and self.aasrb is not None and (dtype2bits(self.constants["weights"].dtype) > 8 or dtype2bits(self.inputs[0].dtype) > 8):
@@ -300,6 +300,33 @@ def WinogradAllocator(self, inp, weights, bias, DEBUG=False):
     return WinogradOut
 
 
+def winograd_tiles(inp, tile_h, tile_w, stride_h, stride_w):
+    # [B, C, H, W] --> [B, C, LoopHeight, LoopWidth, tile_h, tile_w], all the overlapped input tiles at once
+    return inp.unfold(2, tile_h, stride_h).unfold(3, tile_w, stride_w)
+
+
+def winograd_1D_multiply(BTd, Gg, budget):
+    """
+    sum((G*g) * (BT*d)) over input channels and then over kernel rows, for all tiles at once.
+    BTd: [B, Cin, LoopHeight, LoopWidth, kh, t], Gg: [Cout, Cin, kh, t], returns [B, Cout, LoopHeight, LoopWidth, t].
+    the products are computed chunk by chunk of (batch, Cout) to keep them in budget bytes, every
+    output element is reduced in the same order whatever the chunks are.
+    """
+    Batch, _Cin, LoopHeight, LoopWidth, _KernelHeight, TileInWidth = BTd.shape
+    _Cout = Gg.shape[0]
+    Gg = torch.reshape(Gg, (_Cout, _Cin, 1, 1, _KernelHeight, TileInWidth))
+    per_cout = max(1, _Cin * LoopHeight * LoopWidth * _KernelHeight * TileInWidth * BTd.element_size())
+    cout_num = max(1, min(_Cout, budget // per_cout))
+    batch_num = max(1, min(Batch, budget // (per_cout * cout_num))) if cout_num == _Cout else 1
+    out = torch.empty((Batch, _Cout, LoopHeight, LoopWidth, TileInWidth), device=BTd.device, dtype=BTd.dtype)
+    for b in range(0, Batch, batch_num):
+        for o in range(0, _Cout, cout_num):
+            BT_out = BTd[b:b + batch_num].unsqueeze(1) * Gg[o:o + cout_num]
+            BT_out = torch.sum(BT_out, dim=2)
+            out[b:b + batch_num, o:o + cout_num] = torch.sum(BT_out, dim=4)
+    return out
+
+
 def winograd_conv_1D(self, inp, weights, bias, m=2, r=3, DEBUG=True):
     # prepare params
     Batch, _Cin, _Hin, _Win = inp.shape
@@ -438,220 +465,29 @@ def winograd_conv_1D_HP(self, inp, weights, bias, m=2, r=3, DEBUG=True):
     else:
         Gg_weights = self.attrs['WinogradWeights'].permute((0, 3, 1, 2)).float()
 
-    def DataReverseMethod(benchmark=False):
-        data_reverse = torch.zeros((Batch, _Cin, LoopHeight, LoopWidth, _KernelHeight, TileInWidth), device=inp.device)
-
-        def method0(benchmark):
-            # method1 warm up.
-            # reorder input for compute on GPU
-            if benchmark:
-                StartTime = datetime.datetime.now()
-            # tmp = torch.zeros((Batch, _Cin, LoopHeight, LoopWidth, _KernelHeight, TileInWidth), device=inp.device) #64,58*28,3,4)
-            for b in range(Batch):
-                for h in range(LoopHeight):             # 56, 7
-                    for w in range(LoopWidth):          # 28, 2
-                        for _kh in range(_KernelHeight):  # 3,
-                            for c in range(_Cin):       # 512,7,4,3,4
-                                data_reverse[b, c, h, w, _kh, :] = PaddingInp[b, c, h+_kh, 2*w:2*w+TileInWidth]
-            if benchmark:
-                EndTime = datetime.datetime.now()
-                OPT_INFO("[Torch]layer %d reverse input spend t0[warm up] %d micro-second." %
-                         (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
-            return data_reverse
-
-        def method1(benchmark):
-            if benchmark:
-                StartTime = datetime.datetime.now()
-            # tmp = torch.zeros((Batch, _Cin, LoopHeight, LoopWidth, _KernelHeight, TileInWidth), device=inp.device)
-            for b in range(Batch):
-                for h in range(LoopHeight):             # 56, 7
-                    for w in range(LoopWidth):          # 28, 2
-                        for _kh in range(_KernelHeight):  # 3,
-                            for c in range(_Cin):       # 512,7,4,3,4
-                                data_reverse[b, c, h, w, _kh, :] = PaddingInp[b, c,  h+_kh, 2*w:2*w+TileInWidth]
-            if benchmark:
-                EndTime = datetime.datetime.now()
-                OPT_INFO("[Torch]layer %d reverse input spend t1[loop] %d micro-second." %
-                         (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
-            return data_reverse
-
-        def method2(benchmark):
-            # numpy method.
-            if benchmark:
-                StartTime = datetime.datetime.now()
-            np_data_reverse = np.zeros((Batch, _Cin, LoopHeight, LoopWidth, _KernelHeight, TileInWidth))
-            np_inp_padding = PaddingInp.cpu().numpy()
-            for b in range(Batch):
-                for h in range(LoopHeight):             # 56, 7
-                    for w in range(LoopWidth):          # 28, 2
-                        for _kh in range(_KernelHeight):  # 3,
-                            for c in range(_Cin):       # 512,7,4,3,4
-                                np_data_reverse[b, c, h, w, _kh, :] = np_inp_padding[b, c, h+_kh, 2*w:2*w+TileInWidth]
-            gt = torch.tensor(np_data_reverse, dtype=torch.float32, device=inp.device)
-            if benchmark:
-                EndTime = datetime.datetime.now()
-                OPT_INFO("[numpy]layer %d reverse input spend t2[numpy] %d micro-second." %
-                         (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
-            return gt
-
-        def method3(benchmark):
-            if benchmark:
-                StartTime = datetime.datetime.now()
-            w_slice = torch.split(PaddingInp, 2, dim=3)  # [1,64,58,58] --> (29*[1,64,58,2])
-            double_part = list(w_slice[1:-1])  # tuple(tensor) 29-->27
-            double_part2d = [[d]*2 for d in double_part]
-            double_part1d = [x for d2 in double_part2d for x in d2]
-            totalW_part = [w_slice[0]] + double_part1d + [w_slice[-1]]
-            expanded_W = torch.cat(totalW_part, dim=3)
-
-            h_sclice = torch.split(expanded_W, 1, dim=2)
-            tmp = []
-            for i, _slice in enumerate(h_sclice):
-                if i < 2:
-                    continue
-                H3Wtotal = torch.cat((h_sclice[i-2], h_sclice[i-1], h_sclice[i]),
-                                     dim=2)  # [B,C_in,3,W_expanded]: [1,64,3,112]
-                H3W4_tuple = torch.split(H3Wtotal, 4, dim=3)  # tuple(28*[1,64,3,4])
-                Wstack_H3W4 = torch.stack(H3W4_tuple, dim=2)  # [1, 64, 28, 3, 4]
-                tmp.append(Wstack_H3W4)
-
-            data_reverse = torch.stack(tmp, dim=2)
-            if benchmark:
-                EndTime = datetime.datetime.now()
-                OPT_INFO("[Torch]layer %d reverse input spend t3[hp] %d micro-second." %
-                         (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
-            return data_reverse
-
-        if benchmark:
-            _ = method0(benchmark)
-            _ = method1(benchmark)
-            GT = method2(benchmark)
-            _out = method3(benchmark)
-        else:
-            _out = method3(benchmark)
-        return _out.float()
-
     if DEBUG:
         StartTime = datetime.datetime.now()
 
-    DataReverse = DataReverseMethod(benchmark=DEBUG)
+    # reorder input to all the [kh, 4] tiles: [Batch, Cin, LoopHeight, LoopWidth, kh, 4]
+    DataReverse = winograd_tiles(PaddingInp, _KernelHeight, TileInWidth, 1, Overlap).float()
 
     if DEBUG:
         EndTime = datetime.datetime.now()
-        OPT_INFO("layer %d input data reverse[optimized method] spend %d micro-second." %
+        OPT_INFO("layer %d input data reverse spend %d micro-second." %
                  (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
+        StartTime = datetime.datetime.now()
 
-    WinogradOut = torch.zeros((Batch, _Cout, LoopHeight, int(LoopWidth * 2)), device=inp.device, dtype=torch.float32)
-
-    def WinogradKernels(benchmark=False):
-        def isBatchMergeMode():
-            DtyepeSize = 4  # Byte
-            InputSize = Batch * _Cin * _Hin * _Win * DtyepeSize
-            TiledInputSize = Batch * _Cin * LoopHeight * LoopWidth * _KernelHeight * TileInWidth * DtyepeSize
-            max_size = TiledInputSize * _Cout
-            if max_size > 1024*1024*1024:
-                return False
-            return True
-
-        def BatchMergeMode(benchmark):
-            if not isBatchMergeMode():
-                OPT_INFO("not support batch merge mode.")
-                return 0
-
-            if benchmark:
-                StartTime = datetime.datetime.now()
-
-            # compute AT * (G * g + BT * d)
-            data_reverse = torch.matmul(DataReverse, BT.permute(1, 0))
-            BT_out = data_reverse.unsqueeze(1).repeat((1, _Cout, 1, 1, 1, 1, 1))
-            winograd_weights_new = torch.reshape(Gg_weights, (_Cout, _Cin, 1, 1, _KernelHeight, TileInWidth))
-            winograd_weights_new = winograd_weights_new.repeat((1, 1, LoopHeight, LoopWidth, 1, 1))
-            BT_out = BT_out * winograd_weights_new
-            BT_out = torch.sum(BT_out, dim=2)
-            BT_out = torch.sum(BT_out, dim=4)
-            AT_out_1 = torch.matmul(BT_out, AT.permute(1, 0))  # 64,56,28,2
-            WinogradOut = torch.reshape(AT_out_1, (Batch, _Cout, LoopHeight, int(LoopWidth * 2)))
-
-            if benchmark:
-                EndTime = datetime.datetime.now()
-                OPT_INFO("layer %d WinogradKernels[BatchMergeMode] spend %d micro-second." %
-                         (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
-                # OPT_INFO("batch merge mode: enough GPU memory. ")
-                # max_size = _Cout * Batch * _Cin * LoopHeight * LoopWidth * _KernelHeight * TileInWidth * 4 # 4: float32,4byte.
-                # OPT_INFO("max memory footprint size of single variance[*3]: %d MByte"%(int(max_size/(1024*1024))))
-
-        def ExchangeBatchCoutMode(benchmark):
-            ################################ exchange(Batch, output_channel) Mode: cause batch can control##################
-            if benchmark:
-                StartTime = datetime.datetime.now()
-            data_tmp = torch.matmul(DataReverse, BT.permute(1, 0))
-
-            for o in range(_Cout):
-                winograd_weights_new = torch.reshape(Gg_weights[o], (1, _Cin, 1, 1, _KernelHeight, TileInWidth))
-                winograd_weights_new = winograd_weights_new.repeat((Batch, 1, LoopHeight, LoopWidth, 1, 1))
-                BT_out = data_tmp * winograd_weights_new
-                BT_out = torch.sum(BT_out, dim=1)
-                BT_out = torch.sum(BT_out, dim=3)
-                AT_out_1 = torch.matmul(BT_out, AT.permute(1, 0))  # 10,56,28,2
-                WinogradOut[:, o, :, :] = torch.reshape(AT_out_1, (Batch, LoopHeight, int(LoopWidth * 2)))  # 10,56,28,2
-
-            if benchmark:
-                EndTime = datetime.datetime.now()
-                OPT_INFO("layer %d WinogradKernels[ExchangeBatchCoutMode] spend %d micro-second." %
-                         (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
-
-        def HeavyFootprintMode(benchmark):
-            ################################# Split Batch Mode(heavy footprint mode)####################################
-            if benchmark:
-                StartTime = datetime.datetime.now()
-            for b in range(Batch):
-                # compute AT * (G * g + BT * d)
-                data_tmp = torch.matmul(DataReverse[b], BT.permute(1, 0))
-                BT_out = data_tmp.repeat((_Cout, 1, 1, 1, 1, 1))
-                winograd_weights_new = torch.reshape(Gg_weights, (_Cout, _Cin, 1, 1, _KernelHeight, TileInWidth))
-                winograd_weights_new = winograd_weights_new.repeat((1, 1, LoopHeight, LoopWidth, 1, 1))
-                BT_out = BT_out * winograd_weights_new
-                BT_out = torch.sum(BT_out, dim=1)
-                BT_out = torch.sum(BT_out, dim=3)
-                AT_out_1 = torch.matmul(BT_out, AT.permute(1, 0))  # 64,56,28,2
-                WinogradOut[b] = torch.reshape(AT_out_1, (_Cout, LoopHeight, int(LoopWidth * 2)))  # 64,56,28,2
-            if benchmark:
-                EndTime = datetime.datetime.now()
-                OPT_INFO("layer %d WinogradKernels[HeavyFootprintMode] %d micro-second." %
-                         (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
-
-        def LightFootprintMode(benchmark):
-            #################################Split Batch/output_channel(light footprint) mode.##########################
-            if benchmark:
-                StartTime = datetime.datetime.now()
-            for b in range(Batch):
-                data_tmp = torch.matmul(DataReverse[b], BT.permute(1, 0))
-                for o in range(_Cout):
-                    winograd_weights_new = torch.reshape(Gg_weights[o], (_Cin, 1, 1, _KernelHeight, TileInWidth))
-                    winograd_weights_new = winograd_weights_new.repeat((1, LoopHeight, LoopWidth, 1, 1))
-                    BT_out = data_tmp * winograd_weights_new
-                    BT_out = torch.sum(BT_out, dim=0)
-                    BT_out = torch.sum(BT_out, dim=2)
-                    AT_out_1 = torch.matmul(BT_out, AT.permute(1, 0))  # 64,56,28,2
-                    WinogradOut[b][o] = torch.reshape(AT_out_1, (LoopHeight, int(LoopWidth * 2)))  # 64,56,28,2
-                # torch.cuda.empty_cache()
-            if benchmark:
-                EndTime = datetime.datetime.now()
-                OPT_INFO("layer %d WinogradKernels[LightFootprintMode] %d micro-second." %
-                         (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
-        if benchmark:
-            BatchMergeMode(benchmark)
-            LightFootprintMode(benchmark)
-            HeavyFootprintMode(benchmark)
-            ExchangeBatchCoutMode(benchmark)
-        else:
-            try:
-                HeavyFootprintMode(benchmark)
-            except Exception as e:
-                OPT_INFO("GPU memory limited.")
-                ExchangeBatchCoutMode(benchmark)
+    # compute AT * (G * g + BT * d) for all the tiles
+    budget = self.get_attrs('conv_tiling_memory_budget', optional=True, default_value=512) * 1024 * 1024
+    data_tmp = torch.matmul(DataReverse, BT.permute(1, 0))
+    BT_out = winograd_1D_multiply(data_tmp, Gg_weights, budget)
+    AT_out_1 = torch.matmul(BT_out, AT.permute(1, 0))  # 10,64,56,28,2
+    WinogradOut = torch.reshape(AT_out_1, (Batch, _Cout, LoopHeight, int(LoopWidth * 2)))
 
-    WinogradKernels(benchmark=DEBUG)
+    if DEBUG:
+        EndTime = datetime.datetime.now()
+        OPT_INFO("layer %d WinogradKernels spend %d micro-second." %
+                 (int(self.attrs['layer_id']), (EndTime - StartTime).microseconds))
 
     if WinogradWout != _Wout or WinogradHout != _Hout:
         WinogradOut = WinogradOut[:, :, :_Hout, :_Wout]
@@ -659,7 +495,7 @@ def winograd_conv_1D_HP(self, inp, weights, bias, m=2, r=3, DEBUG=True):
     if DEBUG:
         StartTime = datetime.datetime.now()
 
-    out = WinogradOut.add(bias.view(1, _Cout, 1, 1).repeat(1, 1, _Hout, _Wout))
+    out = WinogradOut.add(bias.view(1, _Cout, 1, 1))
 
     if DEBUG:
         EndTime = datetime.datetime.now()
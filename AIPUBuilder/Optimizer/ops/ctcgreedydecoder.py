@@ -20,38 +20,6 @@ layer_top_type=[int32]
 '''
 
 
-def remove_blank(indexes, blanks=[0]):
-    # remove blank
-    no_blank_index = indexes
-    for blank in blanks:
-        no_blank_index = no_blank_index[torch.where(no_blank_index != blank)]
-    return no_blank_index
-
-
-def merge_repeated(indexes):
-    '''
-        index = [1,2,3,3,3,4,4,7,8,8]
-        index_pad = [1,2,3,3,3,4,4,7,8,8,-1]
-        pad_index = [-1,1,2,3,3,3,4,4,7,8,8]
-        diff = index_pad - pad_index
-        diff = [2,1,1,0,0,1,0,1,0,-9]
-        diff = diff[:-1]
-        according to the nonzero element idx of diff, gather from index, then get merged_repeated result
-    '''
-    dev = indexes.device
-    raw_shape = indexes.shape
-    pad_shape = [*raw_shape[:-1], 1]
-    pad_index = torch.full(pad_shape, -1, device=dev, dtype=torch.int32)
-
-    indexes_pad = torch.cat([indexes, pad_index], dim=-1)
-    pad_indexes = torch.cat([pad_index, indexes], dim=-1)
-
-    diff = indexes_pad - pad_indexes
-    diff_no_pad = diff[..., :-1]
-    merge_index = indexes[torch.where(diff_no_pad != 0)]
-    return merge_index
-
-
 @op_register(OpType.CTCGreedyDecoder)
 def ctcgreedydecoder(self, *args):
     """
@@ -63,24 +31,23 @@ def ctcgreedydecoder(self, *args):
     seq_lens = self.inputs[1].betensor
     is_merge_repeated = self.get_param('merge_repeated')
     batch = inps.shape[0]
+    time_steps, num_classes = inps.shape[1], inps.shape[2]
     tout = torch.full([batch] + [*self.outputs[0].ir_shape][1:], dtype2range(self.outputs[0].dtype)[1])
-    for b in range(batch):
-        inp = inps[b]
-        seq_len = seq_lens[b].int().item()
-        if seq_len <= 0:
-            OPT_WARN('id=%s, type=%s, please check the input1: seq_len=%d' % (
-                self.attrs['layer_id'], str(self.type), seq_len))
-            seq_len = inp.shape[0]
-        act_inp = inp[:seq_len, :]
-        num_classes = inp.shape[1]
-        max_idx = torch.argmax(act_inp, dim=-1)
-        if is_merge_repeated:
-            out = merge_repeated(max_idx)
-        else:
-            out = max_idx
-        out = remove_blank(out, blanks=[num_classes - 1])
-        out = out.reshape([*out.shape, 1, 1])
-        tout[b, :out.shape[0], :, :] = out
+    seq_lens = seq_lens.reshape(-1)[:batch].int().long().to(inps.device)
+    for b in torch.nonzero(seq_lens <= 0).flatten().tolist():
+        OPT_WARN('id=%s, type=%s, please check the input1: seq_len=%d' % (
+            self.attrs['layer_id'], str(self.type), seq_lens[b].item()))
+    seq_lens = torch.where(seq_lens <= 0, torch.full_like(seq_lens, time_steps), seq_lens)
+
+    # [batch, time_steps] the decoded classes which are kept: in seq_len, not blank and not repeated if merged
+    max_idx = torch.argmax(inps, dim=-1)
+    keep = torch.arange(time_steps, device=inps.device) < seq_lens.unsqueeze(-1)
+    if is_merge_repeated:
+        keep[:, 1:] &= max_idx[:, 1:] != max_idx[:, :-1]
+    keep &= max_idx != (num_classes - 1)
+    position = torch.cumsum(keep, dim=-1) - 1
+    batch_idx = torch.arange(batch, device=inps.device).unsqueeze(-1).expand(-1, time_steps)
+    tout[batch_idx[keep].to(tout.device), position[keep].to(tout.device), 0, 0] = max_idx[keep].to(tout.device, tout.dtype)
     self.outputs[0].betensor = tout
     return tout
 
@@ -63,17 +63,12 @@ def cumulate(self, *args):
     if method == 'SUM':
         if exclusive:
             input_transpose = torch.cat([torch.zeros([outer_step, 1], device=dev), input_transpose[:, :step-1]], dim=1)
-        tmp_data = torch.zeros([outer_step], device=input_data.device)
+        outp = torch.cumsum(input_transpose, dim=1).float()
         if self.quantized:
             scale = self.params['scale_value']
             shift = self.params['shift_value']
-        for s in range(step):
-            data_step = input_transpose[:, s]
-            tmp_data = tmp_data + data_step
-            outp[:, s] = tmp_data
-            if self.quantized:
-                outp[:, s] = linear_requantize(outp[:, s], scale, shift, self.outputs[0].zerop,
-                                               self.outputs[0].qmin, self.outputs[0].qmax)
+            outp = linear_requantize(outp, scale, shift, self.outputs[0].zerop,
+                                     self.outputs[0].qmin, self.outputs[0].qmax)
     elif method == 'PROD':
         if exclusive:
             input_transpose = torch.cat([torch.ones([outer_step, 1], device=dev), input_transpose[:, :step-1]], dim=1)
@@ -92,10 +87,7 @@ def cumulate(self, *args):
                 outp[:, s] = linear_requantize(tmp_data, scale[s], (shift[s]-left_shifts),
                                                self.outputs[0].zerop, self.outputs[0].qmin, self.outputs[0].qmax)
         else:
-            for s in range(step):
-                data_step = input_transpose[:, s]
-                tmp_data = tmp_data * data_step
-                outp[:, s] = tmp_data
+            outp = torch.cumprod(input_transpose, dim=1).float()
     else:
         OPT_FATAL("unsupported method: %s for Cumulate in node:%s" % (method, self.name))
 
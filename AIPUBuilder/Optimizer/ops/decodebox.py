@@ -149,14 +149,12 @@ def get_roi_one_batch(dec_boxes, class_score, roi_boxes, roi_scores, score_thres
 
         label_perclass, box_num_perclass = torch.unique(class_ids, return_counts=True)
         total_class_num = label_perclass.numel()
-        start_ps = torch.cumsum(box_num_perclass, dim=0) - box_num_perclass
-        end_ps = torch.cumsum(box_num_perclass, dim=0)
-        for t in range(total_class_num):
-            idx = torch.where(class_ids == label_perclass[t])
-            cls_idx = class_ids[idx]
-            box_idx = box_ids[idx]
-            roi_boxes[start_ps[t]:end_ps[t], :] = dec_boxes[box_idx, :]
-            roi_scores[start_ps[t]:end_ps[t]] = cls_score[box_idx, cls_idx]
+        # the proposals are grouped by class, the proposals of one class keep their order
+        class_order = torch.sort(class_ids, stable=True)[1]
+        cls_idx = class_ids[class_order]
+        box_idx = box_ids[class_order]
+        roi_boxes[:class_order.numel(), :] = dec_boxes[box_idx, :]
+        roi_scores[:class_order.numel()] = cls_score[box_idx, cls_idx]
 
         label_perclass_all = torch.zeros(max_class_num)
         box_num_perclass_all = torch.zeros(max_class_num)
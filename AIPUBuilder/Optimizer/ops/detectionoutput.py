@@ -104,36 +104,24 @@ def default_detect(node, class_conf, box_encodings, crop_proposals):
 
 def _get_box_score(class_score, box_encoding, score_thresh, max_detection_num, max_class_num):
     class_num = class_score.shape[-1]
-    crop_box_num = class_score.shape[0]
     box = torch.zeros((max_detection_num, 4), dtype=torch.float32, device=class_score.device)
     score = torch.zeros((max_detection_num), dtype=torch.float32, device=class_score.device)
     box_num_perClass = torch.zeros([max_class_num], dtype=torch.float32, device=class_score.device)
 
-    outbox_idx = 0
-    box_num_perClass_list = []
-    class_label = []
-    for class_idx in range(class_num):
-        # if class_idx == 0:
-        #     continue
-        box_num_curClass = 0
-        for box_idx in range(crop_box_num):
-            if class_score[box_idx][class_idx] > score_thresh:
-                if outbox_idx >= max_detection_num:
-                    break
-                if class_idx not in class_label:
-                    class_label.append(class_idx)
-                box[outbox_idx, :] = box_encoding[box_idx * class_num + class_idx, :]
-                score[outbox_idx] = class_score[box_idx, class_idx]
-                outbox_idx += 1
-                box_num_curClass += 1
-        if box_num_curClass != 0:
-            box_num_perClass_list.append(box_num_curClass)
-    box_num_perClass[:len(box_num_perClass_list)] = torch.tensor(box_num_perClass_list, device=class_score.device)
-    total_class_num = len(class_label)
-    class_label.extend((max_class_num - total_class_num) * [0])
-    return box, score, box_num_perClass, \
-        torch.tensor(class_label, device=class_score.device), \
-        torch.tensor(total_class_num, device=class_score.device)
+    # the boxes above score_thresh ordered by class then by box, at most max_detection_num boxes are output
+    class_idx, box_idx = torch.nonzero(class_score.t() > score_thresh, as_tuple=True)
+    class_idx, box_idx = class_idx[:max_detection_num], box_idx[:max_detection_num]
+    outbox_num = class_idx.numel()
+    box[:outbox_num, :] = box_encoding[box_idx * class_num + class_idx, :].to(box.dtype)
+    score[:outbox_num] = class_score[box_idx, class_idx].to(score.dtype)
+
+    box_num_curClass = torch.bincount(class_idx, minlength=class_num)
+    class_label = torch.nonzero(box_num_curClass).flatten()
+    total_class_num = class_label.numel()
+    box_num_perClass[:total_class_num] = box_num_curClass[class_label].to(box_num_perClass.dtype)
+    class_label = torch.cat([class_label, torch.zeros([max_class_num - total_class_num],
+                                                      dtype=class_label.dtype, device=class_label.device)])
+    return box, score, box_num_perClass, class_label, torch.tensor(total_class_num, device=class_score.device)
 
 
 def get_box_score(batch_class_score, batch_box_encoding, score_thresh, max_box_num, max_class_num):
@@ -205,14 +193,8 @@ def detectionoutput(self, *args):
         box_stats = [torch.exp(th), torch.exp(tw)]
         txty_stats = [ty, tx]
         placeholders = [coords_stats, box_stats, txty_stats]
-        placeholders_output = []
-
-        for placeholder in placeholders:
-            tensor_all = placeholder[0]
-            for idx, tensor in enumerate(placeholder):
-                tensor = torch.reshape(tensor, (-1,))
-                tensor_all = tensor if idx == 0 else torch.cat((tensor_all, tensor), dim=0)
-            placeholders_output.append(tensor_all)
+        placeholders_output = [torch.cat([torch.reshape(tensor, (-1,)) for tensor in placeholder], dim=0)
+                               for placeholder in placeholders]
 
         if len(self.placeholders) < 1:
             ph0 = PyTensor(self.name+"/coords", placeholders_output[0].cpu().numpy().astype(dtype2nptype(Dtype.FP32)))
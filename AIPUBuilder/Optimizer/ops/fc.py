@@ -24,11 +24,14 @@ def fc(self, *args):
         bias += self.constants['biases'].broadcast_zerop
         if aasrb is not None and (dtype2bits(self.constants["weights"].dtype) > 8 or dtype2bits(self.inputs[0].dtype) > 8):
 
-            x = inp @ weights.T
+            x = exact_integer_linear(inp, weights)
             self.outputs[0].betensor = apply_with_activation(self, x,
                                                              *args, aasrb=(aasrb, bias))
             return self.outputs[0].betensor
-    x = nn.functional.linear(inp, weights, bias,)
+    if self.quantized:
+        x = exact_integer_linear(inp, weights, bias)
+    else:
+        x = nn.functional.linear(inp, weights, bias,)
     self.outputs[0].betensor = apply_with_activation(self, x, *args)
     return self.outputs[0].betensor
 
@@ -9,45 +9,26 @@ from AIPUBuilder.Optimizer.utils import *
 def singleGatherNd(inp_betensors, inp_indice):
     # input data last dim is keeped, if input dim == indice dim, input's shape[-1] as 1
     # indice's last dim indicate how many input's dim need be indiced
-    newshape = inp_indice.shape[:-1]+inp_betensors.shape[inp_indice.shape[-1]:]
-    out = torch.zeros(newshape, device=inp_betensors.device)
-    if out.ndim == 1:
-        out = out.unsqueeze(-1)
+    last_dims = inp_indice.shape[-1]
+    if last_dims < 1:
+        OPT_FATAL("need indice data last dim is greater than 0")
+    newshape = inp_indice.shape[:-1]+inp_betensors.shape[last_dims:]
     if inp_indice.ndim > 2:
         m = 1
         for i in range(inp_indice.ndim-1):
             m = m*inp_indice.shape[i]
-        inp_indice = inp_indice.reshape(m, inp_indice.shape[-1])
-        newshape = (m,)+inp_betensors.shape[inp_indice.shape[-1]:]
-        out = torch.zeros(newshape, device=inp_betensors.device)
+        newshape = (m,)+inp_betensors.shape[last_dims:]
+    elif len(newshape) == 1:
+        newshape = newshape + (1,)
+    inp_indice = inp_indice.reshape(-1, last_dims)
 
-    last_dims = inp_indice.shape[-1]
-    for dim in range(last_dims):
-        inp_indice[..., dim] = torch.minimum(torch.tensor(
-            inp_betensors.shape[dim]-1, device=inp_betensors.device), inp_indice[..., dim])
+    max_indice = torch.tensor(inp_betensors.shape[:last_dims], device=inp_betensors.device)
+    inp_indice = torch.minimum(max_indice - 1, inp_indice)
 
-    if(inp_betensors.ndim == inp_indice.shape[-1]):
+    if(inp_betensors.ndim == last_dims):
         inp_betensors = inp_betensors.unsqueeze(-1)
-    if inp_indice.shape[-1] == 1:
-        for seq in range(newshape[0]):
-            out[seq, ...] = inp_betensors[inp_indice[seq, :][0], ...]
-    elif inp_indice.shape[-1] == 2:
-        for seq in range(newshape[0]):
-            out[seq, ...] = inp_betensors[inp_indice[seq, :][0], inp_indice[seq, :][1], ...]
-    elif inp_indice.shape[-1] == 3:
-        for seq in range(newshape[0]):
-            out[seq, ...] = inp_betensors[inp_indice[seq, :][0], inp_indice[seq, :][1], inp_indice[seq, :][2], ...]
-    elif inp_indice.shape[-1] == 4:
-        for seq in range(newshape[0]):
-            out[seq, ...] = inp_betensors[inp_indice[seq, :][0], inp_indice[seq, :]
-                                          [1], inp_indice[seq, :][2], inp_indice[seq, :][3], ...]
-    elif inp_indice.shape[-1] == 5:
-        for seq in range(newshape[0]):
-            out[seq, ...] = inp_betensors[inp_indice[seq, :][0], inp_indice[seq, :][1],
-                                          inp_indice[seq, :][2], inp_indice[seq, :][3], inp_indice[seq, :][4], ...]
-    else:
-        OPT_FATAL("need indice data dim only is 2 or 3,4,5 ")
-    return out
+    out = inp_betensors[tuple(inp_indice[:, dim] for dim in range(last_dims))]
+    return out.float().reshape(newshape)
 
 
 register_optype('GatherND')
@@ -92,18 +73,12 @@ def gatherND(self, *args):
         outer_shape = inp_indice.shape[batch_dims:-1]
         inner_shape = inp_betensors.shape[batch_dims + index_depth:]
         newshape = batch_shape + outer_shape + inner_shape
-        out = torch.zeros(newshape, device=inp_betensors.device)
-        if out.ndim == 1:
-            out = out.unsqueeze(0)
-        new_indice = inp_indice.reshape((batchnum,)+inp_indice.shape[batch_dims:])
+        # gather all the batches at once with the batch index as the first indice
+        new_indice = inp_indice.reshape([int(batchnum), -1, index_depth])
         new_inp = inp_betensors.reshape((batchnum,)+inp_betensors.shape[batch_dims:])
-        out = out.reshape((batchnum,)+out.shape[batch_dims:])
-        for batch in range(batchnum):
-            indice_batch = new_indice[batch, ...]
-            inp_batch = new_inp[batch, ...]
-            if indice_batch.ndim == 1:
-                indice_batch = indice_batch.unsqueeze(0)
-            out[batch, ...] = singleGatherNd(inp_batch, indice_batch).reshape(out[batch, ...].shape)
+        batch_indice = torch.arange(batchnum, device=inp_indice.device).reshape([-1, 1, 1])
+        batch_indice = batch_indice.expand(-1, new_indice.shape[1], 1)
+        out = singleGatherNd(new_inp, torch.cat([batch_indice, new_indice], dim=-1).reshape([-1, index_depth + 1]))
     self.outputs[0].betensor = out.reshape(self.outputs[0].ir_shape)
 
     return self.outputs[0].betensor
@@ -29,30 +29,22 @@ def check_bottom_nodes(node):
 def _get_box_score(class_score, box_encoding, score_thresh):
     max_detection_num = box_encoding.shape[0]
     max_class_num = class_score.shape[-1]
-    crop_box_num = class_score.shape[0]
     box = torch.zeros((max_detection_num, 4), dtype=torch.float32, device=class_score.device)  # [300*80, 4]
     score = torch.zeros((max_detection_num), dtype=torch.float32, device=class_score.device)  # [300*80]
     box_num_perClass = torch.zeros([max_class_num], dtype=torch.float32, device=class_score.device)  # [80]
 
-    outbox_idx = 0
-    box_num_perClass_list = []
-    class_label = []
-    for class_idx in range(max_class_num):
-        box_num_curClass = 0
-        for box_idx in range(crop_box_num):
-            if class_score[box_idx][class_idx] > score_thresh:
-                if outbox_idx >= max_detection_num:
-                    break
-                if class_idx not in class_label:
-                    class_label.append(class_idx)
-                box[outbox_idx, :] = box_encoding[box_idx * max_class_num + class_idx, :]
-                score[outbox_idx] = class_score[box_idx, class_idx]
-                outbox_idx += 1
-                box_num_curClass += 1
-        if box_num_curClass != 0:
-            box_num_perClass_list.append(box_num_curClass)
-    box_num_perClass[:len(box_num_perClass_list)] = box_num_perClass_list
-    total_class_num = len(class_label)
+    # the boxes above score_thresh ordered by class then by box, at most max_detection_num boxes are output
+    class_idx, box_idx = torch.nonzero(class_score.t() > score_thresh, as_tuple=True)
+    class_idx, box_idx = class_idx[:max_detection_num], box_idx[:max_detection_num]
+    outbox_num = class_idx.numel()
+    box[:outbox_num, :] = box_encoding[box_idx * max_class_num + class_idx, :].to(box.dtype)
+    score[:outbox_num] = class_score[box_idx, class_idx].to(score.dtype)
+
+    box_num_curClass = torch.bincount(class_idx, minlength=max_class_num)
+    class_label = torch.nonzero(box_num_curClass).flatten()
+    total_class_num = class_label.numel()
+    box_num_perClass[:total_class_num] = box_num_curClass[class_label].to(box_num_perClass.dtype)
+    class_label = class_label.tolist()
     class_label.extend((max_class_num - total_class_num) * [0])
     return box, score, box_num_perClass, class_label, total_class_num
 
@@ -88,7 +80,35 @@ def _filter_boxes(node, boxes, min_size):
     return keep
 
 
-def NMS_F(boxes, scores, iou_thresh):
+def _greedy_nms(box_num, suppress, max_num, device):
+    # greedy suppression in blocks of the ordered boxes: the boxes of a block are suppressed by the kept boxes of
+    # former blocks, and the greedy result inside a block is the fixed point of kept = ~suppressed_by(kept).
+    # only the boxes not suppressed yet are compared, returns the first max_num kept positions in order.
+    kept = torch.zeros((box_num,), dtype=torch.bool, device=device)
+    removed = torch.zeros((box_num,), dtype=torch.bool, device=device)
+    block_size = 128
+    for begin in range(0, box_num, block_size):
+        if max_num is not None and kept[:begin].sum() >= max_num:
+            break
+        end = min(box_num, begin + block_size)
+        live = begin + torch.nonzero(~removed[begin:]).flatten()
+        rows_num = int((live < end).sum())
+        if rows_num < 1:
+            continue
+        block_suppress = suppress(live[:rows_num], live)
+        intra_suppress = torch.triu(block_suppress[:, :rows_num], diagonal=1)
+        block_kept = torch.ones((rows_num,), dtype=torch.bool, device=device)
+        while True:
+            new_kept = ~(block_kept[:, None] & intra_suppress).any(dim=0)
+            if torch.equal(new_kept, block_kept):
+                break
+            block_kept = new_kept
+        kept[live[:rows_num]] = block_kept
+        removed[live[rows_num:]] |= (block_kept[:, None] & block_suppress[:, rows_num:]).any(dim=0)
+    return torch.nonzero(kept).flatten()[:max_num]
+
+
+def NMS_F(boxes, scores, iou_thresh, max_num=None):
     x1 = boxes[:, 0]
     y1 = boxes[:, 1]
     x2 = boxes[:, 2]
@@ -96,25 +116,26 @@ def NMS_F(boxes, scores, iou_thresh):
 
     areas = (x2 - x1+1) * (y2 - y1+1)
     order = torch.argsort(torch.flatten(scores), descending=True)
-    keep = []
-    while order.shape[0] > 0:
-        i = order[0]
-        keep.append(i)
-        xx1 = torch.maximum(x1[i], x1[order[1:]])
-        yy1 = torch.maximum(y1[i], y1[order[1:]])
-        xx2 = torch.minimum(x2[i], x2[order[1:]])
-        yy2 = torch.minimum(y2[i], y2[order[1:]])
+
+    def suppress(rows, cols):
+        # [len(rows), len(cols)] whether box order[rows[i]] (kept) suppresses box order[cols[j]]
+        i, j = order[rows][:, None], order[cols][None, :]
+        xx1 = torch.maximum(x1[i], x1[j])
+        yy1 = torch.maximum(y1[i], y1[j])
+        xx2 = torch.minimum(x2[i], x2[j])
+        yy2 = torch.minimum(y2[i], y2[j])
         w = torch.maximum(torch.tensor([0], device=boxes.device), xx2 - xx1+1)
         h = torch.maximum(torch.tensor([0], device=boxes.device), yy2 - yy1+1)
 
         inter = w * h
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
-        inds = torch.where(ovr <= iou_thresh)[0]
-        order = order[inds + 1]
+        ovr = inter / (areas[i] + areas[j] - inter)
+        return ~(ovr <= iou_thresh)
+
+    keep = order[_greedy_nms(order.numel(), suppress, max_num, boxes.device)]
     return keep
 
 
-def NMS_Q(box, score, iou_threshold=None):
+def NMS_Q(box, score, iou_threshold=None, max_num=None):
     iou_thresh_shift = 11
     # currently area_shift is consistent with lib, and  will write to quantIR and will be modified
     area_shift = 15
@@ -128,26 +149,24 @@ def NMS_Q(box, score, iou_threshold=None):
     # order = score.ravel().argsort()[::-1]
 
     # order = torch.argsort(torch.flatten(score), descending=True)
-    order = torch.linspace(0, len(torch.flatten(score))-1, steps=len(torch.flatten(score)), device=score.device).long()
-    keep = []
-    while order.shape[0] > 0:
-        i = order[0]
-        keep.append(i)
-
-        xx0 = torch.maximum(x0[i], x0[order[1:]])
-        yy0 = torch.maximum(y0[i], y0[order[1:]])
-        xx1 = torch.minimum(x1[i], x1[order[1:]])
-        yy1 = torch.minimum(y1[i], y1[order[1:]])
+    # the boxes are visited in their input order
+
+    def suppress(i, j):
+        # [len(i), len(j)] whether box i (kept) suppresses box j
+        i, j = i[:, None], j[None, :]
+        xx0 = torch.maximum(x0[i], x0[j])
+        yy0 = torch.maximum(y0[i], y0[j])
+        xx1 = torch.minimum(x1[i], x1[j])
+        yy1 = torch.minimum(y1[i], y1[j])
         w = torch.maximum(torch.tensor([0], device=box.device), xx1 - xx0)
         h = torch.maximum(torch.tensor([0], device=box.device), yy1 - yy0)
 
         inter = (w * h).type(torch.int32) >> area_shift
-        union = areas[i] + areas[order[1:]] - inter
+        union = areas[i] + areas[j] - inter
         inter_area_thresh = union * iou_threshold >> int(iou_thresh_shift)
+        return ~(inter <= inter_area_thresh)
 
-        inds = torch.where(inter <= inter_area_thresh)[0]
-        order = order[inds + 1]
-
+    keep = _greedy_nms(torch.flatten(score).numel(), suppress, max_num, box.device)
     return keep
 
 
@@ -208,7 +227,6 @@ def generateproposals(self, *args):
     out_scores = torch.zeros([batch_num, max_prop], device=class_score.device)
     total_class_num = torch.ones([batch_num, 1], device=class_score.device)  # not used
     batch_index = torch.zeros([batch_num, max_prop, 1], device=class_score.device)
-    ymin_batch, xmin_batch, ymax_batch, xmax_batch = [], [], [], []
     dev = class_score.device
     if not self.quantized:
         coords_stats = []
@@ -217,43 +235,35 @@ def generateproposals(self, *args):
         ha = torch.tensor(generateproposals_context.ha, device=dev)
         ycenter_a = torch.tensor(generateproposals_context.ycenter_a, device=dev)
         xcenter_a = torch.tensor(generateproposals_context.xcenter_a, device=dev)
+        tx, ty, tw, th = box_encoding[..., 0], box_encoding[..., 1], box_encoding[..., 2], box_encoding[..., 3]
+
+        w = torch.exp(tw) * wa[0:tw.shape[1]]
+        h = torch.exp(th) * ha[0:th.shape[1]]
+        ycenter = ty * ha[0:tw.shape[1]] + ycenter_a[0:ty.shape[1]]
+        xcenter = tx * wa[0:tw.shape[1]] + xcenter_a[0:tx.shape[1]]
+
+        # upper left:[ymin,xmin], lower right:[ymax,xmin]
+        ymin = ycenter - h / 2.0
+        xmin = xcenter - w / 2.0
+        ymax = ycenter + h / 2.0
+        xmax = xcenter + w / 2.0
+
+        ymin_batch = torch.clamp(ymin, 0, image_height - 1)
+        xmin_batch = torch.clamp(xmin, 0, image_width - 1)
+        ymax_batch = torch.clamp(ymax, 0, image_height - 1)
+        xmax_batch = torch.clamp(xmax, 0, image_width - 1)
+
+        exp_th, exp_tw = torch.exp(th), torch.exp(tw)
+        ty_ha, tx_wa = ty * ha, tx * wa
         for batch in range(batch_num):
-            tx, ty, tw, th = box_encoding[batch, :, 0], box_encoding[batch,
-                                                                     :, 1], box_encoding[batch, :, 2], box_encoding[batch, :, 3]
-
-            w = torch.exp(tw) * wa[0:tw.shape[0]]
-            h = torch.exp(th) * ha[0:th.shape[0]]
-            ycenter = ty * ha[0:tw.shape[0]] + ycenter_a[0:ty.shape[0]]
-            xcenter = tx * wa[0:tw.shape[0]] + xcenter_a[0:tx.shape[0]]
-
-            # upper left:[ymin,xmin], lower right:[ymax,xmin]
-            ymin = ycenter - h / 2.0
-            xmin = xcenter - w / 2.0
-            ymax = ycenter + h / 2.0
-            xmax = xcenter + w / 2.0
-
-            ymin = torch.clamp(ymin, 0, image_height - 1)
-            xmin = torch.clamp(xmin, 0, image_width - 1)
-            ymax = torch.clamp(ymax, 0, image_height - 1)
-            xmax = torch.clamp(xmax, 0, image_width - 1)
-            ymin_batch.append(ymin)
-            xmin_batch.append(xmin)
-            ymax_batch.append(ymax)
-            xmax_batch.append(xmax)
-
             coords_stats.extend([ycenter_a, xcenter_a,
                                  ha, wa,
-                                 ymin, ymax, xmin, xmax, ycenter, xcenter, h, w,
-                                 ty * ha, tx * wa])
-            box_stats.extend([ty, tx, th, tw, torch.exp(th), torch.exp(tw)])
+                                 ymin_batch[batch], ymax_batch[batch], xmin_batch[batch], xmax_batch[batch],
+                                 ycenter[batch], xcenter[batch], h[batch], w[batch],
+                                 ty_ha[batch], tx_wa[batch]])
+            box_stats.extend([ty[batch], tx[batch], th[batch], tw[batch], exp_th[batch], exp_tw[batch]])
         placeholders = [coords_stats, box_stats]
-        placeholders_output = []
-
-        for placeholder in placeholders:
-            tensor_all = placeholder[0]
-            for idx, tensor in enumerate(placeholder):
-                tensor_all = tensor if idx == 0 else torch.cat((tensor_all, tensor), dim=0)
-            placeholders_output.append(tensor_all)
+        placeholders_output = [torch.cat(placeholder, dim=0) for placeholder in placeholders]
 
         if len(self.placeholders) < 1:
             ph0 = PyTensor(self.name+"/coords", placeholders_output[0].cpu().numpy().astype(dtype2nptype(Dtype.FP32)))
@@ -288,33 +298,27 @@ def generateproposals(self, *args):
         hout_is_signed = is_signed(self.get_constant('wh_lut').dtype)
         yout_is_signed = is_signed(self.get_constant('xy_lut').dtype)
 
-        for batch in range(batch_num):
-            tx, ty, tw, th = box_encoding[batch, :, 0], box_encoding[batch,
-                                                                     :, 1], box_encoding[batch, :, 2], box_encoding[batch, :, 3]
-
-            lut_h = lookup_lut_powerof2(th, th_lut, lut_in_bits, in_is_signed, hlut_out_bits, hout_is_signed)
-            lut_w = lookup_lut_powerof2(tw, tw_lut, lut_in_bits, in_is_signed, hlut_out_bits, hout_is_signed)
-            lut_y = lookup_lut_powerof2(ty, ty_lut, lut_in_bits, in_is_signed, ylut_out_bits, yout_is_signed)
-            lut_x = lookup_lut_powerof2(tx, tx_lut, lut_in_bits, in_is_signed, ylut_out_bits, yout_is_signed)
-
-            h = (lut_h.to(dev).int() * (ha_q).to(dev).int()) >> shift
-            w = (lut_w.to(dev).int() * (wa_q).to(dev).int()) >> shift
-            cy = ((lut_y.to(dev).int() * (ha_q).to(dev).int()) >> shift).int() + (ycenter_a_q).to(dev).int()
-            cx = ((lut_x.to(dev).int() * (wa_q).to(dev).int()) >> shift).int() + (xcenter_a_q).to(dev).int()
-
-            ymin = cy - torch.div(h, 2, rounding_mode='trunc')
-            xmin = cx - torch.div(w, 2, rounding_mode='trunc')
-            ymax = cy + torch.div(h, 2, rounding_mode='trunc')
-            xmax = cx + torch.div(w, 2, rounding_mode='trunc')
-
-            ymin = torch.clamp(ymin, 0, image_height - anchor_scale)
-            ymax = torch.clamp(ymax, 0, image_height - anchor_scale)
-            xmin = torch.clamp(xmin, 0, image_width - anchor_scale)
-            xmax = torch.clamp(xmax, 0, image_width - anchor_scale)
-            ymin_batch.append(ymin)
-            xmin_batch.append(xmin)
-            ymax_batch.append(ymax)
-            xmax_batch.append(xmax)
+        tx, ty, tw, th = box_encoding[..., 0], box_encoding[..., 1], box_encoding[..., 2], box_encoding[..., 3]
+
+        lut_h = lookup_lut_powerof2(th, th_lut, lut_in_bits, in_is_signed, hlut_out_bits, hout_is_signed)
+        lut_w = lookup_lut_powerof2(tw, tw_lut, lut_in_bits, in_is_signed, hlut_out_bits, hout_is_signed)
+        lut_y = lookup_lut_powerof2(ty, ty_lut, lut_in_bits, in_is_signed, ylut_out_bits, yout_is_signed)
+        lut_x = lookup_lut_powerof2(tx, tx_lut, lut_in_bits, in_is_signed, ylut_out_bits, yout_is_signed)
+
+        h = (lut_h.to(dev).int() * (ha_q).to(dev).int()) >> shift
+        w = (lut_w.to(dev).int() * (wa_q).to(dev).int()) >> shift
+        cy = ((lut_y.to(dev).int() * (ha_q).to(dev).int()) >> shift).int() + (ycenter_a_q).to(dev).int()
+        cx = ((lut_x.to(dev).int() * (wa_q).to(dev).int()) >> shift).int() + (xcenter_a_q).to(dev).int()
+
+        ymin = cy - torch.div(h, 2, rounding_mode='trunc')
+        xmin = cx - torch.div(w, 2, rounding_mode='trunc')
+        ymax = cy + torch.div(h, 2, rounding_mode='trunc')
+        xmax = cx + torch.div(w, 2, rounding_mode='trunc')
+
+        ymin_batch = torch.clamp(ymin, 0, image_height - anchor_scale)
+        ymax_batch = torch.clamp(ymax, 0, image_height - anchor_scale)
+        xmin_batch = torch.clamp(xmin, 0, image_width - anchor_scale)
+        xmax_batch = torch.clamp(xmax, 0, image_width - anchor_scale)
 
     for batch in range(batch_num):
         bboxes = torch.stack((xmin_batch[batch], ymin_batch[batch], xmax_batch[batch], ymax_batch[batch]), dim=-1)
@@ -331,14 +335,14 @@ def generateproposals(self, *args):
 
         iou_threshold = self.get_param('iou_threshold')
         if not self.quantized:
-            keep = NMS_F(bboxes, proposal_scores, iou_threshold)
+            keep = NMS_F(bboxes, proposal_scores, iou_threshold, post_nms_topn)
         else:
-            keep = NMS_Q(bboxes, proposal_scores, int(iou_threshold))
+            keep = NMS_Q(bboxes, proposal_scores, int(iou_threshold), post_nms_topn)
 
         keep = keep[:post_nms_topn]
 
         out_boxes[batch, 0:len(keep), :] = bboxes[keep, :]
-        out_scores[batch, :len(keep)] = proposal_scores[[keep]]
+        out_scores[batch, :len(keep)] = proposal_scores[keep]
 
         total_class_num[batch] = len(keep)
 
@@ -38,11 +38,8 @@ def gruv3(self, *args):
     initial_H = inp1.betensor.float()
     start_data_idx = self.current_batch_idx * batch_size
 
-    start_initial_idx = start_data_idx % initial_batch
-    in_state = initial_H[start_initial_idx: start_initial_idx + 1]
-    for initial_idx in range(1, batch_size):
-        current_initial_idx = (start_data_idx + initial_idx) % initial_batch
-        in_state = torch.cat((in_state, initial_H[current_initial_idx: current_initial_idx + 1]), dim=0)
+    data_idx = start_data_idx + torch.arange(batch_size, device=initial_H.device)
+    in_state = initial_H[data_idx % initial_batch]
 
     w = self.constants["weights"].betensor.float()
     bias = self.constants['biases'].betensor.float()
@@ -80,64 +77,63 @@ def gruv3(self, *args):
 
         gates_bias = bias[: 2 * cell_size]
         candidate_bias = bias[2 * cell_size: 3 * cell_size]
-        for b in range(batch_size):
-            state = torch.unsqueeze(in_state[b], dim=0)
-            state_all = torch.zeros([1, cell_size], device=inp0.betensor.device, dtype=torch.float)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size))
-                if 'version' in self.params and self.params['version'] == "GRUV1":
-
-                    gate_kernel_x_f = gates_kernel[:input_size, :]
-                    gate_kernel_h_f = gates_kernel[input_size:, :]
-                    candidate_kernel_x_f = candidate_kernel[:input_size, :]
-                    candidate_kernel_h_f = candidate_kernel[input_size:, :]
-
-                    hidden_bias = bias[3 * cell_size:]
-                    h_by_wg_f = torch.matmul(state, gate_kernel_h_f)
-                    x_by_wg_f = torch.add(torch.matmul(in_ts, gate_kernel_x_f),
-                                          torch.unsqueeze(gates_bias, 0))
-
-                    mat_sum_f = x_by_wg_f + h_by_wg_f
-                    mat_sum_f = torch.clamp(mat_sum_f, -threshold, threshold)
-                    f_lut_in[b, ts, :] = torch.squeeze(mat_sum_f, 0)
-                    sig_lut_out_f = g_rnn_activation_func[activations_list[0]][1](mat_sum_f)
-                    f_lut_out[b, ts, :] = torch.squeeze(sig_lut_out_f, 0)
-                    r_f, u_f = torch.chunk(sig_lut_out_f, 2, dim=1)
-
-                    h_by_wc_f = torch.matmul(state, candidate_kernel_h_f)
-                    h_by_wc_f = torch.add(h_by_wc_f, torch.unsqueeze(hidden_bias, 0))
-                    hidden_gate_out[b, ts, :] = torch.squeeze(h_by_wc_f)
-                    r_hwc_f = torch.multiply(r_f, h_by_wc_f)
-                    x_by_wc_f = torch.add(torch.matmul(in_ts, candidate_kernel_x_f), torch.unsqueeze(candidate_bias, 0))
-                    mat_sum2_f = x_by_wc_f + r_hwc_f
-                    mat_sum2_f = torch.clamp(mat_sum2_f, -threshold, threshold)
-                    g_lut_in[b, ts, :] = torch.squeeze(mat_sum2_f, 0)
-                    c_f = g_rnn_activation_func[activations_list[1]][1](mat_sum2_f)
-                    g_lut_out[b, ts, :] = torch.squeeze(c_f, 0)
-                    state = torch.multiply((1.0 - u_f), c_f) + torch.multiply(u_f, state)
-                else:  # GRUV3
-                    gate_input = torch.cat((in_ts, state), dim=1)
-                    sum0 = torch.add(torch.matmul(gate_input, gates_kernel), torch.unsqueeze(gates_bias, 0))  # [1,1024]
-                    sum0 = torch.clamp(sum0, -threshold, threshold)
-                    f_lut_in[b, ts, :] = torch.squeeze(sum0, 0)
-                    f_out = g_rnn_activation_func[activations_list[0]][1](sum0)
-                    f_lut_out[b, ts, :] = torch.squeeze(f_out, 0)
-                    r, u = torch.chunk(f_out, 2, dim=1)
-                    state_r = torch.multiply(state, r)
-
-                    candidate_input = torch.cat((in_ts, state_r), dim=1)
-                    sum1 = torch.add(torch.matmul(candidate_input, candidate_kernel),
-                                     torch.unsqueeze(candidate_bias, 0))
-                    sum1 = torch.clamp(sum1, -threshold, threshold)
-                    g_lut_in[b, ts, :] = torch.squeeze(sum1, 0)
-                    c = g_rnn_activation_func[activations_list[1]][1](sum1)
-                    g_lut_out[b, ts, :] = torch.squeeze(c, 0)
-                    state = torch.multiply((1.0 - u), c) + torch.multiply(u, state)
-                state_all = state if ts == 0 else torch.cat((state_all, state), dim=0)
-
-            state_last = state if b == 0 else torch.cat((state_last, state), dim=0)
-            state_all = torch.unsqueeze(state_all, dim=0)
-            state_batch = state_all if b == 0 else torch.cat((state_batch, state_all), dim=0)
+        # the whole batch steps forward together, only the timesteps are sequential
+        state = in_state
+        state_all = []
+        for ts in range(time_step):
+            in_ts = input_seq[:, ts, :]
+            if 'version' in self.params and self.params['version'] == "GRUV1":
+
+                gate_kernel_x_f = gates_kernel[:input_size, :]
+                gate_kernel_h_f = gates_kernel[input_size:, :]
+                candidate_kernel_x_f = candidate_kernel[:input_size, :]
+                candidate_kernel_h_f = candidate_kernel[input_size:, :]
+
+                hidden_bias = bias[3 * cell_size:]
+                h_by_wg_f = torch.matmul(state, gate_kernel_h_f)
+                x_by_wg_f = torch.add(torch.matmul(in_ts, gate_kernel_x_f),
+                                      torch.unsqueeze(gates_bias, 0))
+
+                mat_sum_f = x_by_wg_f + h_by_wg_f
+                mat_sum_f = torch.clamp(mat_sum_f, -threshold, threshold)
+                f_lut_in[:, ts, :] = mat_sum_f
+                sig_lut_out_f = g_rnn_activation_func[activations_list[0]][1](mat_sum_f)
+                f_lut_out[:, ts, :] = sig_lut_out_f
+                r_f, u_f = torch.chunk(sig_lut_out_f, 2, dim=1)
+
+                h_by_wc_f = torch.matmul(state, candidate_kernel_h_f)
+                h_by_wc_f = torch.add(h_by_wc_f, torch.unsqueeze(hidden_bias, 0))
+                hidden_gate_out[:, ts, :] = h_by_wc_f
+                r_hwc_f = torch.multiply(r_f, h_by_wc_f)
+                x_by_wc_f = torch.add(torch.matmul(in_ts, candidate_kernel_x_f), torch.unsqueeze(candidate_bias, 0))
+                mat_sum2_f = x_by_wc_f + r_hwc_f
+                mat_sum2_f = torch.clamp(mat_sum2_f, -threshold, threshold)
+                g_lut_in[:, ts, :] = mat_sum2_f
+                c_f = g_rnn_activation_func[activations_list[1]][1](mat_sum2_f)
+                g_lut_out[:, ts, :] = c_f
+                state = torch.multiply((1.0 - u_f), c_f) + torch.multiply(u_f, state)
+            else:  # GRUV3
+                gate_input = torch.cat((in_ts, state), dim=1)
+                sum0 = torch.add(torch.matmul(gate_input, gates_kernel), torch.unsqueeze(gates_bias, 0))  # [b,1024]
+                sum0 = torch.clamp(sum0, -threshold, threshold)
+                f_lut_in[:, ts, :] = sum0
+                f_out = g_rnn_activation_func[activations_list[0]][1](sum0)
+                f_lut_out[:, ts, :] = f_out
+                r, u = torch.chunk(f_out, 2, dim=1)
+                state_r = torch.multiply(state, r)
+
+                candidate_input = torch.cat((in_ts, state_r), dim=1)
+                sum1 = torch.add(torch.matmul(candidate_input, candidate_kernel),
+                                 torch.unsqueeze(candidate_bias, 0))
+                sum1 = torch.clamp(sum1, -threshold, threshold)
+                g_lut_in[:, ts, :] = sum1
+                c = g_rnn_activation_func[activations_list[1]][1](sum1)
+                g_lut_out[:, ts, :] = c
+                state = torch.multiply((1.0 - u), c) + torch.multiply(u, state)
+            state_all.append(state)
+
+        state_last = state
+        state_batch = torch.stack(state_all, dim=1)
         placeholders_list = ['state_batch', 'f_lut_in', 'f_lut_out', 'g_lut_in', 'g_lut_out', 'hidden_gate_out']
         if len(self.placeholders) < len(placeholders_list):
             for placeholder_name in placeholders_list:
@@ -210,78 +206,83 @@ def gruv3(self, *args):
             shift2_zeros_tensor+aasrb, shift[2]) + mtp_trsh_c_x
         itp_trsh_c = shift3_zeros_tensor if input_bits <= 8 else torch.min(shift3_zeros_tensor+aasrb, shift[3])
 
-        for b in range(batch_size):
-            state = torch.unsqueeze(in_state[b], dim=0).float()
-            state_all = torch.zeros([1, cell_size], device=inp0.betensor.device, dtype=torch.float)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size)).float()
-                x_by_wg = torch.matmul(in_ts, wx_gk_q)
-                h_by_wg = torch.matmul(state, wh_gk_q)
-                if input_bits <= 8:
-                    re_scaled_h_by_wg = linear_requantize(h_by_wg, scale[0], shift[0], 0, act_qmin, act_qmax)
-
-                    mat_sum = x_by_wg + re_scaled_h_by_wg + torch.unsqueeze(gates_bias_q, 0)
-                    rescaled_mat_sum = linear_requantize(mat_sum, scale[1], shift[1], 0, qmin, qmax)
-                    rt_zt_lut_out = lookup_lut_powerof2(rescaled_mat_sum, rt_table,
-                                                        lut_in_bits, True, lut_out_bits, True)
-                    r, u = torch.chunk(rt_zt_lut_out, 2, dim=1)
-
-                    x_by_wc = torch.matmul(in_ts, wx_ck_q)
-                    if 'version' in self.params and self.params['version'] == "GRUV1":
-                        hidden_scale = self.params["hidden_scale_value"]
-                        hidden_shift = self.params["hidden_shift_value"]
-                        h_by_wc = torch.add(torch.matmul(state, wh_ck_q), torch.unsqueeze(hidden_bias_q, 0))
-                        h_by_wc = linear_requantize(h_by_wc, hidden_scale, hidden_shift, 0, qmin, qmax)
-                        h_by_wc = torch.multiply(r, h_by_wc)
-                    else:
-                        factor = 256.0
-                        hprev_r = torch.round(torch.div(torch.multiply(r, state), factor))
-                        h_by_wc = torch.matmul(hprev_r, wh_ck_q)
-                    re_scaled_h_by_wc = linear_requantize(h_by_wc, scale[2], shift[2], 0, act_qmin, act_qmax)
-                    mat_sum2 = x_by_wc + re_scaled_h_by_wc + torch.unsqueeze(candidate_bias_q, 0)
-
-                    rescaled_mat_sum2 = linear_requantize(mat_sum2, scale[3], shift[3], 0, qmin, qmax)
-                else:  # int16
-                    h_by_wg = linear_requantize(h_by_wg, 1, mtp_trsh_rz_h, 0, act_qmin, act_qmax)
-                    re_scaled_h_by_wg = linear_requantize(h_by_wg, scale[0], itp_trsh_rz_h, 0, act_qmin, act_qmax)
-                    x_by_wg = linear_requantize(x_by_wg, 1, mtp_trsh_rz_x, 0, act_qmin, act_qmax)
-                    gates_bias_q = linear_requantize(gates_bias_q, 1, mtp_trsh_rz_x, 0, act_qmin, act_qmax)
-                    mat_sum = x_by_wg + re_scaled_h_by_wg + torch.unsqueeze(gates_bias_q, 0)
-                    rescaled_mat_sum = linear_requantize(mat_sum, scale[1], itp_trsh_rz, 0, qmin, qmax)
-                    rt_zt_lut_out = lookup_lut_powerof2(rescaled_mat_sum, rt_table,
-                                                        lut_in_bits, True, lut_out_bits, True)
-                    r, u = torch.chunk(rt_zt_lut_out, 2, dim=1)
-
-                    x_by_wc = torch.matmul(in_ts, wx_ck_q)
-                    if 'version' in self.params and self.params['version'] == "GRUV1":
-                        hidden_scale = self.params["hidden_scale_value"]
-                        hidden_shift = self.params["hidden_shift_value"]
-                        hidden_bias_q = linear_requantize(hidden_bias_q, 1, mtp_trsh_c_h, 0, act_qmin, act_qmax)
-                        h_by_wc = torch.add(torch.matmul(state, wh_ck_q), torch.unsqueeze(hidden_bias_q, 0))
-                        h_by_wc = linear_requantize(h_by_wc, hidden_scale, hidden_shift, 0, qmin, qmax)
-                        h_by_wc = torch.multiply(r, h_by_wc)
-                    else:
-                        factor = 65536.0
-                        hprev_r = torch.round(torch.div(torch.multiply(r, state), factor))
-                        h_by_wc = torch.matmul(hprev_r, wh_ck_q)
-                    x_by_wc = linear_requantize(x_by_wc, 1, mtp_trsh_c_x, 0, act_qmin, act_qmax)
-                    h_by_wc = linear_requantize(h_by_wc, 1, mtp_trsh_c_h, 0, act_qmin, act_qmax)
-                    re_scaled_h_by_wc = linear_requantize(h_by_wc, scale[2], itp_trsh_c_h, 0, act_qmin, act_qmax)
-                    candidate_bias_q = linear_requantize(candidate_bias_q, 1, mtp_trsh_c_x, 0, act_qmin, act_qmax)
-                    mat_sum2 = x_by_wc + re_scaled_h_by_wc + torch.unsqueeze(candidate_bias_q, 0)
-                    rescaled_mat_sum2 = linear_requantize(mat_sum2, scale[3], itp_trsh_c, 0, qmin, qmax)
-                c = lookup_lut_powerof2(rescaled_mat_sum2, ht_table, lut_in_bits, True, lut_out_bits, True)
-                max_pre = qmax
-                c_times_1_minus_u = (max_pre - u) * c
-                rescaled_c_times_1_minus_u = linear_requantize(
-                    c_times_1_minus_u, scale[4], shift[4], 0, act_qmin, act_qmax)
-                state = rescaled_c_times_1_minus_u + u * state
-                state = linear_requantize(state, scale[5], shift[5], 0, qmin+1, qmax)
-                state_all = state if ts == 0 else torch.cat((state_all, state), dim=0)
-
-            state_last = state if b == 0 else torch.cat((state_last, state), dim=0)
-            state_all = torch.unsqueeze(state_all, dim=0)
-            state_batch = state_all if b == 0 else torch.cat((state_batch, state_all), dim=0)
+        if input_bits > 8:
+            gates_bias_q = linear_requantize(gates_bias_q, 1, mtp_trsh_rz_x, 0, act_qmin, act_qmax)
+            candidate_bias_q = linear_requantize(candidate_bias_q, 1, mtp_trsh_c_x, 0, act_qmin, act_qmax)
+            if 'version' in self.params and self.params['version'] == "GRUV1":
+                hidden_bias_q = linear_requantize(hidden_bias_q, 1, mtp_trsh_c_h, 0, act_qmin, act_qmax)
+
+        def int_matmul(x, y):
+            # the operands are integers, accumulating in double is exact whatever the batch size is
+            return torch.matmul(x.double(), y.double()).float()
+
+        state = in_state.float()
+        state_all = []
+        for ts in range(time_step):
+            in_ts = input_seq[:, ts, :].float()
+            x_by_wg = int_matmul(in_ts, wx_gk_q)
+            h_by_wg = int_matmul(state, wh_gk_q)
+            if input_bits <= 8:
+                re_scaled_h_by_wg = linear_requantize(h_by_wg, scale[0], shift[0], 0, act_qmin, act_qmax)
+
+                mat_sum = x_by_wg + re_scaled_h_by_wg + torch.unsqueeze(gates_bias_q, 0)
+                rescaled_mat_sum = linear_requantize(mat_sum, scale[1], shift[1], 0, qmin, qmax)
+                rt_zt_lut_out = lookup_lut_powerof2(rescaled_mat_sum, rt_table,
+                                                    lut_in_bits, True, lut_out_bits, True)
+                r, u = torch.chunk(rt_zt_lut_out, 2, dim=1)
+
+                x_by_wc = int_matmul(in_ts, wx_ck_q)
+                if 'version' in self.params and self.params['version'] == "GRUV1":
+                    hidden_scale = self.params["hidden_scale_value"]
+                    hidden_shift = self.params["hidden_shift_value"]
+                    h_by_wc = torch.add(int_matmul(state, wh_ck_q), torch.unsqueeze(hidden_bias_q, 0))
+                    h_by_wc = linear_requantize(h_by_wc, hidden_scale, hidden_shift, 0, qmin, qmax)
+                    h_by_wc = torch.multiply(r, h_by_wc)
+                else:
+                    factor = 256.0
+                    hprev_r = torch.round(torch.div(torch.multiply(r, state), factor))
+                    h_by_wc = int_matmul(hprev_r, wh_ck_q)
+                re_scaled_h_by_wc = linear_requantize(h_by_wc, scale[2], shift[2], 0, act_qmin, act_qmax)
+                mat_sum2 = x_by_wc + re_scaled_h_by_wc + torch.unsqueeze(candidate_bias_q, 0)
+
+                rescaled_mat_sum2 = linear_requantize(mat_sum2, scale[3], shift[3], 0, qmin, qmax)
+            else:  # int16
+                h_by_wg = linear_requantize(h_by_wg, 1, mtp_trsh_rz_h, 0, act_qmin, act_qmax)
+                re_scaled_h_by_wg = linear_requantize(h_by_wg, scale[0], itp_trsh_rz_h, 0, act_qmin, act_qmax)
+                x_by_wg = linear_requantize(x_by_wg, 1, mtp_trsh_rz_x, 0, act_qmin, act_qmax)
+                mat_sum = x_by_wg + re_scaled_h_by_wg + torch.unsqueeze(gates_bias_q, 0)
+                rescaled_mat_sum = linear_requantize(mat_sum, scale[1], itp_trsh_rz, 0, qmin, qmax)
+                rt_zt_lut_out = lookup_lut_powerof2(rescaled_mat_sum, rt_table,
+                                                    lut_in_bits, True, lut_out_bits, True)
+                r, u = torch.chunk(rt_zt_lut_out, 2, dim=1)
+
+                x_by_wc = int_matmul(in_ts, wx_ck_q)
+                if 'version' in self.params and self.params['version'] == "GRUV1":
+                    hidden_scale = self.params["hidden_scale_value"]
+                    hidden_shift = self.params["hidden_shift_value"]
+                    h_by_wc = torch.add(int_matmul(state, wh_ck_q), torch.unsqueeze(hidden_bias_q, 0))
+                    h_by_wc = linear_requantize(h_by_wc, hidden_scale, hidden_shift, 0, qmin, qmax)
+                    h_by_wc = torch.multiply(r, h_by_wc)
+                else:
+                    factor = 65536.0
+                    hprev_r = torch.round(torch.div(torch.multiply(r, state), factor))
+                    h_by_wc = int_matmul(hprev_r, wh_ck_q)
+                x_by_wc = linear_requantize(x_by_wc, 1, mtp_trsh_c_x, 0, act_qmin, act_qmax)
+                h_by_wc = linear_requantize(h_by_wc, 1, mtp_trsh_c_h, 0, act_qmin, act_qmax)
+                re_scaled_h_by_wc = linear_requantize(h_by_wc, scale[2], itp_trsh_c_h, 0, act_qmin, act_qmax)
+                mat_sum2 = x_by_wc + re_scaled_h_by_wc + torch.unsqueeze(candidate_bias_q, 0)
+                rescaled_mat_sum2 = linear_requantize(mat_sum2, scale[3], itp_trsh_c, 0, qmin, qmax)
+            c = lookup_lut_powerof2(rescaled_mat_sum2, ht_table, lut_in_bits, True, lut_out_bits, True)
+            max_pre = qmax
+            c_times_1_minus_u = (max_pre - u) * c
+            rescaled_c_times_1_minus_u = linear_requantize(
+                c_times_1_minus_u, scale[4], shift[4], 0, act_qmin, act_qmax)
+            state = rescaled_c_times_1_minus_u + u * state
+            state = linear_requantize(state, scale[5], shift[5], 0, qmin+1, qmax)
+            state_all.append(state)
+
+        state_last = state
+        state_batch = torch.stack(state_all, dim=1)
 
     if direction == 'reverse':
         state_batch = torch.flip(state_batch, [1])
@@ -2,10 +2,12 @@
 # Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
 
 import torch
+import functools
 
 from AIPUBuilder.Optimizer.framework import *
 
 from AIPUBuilder.Optimizer.utils import *
+from AIPUBuilder.Optimizer.ops.roialign import roi_chunks
 import torch.nn.functional as Func
 
 '''
@@ -51,33 +53,28 @@ def _scaler(i, ratio, mode, input_size, out_size):
         return i * (1. / ratio) if ratio is not None else (i * input_size / out_size)
 
 
-def accelerate_resize_bilinear(in_data, output_shape, mode, ratio_x, ratio_y, coordination_shift):
-    batch, out_h, out_w, out_c = output_shape
-    in_h, in_w = in_data.shape[1:3]
+@functools.lru_cache(maxsize=64)
+def _bilinear_tables(in_h, in_w, out_h, out_w, mode, ratio_x, ratio_y, coordination_shift, device):
+    # the flat input indexes of the 4 neighbours and their [out_h * out_w, 1] weights, cached per resize shape
     scale_num = 2 ** coordination_shift
     quantized = False if coordination_shift == 0 else True
-    y = _scaler(torch.arange(out_h, device=in_data.device), ratio_y, mode, in_h, out_h)
-    x = _scaler(torch.arange(out_w, device=in_data.device), ratio_x, mode, in_w, out_w)
+    y = _scaler(torch.arange(out_h, device=device), ratio_y, mode, in_h, out_h)
+    x = _scaler(torch.arange(out_w, device=device), ratio_x, mode, in_w, out_w)
 
     y_floor = torch.floor(y).int()
     y_ceil = torch.ceil(y).int()
     x_floor = torch.floor(x).int()
     x_ceil = torch.ceil(x).int()
 
-    y0 = torch.maximum(y_floor, torch.tensor(0, device=in_data.device))
-    y1 = torch.minimum(y_ceil, torch.tensor(in_h - 1, device=in_data.device))
-    x0 = torch.maximum(x_floor, torch.tensor(0, device=in_data.device))
-    x1 = torch.minimum(x_ceil, torch.tensor(in_w - 1, device=in_data.device))
-
-    y0_x0 = torch.cartesian_prod(y0, x0).long()
-    y0_x1 = torch.cartesian_prod(y0, x1).long()
-    y1_x0 = torch.cartesian_prod(y1, x0).long()
-    y1_x1 = torch.cartesian_prod(y1, x1).long()
+    y0 = torch.maximum(y_floor, torch.tensor(0, device=device))
+    y1 = torch.minimum(y_ceil, torch.tensor(in_h - 1, device=device))
+    x0 = torch.maximum(x_floor, torch.tensor(0, device=device))
+    x1 = torch.minimum(x_ceil, torch.tensor(in_w - 1, device=device))
 
-    f00 = in_data[:, y0_x0[:, 0], y0_x0[:, 1], :]
-    f01 = in_data[:, y0_x1[:, 0], y0_x1[:, 1], :]
-    f10 = in_data[:, y1_x0[:, 0], y1_x0[:, 1], :]
-    f11 = in_data[:, y1_x1[:, 0], y1_x1[:, 1], :]
+    indexes = []
+    for yi, xi in [(y0, x0), (y0, x1), (y1, x0), (y1, x1)]:
+        yx = torch.cartesian_prod(yi, xi).long()
+        indexes.append(yx[:, 0] * in_w + yx[:, 1])
 
     y0_lerp = y - y0
     x0_lerp = x - x0
@@ -98,11 +95,23 @@ def accelerate_resize_bilinear(in_data, output_shape, mode, ratio_x, ratio_y, co
         Q10 = torch.floor(Q10 + 0.5)
         Q01 = torch.floor(Q01 + 0.5)
         Q11 = torch.floor(Q11 + 0.5)
+    weights = [q.reshape([-1, 1]) for q in [Q00, Q01, Q10, Q11]]
+    return indexes, weights
+
+
+def accelerate_resize_bilinear(in_data, output_shape, mode, ratio_x, ratio_y, coordination_shift):
+    batch, out_h, out_w, out_c = output_shape
+    in_h, in_w = in_data.shape[1:3]
+    scale_num = 2 ** coordination_shift
+    quantized = False if coordination_shift == 0 else True
+    (i00, i01, i10, i11), (Q00, Q01, Q10, Q11) = _bilinear_tables(in_h, in_w, out_h, out_w, mode, ratio_x, ratio_y,
+                                                                  coordination_shift, in_data.device)
+    flat_data = in_data.reshape(in_data.shape[0], in_h * in_w, -1)
+    f00 = flat_data.index_select(1, i00)
+    f01 = flat_data.index_select(1, i01)
+    f10 = flat_data.index_select(1, i10)
+    f11 = flat_data.index_select(1, i11)
 
-    Q00 = Q00.reshape([-1, 1]).repeat(batch, 1, out_c)
-    Q01 = Q01.reshape([-1, 1]).repeat(batch, 1, out_c)
-    Q10 = Q10.reshape([-1, 1]).repeat(batch, 1, out_c)
-    Q11 = Q11.reshape([-1, 1]).repeat(batch, 1, out_c)
     bilinear_out = (f00 * Q00 + f01 * Q01 + f10 * Q10 + f11 * Q11) / scale_num
     bilinear_out = torch.round(bilinear_out) if quantized else bilinear_out
     outt = bilinear_out.reshape(*output_shape)
@@ -126,56 +135,65 @@ def resize_bilinear(input_data, params):
 
 
 def compute_weight_coefficients(input_size, output_size, rscale, mode, exclude_outside, dev):
-    def filter(x):
-        if x < 0.0:
-            x = -x
-        if x < 1.0:
-            return 1.0 - x
-        return 0.0
-
+    # the [windowsize] linear weights of all the output coordinates, the window positions are iterated in order
+    # to accumulate the total weights and to merge the outside weights in the same order as a scalar loop
     import math
     scale = 1 / rscale if rscale is not None else (input_size / output_size)
     support = scale if (scale >= 1.0) else 1.0
     windowsize = int(math.ceil(support)) * 2 + 1
     inv_scale = 1 / (scale) if scale >= 1.0 else 1.0
-    bound_w_min = []
-    bound_w_max = []
-    scale_buffer = torch.zeros([windowsize * output_size], device=dev)
-    for coord in range(output_size):
-        center = 0.5 + _scaler(torch.tensor(coord), rscale, mode, input_size, output_size)
-        total_weight = 0.0
-        fmin = math.floor(center - support + 0.5)
-        fmax = math.floor(center + support + 0.5)
-        xmin_real = int(fmin)
-        xmax_real = int(fmax)
-        xmin_cut = max(0, xmin_real)
-        xmax_cut = min(input_size, xmax_real)
-        bound_w_min.append(xmin_cut)
-        bound_w_max.append(xmax_cut)
-        xmin = xmin_cut if exclude_outside else xmin_real
-        xmax = xmax_cut if exclude_outside else xmax_real
-        terp = xmax - xmin
-        offset = coord * windowsize
-        for x in range(terp):
-            weight = filter((x + xmin - center + 0.5) * inv_scale)
-            scale_buffer[offset + x] = weight
-            total_weight += weight
-        xmax -= xmin
-        if not exclude_outside:
-            neg_xsize = -xmin if xmin < 0 else 0
-            for i in range(neg_xsize):
-                scale_buffer[offset + neg_xsize] += scale_buffer[offset + i]
-            bound_xsize = (xmax + xmin - input_size) if (xmax + xmin > input_size) else 0
-            for x in range(xmax - bound_xsize, xmax):
-                scale_buffer[offset + xmax - bound_xsize - 1] += scale_buffer[offset + x]
-            x = 0
-            while (neg_xsize | bound_xsize) > 0 and (x < xmax_cut - xmin_cut):
-                scale_buffer[offset + x] = scale_buffer[offset + x + neg_xsize]
-                x += 1
-        total_weight_inv = 1.0 if total_weight == 0.0 else 1.0 / total_weight
-        for x in range(xmax_cut - xmin_cut):
-            scale_buffer[offset + x] *= total_weight_inv
-    return scale_buffer, torch.tensor(bound_w_min, device=dev), torch.tensor(bound_w_max, device=dev)
+    rows = torch.arange(output_size)
+    positions = torch.arange(windowsize)
+
+    center = 0.5 + _scaler(rows, rscale, mode, input_size, output_size)
+    xmin_real = torch.floor(center - support + 0.5).long()
+    xmax_real = torch.floor(center + support + 0.5).long()
+    xmin_cut = torch.clamp(xmin_real, min=0)
+    xmax_cut = torch.clamp(xmax_real, max=input_size)
+    xmin = xmin_cut if exclude_outside else xmin_real
+    xmax = xmax_cut if exclude_outside else xmax_real
+    terp = xmax - xmin
+    cut_size = xmax_cut - xmin_cut
+
+    scale_buffer = torch.zeros([output_size, windowsize])
+    total_weight = torch.zeros([output_size], dtype=torch.float64)
+    for x in range(windowsize):
+        weight = torch.abs(((x + xmin).double() - center + 0.5) * inv_scale)
+        weight = torch.where((weight < 1.0) & (x < terp), 1.0 - weight, torch.zeros_like(weight))
+        scale_buffer[:, x] = weight
+        total_weight = total_weight + weight
+    if not exclude_outside:
+        def accumulate(target, mask):
+            # scale_buffer[target] += scale_buffer[x] for the masked rows, x in order
+            target = target.reshape(-1, 1)
+            for x in range(windowsize):
+                value = scale_buffer.gather(1, target) + torch.where(mask(x), scale_buffer[:, x], 0.0).reshape(-1, 1)
+                scale_buffer.scatter_(1, target, value)
+
+        neg_xsize = torch.clamp(-xmin, min=0)
+        accumulate(torch.clamp(neg_xsize, max=windowsize - 1), lambda x: x < neg_xsize)
+        bound_xsize = torch.clamp(xmax - input_size, min=0)
+        bound_target = terp - bound_xsize - 1
+        accumulate(torch.clamp(bound_target, min=0),
+                   lambda x: (bound_target >= 0) & (x >= terp - bound_xsize) & (x < terp))
+        shifted = scale_buffer.gather(1, torch.clamp(positions + neg_xsize.reshape(-1, 1), max=windowsize - 1))
+        shift_mask = (positions < cut_size.reshape(-1, 1)) & (neg_xsize > 0).reshape(-1, 1)
+        scale_buffer = torch.where(shift_mask, shifted, scale_buffer)
+    total_weight_inv = torch.where(total_weight == 0.0, torch.ones_like(total_weight), 1.0 / total_weight)
+    scale_buffer = torch.where(positions < cut_size.reshape(-1, 1),
+                               (scale_buffer.double() * total_weight_inv.reshape(-1, 1)).float(), scale_buffer)
+    return scale_buffer.reshape(-1).to(dev), xmin_cut.to(dev), xmax_cut.to(dev)
+
+
+def _window_groups(bound_min, bound_max, windowsize):
+    # group the output coordinates by their window size, yields (coordinates, [coordinates, size] input indexes,
+    # [coordinates, size] indexes of their weights in the coefficients buffer)
+    bound_min = bound_min.long()
+    sizes = bound_max.long() - bound_min
+    for size in torch.unique(sizes).tolist():
+        coords = torch.nonzero(sizes == size).reshape(-1)
+        taps = torch.arange(size, device=coords.device)
+        yield coords, bound_min[coords].reshape(-1, 1) + taps, coords.reshape(-1, 1) * windowsize + taps
 
 
 def resize_bilinear_antialias(self, input_data, params):
@@ -224,27 +242,21 @@ def resize_bilinear_antialias(self, input_data, params):
 
     ############################################forward##################################################
     # horizon interpolate
-    for w in range(output_width):
-        xmin = bound_x_min[w]
-        xmax = bound_x_max[w]
-        tmp_data = (input_data[:, :, xmin:xmax, :] * weight_coefficients_x[w *
-                                                                           windowsize_w: w * windowsize_w + xmax - xmin].reshape(
-            [1, 1, -1, 1]))
-        output = torch.sum(tmp_data, dim=2, keepdim=False)
-        image_temp_buffer[:, :, w, :] = output
+    for coords, in_idx, w_idx in _window_groups(bound_x_min, bound_x_max, windowsize_w):
+        for chunk in roi_chunks(coords.numel(), batch_size * input_height * in_idx.shape[1] * channel):
+            tmp_data = input_data[:, :, in_idx[chunk], :] * \
+                weight_coefficients_x[w_idx[chunk]].reshape([1, 1, -1, in_idx.shape[1], 1])
+            image_temp_buffer[:, :, coords[chunk], :] = torch.sum(tmp_data, dim=3, keepdim=False)
     if quantized:
         image_temp_buffer = linear_requantize(image_temp_buffer, 1, coordination_shift,
                                               0, self.inputs[0].qmin, self.inputs[0].qmax)
 
     # vertical interpolate
-    for h in range(output_height):
-        xmin = bound_y_min[h]
-        xmax = bound_y_max[h]
-        tmp_data = (image_temp_buffer[:, xmin:xmax, :, :] * weight_coefficients_y[h *
-                                                                                  windowsize_h: h * windowsize_h + xmax - xmin].reshape(
-            [1, -1, 1, 1]))
-        output = torch.sum(tmp_data, dim=1, keepdim=False)
-        output_data[:, h, :, :] = output
+    for coords, in_idx, w_idx in _window_groups(bound_y_min, bound_y_max, windowsize_h):
+        for chunk in roi_chunks(coords.numel(), batch_size * in_idx.shape[1] * output_width * channel):
+            tmp_data = image_temp_buffer[:, in_idx[chunk], :, :] * \
+                weight_coefficients_y[w_idx[chunk]].reshape([1, -1, in_idx.shape[1], 1, 1])
+            output_data[:, coords[chunk], :, :] = torch.sum(tmp_data, dim=2, keepdim=False)
     if quantized:
         output_data = linear_requantize(output_data, 1, coordination_shift, 0, self.inputs[0].qmin, self.inputs[0].qmax)
     ############################################forward###################################################
@@ -286,18 +298,16 @@ def TF1_compatible_resize(inp, output_shape, mode):
         factor_h = max(out_h, 1) / max(inp_h, 1)
         factor_w = max(out_w, 1) / max(inp_w, 1)
 
-    out_t = torch.zeros([batch, out_c, out_h, out_w])
-
     import math
-    for h in range(out_h):
-        for w in range(out_w):
-            # round and math.floor is align with the tf implementation
-            map_inp_h = min(int(round(h / factor_h) if mode == 'align_corners' else math.floor(h / factor_h)),
-                            inp_h - 1)
-            map_inp_w = min(int(round(w / factor_w) if mode == 'align_corners' else math.floor(w / factor_w)),
-                            inp_w - 1)
-            out_t[:, :, h, w] = inp[:, :, map_inp_h, map_inp_w]
-    return out_t
+    # round and math.floor is align with the tf implementation
+    map_inp_h = [min(int(round(h / factor_h) if mode == 'align_corners' else math.floor(h / factor_h)), inp_h - 1)
+                 for h in range(out_h)]
+    map_inp_w = [min(int(round(w / factor_w) if mode == 'align_corners' else math.floor(w / factor_w)), inp_w - 1)
+                 for w in range(out_w)]
+    map_inp_h = torch.tensor(map_inp_h, device=inp.device)
+    map_inp_w = torch.tensor(map_inp_w, device=inp.device)
+    out_t = inp[:, :, map_inp_h][:, :, :, map_inp_w]
+    return out_t.float().cpu()
 
 
 def nearest_resize(input_data, output_shape, mode, ratio_x, ratio_y, nearest_mode):
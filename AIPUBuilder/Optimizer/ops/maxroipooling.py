@@ -20,9 +20,66 @@ from AIPUBuilder.Optimizer.framework import *
 # currently, this OP is used in caffe fasterrcnn
 
 
+def _window_max_levels(x, dim, levels):
+    # [levels, ...] the max of the windows of 2**k elements along dim starting at each position, k in [0, levels).
+    # the positions whose window crosses the end keep a smaller window, they are never looked up.
+    tables = [x]
+    for k in range(1, levels):
+        prev = tables[-1]
+        step = 1 << (k - 1)
+        cur = prev.clone()
+        num = max(x.shape[dim] - step, 0)
+        cur.narrow(dim, 0, num).copy_(torch.maximum(prev.narrow(dim, 0, num), prev.narrow(dim, step, num)))
+        tables.append(cur)
+    return torch.stack(tables)
+
+
+def _roi_bins_max(feature, batch_idx, hstart, hend, wstart, wend):
+    # [roi_num, pooled_h, pooled_w, channel] max of the bins [hstart, hend) x [wstart, wend) of all rois, the empty
+    # bins are 0. every bin is covered by four windows of 2**kh x 2**kw elements whose max is looked up in tables.
+    roi_num, pooled_h = hstart.shape
+    pooled_w = wstart.shape[1]
+    batch, height, width, channel = feature.shape
+    dev = feature.device
+    top_data = torch.zeros((roi_num, pooled_h, pooled_w, channel), device=dev)
+    if roi_num < 1:
+        return top_data
+
+    def window_levels(start, end, size):
+        length = (end - start).clamp(min=1)
+        level = torch.zeros_like(length)
+        while bool((length >= (2 << level)).any()):
+            level += (length >= (2 << level)).long()
+        first = start.clamp(0, size - 1)
+        last = (end - (1 << level)).clamp(0, size - 1)
+        return level, first, last
+
+    level_h, top, bottom = window_levels(hstart, hend, height)
+    level_w, left, right = window_levels(wstart, wend, width)
+    levels_h, levels_w = int(level_h.max()) + 1, int(level_w.max()) + 1
+    # [roi_num, pooled_h, pooled_w] index of the table of each bin
+    level = level_w.unsqueeze(1) * levels_h + level_h.unsqueeze(-1)
+    b = batch_idx.long().reshape(-1, 1, 1)
+    top, bottom = top.unsqueeze(-1), bottom.unsqueeze(-1)
+    left, right = left.unsqueeze(1), right.unsqueeze(1)
+    empty = (hstart >= hend).unsqueeze(-1) | (wstart >= wend).unsqueeze(1)
+
+    channel_step = max(1, (1 << 24) // max(1, levels_h * levels_w * batch * height * width))
+    for cs in range(0, channel, channel_step):
+        ce = min(channel, cs + channel_step)
+        tables = _window_max_levels(_window_max_levels(feature[..., cs:ce], 1, levels_h), 3, levels_w)
+        tables = tables.reshape(levels_w * levels_h, batch, height, width, ce - cs)
+        bins_max = tables[level, b, top, left]
+        torch.maximum(bins_max, tables[level, b, top, right], out=bins_max)
+        torch.maximum(bins_max, tables[level, b, bottom, left], out=bins_max)
+        torch.maximum(bins_max, tables[level, b, bottom, right], out=bins_max)
+        top_data[..., cs:ce] = bins_max
+    top_data.masked_fill_(empty.unsqueeze(-1), 0)
+    return top_data
+
+
 @op_register(OpType.MaxRoiPool)
 def maxroipooling(self, *args):
-    out = self.outputs[0].betensor
     feature = self.inputs[0].betensor
     rois_box = self.inputs[1].betensor
 
@@ -39,104 +96,77 @@ def maxroipooling(self, *args):
         OPT_WARN("MaxRoiPool batch dim is not correct")
     spatial_scale_value = [self.get_param('spatial')[0], self.get_param('spatial')[1]]  # [spatial_y, spatial_x] in IR
     dev = feature.device
+    # the bins of all rois, [roi_num, resize_height] and [roi_num, resize_width]
     if not self.quantized:
-        top_data = torch.zeros((rois.shape[0], rois.shape[1], resize_height, resize_width, channel), device=dev)
-        for i in range(rois_box.shape[0]):
-            batch_index = rois_box[i, :, 0]
-            for boxidx in range(rois.shape[1]):
-                batch_idx = batch_index[boxidx].int()
-                roi_start_w = (torch.floor(rois[i, boxidx, 1] * spatial_scale_value[1] + 0.5)).int()
-                roi_end_w = (torch.floor(rois[i, boxidx, 3] * spatial_scale_value[1] + 0.5)).int()
-                roi_start_h = (torch.floor(rois[i, boxidx, 0] * spatial_scale_value[0] + 0.5)).int()
-                roi_end_h = (torch.floor(rois[i, boxidx, 2] * spatial_scale_value[0] + 0.5)).int()
-
-                roi_height = max(roi_end_h - roi_start_h + 1, 1)
-                roi_width = max(roi_end_w - roi_start_w + 1, 1)
-                bin_size_h = roi_height / resize_height
-                bin_size_w = roi_width / resize_width
-
-                hstart = torch.floor((torch.arange(0, resize_height, device=out.device)) *
-                                     bin_size_h)  # have pooled size h,such as case, vector len is 7
-                wstart = torch.floor((torch.arange(0, resize_width, device=out.device)) * bin_size_w)
-                hend = torch.ceil((torch.arange(1, resize_height + 1, device=out.device)) * bin_size_h)
-                wend = torch.ceil((torch.arange(1, resize_width + 1, device=out.device)) * bin_size_w)
-
-                # have pooled size h,such as case, vector len is 7
-                hstart = (torch.clamp(hstart + roi_start_h, 0, height)).int()
-                hend = (torch.clamp(hend + roi_start_h, 0, height)).int()
-                wstart = (torch.clamp(wstart + roi_start_w, 0, width)).int()
-                wend = (torch.clamp(wend + roi_start_w, 0, width)).int()
-
-                for ph in range(resize_height):
-                    for pw in range(resize_width):
-                        if hstart[ph] >= hend[ph] or wstart[pw] >= wend[pw]:
-                            continue
-                        else:
-                            top_data[i, boxidx, ph, pw, :] = torch.max(
-                                torch.max(feature[batch_idx, hstart[ph]:hend[ph], wstart[pw]:wend[pw], :], 0)[0], 0)[0]
+        batch_idx = rois_box[..., 0].reshape(-1).int()
+        rois = rois.reshape(-1, 4)
+        roi_start_w = (torch.floor(rois[:, 1:2] * spatial_scale_value[1] + 0.5)).int()
+        roi_end_w = (torch.floor(rois[:, 3:4] * spatial_scale_value[1] + 0.5)).int()
+        roi_start_h = (torch.floor(rois[:, 0:1] * spatial_scale_value[0] + 0.5)).int()
+        roi_end_h = (torch.floor(rois[:, 2:3] * spatial_scale_value[0] + 0.5)).int()
+
+        roi_height = torch.clamp(roi_end_h - roi_start_h + 1, min=1)
+        roi_width = torch.clamp(roi_end_w - roi_start_w + 1, min=1)
+        bin_size_h = roi_height / resize_height
+        bin_size_w = roi_width / resize_width
+
+        hstart = torch.floor((torch.arange(0, resize_height, device=dev)) *
+                             bin_size_h)  # have pooled size h,such as case, vector len is 7
+        wstart = torch.floor((torch.arange(0, resize_width, device=dev)) * bin_size_w)
+        hend = torch.ceil((torch.arange(1, resize_height + 1, device=dev)) * bin_size_h)
+        wend = torch.ceil((torch.arange(1, resize_width + 1, device=dev)) * bin_size_w)
+
+        # have pooled size h,such as case, vector len is 7
+        hstart = (torch.clamp(hstart + roi_start_h, 0, height)).long()
+        hend = (torch.clamp(hend + roi_start_h, 0, height)).long()
+        wstart = (torch.clamp(wstart + roi_start_w, 0, width)).long()
+        wend = (torch.clamp(wend + roi_start_w, 0, width)).long()
     else:
-        top_data = torch.zeros((rois.shape[0], rois.shape[1], resize_height, resize_width, channel), device=dev)
         # here is unreasonable, but lib remove a parameter which indicate box scale, lib maybe match specific case
         # but opt need match general cases test, so workaround like this
         spatial_scale_int16 = [spatial_scale_value[0], spatial_scale_value[1]]
         half_value = 1 << 15
-        rois = rois.long() + self.inputs[1].zerop
-        for i in range(rois_box.shape[0]):
-            batch_index = rois_box[i, :, 0] + self.inputs[1].zerop
-            for boxidx in range(rois.shape[1]):
-                batch_idx = batch_index[boxidx].int()
-                # rois is origin size, feature map size is reduced by 1/16, origin size=224, feature size=224/16/=14
-                expand_start_w = rois[i, boxidx, 1] * spatial_scale_int16[1]
-                expand_end_w = rois[i, boxidx, 3] * spatial_scale_int16[1]
-                expand_start_h = rois[i, boxidx, 0] * spatial_scale_int16[0]
-                expand_end_h = rois[i, boxidx, 2] * spatial_scale_int16[0]
-
-                roi_start_w_q = (expand_start_w // 65536).int().item()
-                roi_end_w_q = (expand_end_w // 65536).int().item()
-                roi_start_h_q = (expand_start_h // 65536).int().item()
-                roi_end_h_q = (expand_end_h // 65536).int().item()
-
-                roi_start_w_q += (1 if (expand_start_w % 65536) >= half_value else 0)
-                roi_end_w_q += (1 if (expand_end_w % 65536) >= half_value else 0)
-                roi_start_h_q += (1 if (expand_start_h % 65536) >= half_value else 0)
-                roi_end_h_q += (1 if (expand_end_h % 65536) >= half_value else 0)
-
-                roi_height_q = max(roi_end_h_q - roi_start_h_q + 1, 1)
-                roi_width_q = max(roi_end_w_q - roi_start_w_q + 1, 1)
-                bin_size_h_q = (roi_height_q // resize_height)
-                bin_size_w_q = (roi_width_q // resize_width)
-                bin_size_h_q_mod = roi_height_q % resize_height
-                bin_size_w_q_mod = roi_width_q % resize_width
-
-                # have pooled size h,such as case, vector len is 7
-                hstart_q = ((torch.arange(0, resize_height)) * bin_size_h_q) + \
-                    (bin_size_h_q_mod * torch.arange(0, resize_height)) // resize_height  # >> 8
-                wstart_q = ((torch.arange(0, resize_width)) * bin_size_w_q) + \
-                    (bin_size_w_q_mod * torch.arange(0, resize_width)) // resize_width  # >> 8
-
-                hend_q = ((torch.arange(1, resize_height+1)) * bin_size_h_q) + \
-                    (bin_size_h_q_mod * torch.arange(1, resize_height+1)) // resize_height
-                mask = ((bin_size_h_q_mod * torch.arange(1, resize_height+1)) % resize_height) > 0
-                hend_q[mask] += 1
-
-                wend_q = ((torch.arange(1, resize_width+1)) * bin_size_w_q) + \
-                    (bin_size_w_q_mod * torch.arange(1, resize_width+1)) // resize_width
-                mask = ((bin_size_w_q_mod * torch.arange(1, resize_width+1)) % resize_width) > 0
-                wend_q[mask] += 1
-
-                hstart_q = torch.clamp(hstart_q + roi_start_h_q, 0, height)
-                hend_q = torch.clamp(hend_q + roi_start_h_q, 0, height)
-                wstart_q = torch.clamp(wstart_q + roi_start_w_q, 0, width)
-                wend_q = torch.clamp(wend_q + roi_start_w_q, 0, width)
-                for ph in range(resize_height):
-                    for pw in range(resize_width):
-                        if hstart_q[ph] >= hend_q[ph] or wstart_q[pw] >= wend_q[pw]:
-                            continue
-                        else:
-                            top_data[i, boxidx, ph, pw, :] = torch.max(
-                                torch.max(feature[batch_idx, hstart_q[ph]:hend_q[ph], wstart_q[pw]:wend_q[pw], :], 0)[
-                                    0], 0)[0]
-
+        batch_idx = (rois_box[..., 0] + self.inputs[1].zerop).reshape(-1).int()
+        rois = rois.long().reshape(-1, 4) + self.inputs[1].zerop
+        # rois is origin size, feature map size is reduced by 1/16, origin size=224, feature size=224/16/=14
+        expand_start_w = rois[:, 1:2] * spatial_scale_int16[1]
+        expand_end_w = rois[:, 3:4] * spatial_scale_int16[1]
+        expand_start_h = rois[:, 0:1] * spatial_scale_int16[0]
+        expand_end_h = rois[:, 2:3] * spatial_scale_int16[0]
+
+        roi_start_w_q = (expand_start_w // 65536).long() + ((expand_start_w % 65536) >= half_value).long()
+        roi_end_w_q = (expand_end_w // 65536).long() + ((expand_end_w % 65536) >= half_value).long()
+        roi_start_h_q = (expand_start_h // 65536).long() + ((expand_start_h % 65536) >= half_value).long()
+        roi_end_h_q = (expand_end_h // 65536).long() + ((expand_end_h % 65536) >= half_value).long()
+
+        roi_height_q = torch.clamp(roi_end_h_q - roi_start_h_q + 1, min=1)
+        roi_width_q = torch.clamp(roi_end_w_q - roi_start_w_q + 1, min=1)
+        bin_size_h_q = (roi_height_q // resize_height)
+        bin_size_w_q = (roi_width_q // resize_width)
+        bin_size_h_q_mod = roi_height_q % resize_height
+        bin_size_w_q_mod = roi_width_q % resize_width
+
+        # have pooled size h,such as case, vector len is 7
+        hstart_q = ((torch.arange(0, resize_height, device=dev)) * bin_size_h_q) + \
+            (bin_size_h_q_mod * torch.arange(0, resize_height, device=dev)) // resize_height  # >> 8
+        wstart_q = ((torch.arange(0, resize_width, device=dev)) * bin_size_w_q) + \
+            (bin_size_w_q_mod * torch.arange(0, resize_width, device=dev)) // resize_width  # >> 8
+
+        hend_q = ((torch.arange(1, resize_height+1, device=dev)) * bin_size_h_q) + \
+            (bin_size_h_q_mod * torch.arange(1, resize_height+1, device=dev)) // resize_height
+        hend_q += ((bin_size_h_q_mod * torch.arange(1, resize_height+1, device=dev)) % resize_height) > 0
+
+        wend_q = ((torch.arange(1, resize_width+1, device=dev)) * bin_size_w_q) + \
+            (bin_size_w_q_mod * torch.arange(1, resize_width+1, device=dev)) // resize_width
+        wend_q += ((bin_size_w_q_mod * torch.arange(1, resize_width+1, device=dev)) % resize_width) > 0
+
+        hstart = torch.clamp(hstart_q + roi_start_h_q, 0, height)
+        hend = torch.clamp(hend_q + roi_start_h_q, 0, height)
+        wstart = torch.clamp(wstart_q + roi_start_w_q, 0, width)
+        wend = torch.clamp(wend_q + roi_start_w_q, 0, width)
+
+    top_data = _roi_bins_max(feature, batch_idx, hstart, hend, wstart, wend)
+    top_data = top_data.reshape(rois_box.shape[0], rois_box.shape[1], resize_height, resize_width, channel)
     self.outputs[0].betensor = top_data.reshape(self.outputs[0].ir_shape)
     return top_data
 
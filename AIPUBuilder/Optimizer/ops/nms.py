@@ -65,6 +65,54 @@ def single_softnms(self, box, score, max_nms_box_num_per_class):
     suppress_begin_index = torch.zeros_like(box_index, device=score.device)
     score_cand = score[greater_score_thres_mask].double().clone()
     selected_boxes_index = []
+    all_index = torch.arange(current_box_num, device=device)
+    # the lut scales and shifts (quantized) or the decay factors (float) between each selected box and all boxes,
+    # their rows grow with the selected boxes
+    if self.quantized:
+        scale_lut = self.constants['gaussian_scale_lut'].betensor
+        shift_lut = self.constants['gaussian_shift_lut'].betensor
+        soft_nms_sigma_in_shift = self.params["soft_nms_sigma_in_shift"]
+        selected_decay = [torch.zeros((0, current_box_num), dtype=scale_lut.dtype, device=device),
+                          torch.zeros((0, current_box_num), dtype=torch.int32, device=device)]
+    else:
+        soft_nms_sigma = -0.5 / self.get_param('soft_nms_sigma')
+        selected_decay = [torch.zeros((0, current_box_num), device=device)]
+
+    def select(k, bid):
+        # the decay of all boxes by the k-th selected box bid
+        if k >= selected_decay[0].shape[0]:
+            rows = min(max(16, 2 * k), max_nms_box_num_per_class) - k
+            for i, t in enumerate(selected_decay):
+                selected_decay[i] = torch.cat([t, torch.zeros((rows, current_box_num), dtype=t.dtype, device=device)])
+        w, h = iou(x0, y0, x1, y1, all_index, bid)
+        inter = w * h
+        if self.quantized:
+            inter = (inter).int()
+            inter = inter >> areas_shift
+            union = areas + areas[bid] - inter
+            offset = 2 ** soft_nms_sigma_in_shift - 1
+            inter = torch.where(union == 0, 0, inter)
+            union = torch.where(union == 0, 1, union)
+            ious = (inter * offset // union).long()
+            selected_decay[0][k] = scale_lut[ious]
+            selected_decay[1][k] = shift_lut[ious].int()
+        else:
+            union = areas + areas[bid] - inter
+            ious = torch.where(union == 0, 0., inter / union)
+            selected_decay[0][k] = torch.exp(soft_nms_sigma * ious * ious)
+
+    def decay(score_value, begin, end, box_id):
+        # apply the decay of the selected boxes [begin, end) in order, until the score drops to score_threshold
+        if self.quantized:
+            for scale, shift in zip(selected_decay[0][begin:end, box_id], selected_decay[1][begin:end, box_id]):
+                score_value = (score_value * scale).long() >> shift
+                if score_value.float() <= score_threshold:
+                    break
+            return score_value
+        scores = torch.cumprod(torch.cat([score_value.reshape(1), selected_decay[0][begin:end, box_id].double()]),
+                              dim=0)[1:]
+        below = torch.nonzero(scores.float() <= score_threshold)
+        return scores[below[0, 0]] if below.numel() > 0 else scores[-1]
 
     keep_idx = 0
     while (keep_idx < max_nms_box_num_per_class and score_cand.numel() > 0):
@@ -73,38 +121,16 @@ def single_softnms(self, box, score, max_nms_box_num_per_class):
         score_value = score_cand[argmax_idx]
         origin_score = score_value.clone()
 
-        for j in range(suppress_begin_index[argmax_idx], len(selected_boxes_index)):
-            bid = selected_boxes_index[j]
-            w, h = iou(x0, y0, x1, y1, box_id, bid)
-            inter = w * h
-            if self.quantized:
-                scale_lut = self.constants['gaussian_scale_lut'].betensor
-                shift_lut = self.constants['gaussian_shift_lut'].betensor
-                soft_nms_sigma_in_shift = self.params["soft_nms_sigma_in_shift"]
-                inter = (inter).int()
-                inter = inter >> areas_shift
-                union = areas[box_id] + areas[bid] - inter
-                offset = 2 ** soft_nms_sigma_in_shift - 1
-                inter[union == 0] = 0
-                union[union == 0] = 1
-                ious = (inter * offset // union).long()
-                score_value = (score_value * scale_lut[ious]).long() >> shift_lut[ious].int()
-            else:
-                union = areas[box_id] + areas[bid] - inter
-                soft_nms_sigma = -0.5 / self.get_param('soft_nms_sigma')
-                ious = inter / union
-                if union == 0:
-                    ious = torch.tensor(0, device=score.device)
-                score_value = score_value * torch.exp(soft_nms_sigma * ious * ious)
-
-            if score_value.float() <= score_threshold:
-                break
+        begin = int(suppress_begin_index[argmax_idx])
+        if begin < len(selected_boxes_index):
+            score_value = decay(score_value, begin, len(selected_boxes_index), box_id)
 
         suppress_begin_index[argmax_idx] = len(selected_boxes_index)
         if origin_score == score_value:
             keep[keep_idx] = box_id
             nms_box[keep_idx, :] = box[box_id, :]
             nms_score[keep_idx] = score_value
+            select(keep_idx, box_id)
             selected_boxes_index.append(box_id.item())
             keep_idx += 1
             score_cand = del_tensor_from_index(score_cand, argmax_idx)
@@ -158,44 +184,55 @@ def single_nms(self, box, score, max_nms_box_num):
         iou_threshold = self.get_param('iou_threshold')
         areas = torch.abs((y1 - y0) * (x1 - x0))
 
+    device = x0.device
     order = score[:].argsort(dim=-1, descending=True)  # descending order
-    keep_idx = 0
-    boxNum_perclass_single = 0
-    device = x0[0].device
-    while order.size()[0] > 0:
-        i = order[0]
-        if score[i].float() <= score_threshold:
-            break
-        boxNum_perclass_single += 1
-
-        keep[keep_idx] = i
-        nms_box[keep_idx, :] = box[i, :]
-        nms_score[keep_idx] = score[i]
-
-        keep_idx += 1
-        if keep_idx >= max_nms_box_num:
-            break
-
-        # xx0 = torch.max(x0[i], x0[order[1:]])
-        # yy0 = torch.max(y0[i], y0[order[1:]])
-        # xx1 = torch.min(x1[i], x1[order[1:]])
-        # yy1 = torch.min(y1[i], y1[order[1:]])
-        # w = torch.max(torch.tensor(0.0).to(device), xx1 - xx0)
-        # h = torch.max(torch.tensor(0.0).to(device), yy1 - yy0)
-        w, h = iou(x0, y0, x1, y1, i, order[1:])
+    # the candidates end at the first box whose score is not above score_threshold
+    below = torch.nonzero(score[order].float() <= score_threshold)
+    cand_num = below[0, 0].item() if below.numel() > 0 else order.numel()
+    order = order[:cand_num]
+
+    def suppress(rows, cols):
+        # [len(rows), len(cols)] whether box rows[i] (kept) suppresses box cols[j]
+        w, h = iou(x0, y0, x1, y1, rows[:, None], cols[None, :])
         inter = w * h
         if self.quantized:
             inter = (inter).int()
             inter = inter >> areas_shift
-
-        union = areas[i] + areas[order[1:]] - inter
-
+        union = areas[rows][:, None] + areas[cols][None, :] - inter
         inter_area_thresh = union * iou_threshold
         if self.quantized:
             inter_area_thresh = union * iou_threshold >> int(iou_thresh_shift)
-
-        inds = torch.where(inter <= inter_area_thresh)[0]
-        order = order[inds + 1]
+        return ~(inter <= inter_area_thresh)
+
+    # greedy suppression in blocks of the sorted candidates: the boxes of a block are suppressed by the kept boxes
+    # of former blocks, and the greedy result inside a block is the fixed point of kept = ~suppressed_by(kept).
+    # only the boxes not suppressed yet are compared.
+    kept = torch.zeros((cand_num,), dtype=torch.bool, device=device)
+    removed = torch.zeros((cand_num,), dtype=torch.bool, device=device)
+    block_size = 128
+    for begin in range(0, cand_num, block_size):
+        if kept[:begin].sum() >= max_nms_box_num:
+            break
+        end = min(cand_num, begin + block_size)
+        live = begin + torch.nonzero(~removed[begin:]).flatten()
+        rows_num = int((live < end).sum())
+        if rows_num < 1:
+            continue
+        block_suppress = suppress(order[live[:rows_num]], order[live])
+        intra_suppress = torch.triu(block_suppress[:, :rows_num], diagonal=1)
+        block_kept = torch.ones((rows_num,), dtype=torch.bool, device=device)
+        while True:
+            new_kept = ~(block_kept[:, None] & intra_suppress).any(dim=0)
+            if torch.equal(new_kept, block_kept):
+                break
+            block_kept = new_kept
+        kept[live[:rows_num]] = block_kept
+        removed[live[rows_num:]] |= (block_kept[:, None] & block_suppress[:, rows_num:]).any(dim=0)
+    keep_index = order[kept][:max_nms_box_num]
+    boxNum_perclass_single = keep_index.numel()
+    keep[:boxNum_perclass_single] = keep_index.to(keep.device, keep.dtype)
+    nms_box[:boxNum_perclass_single, :] = box[keep_index, :].to(nms_box.device, nms_box.dtype)
+    nms_score[:boxNum_perclass_single] = score[keep_index].to(nms_score.device, nms_score.dtype)
 
     boxNum_perclass = boxNum_perclass_single
     if self.quantized:
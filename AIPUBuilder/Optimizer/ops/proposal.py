@@ -105,14 +105,8 @@ def apply_box_deltas(self, config, score, deltas):
                         dy * h, dx * w]
         box_stats = [dy, dx, dh, dw, torch.exp(dh), torch.exp(dw)]
         placeholders = [coords_stats, box_stats]
-        placeholders_output = []
-
-        for placeholder in placeholders:
-            tensor_all = placeholder[0]
-            for idx, tensor in enumerate(placeholder):
-                tensor = torch.reshape(tensor, (-1,))
-                tensor_all = tensor if idx == 0 else torch.cat((tensor_all, tensor), dim=0)
-            placeholders_output.append(tensor_all)
+        placeholders_output = [torch.cat([torch.reshape(tensor, (-1,)) for tensor in placeholder], dim=0)
+                               for placeholder in placeholders]
 
         if len(self.placeholders) < 1:
             ph0 = PyTensor(self.name+"/coords", placeholders_output[0].cpu().numpy().astype(dtype2nptype(Dtype.FP32)))
@@ -125,17 +119,6 @@ def apply_box_deltas(self, config, score, deltas):
     return box, score[:, :, 1]
 
 
-def _get_box_score(node, class_score, box_encoding, score_thresh):
-    max_prop_num = node.outputs[0].ir_shape[1]
-    arg_score = torch.where(class_score > score_thresh)[0].long()
-    box = box_encoding[arg_score, :][:max_prop_num, :]
-    if node.quantized:
-        box = torch.round(box).int()
-    score = class_score[arg_score][:max_prop_num]
-    outbox_idx = box.shape[0]
-    return box, score, outbox_idx
-
-
 def get_box_score(node, batch_class_score, batch_box_encoding):
     if not node.quantized:
         score_thresh = node.get_param('score_threshold')
@@ -144,14 +127,22 @@ def get_box_score(node, batch_class_score, batch_box_encoding):
         score_thresh = node.get_param('score_threshold_value')
     max_prop_num = node.outputs[0].ir_shape[1]
     dev = node.outputs[0].betensor.device
-    box = torch.zeros((batch_class_score.shape[0], max_prop_num, batch_box_encoding.shape[2]), device=dev)
-    score = torch.zeros((batch_class_score.shape[0], max_prop_num), device=dev)
-    box_num_perClass = torch.zeros((batch_class_score.shape[0], 1), device=dev)
-
-    for i in range(batch_class_score.shape[0]):
-        _box, _score, box_num_perClass[i][0] = _get_box_score(
-            node, batch_class_score[i], batch_box_encoding[i], score_thresh)
-        box[i][:_box.shape[0], :], score[i][:_score.shape[0]] = _box, _score
+    batch_size = batch_class_score.shape[0]
+    box = torch.zeros((batch_size, max_prop_num, batch_box_encoding.shape[2]), device=dev)
+    score = torch.zeros((batch_size, max_prop_num), device=dev)
+
+    # the boxes above score_thresh of each batch are moved to the front in their original order
+    mask = batch_class_score > score_thresh
+    order = torch.sort((~mask).int(), dim=1, stable=True)[1][:, :max_prop_num]
+    prop_num = order.shape[1]
+    valid = torch.arange(prop_num, device=order.device) < mask.sum(dim=1, keepdim=True)
+    _box = torch.gather(batch_box_encoding, 1, order.unsqueeze(-1).expand(-1, -1, batch_box_encoding.shape[2]))
+    if node.quantized:
+        _box = torch.round(_box).int()
+    _score = torch.gather(batch_class_score, 1, order)
+    box[:, :prop_num, :] = torch.where(valid.unsqueeze(-1), _box.to(dev), torch.zeros_like(_box)).to(box.dtype)
+    score[:, :prop_num] = torch.where(valid, _score.to(dev), torch.zeros_like(_score)).to(score.dtype)
+    box_num_perClass = valid.sum(dim=1, keepdim=True).to(dev, score.dtype)
 
     return box, score, box_num_perClass
 
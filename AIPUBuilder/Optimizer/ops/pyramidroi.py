@@ -4,6 +4,7 @@
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.utils import construct_torch_tensor as torch_tensor
 from AIPUBuilder.Optimizer.framework import *
+from AIPUBuilder.Optimizer.ops.roialign import roi_chunks
 import torch
 import torchvision
 
@@ -119,54 +120,51 @@ def torch_roi_align(node, nor_box, feature_list):
             # w_bin_size = linear_requantize(w_step_size, sample_w_do_scale, sample_w_do_shift, 0, 0, 2 ** 16 - 1)
             # h_bin_size = linear_requantize(h_step_size, sample_h_do_scale, sample_h_do_shift, 0, 0, 2 ** 16 - 1)
 
-            for b in range(current_box_num):
-                if roi_width[b] == 0 or roi_height[b] == 0:
-                    continue
-                for i in range(out_height):
-                    h_start = (h_step_size[b] * i + h_roi_start[b]).long()
-                    for j in range(out_width):
-                        w_start = (w_step_size[b] * j + w_roi_start[b]).long()
-                        depth_output = torch.zeros([channel_], device=feature_map.device)
-                        for y_ind in range(h_sample_ratios[b]):
-                            # y = h_start[b] + h_bin_size / 2 + h_bin_size * y_ind
-                            y = (h_start + h_bin_size[b] * (2 * y_ind + 1)).long()
-                            for x_ind in range(w_sample_ratios[b]):
-                                # x = w_start[b] + w_bin_size / 2 + w_bin_size * x_ind
-                                x = (w_start + w_bin_size[b] * (2 * x_ind + 1)).long()
-                                y_low = y >> spatial_shift
-                                y_high = y_low + 1
-                                dy1 = y - (y_low << spatial_shift)
-                                x_low = x >> spatial_shift
-                                x_high = x_low + 1
-                                dx1 = x - (x_low << spatial_shift)
-
-                                if y_low < -1 or y_low > fm_height or x_low < -1 or x_low > fm_width:
-                                    depth_output += 0
-                                else:
-                                    y_low = min(max(y_low, 0), fm_height - 1)
-                                    x_low = min(max(x_low, 0), fm_width - 1)
-                                    x_high = min(max(x_high, 0), fm_width - 1)
-                                    y_high = min(max(y_high, 0), fm_height - 1)
-
-                                    dx2 = 2 ** spatial_shift - dx1
-                                    dy2 = 2 ** spatial_shift - dy1
-                                    ws = [dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1]
-                                    ws = [wss >> spatial_shift for wss in ws]
-                                    depth_output += (feature_map[0, y_low, x_low, :] * ws[0] +
-                                                     feature_map[0, y_low, x_high, :] * ws[1] +
-                                                     feature_map[0, y_high, x_low, :] * ws[2] +
-                                                     feature_map[0, y_high, x_high, :] * ws[3])
-                        # nor_output[b, i, j, :] = depth_output / (w_sampling_ratio * h_sampling_ratio)
-                        if w_sample_ratio > 0 and h_sample_ratio > 0:
-                            nor_output[b, i, j, :] = linear_requantize(depth_output, do_scales[level],
-                                                                       do_shifts[level] + spatial_shift,
-                                                                       node.outputs[0].zerop,
-                                                                       node.outputs[0].qmin, node.outputs[0].qmax)
-                        else:
-                            nor_output[b, i, j, :] = linear_requantize(
-                                depth_output * do_scales[level] // (h_sample_ratios[b] * w_sample_ratios[b]), 1,
-                                do_shifts[level] + spatial_shift, node.outputs[0].zerop,
-                                node.outputs[0].qmin, node.outputs[0].qmax)
+            valid = (roi_width != 0) & (roi_height != 0)
+            h_start = (h_step_size[:, None] * torch.arange(out_height, device=dev) + h_roi_start[:, None]).long()
+            w_start = (w_step_size[:, None] * torch.arange(out_width, device=dev) + w_roi_start[:, None]).long()
+            max_h_ratio = int(h_sample_ratios.max().item()) if current_box_num > 0 else 0
+            max_w_ratio = int(w_sample_ratios.max().item()) if current_box_num > 0 else 0
+
+            def _coordinates(start, bin_size, ind, size):
+                # y = h_start + h_bin_size / 2 + h_bin_size * y_ind
+                pos = (start + (bin_size * (2 * ind + 1))[:, None]).long()
+                low = pos >> spatial_shift
+                high = low + 1
+                d1 = pos - (low << spatial_shift)
+                oob = (low < -1) | (low > size)
+                return torch.clamp(low, 0, size - 1), torch.clamp(high, 0, size - 1), d1, 2 ** spatial_shift - d1, oob
+
+            for rs in roi_chunks(current_box_num, resize_height_ * resize_width_ * channel_):
+                depth_output = torch.zeros([rs.stop - rs.start, resize_height_, resize_width_, channel_], device=dev)
+                for y_ind in range(max_h_ratio):
+                    y_low, y_high, dy1, dy2, y_oob = _coordinates(h_start[rs], h_bin_size[rs], y_ind, fm_height)
+                    y_low, y_high, dy1, dy2 = y_low[:, :, None], y_high[:, :, None], dy1[:, :, None], dy2[:, :, None]
+                    for x_ind in range(max_w_ratio):
+                        x_low, x_high, dx1, dx2, x_oob = _coordinates(w_start[rs], w_bin_size[rs], x_ind, fm_width)
+                        x_low, x_high, dx1, dx2 = x_low[:, None, :], x_high[:, None, :], dx1[:, None, :], dx2[:, None, :]
+                        ws = [dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1]
+                        ws = [(wss >> spatial_shift)[..., None] for wss in ws]
+                        sampled = ((y_ind < h_sample_ratios[rs]) & (x_ind < w_sample_ratios[rs]))[:, None, None] & \
+                            ~(y_oob[:, :, None] | x_oob[:, None, :])
+                        depth_output = torch.where(sampled[..., None],
+                                                   depth_output + (feature_map[0, y_low, x_low, :] * ws[0] +
+                                                                   feature_map[0, y_low, x_high, :] * ws[1] +
+                                                                   feature_map[0, y_high, x_low, :] * ws[2] +
+                                                                   feature_map[0, y_high, x_high, :] * ws[3]),
+                                                   depth_output)
+                # nor_output = depth_output / (w_sampling_ratio * h_sampling_ratio)
+                if w_sample_ratio > 0 and h_sample_ratio > 0:
+                    depth_output = linear_requantize(depth_output, do_scales[level],
+                                                     do_shifts[level] + spatial_shift,
+                                                     node.outputs[0].zerop,
+                                                     node.outputs[0].qmin, node.outputs[0].qmax)
+                else:
+                    depth_output = linear_requantize(
+                        depth_output * do_scales[level] // (h_sample_ratios[rs] * w_sample_ratios[rs])[:, None, None, None],
+                        1, do_shifts[level] + spatial_shift, node.outputs[0].zerop,
+                        node.outputs[0].qmin, node.outputs[0].qmax)
+                nor_output[rs] = torch.where(valid[rs][:, None, None, None], depth_output.float(), nor_output[rs])
             output[idx_in_level, ...] = nor_output
 
     else:
@@ -213,43 +211,41 @@ def torch_roi_align(node, nor_box, feature_list):
             w_bin_size = w_step_size / w_sample_ratios
             h_bin_size = h_step_size / h_sample_ratios
 
-            for b in range(current_box_num):
-                if roi_width[b] == 0 or roi_height[b] == 0:
-                    continue
-                for i in range(out_height):
-                    h_start = h_step_size[b] * i + h_roi_start[b]
-                    for j in range(out_width):
-                        w_start = w_step_size[b] * j + w_roi_start[b]  # [750]
-                        depth_output = torch.zeros([channel_], device=feature_map.device)
-                        for y_ind in range(h_sample_ratios[b]):
-                            y = h_start + h_bin_size[b] / 2 + h_bin_size[b] * y_ind
-                            for x_ind in range(w_sample_ratios[b]):
-                                x = w_start + w_bin_size[b] / 2 + w_bin_size[b] * x_ind
-                                if y < -1.0 or y > fm_height or x < -1.0 or x > fm_width:
-                                    # ws = [0., 0., 0., 0.]
-                                    # offset = [0, 0, 0, 0]
-                                    depth_output += 0
-                                else:
-                                    y = torch.minimum(torch.maximum(y, torch.tensor(0., device=dev)),
-                                                      torch.tensor(fm_height - 1, dtype=torch.float32, device=dev))
-                                    x = torch.minimum(torch.maximum(x, torch.tensor(0., device=dev)),
-                                                      torch.tensor(fm_width - 1, dtype=torch.float32, device=dev))
-                                    x_low = torch.floor(x).long()
-                                    y_low = torch.floor(y).long()
-                                    x_high = torch.minimum((x_low + 1), torch.tensor(fm_width - 1, device=dev)).long()
-                                    y_high = torch.minimum((y_low + 1), torch.tensor(fm_height - 1, device=dev)).long()
-                                    dx1 = x - x_low
-                                    dy1 = y - y_low
-                                    dx2 = 1. - dx1
-                                    dy2 = 1. - dy1
-
-                                    ws = [dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1]
-                                    depth_output += (feature_map[0, y_low, x_low, :] * ws[0] +
-                                                     feature_map[0, y_low, x_high, :] * ws[1] +
-                                                     feature_map[0, y_high, x_low, :] * ws[2] +
-                                                     feature_map[0, y_high, x_high, :] * ws[3])
-
-                        nor_output[b, i, j, :] = depth_output / (w_sample_ratios[b] * h_sample_ratios[b])
+            valid = (roi_width != 0) & (roi_height != 0)
+            h_start = h_step_size[:, None] * torch.arange(out_height, device=dev) + h_roi_start[:, None]
+            w_start = w_step_size[:, None] * torch.arange(out_width, device=dev) + w_roi_start[:, None]
+            max_h_ratio = int(h_sample_ratios.max().item()) if current_box_num > 0 else 0
+            max_w_ratio = int(w_sample_ratios.max().item()) if current_box_num > 0 else 0
+
+            def _coordinates(start, bin_size, ind, size):
+                pos = start + (bin_size / 2)[:, None] + (bin_size * ind)[:, None]
+                # nan (from the samples beyond a zero sampling ratio) is regarded as out of bound too
+                oob = ~((pos >= -1.0) & (pos <= size))
+                pos = torch.clamp(torch.where(oob, 0., pos), 0., size - 1)
+                low = torch.floor(pos).long()
+                high = torch.clamp(low + 1, max=size - 1)
+                d1 = pos - low
+                return low, high, d1, 1. - d1, oob
+
+            for rs in roi_chunks(current_box_num, resize_height_ * resize_width_ * channel_):
+                depth_output = torch.zeros([rs.stop - rs.start, resize_height_, resize_width_, channel_], device=dev)
+                for y_ind in range(max_h_ratio):
+                    y_low, y_high, dy1, dy2, y_oob = _coordinates(h_start[rs], h_bin_size[rs], y_ind, fm_height)
+                    y_low, y_high, dy1, dy2 = y_low[:, :, None], y_high[:, :, None], dy1[:, :, None], dy2[:, :, None]
+                    for x_ind in range(max_w_ratio):
+                        x_low, x_high, dx1, dx2, x_oob = _coordinates(w_start[rs], w_bin_size[rs], x_ind, fm_width)
+                        x_low, x_high, dx1, dx2 = x_low[:, None, :], x_high[:, None, :], dx1[:, None, :], dx2[:, None, :]
+                        ws = [wss[..., None] for wss in [dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1]]
+                        sampled = ((y_ind < h_sample_ratios[rs]) & (x_ind < w_sample_ratios[rs]))[:, None, None] & \
+                            ~(y_oob[:, :, None] | x_oob[:, None, :])
+                        depth_output = torch.where(sampled[..., None],
+                                                   depth_output + (feature_map[0, y_low, x_low, :] * ws[0] +
+                                                                   feature_map[0, y_low, x_high, :] * ws[1] +
+                                                                   feature_map[0, y_high, x_low, :] * ws[2] +
+                                                                   feature_map[0, y_high, x_high, :] * ws[3]),
+                                                   depth_output)
+                depth_output = depth_output / (w_sample_ratios[rs] * h_sample_ratios[rs])[:, None, None, None]
+                nor_output[rs] = torch.where(valid[rs][:, None, None, None], depth_output, nor_output[rs])
             output[idx_in_level, ...] = nor_output
     return output
 
@@ -335,12 +331,14 @@ def local_roi_align(node, nor_box, feature_list):
         resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_), device=dev)
         # for batchidx in range(feature.shape[0]):
         batch_idx = 0
-        for boxidx in range(nor_box.shape[1]):
-            feature = feature_maps[roi_level[boxidx] - 1]
-
+        # roi_level - 1 indexes feature_maps like a python list (roi_level=0 picks the last one)
+        feature_idx = (roi_level.long() - 1) % len(feature_maps)
+        for fidx, feature in enumerate(feature_maps):
+            boxidx = torch.where(feature_idx == fidx)[0]
+            if boxidx.numel() < 1:
+                continue
             image_width = feature.shape[1]
             image_height = feature.shape[2]
-            channel = feature.shape[3]
 
             y0_q = nor_box[batch_idx, boxidx, 0].int()
             x0_q = nor_box[batch_idx, boxidx, 1].int()
@@ -351,103 +349,86 @@ def local_roi_align(node, nor_box, feature_list):
             width_scale_q = (torch.div((x1_q - x0_q) * (image_width - 1) * 256,
                                        (resize_width_ - 1), rounding_mode='trunc')) >> 8
 
-            x_q = (image_width-1) * x0_q + torch.arange(0, resize_width_, device=dev) * width_scale_q
-            y_q = (image_height-1) * y0_q + torch.arange(0, resize_height_, device=dev) * height_scale_q
+            # [box_num, resize_width_] and [box_num, resize_height_]
+            x_q = ((image_width-1) * x0_q)[:, None] + torch.arange(0, resize_width_, device=dev) * width_scale_q[:, None]
+            y_q = ((image_height-1) * y0_q)[:, None] + torch.arange(0, resize_height_, device=dev) * height_scale_q[:, None]
 
             yy_q = torch.clamp(y_q, 0,  (image_width - 1)*qmax)
             xx_q = torch.clamp(x_q, 0, (image_height - 1)*qmax)
 
-            top_y_index_q = yy_q >> qvalue
-            bottom_y_index_q = (yy_q+qmax) >> qvalue
-            y_lerp_q = (yy_q & 0x7fff).reshape(resize_height_, 1).repeat(1, channel)
-            # y_lerp = torch.repeat(y_lerp, channel).reshape(resize_height_, channel)
-            left_x_index_q = xx_q >> qvalue
-            right_x_index_q = (xx_q+qmax) >> qvalue
-            x_lerp_q = (xx_q & 0x7fff).reshape(resize_width_, 1).repeat(1, channel)
-
-            for idxh in range(resize_height_):
-                for idxw in range(resize_width_):
-                    # get 4 point
-                    top_left = feature[0, top_y_index_q[idxh], left_x_index_q[idxw], :]  # Q12
-                    top_right = feature[0, top_y_index_q[idxh], right_x_index_q[idxw], :]  # Q22
-                    bottom_left = feature[0, bottom_y_index_q[idxh], left_x_index_q[idxw], :]  # Q11
-                    bottom_right = feature[0, bottom_y_index_q[idxh], right_x_index_q[idxw], :]  # Q21
-
-                    # bilinear interpretate
-                    # f(x,y)=Q12*(1-x_lerp)*(1-y_lerp)+Q22*x_lerp*(1-y_lerp)+Q11*(1-x_lerp)*y_lerp+Q21*x_lerp*y_lerp
-                    # Q11=bottom_left
-                    # Q12=top_left
-                    # Q21=bottom_right
-                    # Q22=top_right
-                    # data=top_left*(1-x_lerp[idxw,:])*(1-y_lerp[idxh,:])+top_right*(1-y_lerp[idxh,:])*x_lerp[idxw,:]
-                    # data=data+bottom_left*(1-x_lerp[idxw,:])*y_lerp[idxh,:]+bottom_right*x_lerp[idxw,:]*y_lerp[idxh,:]
-                    # xy=y_lerp[idxh,:]*x_lerp[idxw,:]
-                    # fourpoint_sum=(top_left+bottom_right-top_right-bottom_left)*xy
-                    # top = top_left + (top_right-top_left)* x_lerp[idxw,:]
-                    # bottom=(bottom_left - top_left) * y_lerp[idxh,:]
-                    # data = fourpoint_sum+top+bottom
-
-                    xy_q = y_lerp_q[idxh, :]*x_lerp_q[idxw, :] >> qvalue
-                    fourpoint_sum = (top_left+bottom_right-top_right-bottom_left)*xy_q
-                    top = (top_left.long() << qvalue) + ((top_right-top_left) * x_lerp_q[idxw, :])
-                    bottom = (bottom_left - top_left) * y_lerp_q[idxh, :]
-                    data_q = (fourpoint_sum+top+bottom).long() >> qvalue
-
-                    resize_feature[boxidx, idxh, idxw, :] = data_q
+            top_y_index_q = (yy_q >> qvalue)[:, :, None]
+            bottom_y_index_q = ((yy_q+qmax) >> qvalue)[:, :, None]
+            y_lerp_q = (yy_q & 0x7fff)[:, :, None, None]
+            left_x_index_q = (xx_q >> qvalue)[:, None, :]
+            right_x_index_q = ((xx_q+qmax) >> qvalue)[:, None, :]
+            x_lerp_q = (xx_q & 0x7fff)[:, None, :, None]
+
+            # get 4 point
+            top_left = feature[0, top_y_index_q, left_x_index_q, :]  # Q12
+            top_right = feature[0, top_y_index_q, right_x_index_q, :]  # Q22
+            bottom_left = feature[0, bottom_y_index_q, left_x_index_q, :]  # Q11
+            bottom_right = feature[0, bottom_y_index_q, right_x_index_q, :]  # Q21
+
+            # bilinear interpretate
+            # f(x,y)=Q12*(1-x_lerp)*(1-y_lerp)+Q22*x_lerp*(1-y_lerp)+Q11*(1-x_lerp)*y_lerp+Q21*x_lerp*y_lerp
+            xy_q = y_lerp_q*x_lerp_q >> qvalue
+            fourpoint_sum = (top_left+bottom_right-top_right-bottom_left)*xy_q
+            top = (top_left.long() << qvalue) + ((top_right-top_left) * x_lerp_q)
+            bottom = (bottom_left - top_left) * y_lerp_q
+            data_q = (fourpoint_sum+top+bottom).long() >> qvalue
+
+            resize_feature[boxidx] = data_q.to(resize_feature.dtype)
         resize_feature = torch.clamp(resize_feature, node.outputs[0].qmin, node.outputs[0].qmax)
     else:
         resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_), device=dev)
         # for batchidx in range(feature.shape[0]):
         batch_idx = 0
-        for boxidx in range(nor_box.shape[1]):
-            feature = feature_maps[roi_level[boxidx] - 1]
-
+        # roi_level - 1 indexes feature_maps like a python list (roi_level=0 picks the last one)
+        feature_idx = (roi_level.long() - 1) % len(feature_maps)
+        for fidx, feature in enumerate(feature_maps):
+            boxidx = torch.where(feature_idx == fidx)[0]
+            if boxidx.numel() < 1:
+                continue
             y0 = nor_box[batch_idx, boxidx, 0]
             x0 = nor_box[batch_idx, boxidx, 1]
             y1 = nor_box[batch_idx, boxidx, 2]
             x1 = nor_box[batch_idx, boxidx, 3]
             image_width = feature.shape[1]
             image_height = feature.shape[2]
-            channel = feature.shape[3]
 
             height_scale = (y1 - y0) * (image_height - 1) / (resize_height_ - 1)
             width_scale = (x1 - x0) * (image_width - 1) / (resize_width_ - 1)
 
-            x = (image_width-1) * x0 + torch.arange(0, resize_width_, device=dev) * width_scale
-            y = (image_height-1) * y0 + torch.arange(0, resize_height_, device=dev) * height_scale
+            # [box_num, resize_width_] and [box_num, resize_height_]
+            x = ((image_width-1) * x0)[:, None] + torch.arange(0, resize_width_, device=dev) * width_scale[:, None]
+            y = ((image_height-1) * y0)[:, None] + torch.arange(0, resize_height_, device=dev) * height_scale[:, None]
 
             yy = torch.clamp(y, 0,  image_width - 1)
             xx = torch.clamp(x, 0, image_height - 1)
             top_y_index = (torch.floor(yy)).int()
             bottom_y_index = (torch.ceil(yy)).int()
-            y_lerp = (yy - top_y_index).reshape(resize_height_, 1).repeat(1, channel)
+            y_lerp = (yy - top_y_index)[:, :, None, None]
             left_x_index = (torch.floor(xx)).int()
             right_x_index = (torch.ceil(xx)).int()
-            x_lerp = (xx - left_x_index).reshape(resize_width_, 1).repeat(1, channel)
-
-            for idxh in range(resize_height_):
-                for idxw in range(resize_width_):
-                    # get 4 point
-                    top_left = feature[0, top_y_index[idxh], left_x_index[idxw], :]  # Q12
-                    top_right = feature[0, top_y_index[idxh], right_x_index[idxw], :]  # Q22
-                    bottom_left = feature[0, bottom_y_index[idxh], left_x_index[idxw], :]  # Q11
-                    bottom_right = feature[0, bottom_y_index[idxh], right_x_index[idxw], :]  # Q21
-
-                    # bilinear interpretate
-                    # f(x,y)=Q12*(1-x_lerp)*(1-y_lerp)+Q22*x_lerp*(1-y_lerp)+Q11*(1-x_lerp)*y_lerp+Q21*x_lerp*y_lerp
-                    # Q11=bottom_left
-                    # Q12=top_left
-                    # Q21=bottom_right
-                    # Q22=top_right
-                    # data=top_left*(1-x_lerp[idxw,:])*(1-y_lerp[idxh,:])+top_right*(1-y_lerp[idxh,:])*x_lerp[idxw,:]
-                    # data=data+bottom_left*(1-x_lerp[idxw,:])*y_lerp[idxh,:]+bottom_right*x_lerp[idxw,:]*y_lerp[idxh,:]
-                    xy = y_lerp[idxh, :]*x_lerp[idxw, :]
-                    fourpoint_sum = (top_left+bottom_right-top_right-bottom_left)*xy
-                    top = top_left + (top_right-top_left) * x_lerp[idxw, :]
-                    bottom = (bottom_left - top_left) * y_lerp[idxh, :]
-                    data = fourpoint_sum+top+bottom
-
-                    resize_feature[boxidx, idxh, idxw, :] = data
+            x_lerp = (xx - left_x_index)[:, None, :, None]
+            top_y_index, bottom_y_index = top_y_index[:, :, None], bottom_y_index[:, :, None]
+            left_x_index, right_x_index = left_x_index[:, None, :], right_x_index[:, None, :]
+
+            # get 4 point
+            top_left = feature[0, top_y_index, left_x_index, :]  # Q12
+            top_right = feature[0, top_y_index, right_x_index, :]  # Q22
+            bottom_left = feature[0, bottom_y_index, left_x_index, :]  # Q11
+            bottom_right = feature[0, bottom_y_index, right_x_index, :]  # Q21
+
+            # bilinear interpretate
+            # f(x,y)=Q12*(1-x_lerp)*(1-y_lerp)+Q22*x_lerp*(1-y_lerp)+Q11*(1-x_lerp)*y_lerp+Q21*x_lerp*y_lerp
+            xy = y_lerp*x_lerp
+            fourpoint_sum = (top_left+bottom_right-top_right-bottom_left)*xy
+            top = top_left + (top_right-top_left) * x_lerp
+            bottom = (bottom_left - top_left) * y_lerp
+            data = fourpoint_sum+top+bottom
+
+            resize_feature[boxidx] = data.to(resize_feature.dtype)
     return resize_feature
 
 
@@ -63,34 +63,35 @@ def get_roi_one_batch(region,
         proposal[3]
     proposal_class, num_proposal_class = torch.unique(cls_idxs, return_counts=True)
     total_class_num = proposal_class.numel()
-    start_ps = torch.cumsum(num_proposal_class, dim=0) - num_proposal_class
-    end_ps = torch.cumsum(num_proposal_class, dim=0)
-    for t in range(total_class_num):
-        idx = torch.where(cls_idxs == proposal_class[t])
-        tx = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 0]
-        ty = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 1]
-        tw = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 2]
-        th = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 3]
-
-        if grid_compensate and grid_height % 2 == 0 and grid_width % 2 == 0:
-            x = (gw_idxs[idx] - 0.5 + torch.sigmoid(tx)) / grid_width
-            y = (gh_idxs[idx] - 0.5 + torch.sigmoid(ty)) / grid_height
-
-        else:
-            x = (gw_idxs[idx] + torch.sigmoid(tx)) / grid_width
-            y = (gh_idxs[idx] + torch.sigmoid(ty)) / grid_height
-        w = anchors_t[2*box_idxs[idx] + 0] * torch.exp(tw) / grid_width
-        h = anchors_t[2*box_idxs[idx] + 1] * torch.exp(th) / grid_height
-
-        ymin = torch.clamp(y - h / 2., 0., 1.)
-        xmin = torch.clamp(x - w / 2., 0., 1.)
-        ymax = torch.clamp(y + h / 2., 0., 1.)
-        xmax = torch.clamp(x + w / 2., 0., 1.)
-
-        roi_box = torch.stack([ymin, xmin, ymax, xmax], axis=-1)
-        roi_boxes[start_ps[t]:end_ps[t], :] = roi_box
-        roi_scores[start_ps[t]:end_ps[t]] = region[gh_idxs[idx],
-                                                   gw_idxs[idx], box_idxs[idx], coords_and_conf_num+cls_idxs[idx]]
+    if cls_idxs.numel() < 1:
+        return roi_boxes, roi_scores, num_proposal_class, proposal_class, total_class_num
+    # the proposals are grouped by class, the proposals of one class keep their order
+    class_order = torch.sort(cls_idxs, stable=True)[1]
+    gh_idxs, gw_idxs, box_idxs, cls_idxs = gh_idxs[class_order], gw_idxs[class_order], \
+        box_idxs[class_order], cls_idxs[class_order]
+    tx = region[gh_idxs, gw_idxs, box_idxs, 0]
+    ty = region[gh_idxs, gw_idxs, box_idxs, 1]
+    tw = region[gh_idxs, gw_idxs, box_idxs, 2]
+    th = region[gh_idxs, gw_idxs, box_idxs, 3]
+
+    if grid_compensate and grid_height % 2 == 0 and grid_width % 2 == 0:
+        x = (gw_idxs - 0.5 + torch.sigmoid(tx)) / grid_width
+        y = (gh_idxs - 0.5 + torch.sigmoid(ty)) / grid_height
+
+    else:
+        x = (gw_idxs + torch.sigmoid(tx)) / grid_width
+        y = (gh_idxs + torch.sigmoid(ty)) / grid_height
+    w = anchors_t[2*box_idxs + 0] * torch.exp(tw) / grid_width
+    h = anchors_t[2*box_idxs + 1] * torch.exp(th) / grid_height
+
+    ymin = torch.clamp(y - h / 2., 0., 1.)
+    xmin = torch.clamp(x - w / 2., 0., 1.)
+    ymax = torch.clamp(y + h / 2., 0., 1.)
+    xmax = torch.clamp(x + w / 2., 0., 1.)
+
+    roi_box = torch.stack([ymin, xmin, ymax, xmax], axis=-1)
+    roi_boxes[:cls_idxs.numel(), :] = roi_box
+    roi_scores[:cls_idxs.numel()] = region[gh_idxs, gw_idxs, box_idxs, coords_and_conf_num+cls_idxs]
 
     return roi_boxes, roi_scores, num_proposal_class, proposal_class, total_class_num
 
@@ -133,47 +134,48 @@ def get_roi_one_batch_quant(self, region,
 
     proposal_class, num_proposal_class = torch.unique(cls_idxs, return_counts=True)
     total_class_num = proposal_class.numel()
-    start_ps = torch.cumsum(num_proposal_class, dim=0) - num_proposal_class
-    end_ps = torch.cumsum(num_proposal_class, dim=0)
-    for t in range(total_class_num):
-        idx = torch.where(cls_idxs == proposal_class[t])
-        tx = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 0]
-        ty = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 1]
-        tw = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 2]
-        th = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 3]
-
-        x_lut = lookup_lut_powerof2(tx, xy_sigmoid_lut, xy_in_bits, xy_in_is_signed,
-                                    xy_out_bits, xy_out_is_signed).int()
-        y_lut = lookup_lut_powerof2(ty, xy_sigmoid_lut, xy_in_bits, xy_in_is_signed,
-                                    xy_out_bits, xy_out_is_signed).int()
-        w_lut = lookup_lut_powerof2(tw, wh_exp_lut, wh_in_bits, wh_in_is_signed, wh_out_bits, wh_out_is_signed).int()
-        h_lut = lookup_lut_powerof2(th, wh_exp_lut, wh_in_bits, wh_in_is_signed, wh_out_bits, wh_out_is_signed).int()
-
-        x = (gw_idxs[idx] << grid_col_shift).int() + x_lut.int()
-        x = (x * grid_w_scale).int() >> grid_w_shift
-        y = (gh_idxs[idx] << grid_row_shift).int() + y_lut.int()
-        y = (y * grid_h_scale).int() >> grid_h_shift
-
-        wh_exp_h_shift = self.get_param('wh_exp_shift')
-        wh_exp_h_scale = self.get_param('wh_exp_scale')
-        w1 = (anchors_t[(2*box_idxs[idx].long() + 0)] * grid_w_scale).int() >> grid_w_shift
-        # w2 = wh_exp_lut[tw.long() + 128].int()*wh_exp_h_scale>>wh_exp_h_shift
-        w2 = w_lut*wh_exp_h_scale >> wh_exp_h_shift
-        w = (w1 * w2).int() >> anchor_exp_w_shift
-
-        h1 = (anchors_t[(2*box_idxs[idx].long() + 1)] * grid_h_scale).int() >> grid_h_shift
-        # h2 = wh_exp_lut[th.long() + 128].int()*wh_exp_h_scale>>wh_exp_h_shift
-        h2 = h_lut * wh_exp_h_scale >> wh_exp_h_shift
-        h = (h1 * h2).int() >> anchor_exp_h_shift
-
-        ymin = torch.clamp(y - (h >> 1), 0, 2**grid_row_shift)
-        xmin = torch.clamp(x - (w >> 1), 0, 2**grid_col_shift)
-        ymax = torch.clamp(y + (h >> 1), 0, 2**grid_row_shift)
-        xmax = torch.clamp(x + (w >> 1), 0, 2**grid_col_shift)
-        roi_box = torch.stack([ymin, xmin, ymax, xmax], axis=-1)
-        roi_boxes[start_ps[t]:end_ps[t], :] = roi_box
-        roi_scores[start_ps[t]:end_ps[t]] = region[gh_idxs[idx], gw_idxs[idx],
-                                                   box_idxs[idx], coords_and_conf_num+cls_idxs[idx]].int()
+    if cls_idxs.numel() < 1:
+        return roi_boxes, roi_scores, num_proposal_class, proposal_class, total_class_num
+    # the proposals are grouped by class, the proposals of one class keep their order
+    class_order = torch.sort(cls_idxs, stable=True)[1]
+    gh_idxs, gw_idxs, box_idxs, cls_idxs = gh_idxs[class_order], gw_idxs[class_order], \
+        box_idxs[class_order], cls_idxs[class_order]
+    tx = region[gh_idxs, gw_idxs, box_idxs, 0]
+    ty = region[gh_idxs, gw_idxs, box_idxs, 1]
+    tw = region[gh_idxs, gw_idxs, box_idxs, 2]
+    th = region[gh_idxs, gw_idxs, box_idxs, 3]
+
+    x_lut = lookup_lut_powerof2(tx, xy_sigmoid_lut, xy_in_bits, xy_in_is_signed,
+                                xy_out_bits, xy_out_is_signed).int()
+    y_lut = lookup_lut_powerof2(ty, xy_sigmoid_lut, xy_in_bits, xy_in_is_signed,
+                                xy_out_bits, xy_out_is_signed).int()
+    w_lut = lookup_lut_powerof2(tw, wh_exp_lut, wh_in_bits, wh_in_is_signed, wh_out_bits, wh_out_is_signed).int()
+    h_lut = lookup_lut_powerof2(th, wh_exp_lut, wh_in_bits, wh_in_is_signed, wh_out_bits, wh_out_is_signed).int()
+
+    x = (gw_idxs << grid_col_shift).int() + x_lut.int()
+    x = (x * grid_w_scale).int() >> grid_w_shift
+    y = (gh_idxs << grid_row_shift).int() + y_lut.int()
+    y = (y * grid_h_scale).int() >> grid_h_shift
+
+    wh_exp_h_shift = self.get_param('wh_exp_shift')
+    wh_exp_h_scale = self.get_param('wh_exp_scale')
+    w1 = (anchors_t[(2*box_idxs.long() + 0)] * grid_w_scale).int() >> grid_w_shift
+    # w2 = wh_exp_lut[tw.long() + 128].int()*wh_exp_h_scale>>wh_exp_h_shift
+    w2 = w_lut*wh_exp_h_scale >> wh_exp_h_shift
+    w = (w1 * w2).int() >> anchor_exp_w_shift
+
+    h1 = (anchors_t[(2*box_idxs.long() + 1)] * grid_h_scale).int() >> grid_h_shift
+    # h2 = wh_exp_lut[th.long() + 128].int()*wh_exp_h_scale>>wh_exp_h_shift
+    h2 = h_lut * wh_exp_h_scale >> wh_exp_h_shift
+    h = (h1 * h2).int() >> anchor_exp_h_shift
+
+    ymin = torch.clamp(y - (h >> 1), 0, 2**grid_row_shift)
+    xmin = torch.clamp(x - (w >> 1), 0, 2**grid_col_shift)
+    ymax = torch.clamp(y + (h >> 1), 0, 2**grid_row_shift)
+    xmax = torch.clamp(x + (w >> 1), 0, 2**grid_col_shift)
+    roi_box = torch.stack([ymin, xmin, ymax, xmax], axis=-1)
+    roi_boxes[:cls_idxs.numel(), :] = roi_box
+    roi_scores[:cls_idxs.numel()] = region[gh_idxs, gw_idxs, box_idxs, coords_and_conf_num+cls_idxs].int()
     return roi_boxes, roi_scores, num_proposal_class, proposal_class, total_class_num
 
 
@@ -10,6 +10,24 @@ import math
 from torchvision.ops import roi_align
 
 
+def _roi_batch_index(rois, batch):
+    # the long batch index of each roi (clamped for gathering) and whether it is valid
+    batch_idx = rois[:, 0]
+    for r in torch.nonzero(batch_idx < 0).flatten().tolist():
+        OPT_WARN(f"RoiAlign layer: the batch_index of box_id={r} is {batch_idx[r]} < 0.")
+    for r in torch.nonzero((batch_idx >= 0) & (batch_idx > batch - 1)).flatten().tolist():
+        OPT_ERROR(f"RoiAlign layer: batch_index={batch_idx[r]} should be < the featuremap batch_size={batch}")
+    valid = (batch_idx >= 0) & (batch_idx <= batch - 1)
+    return batch_idx.long().clamp(0, max(0, batch - 1)), valid
+
+
+def roi_chunks(roi_num, roi_elements, max_elements=1 << 22):
+    # split rois into chunks so that the per-sample temporaries are bounded
+    step = max(1, max_elements // max(1, roi_elements))
+    for r0 in range(0, roi_num, step):
+        yield slice(r0, min(roi_num, r0 + step))
+
+
 def local_float_roi_align(fm, rois, params):
     out_height, out_width = params['output_size']
     spatial_y, spatial_x = params['spatial_scale']
@@ -18,104 +36,85 @@ def local_float_roi_align(fm, rois, params):
     is_half_pixel = params['is_half_pixel']
 
     # nhwc
-    in_height, in_width, in_depth = fm.shape[1:]
+    batch, in_height, in_width, in_depth = fm.shape
     roi_num = rois.shape[0]
     dev = fm.device
-    output_shape = [roi_num, out_height, out_width, fm.shape[-1]]
-    out = torch.zeros(*output_shape)
+    out = torch.zeros([roi_num, out_height, out_width, in_depth], device=dev)
     half_pixel_offset = 0.5 if is_half_pixel else 0.
-    for r in range(roi_num):
-        batch_idx = rois[r, 0]
-        if batch_idx < 0:
-            OPT_WARN(f"RoiAlign layer: the batch_index of box_id={r} is {batch_idx} < 0.")
-            continue
-        if batch_idx > fm.shape[0] - 1:
-            OPT_ERROR(f"RoiAlign layer: batch_index={batch_idx} should be < the featuremap batch_size={fm.shape[0]}")
-            continue
-
-        batch_base = torch.flatten(fm[batch_idx.long()])
-        w_roi_start = rois[r, 2] * spatial_x - half_pixel_offset
-        w_roi_end = rois[r, 4] * spatial_x - half_pixel_offset
-        h_roi_start = rois[r, 1] * spatial_y - half_pixel_offset
-        h_roi_end = rois[r, 3] * spatial_y - half_pixel_offset
-
-        roi_width = w_roi_end - w_roi_start
-        roi_height = h_roi_end - h_roi_start
-        if not is_half_pixel:
-            roi_width = torch.maximum((roi_width), torch.tensor(1.0, device=dev))
-            roi_height = torch.maximum((roi_height), torch.tensor(1.0, device=dev))
-
-        w_step_size = roi_width / out_width
-        h_step_size = roi_height / out_height
-
-        # if sampling_ratio=0, use adaptive value of ceil(roi_width/out_width), same for height
-        w_sampling_ratio = w_sample_ratio if w_sample_ratio > 0 else int(math.ceil(w_step_size))
-        h_sampling_ratio = h_sample_ratio if h_sample_ratio > 0 else int(math.ceil(h_step_size))
-
-        w_bin_size = w_step_size / w_sampling_ratio
-        h_bin_size = h_step_size / h_sampling_ratio
-
-        for i in range(out_height):
-            for j in range(out_width):
-                w_start = w_step_size * j + w_roi_start
-                w_end = w_step_size * (j + 1) + w_roi_start
-                h_start = h_step_size * i + h_roi_start
-                h_end = h_step_size * (i + 1) + h_roi_start
-
-                if method == 'avg':
-                    out_k = torch.zeros(in_depth, device=dev)
-                else:  # method == max
-                    out_k = torch.full([in_depth], torch.finfo(torch.float32).min)
-                for y_ind in range(h_sampling_ratio):
-                    y = h_start + h_bin_size / 2 + h_bin_size * y_ind
-                    for x_ind in range(w_sampling_ratio):
-
-                        x = w_start + w_bin_size / 2 + w_bin_size * x_ind
-
-                        if y < -1.0 or y > in_height or x < -1.0 or x > in_width:
-                            ws = [0., 0., 0., 0.]
-                            offset = [0, 0, 0, 0]
-                        else:
-                            y = torch.minimum(torch.maximum(y, torch.tensor(0., device=dev)),
-                                              torch.tensor(in_height - 1, dtype=torch.float32, device=dev))
-                            x = torch.minimum(torch.maximum(x, torch.tensor(0., device=dev)),
-                                              torch.tensor(in_width - 1, dtype=torch.float32, device=dev))
-                            x_low = torch.floor(x)
-                            y_low = torch.floor(y)
-                            x_high = torch.minimum((x_low + 1), torch.tensor(in_width - 1, device=dev))
-                            y_high = torch.minimum((y_low + 1), torch.tensor(in_height - 1, device=dev))
-                            dx1 = x - x_low
-                            dy1 = y - y_low
-                            dx2 = 1. - dx1
-                            dy2 = 1. - dy1
-
-                            ws = [dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1]
-                            offset = [y_low * in_width * in_depth + x_low * in_depth,
-                                      y_low * in_width * in_depth + x_high * in_depth,
-                                      y_high * in_width * in_depth + x_low * in_depth,
-                                      y_high * in_width * in_depth + x_high * in_depth
-                                      ]
-                            offset = [o.long() for o in offset]
-                        for k in range(in_depth):
-                            if method == 'avg':
-                                interpolation = 0
-                                for c in range(4):
-                                    interpolation += ws[c] * batch_base[offset[c] + k]
-                                out_k[k] += interpolation
-                            else:  # max
-                                max_4points = torch.max(torch.tensor([ws[0] * batch_base[offset[0] + k],
-                                                                      ws[1] * batch_base[offset[1] + k],
-                                                                      ws[2] * batch_base[offset[2] + k],
-                                                                      ws[3] * batch_base[offset[3] + k],
-                                                                      ]))
-                                out_k[k] = torch.maximum(out_k[k], max_4points)
-
+    rois = rois.to(dev)
+    batch_idx, valid = _roi_batch_index(rois, batch)
+
+    w_roi_start = rois[:, 2] * spatial_x - half_pixel_offset
+    w_roi_end = rois[:, 4] * spatial_x - half_pixel_offset
+    h_roi_start = rois[:, 1] * spatial_y - half_pixel_offset
+    h_roi_end = rois[:, 3] * spatial_y - half_pixel_offset
+    roi_width = w_roi_end - w_roi_start
+    roi_height = h_roi_end - h_roi_start
+    if not is_half_pixel:
+        roi_width = torch.maximum(roi_width, torch.tensor(1.0, device=dev))
+        roi_height = torch.maximum(roi_height, torch.tensor(1.0, device=dev))
+    w_step_size = roi_width / out_width
+    h_step_size = roi_height / out_height
+    # if sampling_ratio=0, use adaptive value of ceil(roi_width/out_width), same for height
+    w_sampling_ratio = torch.full_like(w_step_size, w_sample_ratio).long() if w_sample_ratio > 0 \
+        else torch.ceil(w_step_size).long()
+    h_sampling_ratio = torch.full_like(h_step_size, h_sample_ratio).long() if h_sample_ratio > 0 \
+        else torch.ceil(h_step_size).long()
+    w_bin_size = w_step_size / w_sampling_ratio
+    h_bin_size = h_step_size / h_sampling_ratio
+    # [roi_num, out_height] and [roi_num, out_width]
+    h_start = h_step_size[:, None] * torch.arange(out_height, device=dev, dtype=h_step_size.dtype) + h_roi_start[:, None]
+    w_start = w_step_size[:, None] * torch.arange(out_width, device=dev, dtype=w_step_size.dtype) + w_roi_start[:, None]
+    max_h_ratio = int(h_sampling_ratio.max().item()) if roi_num > 0 else 0
+    max_w_ratio = int(w_sampling_ratio.max().item()) if roi_num > 0 else 0
+
+    for rs in roi_chunks(roi_num, out_height * out_width * in_depth):
+        rnum = rs.stop - rs.start
+        if method == 'avg':
+            acc = torch.zeros([rnum, out_height, out_width, in_depth], device=dev)
+        else:  # method == max
+            acc = torch.full([rnum, out_height, out_width, in_depth], torch.finfo(torch.float32).min, device=dev)
+        bidx = batch_idx[rs][:, None, None]
+        for y_ind in range(max_h_ratio):
+            y = h_start[rs] + (h_bin_size[rs] / 2)[:, None] + (h_bin_size[rs] * y_ind)[:, None]
+            y_oob = (y < -1.0) | (y > in_height)
+            y = torch.clamp(y, 0., in_height - 1)
+            y_low = torch.floor(y)
+            y_high = torch.clamp(y_low + 1, max=in_height - 1)
+            dy1 = (y - y_low)[:, :, None]
+            dy2 = 1. - dy1
+            for x_ind in range(max_w_ratio):
+                x = w_start[rs] + (w_bin_size[rs] / 2)[:, None] + (w_bin_size[rs] * x_ind)[:, None]
+                x_oob = (x < -1.0) | (x > in_width)
+                x = torch.clamp(x, 0., in_width - 1)
+                x_low = torch.floor(x)
+                x_high = torch.clamp(x_low + 1, max=in_width - 1)
+                dx1 = (x - x_low)[:, None, :]
+                dx2 = 1. - dx1
+
+                # out of bound points are weighted by 0 on the first pixel
+                oob = y_oob[:, :, None] | x_oob[:, None, :]
+                ws = [torch.where(oob, 0., w) for w in [dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1]]
+                yl = torch.where(oob, 0, y_low.long()[:, :, None])
+                yh = torch.where(oob, 0, y_high.long()[:, :, None])
+                xl = torch.where(oob, 0, x_low.long()[:, None, :])
+                xh = torch.where(oob, 0, x_high.long()[:, None, :])
+                points = [fm[bidx, yl, xl], fm[bidx, yl, xh], fm[bidx, yh, xl], fm[bidx, yh, xh]]
+                sampled = ((y_ind < h_sampling_ratio[rs]) & (x_ind < w_sampling_ratio[rs]))[:, None, None, None]
                 if method == 'avg':
-                    out_k = out_k / (w_sampling_ratio * h_sampling_ratio)
+                    interpolation = ws[0][..., None] * points[0]
+                    for c in range(1, 4):
+                        interpolation = interpolation + ws[c][..., None] * points[c]
+                    acc = torch.where(sampled, acc + interpolation, acc)
                 else:  # max
-                    pass
-                out[r, i, j, :] = out_k
-    return out.to(dev)
+                    max_4points = ws[0][..., None] * points[0]
+                    for c in range(1, 4):
+                        max_4points = torch.maximum(max_4points, ws[c][..., None] * points[c])
+                    acc = torch.where(sampled, torch.maximum(acc, max_4points), acc)
+        if method == 'avg':
+            acc = acc / (w_sampling_ratio[rs] * h_sampling_ratio[rs])[:, None, None, None]
+        out[rs] = torch.where(valid[rs][:, None, None, None], acc, out[rs])
+    return out
 
 
 def quant_roi_align_with_zero_sample(fm, rois, method, is_half_pixel, pooled_shape, sample, spatial, spatial_shift,
@@ -124,161 +123,132 @@ def quant_roi_align_with_zero_sample(fm, rois, method, is_half_pixel, pooled_sha
     h_sample, w_sample = sample
     spatial_y, spatial_x = spatial
     roi_num = rois.shape[0]
-    _, fm_height, fm_width, fm_channel = fm.shape[:]
+    batch, fm_height, fm_width, fm_channel = fm.shape[:]
     do_scale, do_shift = scale_shift_pairs['total_scale_shift']
     input1_scale, input1_shift = scale_shift_pairs['roi_scale_shift']
     total_shift = do_shift + spatial_shift
     half_pixel_offset = 2 ** (spatial_shift - 1) if is_half_pixel else 0  # 0.5 * 2 ** spatial_shift
     dev = fm.device
+    rois = rois.to(dev)
 
     out = torch.zeros([roi_num, out_h, out_w, fm_channel], device=dev)
-    for box_idx in range(roi_num):
-        batch_idx = rois[box_idx, 0]
-        if batch_idx < 0:
-            OPT_WARN(f"RoiAlign layer: the batch_index of box_id={box_idx} is {batch_idx} < 0.")
-            continue
-
-        if batch_idx > fm.shape[0] - 1:
-            OPT_ERROR(f"RoiAlign layer: batch_index={batch_idx} should be < the featuremap batch_size={fm.shape[0]}")
-            continue
-
-        y_start = (rois[box_idx, 1] * spatial_y * input1_scale * (0.5 ** input1_shift)).int() - half_pixel_offset
-        x_start = (rois[box_idx, 2] * spatial_x * input1_scale * (0.5 ** input1_shift)).int() - half_pixel_offset
-        y_end = (rois[box_idx, 3] * spatial_y * input1_scale * (0.5 ** input1_shift)).int() - half_pixel_offset
-        x_end = (rois[box_idx, 4] * spatial_x * input1_scale * (0.5 ** input1_shift)).int() - half_pixel_offset
-        data = fm[batch_idx.long()].reshape(-1).double()
-        # 2. Region out of bound:   || x1|x2 > inWidth || y1|y2 > inHeight
-        if (x_end < x_start) | (y_end < y_start):
-            continue
-        if ((x_end.item() > (fm_width * (2 ** spatial_shift))) or (y_end.item() > (fm_height * (2 ** spatial_shift)))):
-            continue
-        if is_half_pixel:
-            roi_width = x_end - x_start
-            roi_height = y_end - y_start
-        else:
-            roi_width = torch.maximum(x_end - x_start, torch.tensor(2 ** spatial_shift, device=dev))
-            roi_height = torch.maximum(y_end - y_start, torch.tensor(2 ** spatial_shift, device=dev))
-        w_step_size = torch.div(roi_width, out_w * (2 ** spatial_shift), rounding_mode='trunc').long()
-        h_step_size = torch.div(roi_height, out_h * (2 ** spatial_shift), rounding_mode='trunc').long()
-        w_step_size_mod = roi_width - w_step_size * (out_w * 2 ** spatial_shift)
-        h_step_size_mod = roi_height - h_step_size * (out_h * 2 ** spatial_shift)
-        if w_sample > 0:
-            w_sample_ratio = w_sample
-        else:
-            if w_step_size_mod > 0:
-                w_sample_ratio = w_step_size + 1
-            else:
-                w_sample_ratio = w_step_size
-        if h_sample > 0:
-            h_sample_ratio = h_sample
+    batch_idx, valid = _roi_batch_index(rois, batch)
+    y_start = (rois[:, 1] * spatial_y * input1_scale * (0.5 ** input1_shift)).int().long() - half_pixel_offset
+    x_start = (rois[:, 2] * spatial_x * input1_scale * (0.5 ** input1_shift)).int().long() - half_pixel_offset
+    y_end = (rois[:, 3] * spatial_y * input1_scale * (0.5 ** input1_shift)).int().long() - half_pixel_offset
+    x_end = (rois[:, 4] * spatial_x * input1_scale * (0.5 ** input1_shift)).int().long() - half_pixel_offset
+    # 2. Region out of bound:   || x1|x2 > inWidth || y1|y2 > inHeight
+    valid = valid & (x_end >= x_start) & (y_end >= y_start)
+    valid = valid & (x_end <= fm_width * (2 ** spatial_shift)) & (y_end <= fm_height * (2 ** spatial_shift))
+    roi_width = x_end - x_start
+    roi_height = y_end - y_start
+    if not is_half_pixel:
+        roi_width = torch.clamp(roi_width, min=2 ** spatial_shift)
+        roi_height = torch.clamp(roi_height, min=2 ** spatial_shift)
+    w_step_size = torch.div(roi_width, out_w * (2 ** spatial_shift), rounding_mode='trunc')
+    h_step_size = torch.div(roi_height, out_h * (2 ** spatial_shift), rounding_mode='trunc')
+    w_step_size_mod = roi_width - w_step_size * (out_w * 2 ** spatial_shift)
+    h_step_size_mod = roi_height - h_step_size * (out_h * 2 ** spatial_shift)
+    w_sample_ratio = torch.full_like(w_step_size, w_sample) if w_sample > 0 \
+        else torch.where(w_step_size_mod > 0, w_step_size + 1, w_step_size)
+    h_sample_ratio = torch.full_like(h_step_size, h_sample) if h_sample > 0 \
+        else torch.where(h_step_size_mod > 0, h_step_size + 1, h_step_size)
+    # an empty roi has no sample points
+    valid = valid & (w_sample_ratio > 0) & (h_sample_ratio > 0)
+    w_sample_ratio = torch.clamp(w_sample_ratio, min=1)
+    h_sample_ratio = torch.clamp(h_sample_ratio, min=1)
+    num_sample_points = w_sample_ratio * h_sample_ratio
+
+    w_bin_size = torch.div(w_step_size * out_w * (2 ** spatial_shift) + w_step_size_mod,
+                           w_sample_ratio * out_w * (2 ** spatial_shift), rounding_mode='trunc')
+    h_bin_size = torch.div(h_step_size * out_h * (2 ** spatial_shift) + h_step_size_mod,
+                           h_sample_ratio * out_h * (2 ** spatial_shift), rounding_mode='trunc')
+    w_bin_size_mod = w_step_size * out_w * (2 ** spatial_shift) + \
+        w_step_size_mod - w_bin_size * w_sample_ratio * out_w * (2 ** spatial_shift)
+    h_bin_size_mod = h_step_size * out_h * (2 ** spatial_shift) + \
+        h_step_size_mod - h_bin_size * h_sample_ratio * out_h * (2 ** spatial_shift)
+    xscale1 = (out_w * w_sample_ratio * (2 ** (spatial_shift + 1)))[:, None]
+    xscale2 = (2 * w_sample_ratio)[:, None]
+    xscale3 = (out_w * w_sample_ratio * (2 ** spatial_shift))[:, None]
+    yscale1 = (out_h * h_sample_ratio * (2 ** (spatial_shift + 1)))[:, None]
+    yscale2 = (2 * h_sample_ratio)[:, None]
+    yscale3 = (out_h * h_sample_ratio * (2 ** spatial_shift))[:, None]
+    # [roi_num, out_w] and [roi_num, out_h]
+    jj = torch.arange(out_w, device=dev)
+    ii = torch.arange(out_h, device=dev)
+    w_start = w_step_size[:, None] * jj
+    w_start_mod = w_step_size_mod[:, None] * jj + (x_start * out_w)[:, None]
+    h_start = h_step_size[:, None] * ii
+    h_start_mod = h_step_size_mod[:, None] * ii + (y_start * out_h)[:, None]
+
+    def _coordinates(start, start_mod, bin_size, bin_size_mod, scale1, scale2, scale3, ind, size):
+        # the integer coordinate, its next one and the fraction (in scale1) of the ind-th sample point
+        pos = start + (bin_size * ind)[:, None]
+        tmp1 = scale2 * start_mod + (scale3[:, 0] * bin_size + bin_size_mod + 2 * bin_size_mod * ind)[:, None]
+        tmp2 = torch.div(tmp1, scale1, rounding_mode='trunc')
+        p1 = pos + tmp2
+        p2 = p1 + 1
+        d1 = tmp1 - tmp2 * scale1
+        edge = p1 >= size - 1
+        p1 = torch.where(edge, size - 1, p1)
+        p2 = torch.where(edge, size - 1, p2)
+        d1 = torch.where(edge, 0, d1)
+        d2 = scale1 - d1
+        oob = (p1 < -1) | (p1 > size)
+        low = p1 <= 0
+        p1 = torch.where(low, 0, p1)
+        p2 = torch.where(low, 1, p2)
+        d1 = torch.div(d1, 2, rounding_mode='trunc')
+        d2 = torch.div(d2, 2, rounding_mode='trunc')
+        return p1, p2, d1, d2, oob
+
+    data = fm.reshape(batch, -1).double()
+    kk = torch.arange(fm_channel, device=dev)
+    max_h_ratio = int(h_sample_ratio.max().item()) if roi_num > 0 else 0
+    max_w_ratio = int(w_sample_ratio.max().item()) if roi_num > 0 else 0
+    for rs in roi_chunks(roi_num, out_h * out_w * fm_channel):
+        rnum = rs.stop - rs.start
+        if method == 'avg':
+            acc = torch.zeros([rnum, out_h, out_w, fm_channel], device=dev, dtype=torch.float64)
         else:
-            if h_step_size_mod > 0:
-                h_sample_ratio = h_step_size + 1
-            else:
-                h_sample_ratio = h_step_size
-        num_sample_points = w_sample_ratio * h_sample_ratio
-
-        w_bin_size = torch.div(w_step_size * out_w * (2 ** spatial_shift) + w_step_size_mod,
-                               w_sample_ratio * out_w * (2 ** spatial_shift), rounding_mode='trunc').int()
-        h_bin_size = torch.div(h_step_size * out_h * (2 ** spatial_shift) + h_step_size_mod,
-                               h_sample_ratio * out_h * (2 ** spatial_shift), rounding_mode='trunc').int()
-        w_bin_size_mod = w_step_size * out_w * (2 ** spatial_shift) + \
-            w_step_size_mod - w_bin_size * w_sample_ratio * out_w * (2 ** spatial_shift)
-        h_bin_size_mod = h_step_size * out_h * (2 ** spatial_shift) + \
-            h_step_size_mod - h_bin_size * h_sample_ratio * out_h * (2 ** spatial_shift)
-
-        for i in range(out_h):
-            for j in range(out_w):
-                w_start = w_step_size * j
-                w_start_mod = w_step_size_mod * j + x_start * out_w
-                h_start = h_step_size * i
-                h_start_mod = h_step_size_mod * i + y_start * out_h
+            acc = torch.full([rnum, out_h, out_w, fm_channel], -2 ** 31, device=dev, dtype=torch.float64)
+        bidx = batch_idx[rs][:, None, None, None]
+        for yInd in range(max_h_ratio):
+            y1, y2, dy1, dy2, y_oob = _coordinates(h_start[rs], h_start_mod[rs], h_bin_size[rs], h_bin_size_mod[rs],
+                                                   yscale1[rs], yscale2[rs], yscale3[rs], yInd, fm_height)
+            for xInd in range(max_w_ratio):
+                x1, x2, dx1, dx2, x_oob = _coordinates(w_start[rs], w_start_mod[rs], w_bin_size[rs],
+                                                       w_bin_size_mod[rs], xscale1[rs], xscale2[rs], xscale3[rs],
+                                                       xInd, fm_width)
+                # out of bound points are weighted by 0 on the first pixel
+                oob = y_oob[:, :, None] | x_oob[:, None, :]
+                ws = (dx2[:, None, :] * dy2[:, :, None], dx1[:, None, :] * dy2[:, :, None],
+                      dx2[:, None, :] * dy1[:, :, None], dx1[:, None, :] * dy1[:, :, None])
+                ws = [torch.where(oob, 0., (wss * (0.5 ** spatial_shift)).round())[..., None] for wss in ws]
+                row1 = (y1 * fm_width * fm_channel)[:, :, None]
+                row2 = (y2 * fm_width * fm_channel)[:, :, None]
+                col1 = (x1 * fm_channel)[:, None, :]
+                col2 = (x2 * fm_channel)[:, None, :]
+                offsets = [row1 + col1, row1 + col2, row2 + col1, row2 + col2]
+                points = [data[bidx, torch.where(oob, 0, o)[..., None] + kk] for o in offsets]
+                sampled = ((yInd < h_sample_ratio[rs]) & (xInd < w_sample_ratio[rs]))[:, None, None, None]
                 if method == 'avg':
-                    outdata_batch = [0] * fm_channel
-                else:
-                    outdata_batch = [-2 ** 31] * fm_channel
-                xscale1 = out_w * w_sample_ratio * (2 ** (spatial_shift + 1))
-                xscale2 = 2 * w_sample_ratio
-                xscale3 = out_w * w_sample_ratio * (2 ** spatial_shift)
-                yscale1 = out_h * h_sample_ratio * (2 ** (spatial_shift + 1))
-                yscale2 = 2 * h_sample_ratio
-                yscale3 = out_h * h_sample_ratio * (2 ** spatial_shift)
-                for yInd in range(h_sample_ratio):
-                    for xInd in range(w_sample_ratio):
-                        x = w_start + w_bin_size * xInd
-                        x_tmp1 = xscale2 * w_start_mod + xscale3 * w_bin_size + w_bin_size_mod + 2 * w_bin_size_mod * xInd
-                        x_tmp2 = torch.div(x_tmp1, xscale1, rounding_mode='trunc')
-                        x1 = int(x + x_tmp2)
-                        x2 = x1 + 1
-                        dx1 = x_tmp1 - x_tmp2 * xscale1  # xscale1
-                        y = h_start + h_bin_size * yInd
-                        y_tmp1 = yscale2 * h_start_mod + yscale3 * h_bin_size + h_bin_size_mod + 2 * h_bin_size_mod * yInd
-                        y_tmp2 = torch.div(y_tmp1, yscale1, rounding_mode='trunc')
-                        y1 = int(y + y_tmp2)
-                        y2 = y1 + 1
-                        dy1 = y_tmp1 - y_tmp2 * yscale1  # yscale1
-
-                        if x1 >= fm_width - 1:
-                            x1 = x2 = fm_width - 1
-                            dx1 = 0
-                        dx2 = xscale1 - dx1
-
-                        if y1 >= fm_height - 1:
-                            y1 = y2 = fm_height - 1
-                            dy1 = 0
-                        dy2 = yscale1 - dy1
-                        if y1 < -1 or y1 > fm_height or x1 < -1 or x1 > fm_width:
-                            ws = [0, 0, 0, 0]
-                            offsets = [0, 0, 0, 0]
-                        else:
-                            if x1 <= 0:
-                                x1, x2 = 0, 1
-                            if y1 <= 0:
-                                y1, y2 = 0, 1
-
-                            # y1 = min(max(y1, 0), fm_height - 1)
-                            # x1 = min(max(x1, 0), fm_width - 1)
-                            # if x1 >= fm_width - 1:
-                            #     x1 = x2 = fm_width - 1
-                            #     dx1 = 0
-                            # dx2 = xscale1 - dx1
-                            # if y1 >= fm_height - 1:
-                            #     y1 = y2 = fm_height - 1
-                            #     dy1 = 0
-                            # dy2 = yscale1 - dy1
-                            dx1 = torch.div(dx1, 2, rounding_mode='trunc')
-                            dx2 = torch.div(dx2, 2, rounding_mode='trunc')
-                            dy1 = torch.div(dy1, 2, rounding_mode='trunc')
-                            dy2 = torch.div(dy2, 2, rounding_mode='trunc')
-                            ws = (dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1)
-                            ws = [(wss * (0.5 ** spatial_shift)).round() for wss in ws]
-                            offsets = (y1 * fm_width * fm_channel + x1 * fm_channel,
-                                       y1 * fm_width * fm_channel + x2 * fm_channel,
-                                       y2 * fm_width * fm_channel + x1 * fm_channel,
-                                       y2 * fm_width * fm_channel + x2 * fm_channel)
-                        for kk in range(fm_channel):
-                            if method == 'avg':
-                                interpolation = 0
-                                for num in range(0, 4):
-                                    interpolation += ws[num] * data[offsets[num] + kk]
-                                outdata_batch[kk] += interpolation
-                            else:  # max
-                                max_4points = max([ws[0] * data[offsets[0] + kk],
-                                                   ws[1] * data[offsets[1] + kk],
-                                                   ws[2] * data[offsets[2] + kk],
-                                                   ws[3] * data[offsets[3] + kk],
-                                                   ])
-                                max_4points = (max_4points * do_scale * (0.5 ** total_shift) / (
-                                    num_sample_points * out_h * out_w)).round()
-                                outdata_batch[kk] = max([outdata_batch[kk], max_4points])
-                if method == 'avg':
-                    for kk in range(fm_channel):
-                        outdata_batch[kk] = (outdata_batch[kk] * do_scale * (0.5 ** total_shift) / (
-                            num_sample_points * num_sample_points * out_h * out_w)).round()
-                else:  # method == 'max'
-                    pass
-                out[box_idx, i, j, :] = torch.round(torch.tensor(outdata_batch))
-    return out.to(fm.device)
+                    interpolation = ws[0] * points[0]
+                    for num in range(1, 4):
+                        interpolation = interpolation + ws[num] * points[num]
+                    acc = torch.where(sampled, acc + interpolation, acc)
+                else:  # max
+                    max_4points = ws[0] * points[0]
+                    for num in range(1, 4):
+                        max_4points = torch.maximum(max_4points, ws[num] * points[num])
+                    max_4points = (max_4points * do_scale * (0.5 ** total_shift) / (
+                        num_sample_points[rs] * out_h * out_w)[:, None, None, None]).round()
+                    acc = torch.where(sampled, torch.maximum(acc, max_4points), acc)
+        if method == 'avg':
+            acc = (acc * do_scale * (0.5 ** total_shift) / (
+                num_sample_points[rs] * num_sample_points[rs] * out_h * out_w)[:, None, None, None]).round()
+        out[rs] = torch.where(valid[rs][:, None, None, None], torch.round(acc).float(), out[rs])
+    return out
 
 
 def quant_roi_align(fm, rois, method, is_half_pixel, pooled_shape, sample, spatial, spatial_shift, scale_shift_pairs,
@@ -286,8 +256,8 @@ def quant_roi_align(fm, rois, method, is_half_pixel, pooled_shape, sample, spati
     do_scale, do_shift = scale_shift_pairs['total_scale_shift']
     out_h_scale, out_h_shift = scale_shift_pairs['out_h_scale_shift']
     out_w_scale, out_w_shift = scale_shift_pairs['out_w_scale_shift']
-    sample_h_scale_shift = scale_shift_pairs['sample_h_scale_shift']
-    sample_w_scale_shift = scale_shift_pairs['sample_w_scale_shift']
+    sample_h_scale, sample_h_shift = scale_shift_pairs['sample_h_scale_shift']
+    sample_w_scale, sample_w_shift = scale_shift_pairs['sample_w_scale_shift']
     roi_scale, roi_shift = scale_shift_pairs['roi_scale_shift']
 
     half_pixel_offset = 2 ** (spatial_shift - 1) if is_half_pixel else 0  # 0.5 * 2 ** spatial_shift
@@ -295,144 +265,91 @@ def quant_roi_align(fm, rois, method, is_half_pixel, pooled_shape, sample, spati
     sample_h_ratio, sample_w_ratio = sample
     spatial_y, spatial_x = spatial
     roi_num = rois.shape[0]
-    _, fm_height, fm_width, fm_channel = fm.shape[:]
+    batch, fm_height, fm_width, fm_channel = fm.shape[:]
     total_shift = do_shift + spatial_shift
     dev = fm.device
+    rois = rois.to(dev)
     out = torch.zeros([roi_num, out_h, out_w, fm_channel], device=dev)
-    for box_idx in range(roi_num):
-        batch_idx = rois[box_idx, 0]
-        if batch_idx < 0:
-            OPT_WARN(f"RoiAlign layer: the batch_index of box_id={box_idx} is {batch_idx} < 0.")
-            continue
-        if batch_idx > fm.shape[0] - 1:
-            OPT_ERROR(f"RoiAlign layer: batch_index={batch_idx} should be < the featuremap batch_size={fm.shape[0]}")
-            continue
-        # opt impl
-        # y_start = ((rois[box_idx, 1] * spatial_y * roi_scale) >> roi_shift).int() - half_pixel_offset
-        # x_start = ((rois[box_idx, 2] * spatial_x * roi_scale) >> roi_shift).int() - half_pixel_offset
-        # y_end = ((rois[box_idx, 3] * spatial_y * roi_scale) >> roi_shift).int() - half_pixel_offset
-        # x_end = ((rois[box_idx, 4] * spatial_x * roi_scale) >> roi_shift).int() - half_pixel_offset
-        # lib impl
-        y_start = ((rois[box_idx, 1] * roi_scale * 0.5 ** roi_shift).long() * spatial_y) - half_pixel_offset
-        x_start = ((rois[box_idx, 2] * roi_scale * 0.5 ** roi_shift).long() * spatial_x) - half_pixel_offset
-        y_end = ((rois[box_idx, 3] * roi_scale * 0.5 ** roi_shift).long() * spatial_y) - half_pixel_offset
-        x_end = ((rois[box_idx, 4] * roi_scale * 0.5 ** roi_shift).long() * spatial_x) - half_pixel_offset
-
-        if ((x_end < x_start) or (y_end < y_start)):
-            continue
-        if ((x_end.item() > (fm_width * (2 ** spatial_shift))) or (y_end.item() > (fm_height * (2 ** spatial_shift)))):
-            continue
-        data = fm[batch_idx.long()].reshape(-1).double()
-
-        roi_width = x_end - x_start
-        roi_height = y_end - y_start
-        if not is_half_pixel:
-            roi_width = torch.maximum(roi_width, torch.tensor(2 ** spatial_shift, device=dev))
-            roi_height = torch.maximum(roi_height, torch.tensor(2 ** spatial_shift, device=dev))
-        step_size_qw = int(roi_width * out_w_scale / (2 ** out_w_shift))
-        step_size_qh = int(roi_height * out_h_scale / (2 ** out_h_shift))
-        # step_size_w = step_size_qw / spatial_shift
-        # step_size_h = step_size_qh / spatial_shift
-
-        new_sample_h = sample_h_ratio
-        new_sample_w = sample_w_ratio
-        sample_h_scale, sample_h_shift = sample_h_scale_shift
-        real_sample_h_scale = 1
-        real_sample_h_shift = 0
-        sample_w_scale, sample_w_shift = sample_w_scale_shift
-        real_sample_w_scale = 1
-        real_sample_w_shift = 0
-        if sample_h_ratio <= 0:
-            OPT_ERROR(f"optimizer quant forward now does not support sample_h <=0")
-        if sample_w_ratio <= 0:
-            OPT_ERROR(f"optimizer quant forward now does not support sample_w <=0")
-
-        # lib impl
-        wBinSize = int(step_size_qw * sample_w_scale / 2 ** sample_w_shift)
-        hBinSize = int(step_size_qh * sample_h_scale / 2 ** sample_h_shift)
-        for i in range(out_h):
-            for j in range(out_w):
-                h_start = step_size_qh * i + y_start
-                w_start = step_size_qw * j + x_start
-                if method == 'avg':
-                    outdata_batch = [0] * fm_channel
-                else:
-                    outdata_batch = [-2 ** 31] * fm_channel
-
-                for yInd in range(new_sample_h):
-                    for xInd in range(new_sample_w):
-                        # y = h_start + (((2 * yInd + 1) * step_size_qh * sample_h_scale) >> sample_h_shift)
-                        # x = w_start + (((2 * xInd + 1) * step_size_qw * sample_w_scale) >> sample_w_shift)
-                        # lib impl
-                        y = h_start + hBinSize * (2 * yInd + 1)
-                        x = w_start + wBinSize * (2 * xInd + 1)
-
-                        y1 = y >> spatial_shift
-                        y2 = y1 + 1
-                        dy1 = y - (y1 << spatial_shift)
-                        x1 = x >> spatial_shift
-                        x2 = x1 + 1
-                        dx1 = x - (x1 << spatial_shift)
-
-                        if y1 < -1 or y1 > fm_height or x1 < -1 or x1 > fm_width:
-                            ws = [0, 0, 0, 0]
-                            offsets = [0, 0, 0, 0]
-                        else:
-                            y1 = min(max(y1, 0), fm_height - 1)
-                            x1 = min(max(x1, 0), fm_width - 1)
-
-                            if x1 >= fm_width - 1:
-                                x1 = x2 = torch.tensor(fm_width - 1, device=fm.device)
-                                dx1 = torch.tensor(0, device=fm.device)
-                            dx2 = 2 ** spatial_shift - dx1
-
-                            if y1 >= fm_height - 1:
-                                y1 = y2 = torch.tensor(fm_height - 1, device=fm.device)
-                                dy1 = torch.tensor(0, device=fm.device)
-                            dy2 = 2 ** spatial_shift - dy1
-
-                            ws = (dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1)
-                            ws = [wss >> spatial_shift for wss in ws]
-                            offsets = (y1 * fm_width * fm_channel + x1 * fm_channel,
-                                       y1 * fm_width * fm_channel + x2 * fm_channel,
-                                       y2 * fm_width * fm_channel + x1 * fm_channel,
-                                       y2 * fm_width * fm_channel + x2 * fm_channel)
-                        for kk in range(fm_channel):
-                            if method == 'avg':
-                                interpolation = 0
-                                for num in range(0, 4):
-                                    interpolation += ws[num] * data[offsets[num] + kk]
-                                outdata_batch[kk] += interpolation
-                            else:  # max
-                                max_4points = max([ws[0] * data[offsets[0] + kk],
-                                                   ws[1] * data[offsets[1] + kk],
-                                                   ws[2] * data[offsets[2] + kk],
-                                                   ws[3] * data[offsets[3] + kk],
-                                                   ])
-                                max_4points = torch.round(max_4points * do_scale / 2 ** total_shift)
-                                outdata_batch[kk] = max([outdata_batch[kk], max_4points])
+    if roi_num > 0 and sample_h_ratio <= 0:
+        OPT_ERROR(f"optimizer quant forward now does not support sample_h <=0")
+    if roi_num > 0 and sample_w_ratio <= 0:
+        OPT_ERROR(f"optimizer quant forward now does not support sample_w <=0")
+    batch_idx, valid = _roi_batch_index(rois, batch)
+    # lib impl
+    y_start = ((rois[:, 1] * roi_scale * 0.5 ** roi_shift).long() * spatial_y) - half_pixel_offset
+    x_start = ((rois[:, 2] * roi_scale * 0.5 ** roi_shift).long() * spatial_x) - half_pixel_offset
+    y_end = ((rois[:, 3] * roi_scale * 0.5 ** roi_shift).long() * spatial_y) - half_pixel_offset
+    x_end = ((rois[:, 4] * roi_scale * 0.5 ** roi_shift).long() * spatial_x) - half_pixel_offset
+    valid = valid & (x_end >= x_start) & (y_end >= y_start)
+    valid = valid & (x_end <= fm_width * (2 ** spatial_shift)) & (y_end <= fm_height * (2 ** spatial_shift))
+
+    roi_width = x_end - x_start
+    roi_height = y_end - y_start
+    if not is_half_pixel:
+        roi_width = torch.clamp(roi_width, min=2 ** spatial_shift)
+        roi_height = torch.clamp(roi_height, min=2 ** spatial_shift)
+    step_size_qw = (roi_width * out_w_scale / (2 ** out_w_shift)).long()
+    step_size_qh = (roi_height * out_h_scale / (2 ** out_h_shift)).long()
+    # the same as python's int(int * int / int)
+    wBinSize = (step_size_qw.double() * sample_w_scale / 2 ** sample_w_shift).long()
+    hBinSize = (step_size_qh.double() * sample_h_scale / 2 ** sample_h_shift).long()
+    # [roi_num, out_h] and [roi_num, out_w]
+    h_start = step_size_qh[:, None] * torch.arange(out_h, device=dev) + y_start[:, None]
+    w_start = step_size_qw[:, None] * torch.arange(out_w, device=dev) + x_start[:, None]
+    all_shift = do_shift + spatial_shift
+    all_scale = do_scale
+
+    def _coordinates(start, bin_size, ind, size):
+        # the integer coordinate, its next one and the fraction (in 2 ** spatial_shift) of the ind-th sample point
+        pos = start + (bin_size * (2 * ind + 1))[:, None]
+        p1 = pos >> spatial_shift
+        p2 = p1 + 1
+        d1 = pos - (p1 << spatial_shift)
+        oob = (p1 < -1) | (p1 > size)
+        p1 = torch.clamp(p1, 0, size - 1)
+        edge = p1 >= size - 1
+        p2 = torch.where(edge, size - 1, p2)
+        d1 = torch.where(edge, 0, d1)
+        d2 = 2 ** spatial_shift - d1
+        return p1, p2, d1, d2, oob
+
+    fm_d = fm.double()
+    for rs in roi_chunks(roi_num, out_h * out_w * fm_channel):
+        rnum = rs.stop - rs.start
+        if method == 'avg':
+            acc = torch.zeros([rnum, out_h, out_w, fm_channel], device=dev, dtype=torch.float64)
+        else:
+            acc = torch.full([rnum, out_h, out_w, fm_channel], -2 ** 31, device=dev, dtype=torch.float64)
+        bidx = batch_idx[rs][:, None, None]
+        for yInd in range(sample_h_ratio):
+            y1, y2, dy1, dy2, y_oob = _coordinates(h_start[rs], hBinSize[rs], yInd, fm_height)
+            for xInd in range(sample_w_ratio):
+                x1, x2, dx1, dx2, x_oob = _coordinates(w_start[rs], wBinSize[rs], xInd, fm_width)
+                # out of bound points are weighted by 0 on the first pixel
+                oob = y_oob[:, :, None] | x_oob[:, None, :]
+                ws = (dx2[:, None, :] * dy2[:, :, None], dx1[:, None, :] * dy2[:, :, None],
+                      dx2[:, None, :] * dy1[:, :, None], dx1[:, None, :] * dy1[:, :, None])
+                ws = [torch.where(oob, 0, wss >> spatial_shift)[..., None] for wss in ws]
+                ys = [torch.where(oob, 0, y[:, :, None]) for y in [y1, y2]]
+                xs = [torch.where(oob, 0, x[:, None, :]) for x in [x1, x2]]
+                points = [fm_d[bidx, ys[0], xs[0]], fm_d[bidx, ys[0], xs[1]],
+                          fm_d[bidx, ys[1], xs[0]], fm_d[bidx, ys[1], xs[1]]]
                 if method == 'avg':
-                    '''
-                    outdata =  outdata / (sample_h * sample_w)
-                    if sample_h and sample_w all > 0:
-                        1/(sample_h*sample_w) has included in do_scale/do_shift
-                    elif sample_h <= 0 and sample_w > 0:
-                        1. /sample_h is from the lut and now use the real_sample_h_scale/real_sample_h_shift. 1./sample_w has included in do_scale/do_shift
-                    elif sample_w <= 0 and sample_h > 0:
-                        1. /sample_w is from the lut and now use the real_sample_w_scale/real_sample_w_shift. 1./sample_h has included in do_scale/do_shift
-                    else: # sample_w <=0 and sample_h <= 0:
-                        all 1./sample_w and 1./sample_h are from the lut, so we use the real_sample_h_scale/real_sample_h_shift, real_sample_w_scale/real_sample_w_shfit
-                    '''
-                    all_shift = do_shift + spatial_shift + real_sample_h_shift + real_sample_w_shift
-                    all_scale = do_scale * real_sample_h_scale * real_sample_w_scale
-                    for kk in range(fm_channel):
-                        outdata_batch[kk] = torch.round((outdata_batch[kk] * all_scale) * 0.5 ** all_shift)
-                else:  # method == 'max'
-                    pass
-
-                # out[box_idx, i, j, :] = torch.clamp(torch.tensor(outdata_batch), o_qmin, o_qmax)
-                out[box_idx, i, j, :] = torch.tensor(outdata_batch)
-    return out.to(fm.device)
+                    interpolation = ws[0] * points[0]
+                    for num in range(1, 4):
+                        interpolation = interpolation + ws[num] * points[num]
+                    acc = acc + interpolation
+                else:  # max
+                    max_4points = ws[0] * points[0]
+                    for num in range(1, 4):
+                        max_4points = torch.maximum(max_4points, ws[num] * points[num])
+                    max_4points = torch.round(max_4points * do_scale / 2 ** total_shift)
+                    acc = torch.maximum(acc, max_4points)
+        if method == 'avg':
+            # 1/(sample_h*sample_w) has included in do_scale/do_shift
+            acc = torch.round((acc * all_scale) * 0.5 ** all_shift)
+        out[rs] = torch.where(valid[rs][:, None, None, None], acc.float(), out[rs])
+    return out
 
 
 @op_register(OpType.RoiAlign)
@@ -3,6 +3,7 @@
 
 from AIPUBuilder.Optimizer.utils import *
 from AIPUBuilder.Optimizer.framework import *
+from AIPUBuilder.Optimizer.ops.roialign import roi_chunks
 
 
 register_optype('ROIPooling')
@@ -36,47 +37,41 @@ def roipooling(self, *args):
     channel_ = out.shape[3]
     feature_height_, feature_width_ = feature.shape[1:3]
 
+    # this nor_box has normalized to (0,1)
+    # for batchidx in range(feature.shape[0]):
+    batch_idx = 0
     if not self.quantized:
         resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_), device=feature.device)
-        # this nor_box has normalized to (0,1)
-        # for batchidx in range(feature.shape[0]):
-        batch_idx = 0
-        for j in range(nor_box.shape[1]):
-            y0 = nor_box[batch_idx, j, 0]*feature_height_/resize_height_
-            y1 = nor_box[batch_idx, j, 2]*feature_height_/resize_height_
-            x0 = nor_box[batch_idx, j, 1]*feature_width_/resize_width_
-            x1 = nor_box[batch_idx, j, 3]*feature_width_/resize_width_
-
-            x = ((resize_width_ * x0 + torch.arange(0, resize_width_, device=out.device) * (x1+1 - x0))).int()
-            y = ((resize_height_ * y0 + torch.arange(0, resize_height_, device=out.device) * (y1+1 - y0))).int()
-            y = torch.clamp(y, 0, feature_height_ - 1)
-            x = torch.clamp(x, 0, feature_width_ - 1)
-            for idxh in range(resize_height_):
-                resize_feature[j, idxh, :, :] = feature[batch_idx, y[idxh].item(), x.long(), :]
+        y0 = nor_box[batch_idx, :, 0:1]*feature_height_/resize_height_
+        y1 = nor_box[batch_idx, :, 2:3]*feature_height_/resize_height_
+        x0 = nor_box[batch_idx, :, 1:2]*feature_width_/resize_width_
+        x1 = nor_box[batch_idx, :, 3:4]*feature_width_/resize_width_
+
+        # the sample rows and columns of all boxes, [box_num, resize_height_] and [box_num, resize_width_]
+        x = ((resize_width_ * x0 + torch.arange(0, resize_width_, device=out.device) * (x1+1 - x0))).int()
+        y = ((resize_height_ * y0 + torch.arange(0, resize_height_, device=out.device) * (y1+1 - y0))).int()
     else:
         resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_))
         x_index_scale_ = self.get_param('x_index_scale')
         y_index_scale_ = self.get_param('y_index_scale')
         x_index_shift_ = self.get_param('x_index_shift')
         y_index_shift_ = self.get_param('y_index_shift')
-        # for batchidx in range(feature.shape[0]):
-        batch_idx = 0
         nor_box = torch.clamp(torch.round(nor_box * 255.0) >> 15, 0, 255)
 
-        for j in range(nor_box.shape[1]):
-            y0 = nor_box[batch_idx, j, 0]
-            y1 = nor_box[batch_idx, j, 2]
-            x0 = nor_box[batch_idx, j, 1]
-            x1 = nor_box[batch_idx, j, 3]
-
-            x = ((resize_width_ * x0 + torch.arange(0, resize_width_, device=out.device)
-                 * (x1 - x0 + 1)).int() * (x_index_scale_)) >> x_index_shift_
-            y = ((resize_height_ * y0 + torch.arange(0, resize_height_, device=out.device)
-                 * (y1 - y0 + 1)).int() * (y_index_scale_)) >> y_index_shift_
-            y = torch.clamp(y, 0, feature_height_ - 1)
-            x = torch.clamp(x, 0, feature_width_ - 1)
-            for idxh in range(resize_height_):
-                resize_feature[j, idxh, :, :] = feature[batch_idx, y[idxh].long(), x.long(), :]
+        y0 = nor_box[batch_idx, :, 0:1]
+        y1 = nor_box[batch_idx, :, 2:3]
+        x0 = nor_box[batch_idx, :, 1:2]
+        x1 = nor_box[batch_idx, :, 3:4]
+
+        x = ((resize_width_ * x0 + torch.arange(0, resize_width_, device=out.device)
+             * (x1 - x0 + 1)).int() * (x_index_scale_)) >> x_index_shift_
+        y = ((resize_height_ * y0 + torch.arange(0, resize_height_, device=out.device)
+             * (y1 - y0 + 1)).int() * (y_index_scale_)) >> y_index_shift_
+    y = torch.clamp(y, 0, feature_height_ - 1).long()
+    x = torch.clamp(x, 0, feature_width_ - 1).long()
+    for chunk in roi_chunks(nor_box.shape[1], resize_height_ * resize_width_ * channel_):
+        resize_feature[chunk] = feature[batch_idx, y[chunk].unsqueeze(-1), x[chunk].unsqueeze(1), :].to(
+            resize_feature.device, resize_feature.dtype)
 
     self.outputs[0].betensor = resize_feature
     return resize_feature
@@ -92,6 +92,17 @@ def convert_less_mbit(data, threshold_min, threshold_max):
     return data, left_shift
 
 
+def convert_less_mbit_tensor(data, threshold_min, threshold_max):
+    # elementwise convert_less_mbit, returns the shifted data and the per element shifts
+    left_shift = torch.zeros_like(data)
+    out_of_range = (data > threshold_max) | (data < threshold_min)
+    while out_of_range.any():
+        data = torch.where(out_of_range, data >> 1, data)
+        left_shift += out_of_range.to(left_shift.dtype)
+        out_of_range = (data > threshold_max) | (data < threshold_min)
+    return data, left_shift
+
+
 @quant_register(OpType.ScatterElements)
 def ScatterElements_quantize(self, *args):
     # re-arrange params
@@ -188,21 +199,18 @@ def ScatterElements(self, *args):
             output_signed = is_signed(self.outputs[0].dtype)
             qmin, qmax = bits2range(16, output_signed)
             data = linear_requantize(data + self.inputs[0].zerop, scale[0], shift[0], 0, qmin, qmax).int()
-            updates += self.inputs[2].zerop
-            idx, updates_idx = get_src_indices_and_update_indices(indices.cpu().numpy(), axis)
+            updates = updates + self.inputs[2].zerop
+            updates = updates[tuple(slice(0, s) for s in indices.shape)].int()
 
+            # the indice in one slice along axis point to different elements, so each slice is scattered at once,
+            # and the duplicated indice are multiplied in the order of the slices
             scattered = data.clone().int()
-            idx_dict = {}
-            for iter, idx_set in enumerate(idx):
-                scattered[idx_set] *= (updates[updates_idx[iter]].int())
-                scattered[idx_set], left_shift = convert_less_mbit(scattered[idx_set], qmin, qmax)
-                scattered[idx_set] = (scattered[idx_set] * scale[1]) >> (shift[1] - left_shift)
-            #     if idx_set not in idx_dict.keys():
-            #         idx_dict[idx_set] = shift[1] - left_shift
-            #     else:
-            #         idx_dict[idx_set] += (shift[1] - left_shift)
-            # for key in idx_dict.keys():
-            #     scattered[key] = linear_requantize(scattered[key], 1, idx_dict[key], 0, qmin, qmax)#(scattered[idx_set] * scale[1]) >> (shift[1] - left_shift)
+            for i in range(indices.shape[axis]):
+                idx_set = indices.narrow(axis, i, 1)
+                tmp_data = scattered.gather(axis, idx_set) * updates.narrow(axis, i, 1)
+                tmp_data, left_shift = convert_less_mbit_tensor(tmp_data, qmin, qmax)
+                tmp_data = (tmp_data * scale[1]) >> (shift[1] - left_shift)
+                scattered.scatter_(axis, idx_set, tmp_data)
             output = torch.clamp(scattered, self.outputs[0].qmin, self.outputs[0].qmax)
 
         else:
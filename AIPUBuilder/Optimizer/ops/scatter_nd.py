@@ -97,6 +97,22 @@ def ScatterND_quantize(self, *args):
         self.params["shift_value"] = shift
 
 
+def _occurrence_rounds(flat_idx):
+    # split the positions of flat_idx into rounds, the k-th round holds the k-th occurrence of every indice, so
+    # that the indice in one round are unique and the duplicated indice are applied in their original order
+    sorted_idx, order = torch.sort(flat_idx, stable=True)
+    positions = torch.arange(flat_idx.numel(), device=flat_idx.device)
+    is_first = torch.ones_like(sorted_idx, dtype=torch.bool)
+    is_first[1:] = sorted_idx[1:] != sorted_idx[:-1]
+    first_pos = torch.cummax(torch.where(is_first, positions, torch.zeros_like(positions)), dim=0)[0]
+    occurrence = torch.empty_like(positions)
+    occurrence[order] = positions - first_pos
+    rounds = []
+    for k in range(int(occurrence.max().item()) + 1 if occurrence.numel() else 0):
+        rounds.append(torch.nonzero(occurrence == k).reshape(-1))
+    return rounds
+
+
 @op_register(OpType.ScatterND)
 def ScatterND(self, *args):
     dev = self.inputs[0].betensor.device
@@ -121,55 +137,55 @@ def ScatterND(self, *args):
         data = (data + self.inputs[0].zerop.to(data.device)) * scale0
         updates = (updates + self.inputs[2].zerop.to(updates.device)) * scale1
 
-    output = torch.clone(data)
-    c = [torch.arange(s) for s in indices.shape[:-1]]
-    idxs = torch.cartesian_prod(*c) if len(indices.shape) > 1 else [()]
-
     if len(self.placeholders) < 1:
         ph0 = PyTensor(self.name+"/tmp_s", torch.tensor(0.).cpu().numpy().astype(dtype2nptype(Dtype.FP32)))
         self.placeholders.append(ph0)
 
-    #  scatternd allow add/mul index duplicate
+    # flatten the indiced dims of data, so that each indice selects one row of data
+    index_depth = indices.shape[-1]
+    data_shape = list(data.shape)
+    indices = indices.reshape([-1, index_depth])
+    max_idxx = torch.tensor(data_shape[:index_depth], device=indices.device)
+    indices = torch.where(indices >= max_idxx, max_idxx - 1, indices)
+    indices = torch.where(indices < 0, indices + max_idxx, indices)
+    strides = [1] * index_depth
+    for i in range(index_depth - 2, -1, -1):
+        strides[i] = strides[i + 1] * data_shape[i + 1]
+    flat_idx = (indices * torch.tensor(strides, device=indices.device)).sum(dim=-1)
+    output = torch.clone(data).reshape([-1] + data_shape[index_depth:])
+    updates = updates.reshape([flat_idx.numel()] + data_shape[index_depth:])
+
+    #  scatternd allow add/mul index duplicate, the duplicated indice are applied in order
     method = {
         "ADD": lambda a, b: a + b,
-        "MAX": lambda a, b: torch.max(a, b),
-        "MIN": lambda a, b: torch.min(a, b),
-        'NONE': lambda a, b: b,
+        "MUL": lambda a, b: a * b,
     }
+    if self.quantized and reduce_method == 'MUL':
+        # rounding at 16+bit is much slower than shift
+        requantize = linear_requantize if qbits <= 8 else linear_requantize_floor
+        method['MUL'] = lambda a, b: requantize(a * b, 1, shift_, 0, inner_min, inner_max)
+
+    if reduce_method == 'NONE':
+        # the last update of a duplicated indice wins
+        uniq_idx, inverse = torch.unique(flat_idx, return_inverse=True)
+        last = torch.full_like(uniq_idx, -1).scatter_reduce(0, inverse, torch.arange(flat_idx.numel()), reduce='amax')
+        output[uniq_idx] = updates[last].to(output.dtype)
+    elif reduce_method in ['MIN', 'MAX']:
+        row_idx = flat_idx.reshape([-1] + [1] * (output.dim() - 1)).expand(updates.shape)
+        output = output.scatter_reduce(0, row_idx, updates.to(output.dtype), reduce='a' + reduce_method.lower())
+    elif reduce_method == 'ADD' and not self.quantized:
+        output.index_put_((flat_idx,), updates.to(output.dtype), accumulate=True)
+    elif reduce_method in ['ADD', 'MUL']:
+        for round_idx in _occurrence_rounds(flat_idx):
+            rows = flat_idx[round_idx]
+            output[rows] = method[reduce_method](output[rows], updates[round_idx]).to(output.dtype)
+            if self.quantized and reduce_method == 'ADD':
+                output[rows] = torch.clamp(output[rows].long(), inner_min, inner_max).to(output.dtype)
+    if self.quantized and reduce_method in ['NONE', 'MIN', 'MAX']:
+        rows = torch.unique(flat_idx)
+        output[rows] = torch.clamp(output[rows].long(), inner_min, inner_max).to(output.dtype)
+    output = output.reshape(data_shape)
 
-    def get_valid_idxx(indices, idx, shape):
-        idxx = indices[idx]
-        max_idxx = torch.tensor(shape, device=indices.device)[:idxx.numel()]
-        invalid_idxx = idxx >= max_idxx
-        idxx[invalid_idxx] = max_idxx[invalid_idxx] - 1
-        idxx = list(idxx)
-        return idxx
-
-    if reduce_method in ['ADD', 'MIN', 'MAX', 'NONE']:
-        for idx in idxs:
-            if idx != ():
-                idx = list(idx) if len(idx.shape) >= 1 else int(idx)
-            idxx = get_valid_idxx(indices, idx, output.shape)
-            output[idxx] = method[reduce_method](output[idxx], updates[idx])
-            if self.quantized:
-                output[idxx] = torch.clamp(output[idxx].long(), inner_min, inner_max)
-    if reduce_method == 'MUL':
-        if self.quantized:
-            for idx in idxs:
-                if idx != ():
-                    idx = list(idx) if len(idx.shape) >= 1 else int(idx)
-                idxx = get_valid_idxx(indices, idx, output.shape)
-                if qbits <= 8:
-                    output[idxx] = linear_requantize(output[idxx] * updates[idx], 1, shift_, 0, inner_min, inner_max)
-                else:  # rounding at 16+bit is much slower than shift
-                    output[idxx] = linear_requantize_floor(
-                        output[idxx] * updates[idx], 1, shift_, 0, inner_min, inner_max)
-        else:
-            for idx in idxs:
-                if idx != ():
-                    idx = list(idx) if len(idx.shape) >= 1 else int(idx)
-                idxx = get_valid_idxx(indices, idx, output.shape)
-                output[idxx] = output[idxx] * updates[idx]
     if self.quantized:
         if qbits <= 8:
             output = linear_requantize(output, scale, shift, out.zerop.to(output.device), out.qmin, out.qmax)
@@ -66,7 +66,7 @@ def segmentreduce(self, *args):
     segment_index = inp1.betensor
     if self.quantized:
         input_data = (input_data + inp0.zerop).long()
-        segment_index += inp1.zerop
+        segment_index = segment_index + inp1.zerop
     segment_index = segment_index.reshape(-1,).int()
     index_size = segment_index.numel()
     # segment_index first dim must equal to input_data first dim currently
@@ -84,26 +84,28 @@ def segmentreduce(self, *args):
         OPT_WARN('layer_id=%s, type=%s, index size is less than data %s-th dimension, so pad the dimensions of index'
                  % (self.attrs['layer_id'], str(self.type), str(axis)))
 
-    method_d = {
-        "SUM": torch.sum,
-    }
-    op = method_d[method]
-
     index_range = (segment_index[-1] + 1).item()
-    zero_dim = list(input_data_dim)
-    zero_dim[axis] = 1
-    zero_value = 0
     output = None
     if method == 'SUM':
-        for j in range(index_range):
-            if j in segment_index:
-                j_index = torch.eq(segment_index, j)
-                j_index_range = torch.nonzero(j_index)
-                tmp_data = torch.index_select(input_data, axis, torch.squeeze(j_index_range))
-                tmp_data = op(tmp_data, axis, keepdim=True)
-            else:
-                tmp_data = torch.full((zero_dim), zero_value, device=inp0.betensor.device)
-            output = tmp_data if output == None else torch.cat((output, tmp_data), dim=axis)
+        # the segments with the same length are summed at once, the rows of one segment keep their order
+        segment_index = segment_index.long()
+        valid = (segment_index >= 0) & (segment_index < index_range)
+        segment_rows = torch.nonzero(valid).reshape(-1)
+        sorted_index, order = torch.sort(segment_index[segment_rows], stable=True)
+        segment_rows = segment_rows[order]
+        counts = torch.bincount(sorted_index, minlength=index_range)
+        starts = torch.cumsum(counts, dim=0) - counts
+        output_dim = list(input_data_dim)
+        output_dim[axis] = index_range
+        output = torch.zeros(output_dim, device=inp0.betensor.device, dtype=input_data.dtype)
+        for count in torch.unique(counts).tolist():
+            if count == 0:
+                continue
+            segments = torch.nonzero(counts == count).reshape(-1)
+            rows = segment_rows[starts[segments].reshape(-1, 1) + torch.arange(count, device=segments.device)]
+            tmp_data = torch.index_select(input_data, axis, rows.reshape(-1))
+            tmp_data = tmp_data.reshape([segments.numel(), count] + list(input_data_dim[axis + 1:]))
+            output[segments] = torch.sum(tmp_data, dim=1, keepdim=False)
 
     if self.quantized:
         do_shift = self.params["shift_value"]
@@ -13,25 +13,35 @@ register_optype('RNN')
 split_weights_name = ['wx', 'wh']
 
 
+def _split_weights(self, input_size):
+    # wx and wh of the [input_size + cell_size, cell_size] weights, cached until the weights are changed.
+    # the cache is a private attribute of the node, out of attrs which are cloned and keyed by the quantization cache
+    w = self.constants["weights"].betensor
+    cached = getattr(self, '_rnn_split_weights', None)
+    if cached is not None and cached[0] is w and cached[1] == (w._version, self.quantized, input_size):
+        return cached[2], cached[3]
+    # the quantized operands are integers, so the double matmuls are exact whatever the batch size is
+    weights = w.permute(1, 0).double() if self.quantized else w.permute(1, 0).float()
+    wx = weights[:input_size, :]
+    wh = weights[input_size:, :]
+    self._rnn_split_weights = (w, (w._version, self.quantized, input_size), wx, wh)
+    return wx, wh
+
+
 @op_register(OpType.RNN)
 def rnn(self, *args):
     inp0 = self.inputs[0]
     inp1 = self.inputs[1]
     outp = self.outputs[0]
 
-    current_batch_idx = self.current_batch_idx
     input_seq = inp0.betensor
     [batch_size, time_step, input_size] = input_seq.shape
     initial_batch = self.inputs[1].ir_shape[0]
 
     initial_H = inp1.betensor
     start_data_idx = self.current_batch_idx * batch_size
-
-    start_initial_idx = start_data_idx % initial_batch
-    in_state = initial_H[start_initial_idx: start_initial_idx + 1]
-    for initial_idx in range(1, batch_size):
-        current_initial_idx = (start_data_idx + initial_idx) % initial_batch
-        in_state = torch.cat((in_state, initial_H[current_initial_idx: current_initial_idx + 1]), dim=0)
+    data_idx = start_data_idx + torch.arange(batch_size, device=initial_H.device)
+    in_state = initial_H[data_idx % initial_batch]
 
     activations = self.get_param('activations')
     cell_size = self.get_param('cell_size')
@@ -41,17 +51,13 @@ def rnn(self, *args):
     if direction == "reverse":
         input_seq = torch.flip(input_seq, [1])
 
-    w = self.constants["weights"].betensor
     bias = self.constants['biases'].betensor
-    weights = w.permute(1, 0).float()
-    wx = weights[:input_size, :]
-    wh = weights[input_size:, :]
+    wx, wh = _split_weights(self, input_size)
 
-    # generate output
-    state_batch = torch.zeros([batch_size, time_step, cell_size], device=inp0.betensor.device)
-    state_last = torch.zeros([batch_size, cell_size], device=inp0.betensor.device)
-    xw_hw_sum = torch.zeros([batch_size, time_step, cell_size], device=inp0.betensor.device)
-    lut_in_batch = torch.zeros([batch_size, time_step, cell_size], device=inp0.betensor.device)
+    # the input projection of all the timesteps at once, only the recurrence is sequential
+    x_wx_sum = torch.matmul(input_seq.to(wx.dtype), wx).float()
+    state = in_state.float()
+    state_all = []
 
     if not self.quantized:
         for idx, weights_name in enumerate(split_weights_name):
@@ -63,42 +69,37 @@ def rnn(self, *args):
                 self.constants[weights_name].ir_dtype = self.constants["weights"].dtype
                 self.constants[weights_name].dtype = self.constants["weights"].dtype
                 self.constants[weights_name].ir_shape = TensorShape(list(split_weights.shape))
-        for b in range(batch_size):
-            state = torch.unsqueeze(in_state[b], dim=0).float()  # (1,2161)
-            state_all = torch.zeros([0, cell_size], device=inp0.betensor.device)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size)).float()
-                #x*wx + h*wh + bias
-                x_wx_sum = torch.matmul(in_ts, wx)
-                h_wh_sum = torch.matmul(state, wh)
-                xw_hw_sum = x_wx_sum + h_wh_sum + torch.unsqueeze(bias, 0)
-                if threshold is not None:
-                    xw_hw_sum = torch.clamp(xw_hw_sum, -threshold, threshold)
-                lut_in_batch[b, ts, :] = torch.squeeze(xw_hw_sum).clone()
-
-                if activations == 'TANH':
-                    state = torch.tanh(xw_hw_sum)
-                elif activations == 'SIGMOID':
-                    state = torch.sigmoid(xw_hw_sum)
-                elif activations == 'RELU':
-                    state = torch.relu(xw_hw_sum)
-                elif activations == 'CLIP':
-                    clip_min = self.get_param('clip_min')
-                    clip_max = self.get_param('clip_max')
-                    state = torch.clamp(xw_hw_sum, clip_min, clip_max)
-                elif activations == 'SIGN_BIT':
-                    less_zero = xw_hw_sum < 0
-                    larger_zero = xw_hw_sum >= 0
-                    xw_hw_sum[less_zero] = 1
-                    xw_hw_sum[larger_zero] = 0
-                    state = xw_hw_sum
-                elif activations == 'NONE':
-                    state = xw_hw_sum
-
-                state_all = torch.cat((state_all, state), dim=0)
-
-            state_last[b, :] = state
-            state_batch[b, :, :] = state_all
+        lut_in_all = []
+        for ts in range(time_step):
+            #x*wx + h*wh + bias
+            h_wh_sum = torch.matmul(state, wh)
+            xw_hw_sum = x_wx_sum[:, ts, :] + h_wh_sum + torch.unsqueeze(bias, 0)
+            if threshold is not None:
+                xw_hw_sum = torch.clamp(xw_hw_sum, -threshold, threshold)
+            lut_in_all.append(xw_hw_sum.clone())
+
+            if activations == 'TANH':
+                state = torch.tanh(xw_hw_sum)
+            elif activations == 'SIGMOID':
+                state = torch.sigmoid(xw_hw_sum)
+            elif activations == 'RELU':
+                state = torch.relu(xw_hw_sum)
+            elif activations == 'CLIP':
+                clip_min = self.get_param('clip_min')
+                clip_max = self.get_param('clip_max')
+                state = torch.clamp(xw_hw_sum, clip_min, clip_max)
+            elif activations == 'SIGN_BIT':
+                less_zero = xw_hw_sum < 0
+                larger_zero = xw_hw_sum >= 0
+                xw_hw_sum[less_zero] = 1
+                xw_hw_sum[larger_zero] = 0
+                state = xw_hw_sum
+            elif activations == 'NONE':
+                state = xw_hw_sum
+
+            state_all.append(state)
+        lut_in_batch = torch.stack(lut_in_all, dim=1).float()
+        state_batch = torch.stack(state_all, dim=1).float()
 
         if len(self.placeholders) < 1:
             ph0 = PyTensor(self.name + "/h_state", state_batch.cpu().numpy().astype(dtype2nptype(Dtype.FP32)))
@@ -121,42 +122,36 @@ def rnn(self, *args):
             act_qmin = -2 ** 47
         qmin, qmax = dtype2range(self.outputs[0].dtype)
         qbits = self.outputs[0].qbits
-        for b in range(batch_size):
-            state = torch.unsqueeze(in_state[b], dim=0).float()
-            state_all = torch.zeros([0, cell_size], device=inp0.betensor.device)
-            for ts in range(time_step):
-                in_ts = torch.reshape(input_seq[b, ts, :], (-1, input_size)).float()
-                #x*wx + h*wh + bias
-                x_wx_sum = torch.matmul(in_ts, wx)
-                h_wh_sum = torch.matmul(state, wh)
-                re_scaled_x_wx_sum = linear_requantize(x_wx_sum, scale[0], shift[0], 0, act_qmin, act_qmax)
-                re_scaled_h_wh_sum = linear_requantize(h_wh_sum, scale[1], shift[1], 0, act_qmin, act_qmax)
-                xw_hw_sum = re_scaled_x_wx_sum + re_scaled_h_wh_sum + torch.unsqueeze(bias, 0)
-                if activations in ['TANH', 'SIGMOID']:
-                    xw_hw_sum = linear_requantize(xw_hw_sum, scale[2], shift[2], 0, qmin, qmax)
-                    state = lookup_lut_powerof2(xw_hw_sum, lut_table.betensor, qbits, True,
-                                                dtype2bits(lut_table.dtype), is_signed(lut_table.dtype))
-                elif activations == "RELU":
-                    xw_hw_sum = torch.nn.functional.relu(xw_hw_sum)
-                    state = linear_requantize(xw_hw_sum, scale[2], shift[2], outp.zerop, outp.qmin, outp.qmax)
-                elif activations in ["NONE"]:
-                    state = linear_requantize(xw_hw_sum, scale[2], shift[2], outp.zerop, outp.qmin, outp.qmax)
-                elif activations == "CLIP":
-                    clip_max, clip_min = self.get_param('clip_max'), self.get_param('clip_min')
-                    xw_hw_sum = torch.clamp(xw_hw_sum, clip_min, clip_max)
-                    state = linear_requantize(
-                        xw_hw_sum, scale[2], shift[2], 0, self.outputs[0].qmin, self.outputs[0].qmax)
-                elif activations == "SIGN_BIT":
-                    less_zero = xw_hw_sum < 0
-                    larger_zero = xw_hw_sum >= 0
-                    xw_hw_sum[less_zero] = 1
-                    xw_hw_sum[larger_zero] = 0
-                    state = xw_hw_sum
-                state_all = torch.cat((state_all, state), dim=0)
-
-            state_last[b, :] = state
-            state_batch[b, :, :] = state_all
-
+        re_scaled_x_wx_sum = linear_requantize(x_wx_sum, scale[0], shift[0], 0, act_qmin, act_qmax)
+        for ts in range(time_step):
+            #x*wx + h*wh + bias
+            h_wh_sum = torch.matmul(state.to(wh.dtype), wh).float()
+            re_scaled_h_wh_sum = linear_requantize(h_wh_sum, scale[1], shift[1], 0, act_qmin, act_qmax)
+            xw_hw_sum = re_scaled_x_wx_sum[:, ts, :] + re_scaled_h_wh_sum + torch.unsqueeze(bias, 0)
+            if activations in ['TANH', 'SIGMOID']:
+                xw_hw_sum = linear_requantize(xw_hw_sum, scale[2], shift[2], 0, qmin, qmax)
+                state = lookup_lut_powerof2(xw_hw_sum, lut_table.betensor, qbits, True,
+                                            dtype2bits(lut_table.dtype), is_signed(lut_table.dtype))
+            elif activations == "RELU":
+                xw_hw_sum = torch.nn.functional.relu(xw_hw_sum)
+                state = linear_requantize(xw_hw_sum, scale[2], shift[2], outp.zerop, outp.qmin, outp.qmax)
+            elif activations in ["NONE"]:
+                state = linear_requantize(xw_hw_sum, scale[2], shift[2], outp.zerop, outp.qmin, outp.qmax)
+            elif activations == "CLIP":
+                clip_max, clip_min = self.get_param('clip_max'), self.get_param('clip_min')
+                xw_hw_sum = torch.clamp(xw_hw_sum, clip_min, clip_max)
+                state = linear_requantize(
+                    xw_hw_sum, scale[2], shift[2], 0, self.outputs[0].qmin, self.outputs[0].qmax)
+            elif activations == "SIGN_BIT":
+                less_zero = xw_hw_sum < 0
+                larger_zero = xw_hw_sum >= 0
+                xw_hw_sum[less_zero] = 1
+                xw_hw_sum[larger_zero] = 0
+                state = xw_hw_sum
+            state_all.append(state)
+        state_batch = torch.stack(state_all, dim=1).float()
+
+    state_last = state_batch[:, -1, :]
     if direction == "reverse":
         state_batch = torch.flip(state_batch, [1])
 
@@ -64,14 +64,18 @@ class OptMaster(object):
         self.fake_quant_scopes = []
         self.op_need_cast_dtypes_for_lib = set()
         self.batch_size_in_IR = 1
+        # float outputs shared by the float metric, autosearch and easy_quant
+        self.reference_cache = None
         self.g.disable_fit_dtype()
 
+    @opt_workflow_register
     def prepare(self, argv):
         """prepare the calibration and validation dataset, the metric method, and config.json
         :param argv: config in cfg file
         :return:
         """
         config_info = get_info_from_graph(self.g, batch_dim=argv.data_batch_dim)
+        self.reference_cache = FloatReferenceCache(int(argv.float_reference_cache_size * 1024 * 1024))
         if argv.without_batch_dim:
             config_info['batch_size'] = 0
             argv.calibration_batch_size = 1
@@ -208,6 +212,7 @@ class OptMaster(object):
             if node.type in [OpType.Convolution, OpType.DepthwiseConv, OpType.ConvTranspose, OpType.Convolution3D,
                              OpType.ConvTranspose3D]:
                 init_attrs('with_winograd', self.hparams.with_winograd.get(node)),
+                init_attrs('conv_tiling_memory_budget', self.hparams.conv_tiling_memory_budget)
             init_attrs('lut_items_in_bits', self.hparams.lut_items_in_bits.get(node))
             init_attrs('multiplier_bits', node.attrs['q_bits_activation'] if self.hparams.multiplier_bits == ''
                        else self.hparams.multiplier_bits.get(node))
@@ -339,7 +344,10 @@ class OptMaster(object):
             # get the intial calibration's results (each tensor's scale, zp, dtype, qbits)
             self.g.set_tensor_quantization_attrs()
             # apply global quantization optimization (scales, rounding, etc) here
-            apply_global_calibration(self.g, self.calibration_dataloader, self.hparams.global_calibration)
+            apply_global_calibration(self.g, self.calibration_dataloader, self.hparams.global_calibration,
+                                     self.hparams.global_calibration_cache_size,
+                                     self.hparams.global_calibration_checkpoint,
+                                     self.reference_cache)
             # clear float graph's calibration results (each tensor's scale, zp, dtype, qbits) to avoid misusing in float forward
             self.g.clear_tensor_quantization_attrs()
 
@@ -515,11 +523,15 @@ class OptMaster(object):
 
         abatches, _, _ = self.hparams.mixed_precision_auto_search
         if abatches > 0:
-            autosearch_enginer = NaiveAutoSearchMixedPrecision(self.g,
-                                                               self.validation_dataloader,
-                                                               self.f_metrics,
-                                                               self.q_metrics,
-                                                               self.hparams)
+            autosearch_strategy, _ = self.hparams.mixed_precision_auto_search_strategy
+            autosearch_class = SensitivityAutoSearchMixedPrecision if 'sensitivity' == autosearch_strategy \
+                else NaiveAutoSearchMixedPrecision
+            autosearch_enginer = autosearch_class(self.g,
+                                                  self.validation_dataloader,
+                                                  self.f_metrics,
+                                                  self.q_metrics,
+                                                  self.hparams,
+                                                  self.reference_cache)
             autosearch_enginer.auto_search()
 
         # this pass will insert cast/quantize/dequantize op which meets the requirement
@@ -855,6 +867,7 @@ class OptMaster(object):
                 self.dataloader4debug) else 1
             OPT_INFO(
                 f'collecting per-layer similarity infomation between float graph and quanted graph by forwarding {check_sim_len} sample on both of them')
+            sim_analyzer = SimilarityAnalyzer(self.g.quantgraph, max_elements=self.hparams.similarity_max_elements)
             for i, sample in zip(range(check_sim_len), self.dataloader4debug):
                 inp, _ = sample
                 self.g.current_batch_idx = i
@@ -863,8 +876,14 @@ class OptMaster(object):
                     bsize = len(self.dataloader4debug.dataset) - i * self.dataloader4debug.batch_size
                     self.g.current_batch_size = bsize
                     self.g.quantgraph.current_batch_size = bsize
-                check_nodes_similarity(self.g, self.g.quantgraph, inp, keep_tensors=self.hparams.dump)
-            show_similarity(self.g.quantgraph)
+                check_nodes_similarity(self.g, self.g.quantgraph, inp, keep_tensors=self.hparams.dump,
+                                       analyzer=sim_analyzer)
+            show_similarity(self.g.quantgraph, sim_analyzer)
+            if self.hparams.similarity_report != '':
+                report_file = os.path.join(self.hparams.output_dir, self.hparams.model_name + '_similarity.' +
+                                           self.hparams.similarity_report)
+                sim_analyzer.save(report_file)
+                OPT_INFO(f"per-layer similarity statistics are saved to {report_file}")
 
             calculate_op_running_time(self.g, self.g.quantgraph)
 
@@ -883,7 +902,8 @@ class OptMaster(object):
         def _metric(metric_graph, forward_func, dataloader, metrics, with_float=False, msg="metric"):
             if opt_use_cuda():
                 torch.cuda.empty_cache()
-            graph_inference(metric_graph, forward_func, dataloader, metrics, with_float)
+            graph_inference(metric_graph, forward_func, dataloader, metrics, with_float,
+                            reference_cache=self.reference_cache)
             for metric in metrics:
                 OPT_INFO(f"{msg}: {metric.report()}")
 
@@ -919,8 +939,24 @@ class OptMaster(object):
                 self.serialize(os.path.join(self.hparams.output_dir, self.hparams.out_ir_name))
 
     def __call__(self, *args, **kwargs):
-        self.prepare(self.hparams)
-        self.optimize()
-        self.metric()
+        profiler = OpProfiler().start() if self.hparams.op_profile else None
+        mprofiler = MemoryProfiler().start() if self.hparams.memory_profile else None
+        try:
+            self.prepare(self.hparams)
+            self.optimize()
+            self.metric()
+        finally:
+            if mprofiler is not None:
+                mprofiler.stop()
+                mfile = os.path.join(self.hparams.output_dir, self.hparams.model_name + '_memory.txt')
+                mprofiler.save(mfile)
+                OPT_INFO(mprofiler.summary().split('\n')[0])
+                OPT_INFO(f"memory profile is saved to {mfile}")
+            if profiler is not None:
+                profiler.stop()
+                prefix = os.path.join(self.hparams.output_dir, self.hparams.model_name)
+                profiler.save_summary(prefix + '_op_profile.txt')
+                profiler.save_trace(prefix + '_op_trace.json')
+                OPT_INFO(f"op profile is saved to {prefix}_op_profile.txt and {prefix}_op_trace.json")
         report = self.report()
         return report
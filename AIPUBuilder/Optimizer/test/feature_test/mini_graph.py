@@ -0,0 +1,131 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+# small float graphs (Input -> LayerNorm -> FullyConnected -> FullyConnected, or two LayerNorm -> FullyConnected
+# branches) and their calibration dataloader, shared by the feature tests
+
+import torch
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.ops import *  # noqa
+
+SEQ, CH, HIDDEN = 8, 16, 24
+
+
+# the quantization attrs optmaster sets on every node (with the default config values)
+MINI_QUANT_ATTRS = {
+    'q_mode_activation': 'per_tensor_asymmetric', 'q_mode_weight': 'per_channel_symmetric_restricted_range',
+    'q_mode_bias': 'per_channel_symmetric_restricted_range', 'q_bits_activation': 8, 'q_bits_weight': 8,
+    'q_bits_bias': 32, 'q_strategy_activation': 'extrema', 'q_strategy_weight': 'extrema',
+    'q_strategy_bias': 'extrema', 'running_statistic_momentum': 1.0, 'histc_bins': 2048,
+    'trim_infinity_before_statistic': '', 'lut_items_in_bits': 8, 'multiplier_bits': 8, 'force_dtype_int': False,
+    'force_shift_positive': False, 'bias_effective_bits': 32, 'bias_effective_bits_auto_adaption': False,
+    'min_compatible_zhouyi_target': 'X2_1204', 'unify_shifts_for_aiff': True, 'trigger_float_op': 'disable',
+    'trigger_float_op_bkup': 'disable', 'optimize_wdc_for_x2': False, 'activation_perchannel_min_elements': 16,
+    'regularize_activation_perchannel_scales': '', 'weight_block_size': 0, 'debug_fake_quantize': False,
+    'batch_size_in_IR': 1, 'calculate_running_time': False, 'layer_top_type_original': ['float32'],
+    'unify_scales_for_multi_inputs_operators': False,
+}
+
+
+class MiniGraphBuilder:
+    def __init__(self, seed=0):
+        torch.manual_seed(seed)
+        self.g = QuantizeGraph('mini')
+
+    def add_node(self, name, optype, inputs, shape, constants=None, params=None):
+        n = PyNode(name, optype)
+        n.attrs['layer_id'] = str(len(self.g.nodes))
+        for t in inputs:
+            n.add_input(t)
+        t = PyTensor(name, TensorShape(shape), Dtype.FP32)
+        t.ir_shape = TensorShape(shape)
+        # channels are on the last axis
+        t.key_axis = len(shape) - 1
+        n.add_output(t)
+        for k, v in (constants or {}).items():
+            n.constants[k] = PyTensor(f'{name}/{k}', v.numpy())
+        n.params.update(params or {})
+        self.g.nodes.append(n)
+        return t
+
+    def layernorm(self, name, inp):
+        return self.add_node(name, OpType.LayerNorm, [inp], [1, SEQ, CH],
+                             {'weights': 1 + torch.rand(CH), 'biases': 0.1 * torch.randn(CH)},
+                             {'axis': [-1], 'epsilon': 1e-5})
+
+    def fc(self, name, inp, cin, cout):
+        return self.add_node(name, OpType.FullyConnected, [inp], [1, SEQ, cout],
+                             {'weights': 0.1 * torch.randn(cout, cin), 'biases': 0.01 * torch.randn(cout)},
+                             {'num_output': cout, 'with_activation': 'NONE'})
+
+    def build(self, inputs, outputs):
+        self.g.input_tensors = tuple(inputs)
+        self.g.output_tensors = tuple(outputs)
+        self.g.init_networkx()
+        return self.g
+
+
+def mini_graph(seed=0):
+    b = MiniGraphBuilder(seed)
+    inp = b.add_node('inp', OpType.Input, [], [1, SEQ, CH])
+    ln = b.layernorm('ln', inp)
+    fc1 = b.fc('fc1', ln, CH, HIDDEN)
+    fc2 = b.fc('fc2', fc1, HIDDEN, CH)
+    return b.build([inp], [fc2])
+
+
+def mini_branch_graph(seed=0):
+    # two independent LayerNorm -> FullyConnected branches
+    b = MiniGraphBuilder(seed)
+    inp = b.add_node('inp', OpType.Input, [], [1, SEQ, CH])
+    outputs = []
+    for k in ['a', 'b']:
+        ln = b.layernorm(f'ln_{k}', inp)
+        outputs.append(b.fc(f'fc_{k}', ln, CH, HIDDEN))
+    return b.build([inp], outputs)
+
+
+def mini_data(samples=10, seed=1):
+    torch.manual_seed(seed)
+    return torch.randn(samples, SEQ, CH), torch.zeros(samples)
+
+
+def mini_dataloader(data=None, batch_size=4):
+    x, y = mini_data() if data is None else data
+    return torch.utils.data.DataLoader(torch.utils.data.TensorDataset(x, y), batch_size=batch_size, shuffle=False)
+
+
+def float_forward(g, x):
+    # {tensor name: betensor} of all the tensors in one forward
+    g.forward(x, keep_tensors=True)
+    return {t.name: t.betensor.clone() for n in g.nodes for t in n.outputs}
+
+
+def mini_calibrate(g, x):
+    # set the quantization attrs and calibrate all the tensors on the samples x
+    for n in g.nodes:
+        n.attrs.update(MINI_QUANT_ATTRS)
+        n.attrs['optimization_info'] = {}
+    g.forward(x, keep_tensors=True)
+    for n in g.nodes:
+        n.statistic()
+        n.calibration()
+    return g
+
+
+def mini_hparams(**fields):
+    # the default config fields, with the given ones overridden
+    from types import SimpleNamespace
+    from AIPUBuilder.Optimizer.config.cfg_fields import ALL_FIELDS
+    from AIPUBuilder.Optimizer.utils import string_to_base_type
+    hparams = {}
+    for k, f in ALL_FIELDS.items():
+        _, hparams[k] = f.parse(string_to_base_type(f.default()))
+    hparams.update(fields)
+    return SimpleNamespace(**hparams)
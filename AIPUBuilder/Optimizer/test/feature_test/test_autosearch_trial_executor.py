@@ -0,0 +1,65 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+from mini_graph import *  # noqa
+from AIPUBuilder.Optimizer.features.autosearch import NaiveAutoSearchMixedPrecision  # noqa
+from AIPUBuilder.Optimizer.features.autosearch.trial_executor import AutoSearchTrialExecutor  # noqa
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_CosDistance import CosDistanceMetric  # noqa
+
+
+def naive_search(workers, athres):
+    # the naive search on mini_graph, scored by the cosine distance to the float outputs
+    x, _ = mini_data(10)
+    g = mini_calibrate(mini_graph(), x)
+    y = float_forward(g, x)['fc2']
+    dataloader = torch.utils.data.DataLoader(torch.utils.data.TensorDataset(x, y), batch_size=4, shuffle=False)
+    hparams = mini_hparams(mixed_precision_auto_search=(3, athres, True),
+                           mixed_precision_auto_search_workers=workers)
+    return NaiveAutoSearchMixedPrecision(g, dataloader, [CosDistanceMetric()], [CosDistanceMetric()], hparams)
+
+
+def searched_attrs(s):
+    return [(n.name, n.attrs['q_bits_activation'], n.attrs['q_bits_weight'], n.attrs['trigger_float_op'],
+             n.get_param('unquantifiable', optional=True, default_value=False)) for n in s.g.nodes]
+
+
+@pytest.mark.skipif(not AutoSearchTrialExecutor.available(), reason="requires the fork start method on cpu")
+@pytest.mark.parametrize("athres", [1.5e-4, 1e-4, 1e-9, 1.0])
+def test_parallel_matches_serial(athres, monkeypatch):
+    serial = naive_search(1, athres)
+    serial.auto_search()
+    rounds = []
+    executor_map = AutoSearchTrialExecutor.map
+
+    def spy_map(self, candidates):
+        rounds.append(list(candidates))
+        return executor_map(self, candidates)
+    monkeypatch.setattr(AutoSearchTrialExecutor, 'map', spy_map)
+    parallel = naive_search(3, athres)
+    parallel.auto_search()
+    assert parallel.executor is None
+    # the probed candidates are a superset of the serial ones, with the same scores
+    assert set(serial.trials.keys()) <= set(parallel.trials.keys())
+    for c, qscore in serial.trials.items():
+        assert parallel.trials[c] == pytest.approx(qscore, abs=1e-6)
+    assert searched_attrs(parallel) == searched_attrs(serial)
+    if len(serial.trials) > 1:
+        assert len(rounds) > 0 and all([len(r) > 1 for r in rounds])
+
+
+def test_not_available(monkeypatch):
+    import multiprocessing
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    assert not AutoSearchTrialExecutor.available()
+    with pytest.raises(RuntimeError):
+        AutoSearchTrialExecutor(naive_search(2, 1e-4), 2)
+    # the search falls back to the serial evaluation
+    serial = naive_search(1, 1e-4)
+    serial.auto_search()
+    s = naive_search(2, 1e-4)
+    s.auto_search()
+    assert s.trials.keys() == serial.trials.keys()
+    assert searched_attrs(s) == searched_attrs(serial)
@@ -0,0 +1,147 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+import pytest
+
+from mini_graph import *  # noqa
+from AIPUBuilder.Optimizer.config.cfg_fields import PerNodeFieldDict  # noqa
+from AIPUBuilder.Optimizer.features.calibration.calibration import apply_global_calibration  # noqa
+from AIPUBuilder.Optimizer.features.calibration.global_calibration import smooth_quant_zy  # noqa
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.checkpoint import *  # noqa
+
+SMOOTH_QUANT_PARAMS = [0.5, True, 0.0, 1.0, 10, False, 1]
+
+
+def smooth_quant_strategy():
+    return [('smooth_quant_zy', SMOOTH_QUANT_PARAMS, PerNodeFieldDict(True))]
+
+
+def calibrated_graph(data=None):
+    # the initial statistics are collected on the same samples
+    return mini_calibrate(mini_graph(), (mini_data(10) if data is None else data)[0])
+
+
+def changed_data(batch_idx, batch_size=4):
+    # the same samples except one in the batch batch_idx
+    x, y = mini_data(10)
+    x = x.clone()
+    x[batch_idx * batch_size] += 1.0
+    return x, y
+
+
+def test_fingerprint():
+    data = mini_data(10)
+    g = calibrated_graph(data)
+    fp = global_calibration_fingerprint(g, mini_dataloader(data, 4), smooth_quant_strategy())
+    assert fp == global_calibration_fingerprint(calibrated_graph(data), mini_dataloader(data, 4), smooth_quant_strategy())
+    # any batch of the calibration data changes the fingerprint
+    for batch_idx in range(3):
+        assert fp != global_calibration_fingerprint(g, mini_dataloader(changed_data(batch_idx), 4),
+                                                    smooth_quant_strategy())
+    assert fp != global_calibration_fingerprint(g, mini_dataloader(data, 2), smooth_quant_strategy())
+    assert fp != global_calibration_fingerprint(g, mini_dataloader(data, 4),
+                                                [('smooth_quant_zy', [0.6], PerNodeFieldDict(True))])
+    g.nodes[2].constants['weights'].betensor[0, 0] += 1.0
+    assert fp != global_calibration_fingerprint(g, mini_dataloader(data, 4), smooth_quant_strategy())
+
+
+def test_save_and_restore(tmp_path):
+    data = mini_data(10)
+    g = calibrated_graph(data)
+    ckpt = GlobalCalibrationCheckpoint(str(tmp_path), g, mini_dataloader(data, 4), smooth_quant_strategy())
+    ckpt.begin(0)
+    fc1 = g.nodes[2]
+    weights = fc1.constants['weights'].betensor.clone()
+    out_max = fc1.outputs[0].max_key_axis.clone()
+    fc1.constants['weights'].betensor *= 2
+    fc1.outputs[0].max_key_axis = out_max * 2
+    fc1.attrs['gptq_weights'] = {8: fc1.constants['weights'].betensor.clone()}
+    ckpt.save('fc1', [fc1], extra=torch.ones(3))
+    assert ckpt.has('fc1') and not ckpt.has('fc1', midx=1) and not ckpt.method_done(0)
+    ckpt.end(g)
+    assert ckpt.method_done(0)
+
+    # a rerun with the same graph, config and data loads the records
+    g = calibrated_graph(data)
+    fc1 = g.nodes[2]
+    ckpt = GlobalCalibrationCheckpoint(str(tmp_path), g, mini_dataloader(data, 4), smooth_quant_strategy())
+    assert ckpt.method_done(0)
+    ckpt.begin(0)
+    assert torch.equal(ckpt.restore('fc1', g.nodes), torch.ones(3))
+    assert torch.equal(fc1.constants['weights'].betensor, weights * 2)
+    assert torch.equal(fc1.outputs[0].max_key_axis, out_max * 2)
+    assert torch.equal(fc1.attrs['gptq_weights'][8], weights * 2)
+
+    # broken and unfinished records are ignored
+    fname = sorted(os.listdir(ckpt.dir))[0]
+    with open(os.path.join(ckpt.dir, fname), 'wb') as f:
+        f.write(b'broken')
+    with open(os.path.join(ckpt.dir, '00000009.pt.tmp'), 'wb') as f:
+        f.write(b'unfinished')
+    ckpt = GlobalCalibrationCheckpoint(str(tmp_path), calibrated_graph(data), mini_dataloader(data, 4),
+                                       smooth_quant_strategy())
+    assert not ckpt.has('fc1', midx=0) and ckpt.method_done(0)
+
+
+def run_smooth_quant(data, checkpoint, monkeypatch):
+    # returns the rebalanced graph and the number of searched groups
+    searched = []
+    scores = smooth_quant_zy._rebalance_candidates_scores
+
+    def counted_scores(n, *args, **kwargs):
+        searched.append(n.name)
+        return scores(n, *args, **kwargs)
+    monkeypatch.setattr(smooth_quant_zy, '_rebalance_candidates_scores', counted_scores)
+    g = calibrated_graph()
+    apply_global_calibration(g, mini_dataloader(data, 4), smooth_quant_strategy(), checkpoint=checkpoint)
+    return g, searched
+
+
+def test_resume(tmp_path, monkeypatch):
+    data = mini_data(10)
+    ref, _ = run_smooth_quant(data, '', monkeypatch)
+    g, searched = run_smooth_quant(data, str(tmp_path), monkeypatch)
+    assert searched == ['ln']
+    # the rerun restores the rebalanced Norm - FC group instead of searching it again
+    resumed, searched = run_smooth_quant(data, str(tmp_path), monkeypatch)
+    assert searched == []
+    for n, rn, fn in zip(ref.nodes, resumed.nodes, g.nodes):
+        for k, t in n.constants.items():
+            assert torch.equal(t.betensor, rn.constants[k].betensor)
+            assert torch.equal(t.betensor, fn.constants[k].betensor)
+        for t, rt in zip(n.outputs, rn.outputs):
+            assert torch.equal(t.max_key_axis, rt.max_key_axis)
+
+
+@pytest.mark.parametrize("batch_idx", [0, 2])
+def test_changed_data_invalidates_resume(tmp_path, monkeypatch, batch_idx):
+    run_smooth_quant(mini_data(10), str(tmp_path), monkeypatch)
+    _, searched = run_smooth_quant(changed_data(batch_idx), str(tmp_path), monkeypatch)
+    assert searched == ['ln']
+
+
+def test_gptq_workers_save_from_main_thread(tmp_path, monkeypatch):
+    import threading
+    data = mini_data(10)
+    strategy = [('gptq_zy', [2, True, 0.01, 8, 2], PerNodeFieldDict(True))]
+    saved = []
+    save = GlobalCalibrationCheckpoint.save
+
+    def checked_save(self, key, *args, **kwargs):
+        saved.append((key, threading.current_thread() is threading.main_thread()))
+        return save(self, key, *args, **kwargs)
+    monkeypatch.setattr(GlobalCalibrationCheckpoint, 'save', checked_save)
+    g = mini_calibrate(mini_branch_graph(), data[0])
+    apply_global_calibration(g, mini_dataloader(data, 4), strategy, checkpoint=str(tmp_path))
+    # the layers quantized by the workers are saved by the main thread, in order
+    assert all([main for _, main in saved])
+    assert [key for key, _ in saved if key is not None] == ['fc_a', 'fc_b']
+    saved.clear()
+    resumed = mini_calibrate(mini_branch_graph(), data[0])
+    apply_global_calibration(resumed, mini_dataloader(data, 4), strategy, checkpoint=str(tmp_path))
+    assert [key for key, _ in saved if key is not None] == []
+    for n, rn in zip(g.nodes, resumed.nodes):
+        if 'gptq_weights' in n.attrs:
+            assert torch.equal(n.attrs['gptq_weights'][8], rn.attrs['gptq_weights'][8])
@@ -0,0 +1,116 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.utils import *  # noqa
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.gptq_zy import _gptq_prepare_hessian, _gptq_quantize_weights  # noqa
+
+
+# the per-column GPTQ which the lazy batch updates must reproduce
+
+def loop_gptq_quantize_weights(w, w_scale, w_zerop, w_qmin, w_qmax, H, use_act_order, perc_damp, block_size):
+    w = w.clone()
+    H = H.clone()
+    Hcolumns = H.shape[1]
+    dead = torch.diag(H) == 0
+    H[dead, dead] = 1
+    w[:, dead] = 0
+
+    if use_act_order:
+        perm = torch.argsort(torch.diag(H), descending=True)
+        w = w[:, perm]
+        H = H[perm][:, perm]
+        invperm = torch.argsort(perm)
+    qw = torch.zeros_like(w)
+    damp = perc_damp * torch.mean(torch.diag(H))
+    diag = torch.arange(Hcolumns, device=w.device)
+    H[diag, diag] += damp
+    H = torch.linalg.cholesky(H)
+    H = torch.cholesky_inverse(H)
+    H = torch.linalg.cholesky(H, upper=True)
+    Hinv = H
+    for i1 in range(0, Hcolumns, block_size):
+        i2 = min(i1 + block_size, Hcolumns)
+        count = i2 - i1
+        w1 = w[:, i1:i2].clone()
+        qw1 = torch.zeros_like(w1)
+        err1 = torch.zeros_like(w1)
+        Hinv1 = Hinv[i1:i2, i1:i2]
+        for i in range(count):
+            w2 = w1[:, i]
+            d = Hinv1[i, i]
+            qw2 = linear_dequantize(linear_quantize_clip(w2, w_scale, w_zerop, w_qmin,
+                                    w_qmax), w_scale, w_zerop).flatten().to(w2.dtype)
+            qw1[:, i] = qw2
+            err2 = (w2 - qw2) / d
+            w1[:, i:] -= err2.unsqueeze(1).matmul(Hinv1[i, i:].unsqueeze(0))
+            err1[:, i] = err2
+        qw[:, i1:i2] = qw1
+        w[:, i2:] -= err1.matmul(Hinv[i1:i2, i2:])
+    if use_act_order:
+        qw = qw[:, invperm]
+    return qw
+
+
+def assert_gptq_levels(qw, ref, scale, max_mismatch):
+    # the levels are the reference's up to the float summation order: a few of them differ by one step
+    steps = torch.round((qw - ref) * scale.reshape(-1, 1))
+    assert torch.allclose(qw, ref + steps / scale.reshape(-1, 1), rtol=0, atol=1e-5)
+    assert steps.abs().max() <= 1
+    assert (steps != 0).float().mean() <= max_mismatch
+
+
+@pytest.mark.parametrize("rows, cols, block_size", [(24, 80, 128), (24, 80, 32), (16, 45, 7), (5, 200, 64),
+                                                    (256, 512, 128)])
+@pytest.mark.parametrize("use_act_order", [True, False])
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_gptq_quantize_weights(rows, cols, block_size, use_act_order, dtype):
+    torch.manual_seed(0)
+    x = torch.randn(2 * cols + 7, cols, dtype=dtype)
+    # a dead input channel
+    x[:, 3] = 0
+    H = 2 * x.t() @ x / x.shape[0]
+    w = torch.randn(rows, cols, dtype=dtype)
+    scale = 127 / w.abs().amax(1)
+    zerop = torch.zeros(rows, dtype=dtype)
+    ref = loop_gptq_quantize_weights(w, scale, zerop, -127, 127, H, use_act_order, 0.01, block_size)
+    dead, perm, invperm, Hinv = _gptq_prepare_hessian(H, use_act_order, 0.01)
+    qw = _gptq_quantize_weights(w, scale, zerop, -127, 127, dead, perm, invperm, Hinv, block_size)
+    assert_gptq_levels(qw, ref, scale, 0.001)
+    # the shared preparation is reusable
+    assert torch.equal(_gptq_quantize_weights(w, scale, zerop, -127, 127, dead, perm, invperm, Hinv, block_size), qw)
+
+
+@pytest.mark.parametrize("params", ['per_tensor', 'asymmetric', 'zero_channel'])
+def test_gptq_quantize_weights_params(params):
+    torch.manual_seed(0)
+    rows, cols = 12, 40
+    x = torch.randn(3 * cols, cols)
+    H = 2 * x.t() @ x / x.shape[0]
+    w = torch.randn(rows, cols)
+    qmin, qmax = -127, 127
+    if params == 'per_tensor':
+        scale = 127 / w.abs().max()
+        zerop = torch.zeros([])
+    elif params == 'asymmetric':
+        scale = 255 / (w.amax(1) - w.amin(1))
+        zerop = torch.round(w.amin(1) * scale) + 0
+        qmin, qmax = 0, 255
+    else:
+        # an all zeros output channel has an infinite scale
+        w[5] = 0
+        scale = 127 / w.abs().amax(1)
+        zerop = torch.zeros(rows)
+    ref = loop_gptq_quantize_weights(w, scale, zerop, qmin, qmax, H, True, 0.01, 16)
+    qw = _gptq_quantize_weights(w, scale, zerop, qmin, qmax, *_gptq_prepare_hessian(H, True, 0.01), 16)
+    if params == 'zero_channel':
+        assert torch.equal(qw[5], torch.zeros(cols)) and torch.equal(ref[5], torch.zeros(cols))
+        scale[5] = 1
+    assert_gptq_levels(qw, ref, scale.expand(rows), 0.001)
@@ -0,0 +1,152 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+from mini_graph import *  # noqa
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.layerwise_engine import LayerwiseCalibrationEngine  # noqa
+
+
+def batch_refs(g, data, batch_size):
+    # the float tensors of every batch
+    x, _ = data
+    return [float_forward(g, x[i:i + batch_size]) for i in range(0, x.shape[0], batch_size)]
+
+
+@pytest.mark.parametrize("cache_size", [2048, 0])
+def test_request_and_tensor_batches(cache_size):
+    g = mini_graph()
+    data = mini_data(10)
+    refs = batch_refs(g, data, 4)
+    engine = LayerwiseCalibrationEngine(g, mini_dataloader(data, 4), cache_size=cache_size)
+    engine.request_tensors(['ln', 'fc1'], 2, owner='a')
+    engine.request_tensors(['fc1'], None, owner='b')
+    engine.run()
+    assert engine.sweeps == 1
+    assert engine.batch_sizes == {0: 4, 1: 4, 2: 2}
+    # the requests of different owners are merged: fc1 is captured for all the batches, ln for the first two
+    ln = list(engine.tensor_batches('ln'))
+    fc1 = list(engine.tensor_batches('fc1'))
+    assert len(ln) == 2 and len(fc1) == 3
+    for i, t in enumerate(ln):
+        assert torch.equal(t, refs[i]['ln'])
+    for i, t in enumerate(fc1):
+        assert torch.equal(t, refs[i]['fc1'])
+    assert len(list(engine.tensor_batches('fc1', 1))) == 1
+    # nothing is pending, no more sweeps
+    engine.run()
+    list(engine.tensor_batches('ln'))
+    assert engine.sweeps == 1
+    # a request for more batches is swept again
+    engine.request_tensors(['ln'], 3, owner='a')
+    assert len(list(engine.tensor_batches('ln'))) == 3
+    assert engine.sweeps == 2
+
+
+def test_release():
+    g = mini_graph()
+    engine = LayerwiseCalibrationEngine(g, mini_dataloader())
+    engine.request_tensors(['fc1'], 1, owner='a')
+    engine.request_tensors(['fc1'], 1, owner='b')
+    engine.run()
+    engine.release(['fc1'], owner='a')
+    assert len(list(engine.tensor_batches('fc1'))) == 1
+    engine.release(['fc1'], owner='b')
+    assert 'fc1' not in engine.tensor_requests
+    assert len(engine.cache.keys()) == 0
+
+
+def test_restore_tensors():
+    g = mini_graph()
+    data = mini_data(10)
+    refs = batch_refs(g, data, 4)
+    engine = LayerwiseCalibrationEngine(g, mini_dataloader(data, 4))
+    engine.request_tensors(['ln', 'fc2'], None)
+    engine.restore_tensors(['ln', 'fc2'], batch_idx=1)
+    tensors = {t.name: t for n in g.nodes for t in n.outputs}
+    assert torch.equal(tensors['ln'].betensor, refs[1]['ln'])
+    assert torch.equal(tensors['fc2'].betensor, refs[1]['fc2'])
+    # not captured batches are left untouched
+    engine.restore_tensors(['ln'], batch_idx=5)
+    assert torch.equal(tensors['ln'].betensor, refs[1]['ln'])
+
+
+def test_rescale_tensors():
+    g = mini_graph()
+    data = mini_data(10)
+    engine = LayerwiseCalibrationEngine(g, mini_dataloader(data, 4))
+    engine.request_tensors(['ln', 'fc1'], None)
+    engine.run()
+    ln = list(engine.tensor_batches('ln'))
+    fc1 = list(engine.tensor_batches('fc1'))
+    # per channel factors on the last axis
+    factor = torch.rand(CH) + 0.5
+    ln_node = [n for n in g.nodes if n.name == 'ln'][0]
+    ln_node.constants['weights'].betensor *= factor
+    ln_node.constants['biases'].betensor *= factor
+    engine.rescale_tensors(['ln'], factor)
+    for t, s in zip(engine.tensor_batches('ln'), ln):
+        assert torch.equal(t, s * factor)
+    for t, s in zip(engine.tensor_batches('fc1'), fc1):
+        assert torch.equal(t, s)
+    # the cached tensors were updated in place, no more sweeps
+    assert engine.sweeps == 1
+    refs = batch_refs(g, data, 4)
+    for i, t in enumerate(engine.tensor_batches('ln')):
+        assert torch.allclose(t, refs[i]['ln'], atol=1e-6)
+    # factors which can not be broadcast invalidate the cache and the tensors are captured again
+    engine.rescale_tensors(['fc1'], torch.ones(CH + 1))
+    assert len(list(engine.tensor_batches('fc1'))) == 3
+    assert engine.sweeps == 2
+
+
+def test_invalidate_and_hooks():
+    g = mini_graph()
+    engine = LayerwiseCalibrationEngine(g, mini_dataloader())
+    calls = []
+    req = engine.request_hook(lambda n, i: calls.append((n.name, i)), 2)
+    engine.run()
+    assert calls == [(n.name, i) for i in range(2) for n in g.nodes]
+    engine.run()
+    assert len(calls) == 2 * len(g.nodes)
+    engine.invalidate()
+    engine.run()
+    assert len(calls) == 4 * len(g.nodes)
+    engine.remove_hook(req)
+    engine.invalidate()
+    engine.run()
+    assert len(calls) == 4 * len(g.nodes) and engine.sweeps == 2
+
+
+def test_graph_inputs_and_calibration_samples():
+    g = mini_graph()
+    data = mini_data(10)
+    engine = LayerwiseCalibrationEngine(g, mini_dataloader(data, 4))
+    inputs = engine.graph_inputs(2)
+    assert torch.equal(inputs['inp'], data[0][:8])
+    samples, sample_num = engine.calibration_samples(2, 3)
+    assert sample_num == 9
+    assert torch.equal(samples['inp'], torch.cat((data[0][:8], data[0][:1])))
+    # graph inputs are captured only once
+    assert engine.sweeps == 1
+
+
+def test_layerwise():
+    g = mini_graph()
+    data = mini_data(10)
+    engine = LayerwiseCalibrationEngine(g, mini_dataloader(data, 4))
+    samples, sample_num = engine.calibration_samples(2, 4)
+    ref = float_forward(mini_graph(), samples['inp'])
+    qg = g.clone()
+    visited = []
+    for n, qn, float_tensors, quant_tensors, abnormal_tensors in engine.layerwise(samples, sample_num, qg):
+        visited.append(n.name)
+        assert qn.name == n.name
+        for t in n.outputs:
+            assert torch.equal(float_tensors[t.name], ref[t.name])
+        # the quantized prefix was propagated up to the inputs of qn
+        for t in qn.inputs:
+            assert torch.equal(quant_tensors[t.name].to(ref[t.name].device), ref[t.name])
+        assert len(abnormal_tensors) == 0
+    assert visited == [n.name for n in g.nodes]
@@ -0,0 +1,96 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import gc
+import weakref
+from types import SimpleNamespace
+
+from mini_graph import *  # noqa
+from AIPUBuilder.Optimizer.analyzer import MemoryProfiler  # noqa
+
+BATCH = 4
+# bytes of the [BATCH, SEQ, channels] featuremaps: the float32 input, and the float64 outputs of the float ops
+FM = {'inp': 4 * BATCH * SEQ * CH, 'ln': 8 * BATCH * SEQ * CH, 'fc1': 8 * BATCH * SEQ * HIDDEN,
+      'fc2': 8 * BATCH * SEQ * CH}
+# featuremaps alive after each node's forward: its inputs and its outputs
+LIVE_FM = {'inp': FM['inp'], 'ln': FM['inp'] + FM['ln'], 'fc1': FM['ln'] + FM['fc1'], 'fc2': FM['fc1'] + FM['fc2']}
+# float32 weights and biases of ln, fc1 and fc2
+CONSTANT = 4 * (CH + CH + HIDDEN * CH + HIDDEN + CH * HIDDEN + CH)
+# the zerops which the ops create on their first forward: int32 ones of ln, fc1 and fc2 and int64 ones of ln's constants
+ZEROPS = 3 * 4 + 2 * 8
+
+
+def extrema_statistic(channels):
+    # float32 extrema and running min/max, per tensor and per channel
+    return 4 * 4 + 4 * 4 * channels
+
+
+CONSTANT_STATISTIC = 4 * extrema_statistic(CH) + 2 * extrema_statistic(HIDDEN)
+OUTPUT_STATISTIC = {'inp': extrema_statistic(CH), 'ln': extrema_statistic(CH), 'fc1': extrema_statistic(HIDDEN),
+                    'fc2': extrema_statistic(CH)}
+
+
+def warm_graph():
+    # a calibrated-ready mini graph whose lazily created zerops exist and which keeps no featuremaps
+    g = mini_graph()
+    for n in g.nodes:
+        n.attrs.update(MINI_QUANT_ATTRS)
+        n.attrs['optimization_info'] = {}
+    x, _ = mini_data(BATCH)
+    g.forward(x)
+    for t in g.output_tensors:
+        t.betensor = PyTensor('null').betensor
+    return g, x
+
+
+def live_bytes(profiler, g):
+    label = profiler.graphs[g].label
+    return {n.name: profiler.timeline[(label, n.name)][2:4] for n in g.nodes}
+
+
+def test_forward_bytes():
+    g, x = warm_graph()
+    with MemoryProfiler() as profiler:
+        g.forward(x)
+    static = CONSTANT + ZEROPS
+    assert live_bytes(profiler, g) == {k: [v, v + static] for k, v in LIVE_FM.items()}
+    assert profiler.peak_node[1] == 'fc1'
+    assert profiler.peak_bytes == {'featuremap': LIVE_FM['fc1'], 'constant': CONSTANT, 'statistic': ZEROPS, 'kept': 0}
+
+
+def test_statistic_bytes():
+    # QuantizeGraph.statistic forwards the nodes directly and gathers each node's statistics after its forward
+    g, x = warm_graph()
+    config = SimpleNamespace(save_statistic_info=False)
+    with MemoryProfiler() as profiler:
+        g.statistic(x, config)
+    gathered = 0
+    expected = {}
+    for n in g.nodes:
+        statistic = ZEROPS + CONSTANT_STATISTIC + gathered
+        expected[n.name] = [LIVE_FM[n.name], LIVE_FM[n.name] + CONSTANT + statistic]
+        gathered += OUTPUT_STATISTIC[n.name]
+    assert live_bytes(profiler, g) == expected
+    assert profiler.peak_node[1] == 'fc2'
+    assert profiler.peak_bytes == {'featuremap': LIVE_FM['fc2'], 'constant': CONSTANT, 'kept': 0,
+                                   'statistic': ZEROPS + CONSTANT_STATISTIC + gathered - OUTPUT_STATISTIC['fc2']}
+
+    # the next pass starts from all the gathered statistics, and the graph output kept by the last one
+    with MemoryProfiler() as profiler:
+        g.statistic(x, config)
+    fm = LIVE_FM['inp'] + FM['fc2']
+    statistic = ZEROPS + CONSTANT_STATISTIC + gathered
+    assert live_bytes(profiler, g)['inp'] == [fm, fm + CONSTANT + statistic]
+
+
+def test_graphs_released():
+    g, x = warm_graph()
+    with MemoryProfiler() as profiler:
+        g.forward(x)
+    assert len(profiler.graphs) == 1
+    ref = weakref.ref(g)
+    del g
+    gc.collect()
+    assert ref() is None
+    assert len(profiler.graphs) == 0
+    assert len(profiler.timeline) == 4
@@ -0,0 +1,126 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+from mini_graph import *  # noqa
+from AIPUBuilder.Optimizer.features.autosearch import SensitivityAutoSearchMixedPrecision  # noqa
+from AIPUBuilder.Optimizer.features.autosearch.trial_executor import AutoSearchTrialExecutor  # noqa
+from AIPUBuilder.Optimizer.plugins.aipubt_metric_CosDistance import CosDistanceMetric  # noqa
+
+
+def sensitivity_search(budget, workers=1):
+    # the search on mini_graph, scored by the cosine distance to the float outputs
+    x, _ = mini_data(10)
+    g = mini_calibrate(mini_graph(), x)
+    y = float_forward(g, x)['fc2']
+    dataloader = torch.utils.data.DataLoader(torch.utils.data.TensorDataset(x, y), batch_size=4, shuffle=False)
+    hparams = mini_hparams(mixed_precision_auto_search=(3, 0.0, True),
+                           mixed_precision_auto_search_strategy=('sensitivity', budget),
+                           mixed_precision_auto_search_workers=workers)
+    s = SensitivityAutoSearchMixedPrecision(g, dataloader, [CosDistanceMetric()], [CosDistanceMetric()], hparams)
+    s.abatches, s.athres, s.aless = hparams.mixed_precision_auto_search
+    return s
+
+
+def assert_bits(g, assignment):
+    for n in g.nodes:
+        assert n.attrs['q_bits_activation'] == (16 if n.name in assignment else 8)
+
+
+@pytest.mark.parametrize("budget", [0.25, 0.5, 1.0])
+def test_no_worse_than_unpromoted(budget):
+    s = sensitivity_search(budget)
+    base_score = s.qinference({})
+    assignment = s.auto_search()
+    assert_bits(s.g, assignment)
+    # promoting the input alone feeds the 8 bits LayerNorm with 16 bits, which is worse than no promotion
+    assert 'inp' not in assignment
+    # the graph carries the assignment
+    assert s.qinference({}) >= base_score
+
+
+def test_boundary_degradations():
+    s = sensitivity_search(0.5)
+    degradations = s.sensitivity()
+    ln = degradations[1]
+    # the 8 bits LayerNorm after the 16 bits input, and the 16 bits one after the 8 bits input
+    assert ln['d8_in16']['inp'] > ln['d8']
+    assert ln['d16_in8'] > ln['d16']
+    assert list(degradations[0]['d8_in16'].keys()) == []
+    assert list(degradations[3]['d8_in16'].keys()) == ['fc1']
+
+
+@pytest.mark.parametrize("budget, expected", [(1.0, {'ln': 16, 'fc1': 16}), (0.5, {})])
+def test_assign_segments(budget, expected):
+    s = sensitivity_search(budget)
+    # promoting ln or fc1 alone is worse because of the boundaries, only the segment of both pays off
+    zero = {'d8': 0.0, 'd16': 0.0, 'd16_in8': 0.0, 'd8_in16': {}}
+    degradations = [zero,
+                    {'d8': 0.1, 'd16': 0.0, 'd16_in8': 0.0, 'd8_in16': {'inp': 0.5}},
+                    {'d8': 0.1, 'd16': 0.0, 'd16_in8': 0.2, 'd8_in16': {'ln': 0.3}},
+                    {'d8': 0.0, 'd16': 0.0, 'd16_in8': 0.0, 'd8_in16': {'fc1': 0.0}}]
+    assignment, used, total_cost = s.assign(degradations)
+    assert assignment == expected
+    assert used == sum([s.promotion_cost(n) for n in s.g.nodes if n.name in expected]) and used <= budget * total_cost
+
+
+@pytest.mark.parametrize("harmful, dropped", [({'inp': 16, 'fc2': 16}, ['inp']), ({'inp': 16}, ['inp'])])
+def test_drop_harmful_promotions(harmful, dropped):
+    s = sensitivity_search(1.0)
+    base_score = s.qinference({})
+    assert s.qinference(harmful) < base_score
+    s.assign = lambda degradations: (dict(harmful), 0, 1)
+    assignment = s.auto_search()
+    for name in dropped:
+        assert name not in assignment
+    assert_bits(s.g, assignment)
+    assert s.qinference({}) >= base_score
+
+
+def test_one_pass_scores():
+    s = sensitivity_search(1.0)
+    assignments = [{}, {'fc1': 16}, {'inp': 16, 'fc2': 16}]
+    assert s.qinference_scores(assignments) == [s.qinference(a) for a in assignments]
+
+
+@pytest.mark.parametrize("segment_probes", [1, 3])
+def test_one_validation_round(segment_probes, monkeypatch):
+    s = sensitivity_search(1.0)
+    s.segment_probes = segment_probes
+    rounds = []
+    scores = s.qinference_scores
+
+    def counted_scores(assignments):
+        rounds.append([dict(a) for a in assignments])
+        return scores(assignments)
+    monkeypatch.setattr(s, 'qinference_scores', counted_scores)
+    # two harmful segments
+    s.assign = lambda degradations: ({'inp': 16, 'fc1': 16}, 0, 1)
+    assignment = s.auto_search()
+    assert len(rounds) == 1
+    assert rounds[0][0] == {'inp': 16, 'fc1': 16} and rounds[0][-1] == {}
+    # the assignment, its drops of at most segment_probes (of two) segments and no promotion
+    assert len(rounds[0]) == 2 + min(segment_probes, 2)
+    assert assignment in rounds[0] and 'inp' not in assignment
+    assert_bits(s.g, assignment)
+
+
+@pytest.mark.skipif(not AutoSearchTrialExecutor.available(), reason="requires the fork start method on cpu")
+def test_parallel_validation(monkeypatch):
+    serial = sensitivity_search(1.0)
+    serial.assign = lambda degradations: ({'inp': 16, 'fc1': 16}, 0, 1)
+    rounds = []
+    executor_map = AutoSearchTrialExecutor.map
+
+    def spy_map(self, candidates):
+        rounds.append(list(candidates))
+        return executor_map(self, candidates)
+    monkeypatch.setattr(AutoSearchTrialExecutor, 'map', spy_map)
+    parallel = sensitivity_search(1.0, workers=2)
+    parallel.assign = lambda degradations: ({'inp': 16, 'fc1': 16}, 0, 1)
+    assert parallel.auto_search() == serial.auto_search()
+    assert len(rounds) == 1 and len(rounds[0]) == 4
+    assert rounds[0][0] == ('fc1', 'inp') and rounds[0][-1] == () and set(rounds[0][1:3]) == set([('fc1', ), ('inp', )])
+    assert parallel.executor is None
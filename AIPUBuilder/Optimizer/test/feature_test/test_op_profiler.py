@@ -0,0 +1,63 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import pytest
+
+from mini_graph import *  # noqa
+from AIPUBuilder.Optimizer.analyzer import OpProfiler  # noqa
+from AIPUBuilder.Optimizer.logger import opt_workflow_register  # noqa
+from AIPUBuilder.Optimizer.logger.opt_log_management import opt_log_manager  # noqa
+
+
+class MiniWorkflow:
+    # the stages of optmaster, registered the same way
+    def __init__(self):
+        self.validation_dataloader = None
+        self.x, _ = mini_data(4)
+        self.g = mini_graph()
+
+    @opt_workflow_register
+    def prepare(self):
+        self.g.forward(self.x)
+
+    @opt_workflow_register
+    def quantize(self):
+        mini_calibrate(self.g, self.x)
+        self.g.quantgraph = self.g.clone()
+        self.g.quantize()
+
+
+def test_forward_stages():
+    footprint = opt_log_manager.opt_workflow_footprint_
+    try:
+        opt_log_manager.opt_workflow_footprint_ = 'arg_parser'
+        w = MiniWorkflow()
+        with OpProfiler() as profiler:
+            w.prepare()
+            w.quantize()
+    finally:
+        opt_log_manager.opt_workflow_footprint_ = footprint
+    stages = {}
+    for e in profiler.trace_events:
+        stages.setdefault(e['pid'], set()).add(e['tid'])
+    # the forwards of each stage are tagged with the stage, not with the argument parsing before it
+    assert stages == {'prepare': {'forward'}, 'quantize': {'forward', 'quantize'}}
+    assert set([e['name'].split(' ')[1] for e in profiler.trace_events if e['pid'] == 'prepare']) == \
+        set([n.name for n in w.g.nodes])
+
+
+def test_optmaster_prepare_stage():
+    from AIPUBuilder.Optimizer.optmaster import OptMaster
+    hparams = mini_hparams()
+    g = mini_graph()
+    footprint = opt_log_manager.opt_workflow_footprint_
+    try:
+        # the arguments were parsed just before
+        opt_log_manager.opt_workflow_footprint_ = 'arg_parser'
+        with OpProfiler() as profiler:
+            OptMaster(g, hparams).prepare(hparams)
+    finally:
+        opt_log_manager.opt_workflow_footprint_ = footprint
+    # the init forward of prepare is recorded under its own stage
+    events = [(e['pid'], e['tid'], e['name']) for e in profiler.trace_events]
+    assert set(events) == set([('prepare', 'forward', f"{str(n.type)[7:]} {n.name}") for n in g.nodes])
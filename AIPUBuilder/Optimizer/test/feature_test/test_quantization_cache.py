@@ -0,0 +1,102 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+from mini_graph import *  # noqa
+from AIPUBuilder.Optimizer.framework import QuantizationCache  # noqa
+
+
+def quantize(g, cache=None, bits=None):
+    # quantize a fresh clone of the float graph g, bits={node name: activation bits}
+    g.quantgraph = g.clone()
+    for n in g.quantgraph.nodes:
+        if bits is not None and n.name in bits:
+            n.attrs['q_bits_activation'] = bits[n.name]
+    g.quantize(cache)
+    return g.quantgraph
+
+
+def assert_same_quantization(qg, ref):
+    for n, rn in zip(qg.nodes, ref.nodes):
+        assert n.quantized == rn.quantized
+        assert str(n.params) == str(rn.params)
+        for k, t in rn.constants.items():
+            assert torch.equal(n.constants[k].betensor, t.betensor)
+        for t, rt in zip(n.outputs, rn.outputs):
+            assert torch.equal(torch.as_tensor(t.scale), torch.as_tensor(rt.scale))
+            assert torch.equal(torch.as_tensor(t.zerop), torch.as_tensor(rt.zerop))
+            assert t.dtype == rt.dtype and t.qbits == rt.qbits
+
+
+def test_key():
+    g = mini_calibrate(mini_graph(), mini_data(10)[0])
+    cache = QuantizationCache()
+    fc1 = g.nodes[2]
+    key = cache.key(fc1)
+    assert key == cache.key(fc1.clone(fc1.name))
+    assert key != cache.key(fc1, with_own_tensors=True)
+    # own params and attrs, and the quantization infos of the inputs are in the key
+    fc1.params['with_activation'] = 'RELU'
+    assert key != cache.key(fc1)
+    fc1.params['with_activation'] = 'NONE'
+    fc1.attrs['q_bits_weight'] = 16
+    assert key != cache.key(fc1)
+    fc1.attrs['q_bits_weight'] = 8
+    fc1.inputs[0].scale = 2.0
+    assert key != cache.key(fc1)
+    fc1.inputs[0].scale = 1.0
+    assert key == cache.key(fc1)
+    # but not the dict and tensor attrs, which are results of quantization
+    fc1.attrs['optimization_info'] = {'x': 1}
+    fc1.attrs['gptq_weights'] = {8: torch.zeros(1)}
+    assert key == cache.key(fc1)
+    # quantization infos of own tensors are in the key only with_own_tensors
+    key = cache.key(fc1, with_own_tensors=True)
+    fc1.outputs[0].scale = 3.0
+    assert key != cache.key(fc1, with_own_tensors=True)
+
+
+def test_hits_and_misses():
+    data = mini_data(10)
+    ref = quantize(mini_calibrate(mini_graph(), data[0]))
+    g = mini_calibrate(mini_graph(), data[0])
+    cache = QuantizationCache()
+    assert_same_quantization(quantize(g, cache), ref)
+    nodes = len(g.nodes)
+    assert cache.hits == 0 and cache.misses == nodes
+    # nothing changed, all the nodes are restored
+    assert_same_quantization(quantize(g, cache), ref)
+    assert cache.hits == nodes and cache.misses == nodes
+    # fc1 and its consumer fc2 are quantized again, the others are restored
+    ref16 = quantize(mini_calibrate(mini_graph(), data[0]), bits={'fc1': 16})
+    assert_same_quantization(quantize(g, cache, bits={'fc1': 16}), ref16)
+    assert cache.hits == nodes + 2 and cache.misses == nodes + 2
+    assert_same_quantization(quantize(g, cache, bits={'fc1': 16}), ref16)
+    assert cache.hits == 2 * nodes + 2 and cache.misses == nodes + 2
+    cache.clear()
+    assert_same_quantization(quantize(g, cache), ref)
+    assert cache.misses == 2 * nodes + 2
+
+
+def test_restored_attrs_are_copies():
+    data = mini_data(10)
+    g = mini_calibrate(mini_graph(), data[0])
+    cache = QuantizationCache()
+    qg = quantize(g, cache)
+    fc1 = qg.nodes[2]
+    fc1.attrs['optimization_info']['x'] = 1
+    qg = quantize(g, cache)
+    fc1 = qg.nodes[2]
+    assert cache.hits == len(g.nodes)
+    # the live node's mutable attrs are not the cached ones
+    assert 'x' not in fc1.attrs['optimization_info']
+    fc1.attrs['optimization_info']['y'] = [1]
+    fc1.attrs['layer_top_type_original'].append('int8')
+    qg = quantize(g, cache)
+    fc1 = qg.nodes[2]
+    assert 'y' not in fc1.attrs['optimization_info']
+    assert fc1.attrs['layer_top_type_original'] == ['float32']
+    # the map to the float graph is the live one
+    assert fc1.attrs['map_to_original_node']['fc1'] is g.nodes[2]
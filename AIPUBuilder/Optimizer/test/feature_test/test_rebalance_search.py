@@ -0,0 +1,69 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+from mini_graph import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+from AIPUBuilder.Optimizer.config.cfg_fields import PerNodeFieldDict  # noqa
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.smooth_quant_zy import *  # noqa
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.smooth_quant_zy import _rebalance_n_outputs  # noqa
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.smooth_quant_zy import _rebalance_fake_quantize_weights  # noqa
+from AIPUBuilder.Optimizer.features.calibration.global_calibration.awq_zy import *  # noqa
+
+
+def rebalanced_graph(graph_func, method, mparams):
+    data = mini_data(10)
+    g = mini_calibrate(graph_func(), data[0])
+    method(g, mini_dataloader(data, 4), mparams, PerNodeFieldDict(True))
+    return g
+
+
+@pytest.mark.parametrize("graph_func", [mini_graph, mini_branch_graph])
+@pytest.mark.parametrize("method, mparams", [
+    (smooth_quant_zy_global_calibration, [0.5, True, 0.0, 1.0, 10, False]),
+    (awq_zy_global_calibration, [10, 0.5, False]),
+])
+def test_parallel_search_matches_serial(graph_func, method, mparams):
+    serial = rebalanced_graph(graph_func, method, mparams + [1])
+    parallel = rebalanced_graph(graph_func, method, mparams + [3])
+    changed = False
+    for sn, pn, fn in zip(serial.nodes, parallel.nodes, graph_func().nodes):
+        for k, t in sn.constants.items():
+            assert torch.equal(t.betensor, pn.constants[k].betensor)
+            changed = changed or not torch.equal(t.betensor, fn.constants[k].betensor)
+        for st, pt in zip(sn.outputs, pn.outputs):
+            assert torch.equal(st.max_key_axis, pt.max_key_axis)
+            assert torch.equal(st.min_key_axis, pt.min_key_axis)
+    assert changed
+
+
+@pytest.mark.parametrize("q_mode", ['per_tensor_symmetric_restricted_range', 'per_channel_symmetric_restricted_range'])
+def test_rebalance_n_outputs(q_mode):
+    data = mini_data(10)
+    g = mini_calibrate(mini_graph(), data[0])
+    x = data[0][:4]
+    nodes = {n.name: n for n in g.nodes}
+    torch.manual_seed(2)
+    for nn, vn in [('ln', 'fc1'), ('fc1', 'fc2')]:
+        # the captured tensors
+        ref = float_forward(g, x)
+        n = nodes[nn]
+        n.attrs['q_mode_weight'] = q_mode
+        channels = n.outputs[0].ir_shape[-1]
+        sig = torch.rand(3, channels) + 0.5
+        y = _rebalance_n_outputs(n, nodes[vn], ref[nn].reshape(1, -1, channels), sig)
+        w = n.constants['weights'].betensor.clone()
+        b = n.constants['biases'].betensor.clone()
+        for k in range(sig.shape[0]):
+            # the float n with its weights divided by sigma and quantized
+            wk = w / sig[k].reshape([-1] + [1] * (w.dim() - 1))
+            wk = _rebalance_fake_quantize_weights(wk.reshape(1, channels, -1), q_mode, 8, [1.0]).reshape(w.shape)
+            n.constants['weights'].betensor = wk
+            n.constants['biases'].betensor = b / sig[k]
+            assert torch.allclose(y[k], float_forward(g, x)[nn].reshape(-1, channels), atol=1e-5)
+            if q_mode.startswith('per_tensor'):
+                assert not torch.allclose(y[k], ref[nn].reshape(-1, channels) / sig[k], atol=1e-5)
+        n.constants['weights'].betensor = w
+        n.constants['biases'].betensor = b
@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import csv
+import json
+import numpy as np
+import torch
+import pytest
+
+from mini_graph import *  # noqa
+from AIPUBuilder.Optimizer.analyzer.cosine import SimilarityAnalyzer, check_nodes_similarity  # noqa
+
+
+def np_metrics(x, y):
+    # the reference values of SimilarityAnalyzer.METRICS for one batch
+    x = x.astype(np.float64).flatten()
+    y = y.astype(np.float64).flatten()
+    diff = x - y
+    noise = np.sum(diff * diff)
+    return [np.dot(x, y) / (np.linalg.norm(x) * np.linalg.norm(y)), noise / x.size,
+            10 * np.log10(np.sum(x * x) / noise), np.max(np.abs(diff))]
+
+
+def random_batches(batches, shape=(4, 6, 10), seed=0):
+    # float outputs and their noisy dequantized outputs, with a batch dependent noise level
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for b in range(batches):
+        x = rng.standard_normal(shape).astype(np.float32)
+        y = x + rng.uniform(0.01, 0.5) * rng.standard_normal(shape).astype(np.float32)
+        pairs.append((x, y))
+    return pairs
+
+
+def analyzer_of(g, **kwargs):
+    return SimilarityAnalyzer(g, **kwargs)
+
+
+@pytest.mark.parametrize("batches, reservoir_size", [(1, 256), (7, 256), (40, 40)])
+def test_aggregates_and_percentiles(batches, reservoir_size):
+    g = mini_graph()
+    analyzer = analyzer_of(g, reservoir_size=reservoir_size)
+    pairs = random_batches(batches)
+    for x, y in pairs:
+        values = analyzer.update('fc1', torch.from_numpy(x), torch.from_numpy(y))
+        assert np.allclose(values, np_metrics(x, y), rtol=1e-9, atol=0)
+    ref = np.array([np_metrics(x, y) for x, y in pairs])
+    rows = analyzer.summary()
+    # only the updated tensors are summarized
+    assert [r['tensor_name'] for r in rows] == ['fc1']
+    row = rows[0]
+    assert row['batches'] == batches and row['layer_name'] == 'fc1' and row['layer_id'] == '2'
+    for k, metric in enumerate(SimilarityAnalyzer.METRICS):
+        assert row[metric]['mean'] == pytest.approx(ref[:, k].mean(), rel=1e-9)
+        assert row[metric]['min'] == pytest.approx(ref[:, k].min(), rel=1e-9)
+        assert row[metric]['max'] == pytest.approx(ref[:, k].max(), rel=1e-9)
+        for p in SimilarityAnalyzer.PERCENTILES:
+            assert row[metric][f'p{p}'] == pytest.approx(np.percentile(ref[:, k], p), rel=1e-9)
+    assert analyzer.mean('fc1', 'mse') == pytest.approx(ref[:, 1].mean(), rel=1e-9)
+    assert analyzer.mean('ln') is None
+
+
+def test_constant_memory():
+    g = mini_graph()
+    analyzer = analyzer_of(g, reservoir_size=16)
+    buffers = [analyzer.count, analyzer.sum, analyzer.min, analyzer.max, analyzer.samples]
+    shapes = [b.shape for b in buffers]
+    ptrs = [b.data_ptr() for b in buffers]
+    pairs = random_batches(200, seed=1)
+    for x, y in pairs:
+        analyzer.update('fc2', torch.from_numpy(x), torch.from_numpy(y))
+    # the preallocated buffers are updated in place, whatever the number of batches
+    buffers = [analyzer.count, analyzer.sum, analyzer.min, analyzer.max, analyzer.samples]
+    assert [b.shape for b in buffers] == shapes and [b.data_ptr() for b in buffers] == ptrs
+    ref = np.array([np_metrics(x, y) for x, y in pairs])
+    row = analyzer.summary()[0]
+    assert row['batches'] == 200
+    assert row['cosine']['mean'] == pytest.approx(ref[:, 0].mean(), rel=1e-9)
+    # the reservoir is a sample of the batches' values
+    i = analyzer.index['fc2']
+    kept = analyzer.samples[i, 0].numpy()
+    assert len(set(kept.tolist())) == 16 and (np.abs(kept[:, None] - ref[None, :, 0]).min(1) < 1e-12).all()
+    assert ref[:, 0].min() <= row['cosine']['p1'] <= row['cosine']['p99'] <= ref[:, 0].max()
+
+
+@pytest.mark.parametrize("numel, max_elements, kept", [(240, 0, 240), (240, 240, 240), (240, 100, 80), (240, 7, 7)])
+def test_subsample(numel, max_elements, kept):
+    g = mini_graph()
+    analyzer = analyzer_of(g, max_elements=max_elements)
+    x = torch.arange(numel, dtype=torch.float32)
+    sub = analyzer.subsample(x)
+    step = 1 if max_elements < 1 or numel <= max_elements else (numel + max_elements - 1) // max_elements
+    assert sub.dtype == torch.float64 and sub.numel() == kept <= (max_elements or numel)
+    assert torch.equal(sub, x[::step].double())
+    # the metrics are computed on the evenly strided elements
+    (x, y), = random_batches(1, shape=(numel, ))
+    values = analyzer.update('ln', torch.from_numpy(x), torch.from_numpy(y))
+    assert np.allclose(values, np_metrics(x[::step], y[::step]), rtol=1e-9, atol=0)
+
+
+def test_save(tmp_path):
+    g = mini_graph()
+    analyzer = analyzer_of(g)
+    for name, seed in [('ln', 2), ('fc2', 3)]:
+        for x, y in random_batches(5, seed=seed):
+            analyzer.update(name, torch.from_numpy(x), torch.from_numpy(y))
+    rows = analyzer.summary()
+    jpath = str(tmp_path / 'similarity.json')
+    analyzer.save(jpath)
+    with open(jpath) as f:
+        assert json.load(f) == rows
+    cpath = str(tmp_path / 'similarity.CSV')
+    analyzer.save(cpath)
+    with open(cpath, newline='') as f:
+        table = list(csv.reader(f))
+    stats = ['mean', 'min', 'max'] + [f'p{p}' for p in SimilarityAnalyzer.PERCENTILES]
+    head = ['layer_id', 'layer_type', 'layer_name', 'tensor_name', 'batches']
+    assert table[0] == head + [f'{m}_{s}' for m in SimilarityAnalyzer.METRICS for s in stats]
+    assert len(table) == 1 + len(rows)
+    for line, row in zip(table[1:], rows):
+        assert line[:5] == [str(row[h]) for h in head]
+        assert [float(v) for v in line[5:]] == [row[m][s] for m in SimilarityAnalyzer.METRICS for s in stats]
+
+
+def test_check_nodes_similarity():
+    # the analyzer accumulates the same similarity as the per-tensor lists
+    x, _ = mini_data(8)
+    g = mini_calibrate(mini_graph(), x)
+    g.quantgraph = g.clone()
+    g.quantize()
+    qg = g.quantgraph
+    analyzer = analyzer_of(qg)
+    for i in range(2):
+        inp = x[4 * i:4 * i + 4]
+        check_nodes_similarity(g, qg, [inp], analyzer=analyzer)
+        check_nodes_similarity(g, qg, [inp])
+    for n in qg.nodes:
+        for t in n.outputs:
+            assert len(t.similarity) == 2
+            assert analyzer.mean(t.name) == pytest.approx(sum(t.similarity) / 2, rel=1e-9)
+            assert analyzer.mean(t.name, 'mse') == pytest.approx(sum(t.mse) / 2, rel=1e-5)
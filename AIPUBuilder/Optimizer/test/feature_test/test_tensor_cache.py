@@ -0,0 +1,101 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+import pytest
+
+import sys
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.utils import TensorCache  # noqa
+
+
+def tensors(n, numel=16):
+    # float32 tensors of numel * 4 bytes
+    torch.manual_seed(0)
+    return [torch.randn(numel) for _ in range(n)]
+
+
+def in_memory(cache, key):
+    return not isinstance(cache.items[key], str)
+
+
+@pytest.mark.parametrize("max_bytes, resident", [(3 * 64, 3), (3 * 64 + 63, 3), (0, 0), (1 << 20, 5)])
+def test_capacity_and_spill(max_bytes, resident):
+    cache = TensorCache(max_bytes)
+    ts = tensors(5)
+    for i, t in enumerate(ts):
+        cache.put(i, t)
+    assert cache.keys() == list(range(5))
+    assert [in_memory(cache, i) for i in range(5)] == [i < resident for i in range(5)]
+    assert cache.mem_bytes == resident * 64 and cache.mem_bytes <= max_bytes
+    assert (cache.spill_dir is None) == (resident == 5)
+    for i, t in enumerate(ts):
+        assert i in cache
+        assert torch.equal(cache.get(i), t)
+    spill_dir = cache.spill_dir.name if cache.spill_dir is not None else None
+    cache.clear()
+    assert cache.keys() == [] and cache.mem_bytes == 0 and cache.spill_dir is None
+    assert spill_dir is None or not os.path.exists(spill_dir)
+
+
+def test_put_copies():
+    cache = TensorCache(64)
+    a, b = tensors(2)
+    ref_a, ref_b = a.clone(), b.clone()
+    cache.put('a', a)
+    cache.put('b', b)
+    a += 1
+    b += 1
+    assert torch.equal(cache.get('a'), ref_a)
+    assert torch.equal(cache.get('b'), ref_b)
+
+
+def test_pop_and_replace():
+    cache = TensorCache(2 * 64)
+    a, b, c, d = tensors(4)
+    cache.put('a', a)
+    cache.put('b', b)
+    cache.put('c', c)
+    spilled = cache.items['c']
+    assert os.path.exists(spilled)
+    # popping a spilled tensor removes its file, popping a resident one frees its bytes
+    cache.pop('c')
+    assert not os.path.exists(spilled) and 'c' not in cache
+    cache.pop('a')
+    assert cache.mem_bytes == 64
+    cache.put('d', d)
+    assert in_memory(cache, 'd') and cache.mem_bytes == 2 * 64
+    # putting a key again replaces it without counting its bytes twice
+    cache.put('b', a)
+    assert in_memory(cache, 'b') and cache.mem_bytes == 2 * 64
+    assert torch.equal(cache.get('b'), a)
+    cache.pop('missing')
+    assert cache.keys() == ['d', 'b']
+
+
+def test_update():
+    cache = TensorCache(2 * 64)
+    a, b, c = tensors(3)
+    cache.put('a', a)
+    cache.put('b', b)
+    cache.put('c', c)
+    # a spilled tensor is updated in place
+    cache.update('c', 2 * c)
+    assert not in_memory(cache, 'c') and torch.equal(cache.get('c'), 2 * c)
+    # a larger resident tensor which no longer fits is spilled, the resident bytes stay accurate
+    cache.update('a', torch.randn(32))
+    assert not in_memory(cache, 'a') and cache.mem_bytes == 64
+    # a smaller one frees bytes
+    cache.update('b', b[:8])
+    assert in_memory(cache, 'b') and cache.mem_bytes == 32
+    assert torch.equal(cache.get('b'), b[:8])
+    # updates copy as puts do
+    t = torch.ones(8)
+    cache.update('b', t)
+    t += 1
+    assert torch.equal(cache.get('b'), torch.ones(8))
+    with pytest.raises(KeyError):
+        cache.update('missing', a)
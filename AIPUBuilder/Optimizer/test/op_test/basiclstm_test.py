@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import numpy as np
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.basiclstm import lstm  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+BATCH, INITIAL_BATCH, TIME_STEP, INPUT_SIZE, CELL_SIZE = 5, 3, 6, 7, 8
+
+
+def lstm_node(x, h, c, direction, out_sequence, dtype=None, qat=False):
+    quantized = dtype is not None
+    node = PyNode('basiclstm', OpType.BasicLSTM)
+    node.add_input(PyTensor('x', x, Dtype.FP32))
+    node.add_input(PyTensor('h', h, Dtype.FP32))
+    node.add_input(PyTensor('c', c, Dtype.FP32))
+    for name in out_sequence:
+        node.add_output(PyTensor(name, TensorShape([1]), dtype if quantized else Dtype.FP32))
+    node.params['time_steps'] = TIME_STEP
+    node.params['input_size'] = INPUT_SIZE
+    node.params['cell_size'] = CELL_SIZE
+    node.params['direction'] = direction
+    node.params['out_sequence'] = out_sequence
+    node.quantized = quantized and not qat
+    if not quantized:
+        node.constants['weights'] = PyTensor('weights', torch.randn(4 * CELL_SIZE, INPUT_SIZE + CELL_SIZE))
+        node.constants['biases'] = PyTensor('biases', torch.randn(4 * CELL_SIZE))
+        node.params['cell_clip'] = 3.0
+        node.params['forget_bias'] = 0.5
+        return node
+
+    bits = dtype2bits(dtype)
+    qmin, qmax = bits2range(bits, True)
+    node.inputs[0].qbits = bits
+    node.outputs[0].qbits = bits
+    node.constants['weights'] = PyTensor('weights', torch.randint(qmin, qmax + 1, (4 * CELL_SIZE, INPUT_SIZE + CELL_SIZE)))
+    node.constants['biases'] = PyTensor('biases', torch.randint(-2 ** (bits + 6), 2 ** (bits + 6), (4 * CELL_SIZE,)))
+    lut_size = 256 if bits <= 8 else 512
+    if qat:
+        node.params['basiclstm_for_qat'] = True
+        node.inputs[2].zerop = 3
+        for name in ['lut_ft', 'lut_it', 'lut_ct', 'lut_ot', 'lut_h']:
+            node.constants[name] = PyTensor(name, torch.randint(qmin, qmax + 1, (TIME_STEP * lut_size,)))
+        node.constants['scale'] = PyTensor('scale', torch.randint(1, 256, (TIME_STEP, 8)).float())
+        node.constants['shift'] = PyTensor('shift', torch.randint(6, 14, (TIME_STEP, 6)).float())
+        node.constants['zerop'] = PyTensor('zerop', torch.randint(-4, 5, (TIME_STEP, 11)).float())
+        return node
+
+    for name in ['lut_it', 'lut_ft', 'lut_ct', 'lut_ot', 'lut_h']:
+        node.constants[name] = PyTensor(name, torch.randint(qmin, qmax + 1, (lut_size,)))
+    # scale_[0:5] for h_by_wh, the gates, g, c and h, then two (scale, shift) pairs per timestep for c
+    node.constants['scale'] = PyTensor('scale', torch.randint(2 ** 14, 2 ** 15, (5 + 2 * TIME_STEP,)))
+    shift = torch.randint(bits + 12, bits + 15, (5 + 2 * TIME_STEP,))
+    shift[0] = 15
+    node.constants['shift'] = PyTensor('shift', shift)
+    node.constants['diff_shifts'] = PyTensor('diff_shifts', torch.randint(0, 3, (TIME_STEP,)))
+    node.params['lut_shift_value'] = 2
+    return node
+
+
+def random_states(quantized, bits=8):
+    if quantized:
+        qmin, qmax = bits2range(bits, True)
+        x = torch.randint(qmin, qmax + 1, (BATCH, TIME_STEP, INPUT_SIZE)).float()
+        h = torch.randint(qmin, qmax + 1, (INITIAL_BATCH, CELL_SIZE)).float()
+        c = torch.randint(qmin, qmax + 1, (INITIAL_BATCH, CELL_SIZE)).float()
+    else:
+        x = torch.randn(BATCH, TIME_STEP, INPUT_SIZE)
+        h = torch.randn(INITIAL_BATCH, CELL_SIZE)
+        c = torch.randn(INITIAL_BATCH, CELL_SIZE)
+    return x, h, c
+
+
+def forward_per_sample(node, batch_idx):
+    # run the samples of the batch one by one, each one picks the same initial states as in the whole batch
+    x = node.inputs[0].betensor
+    outputs = []
+    for b in range(x.shape[0]):
+        node.inputs[0].betensor = x[b:b + 1]
+        node.current_batch_idx = batch_idx * x.shape[0] + b
+        lstm(node)
+        outputs.append([o.betensor.clone() for o in node.outputs])
+    node.inputs[0].betensor = x
+    return [torch.cat(o, dim=0) for o in zip(*outputs)]
+
+
+def forward_batch(node, batch_idx):
+    node.current_batch_idx = batch_idx
+    lstm(node)
+    return [o.betensor.clone() for o in node.outputs]
+
+
+@pytest.mark.parametrize("direction", ['forward', 'reverse'])
+@pytest.mark.parametrize("out_sequence", [['Y'], ['H'], ['Y', 'H', 'C'], ['C', 'H']])
+def test_basiclstm_float(direction, out_sequence):
+    torch.manual_seed(0)
+    node = lstm_node(*random_states(False), direction, out_sequence)
+    outs = forward_batch(node, 1)
+    placeholders = [p.betensor.clone() for p in node.placeholders]
+    refs = forward_per_sample(node, 1)
+    for out, ref in zip(outs, refs):
+        # the batched matmul may accumulate in another order than the one row matmul
+        assert out.dtype == ref.dtype
+        assert torch.allclose(out, ref, rtol=1e-12, atol=1e-12)
+    assert len(placeholders) == 7 + TIME_STEP
+    assert placeholders[0].shape == (BATCH, TIME_STEP, CELL_SIZE)
+    assert placeholders[7].shape == (BATCH, CELL_SIZE)
+
+
+@pytest.mark.parametrize("dtype", [Dtype.INT8, Dtype.INT16])
+@pytest.mark.parametrize("direction", ['forward', 'reverse'])
+@pytest.mark.parametrize("out_sequence", [['Y'], ['H'], ['Y', 'H', 'C']])
+def test_basiclstm_quant(dtype, direction, out_sequence):
+    torch.manual_seed(0)
+    node = lstm_node(*random_states(True, dtype2bits(dtype)), direction, out_sequence, dtype)
+    outs = forward_batch(node, 1)
+    refs = forward_per_sample(node, 1)
+    for out, ref in zip(outs, refs):
+        assert torch.equal(out, ref)
+    assert outs[0].unique().numel() > 2
+
+
+@pytest.mark.parametrize("direction", ['forward', 'reverse'])
+def test_basiclstm_qat(direction):
+    torch.manual_seed(0)
+    x, h, c = random_states(True)
+    node = lstm_node(x, h[:1].repeat(BATCH, 1), c[:1].repeat(BATCH, 1), direction, ['Y', 'C'], Dtype.INT8, qat=True)
+    outs = forward_batch(node, 0)
+    refs = forward_per_sample(node, 0)
+    for out, ref in zip(outs, refs):
+        assert torch.equal(out, ref)
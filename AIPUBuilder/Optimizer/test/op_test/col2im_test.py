@@ -0,0 +1,185 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.col2im import col2im2D, col2imND, unfoldNd  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def loop_col2im2D(node, inp, image_dims, kernel_dims):
+    batch_size = inp.shape[0]
+    in_channels_kernel_size_numel = inp.shape[1]
+    kernel_size_numel = torch.prod(kernel_dims)
+    output_size_numel = torch.prod(image_dims)
+    in_channels = in_channels_kernel_size_numel // kernel_size_numel
+
+    idx = torch.arange(output_size_numel, dtype=torch.float32, device=inp.device).reshape(1, 1, *image_dims)
+    idx = unfoldNd(node, idx, kernel_dims, kernel_size_numel)
+
+    inp = inp.reshape(batch_size, in_channels, -1)
+    idx = idx.reshape(1, 1, -1).long().expand(batch_size, in_channels, -1)
+
+    mask = idx == -32767
+    inp[mask] = 0
+    idx[mask] = 0
+
+    out = torch.zeros(
+        batch_size, in_channels, output_size_numel, dtype=inp.dtype, device=inp.device)
+
+    out.scatter_add_(2, idx, inp)
+
+    out = out.reshape(batch_size, in_channels, *image_dims)
+
+    if node.quantized:
+        do_scale = node.get_param('scale_value')
+        do_shift = node.get_param('shift_value')
+        out = linear_requantize(out, do_scale, do_shift,
+                                node.outputs[0].zerop, node.outputs[0].qmin, node.outputs[0].qmax)
+
+    return out
+
+
+def loop_col2imND(node, inp, image_dims, kernel_dims):
+    from AIPUBuilder.Optimizer.utils import construct_torch_tensor as torch_tensor
+    padding = [node.get_param('pad_z_begin'), node.get_param('pad_y_begin'), node.get_param('pad_x_begin'),
+               node.get_param('pad_z_end'), node.get_param('pad_y_end'), node.get_param('pad_x_end')]
+    dilations = [node.get_param('dilation_z'), node.get_param('dilation_y'), node.get_param('dilation_x')]
+    strides = [node.get_param('stride_z'), node.get_param('stride_y'), node.get_param('stride_x')]
+    rank = image_dims.numel()
+    image_shape_size = torch.prod(image_dims)
+    kernel_shape_size = torch.prod(kernel_dims)
+    adjusted_kernel_shape = torch_tensor(dilations, device=inp.device) * (kernel_dims - 1) + 1
+
+    N = inp.shape[0]
+    C = int(inp.shape[1] / kernel_shape_size)
+    col_stride = C * image_shape_size  # 3*14*15*16
+    col_data_stride = inp.shape[1] * inp.shape[2]
+    batched_image_shape_dims = torch.cat(
+        (torch_tensor([N, C], device=inp.device), torch.zeros([rank], device=inp.device)))
+    batched_image_shape_dims[2:] = image_dims
+    adjusted_image_shape_dims = image_dims - adjusted_kernel_shape + 1
+    batched_image_shape_dims = batched_image_shape_dims.long().tolist()
+
+    inp_flatten = inp.flatten()
+    image_data = torch.zeros(batched_image_shape_dims, device=inp.device).flatten()
+    for b in range(N):
+        data_im = inp_flatten[b * col_data_stride:]
+        im_shape = image_dims
+        output_shape = adjusted_image_shape_dims
+        channels_col = kernel_shape_size * C
+        kernel_shape = adjusted_kernel_shape
+        data_col = image_data[b * col_stride:]
+        kernel_size = torch.prod(kernel_shape)
+        d_offset = [0] * rank
+        d_iter = [0] * rank
+        for c_col in range(channels_col):
+            offset = c_col
+            for di in range(rank - 1, -1, -1):
+                if di < (rank - 1):
+                    offset = offset // kernel_shape[di + 1]
+                d_offset[di] = int(offset) % kernel_shape[di]
+            while True:
+                index_col = c_col
+                index_im = c_col // kernel_size
+                is_padding = False
+                for d_i in range(rank):
+                    d = d_iter[d_i]
+                    d_im = d * strides[d_i] - padding[d_i] + d_offset[d_i] * dilations[d_i]
+                    is_padding = is_padding or (not (d_im >= 0 and d_im < im_shape[d_i]))
+                    index_col *= output_shape[d_i]
+                    index_col += d
+                    index_im *= im_shape[d_i]
+                    index_im += d_im
+                if not is_padding:
+                    if index_col < data_im.shape[0] and index_im < data_col.shape[0]:
+                        data_col[index_im] += data_im[index_col]
+
+                def NextPosition(shape, d_iter):
+                    has_next_output = False
+                    for d_x in range(rank - 1, -1, -1):
+                        d_max = shape[d_x]
+                        if d_iter[d_x] == (d_max - 1):
+                            d_iter[d_x] = 0
+                        else:
+                            d_iter[d_x] += 1
+                            has_next_output = True
+                            break
+                    return has_next_output, d_iter
+
+                has_next_output, d_iter = NextPosition(output_shape, d_iter)
+                if not has_next_output:
+                    break
+
+    output = torch.reshape(image_data, batched_image_shape_dims)
+
+    if node.quantized:
+        do_scale = node.get_param('scale_value')
+        do_shift = node.get_param('shift_value')
+        output = linear_requantize(output, do_scale, do_shift,
+                                   node.outputs[0].zerop, node.outputs[0].qmin, node.outputs[0].qmax)
+
+    return output
+
+
+def col2im_node(quantized, stride, dilation, pad):
+    node = PyNode('col2im', OpType.Col2Im)
+    node.quantized = quantized
+    for i, ax in enumerate(['z', 'y', 'x']):
+        node.params['stride_' + ax] = stride[i]
+        node.params['dilation_' + ax] = dilation[i]
+        node.params['pad_%s_begin' % ax] = pad[i]
+        node.params['pad_%s_end' % ax] = pad[i]
+    node.params['pad_top'], node.params['pad_left'] = pad[1], pad[2]
+    node.params['pad_bottom'], node.params['pad_right'] = pad[1], pad[2]
+    if quantized:
+        node.params['scale_value'] = 23001
+        node.params['shift_value'] = 16
+        out = PyTensor('out')
+        out.zerop, out.qmin, out.qmax = 0, -128, 127
+        node.add_output(out)
+    return node
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+@pytest.mark.parametrize("batch, channel", [(1, 1), (2, 3)])
+@pytest.mark.parametrize("stride, dilation, pad", [([1, 1, 1], [1, 1, 1], [0, 0, 0]),
+                                                   ([1, 2, 1], [1, 1, 2], [1, 0, 1]),
+                                                   ([2, 2, 2], [2, 1, 1], [0, 1, 0])])
+def test_col2im_nd(quantized, batch, channel, stride, dilation, pad):
+    torch.manual_seed(0)
+    node = col2im_node(quantized, stride, dilation, pad)
+    image_dims = torch.tensor([5, 6, 7])
+    kernel_dims = torch.tensor([2, 3, 2])
+    inp = torch.randn(batch, channel * 12, 40)
+    if quantized:
+        inp = torch.randint(-128, 128, inp.shape).float()
+    out = col2imND(node, inp, image_dims, kernel_dims)
+    ref = loop_col2imND(node, inp, image_dims, kernel_dims)
+    assert torch.equal(out, ref)
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+@pytest.mark.parametrize("stride, dilation, pad", [([1, 1, 1], [1, 1, 1], [0, 0, 0]),
+                                                   ([1, 2, 1], [1, 1, 2], [1, 1, 2])])
+def test_col2im_2d(quantized, stride, dilation, pad):
+    torch.manual_seed(0)
+    node = col2im_node(quantized, stride, dilation, pad)
+    image_dims = torch.tensor([6, 7])
+    kernel_dims = torch.tensor([2, 3])
+    blocks = unfoldNd(node, torch.zeros(1, 1, 6, 7), [2, 3], 6).shape[-1]
+    inp = torch.randn(1, 6, blocks)
+    if quantized:
+        inp = torch.randint(-128, 128, inp.shape).float()
+    inp_copy = inp.clone()
+    out = col2im2D(node, inp, image_dims, kernel_dims)
+    assert torch.equal(inp, inp_copy)
+    ref = loop_col2im2D(node, inp, image_dims, kernel_dims)
+    assert torch.equal(out, ref)
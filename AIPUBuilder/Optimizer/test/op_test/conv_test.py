@@ -0,0 +1,191 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.conv import _conv2d_torch_impl, _conv2d_tile_shape, tiled_conv2d  # noqa
+from AIPUBuilder.Optimizer.ops.convwinograd import *  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+from AIPUBuilder.Optimizer.utils.math_utils import _exact_fp32_splits  # noqa
+
+
+# the double implementation which the float32 fast path must reproduce exactly
+
+def loop_conv2d_torch_impl(self, *args):
+    inp = self.inputs[0].betensor.double()
+    weights = self.constants['weights'].betensor.clone().double()
+    bias = self.constants['biases'].betensor.clone().double()
+    stride = (self.get_param("stride_y"), self.get_param("stride_x"))
+    dilation = (self.get_param('dilation_y'), self.get_param('dilation_x'))
+    padding = (self.get_param('pad_left'), self.get_param('pad_right'),
+               self.get_param('pad_top'), self.get_param('pad_bottom'))
+    group = self.get_param('group')
+    pad_val = 0
+    if self.quantized:
+        # input's zerop has been absorbed to bias.
+        # inp += self.inputs[0].zerop
+        pad_val = -self.inputs[0].zerop[0]
+        weights += self.constants["weights"].broadcast_zerop
+        bias += self.constants['biases'].broadcast_zerop
+
+    inp = nhwc2nchw(inp)
+    weights = nhwc2nchw(weights)
+    if WinogradChecker.run(self) or self.get_param('with_winograd', optional=True, default_value=False):
+        x = WinogradAllocator(self, inp, weights, bias)
+    else:
+        if self.aasrb is not None:
+            bias = None
+        inp = torch.nn.functional.pad(inp, padding, value=pad_val)
+        x = torch.nn.functional.conv2d(inp,
+                                       weights,
+                                       bias,
+                                       stride=stride,
+                                       padding=0,
+                                       dilation=dilation,
+                                       groups=group)
+    x = nchw2nhwc(x)
+    return x
+
+
+def conv_node(in_bits, w_bits, channels, group, kernel, stride, dilation, pad, zerop, quantized=True, aasrb=None):
+    cin, cout = channels
+    x_qmin, x_qmax = bits2range(in_bits, False)
+    w_qmin, w_qmax = bits2range(w_bits, True)
+    node = PyNode('conv', OpType.Convolution)
+    node.attrs['layer_id'] = '0'
+    node.quantized = quantized
+    if quantized:
+        x = torch.randint(x_qmin, x_qmax + 1, (2, 13, 11, cin)).float()
+        w = torch.randint(w_qmin, w_qmax + 1, (cout, kernel, kernel, cin // group)).float()
+        b = torch.randint(-2 ** 20, 2 ** 20, (cout,)).float()
+    else:
+        x = torch.randn(2, 13, 11, cin)
+        w = torch.randn(cout, kernel, kernel, cin // group)
+        b = torch.randn(cout)
+    inp = PyTensor('x', x.numpy())
+    inp.zerop = torch.tensor([zerop])
+    node.add_input(inp)
+    node.add_output(PyTensor('y'))
+    node.constants['weights'] = PyTensor('weights', w.numpy())
+    node.constants['weights'].zerop = torch.zeros(cout)
+    node.constants['biases'] = PyTensor('biases', b.numpy())
+    node.constants['biases'].zerop = torch.zeros(cout)
+    for k, v in {'stride_y': stride, 'stride_x': stride, 'dilation_y': dilation, 'dilation_x': dilation,
+                 'pad_left': pad, 'pad_right': pad, 'pad_top': pad, 'pad_bottom': pad, 'group': group,
+                 'kernel_y': kernel, 'kernel_x': kernel}.items():
+        node.params[k] = v
+    node.aasrb = aasrb
+    return node
+
+
+@pytest.mark.parametrize("in_bits, w_bits, channels, group, kernel, stride, dilation, pad, zerop, splits", [
+    (8, 8, (16, 24), 1, 3, 1, 1, 1, 128, 1),
+    (8, 8, (16, 16), 16, 3, 2, 1, 1, 0, 1),
+    (8, 8, (32, 8), 4, 5, 1, 2, 2, 7, 1),
+    (8, 8, (512, 16), 1, 3, 1, 1, 1, 128, 7),
+    (8, 8, (1024, 8), 1, 1, 1, 1, 0, 128, 2),
+    (8, 8, (2048, 4), 1, 3, 1, 1, 1, 128, 0),
+    (8, 4, (1024, 8), 1, 3, 1, 1, 1, 128, 1),
+    (16, 8, (16, 8), 1, 3, 1, 1, 1, 0, 0),
+    (8, 8, (1024, 8), 2, 3, 1, 1, 1, 128, 0),
+])
+@pytest.mark.parametrize("aasrb", [None, 8])
+def test_conv_quant(in_bits, w_bits, channels, group, kernel, stride, dilation, pad, zerop, splits, aasrb):
+    torch.manual_seed(0)
+    node = conv_node(in_bits, w_bits, channels, group, kernel, stride, dilation, pad, zerop, aasrb=aasrb)
+    out = _conv2d_torch_impl(node)
+    ref = loop_conv2d_torch_impl(node)
+    assert out.dtype == ref.dtype
+    assert torch.equal(out, ref)
+    # 0 for the double fallback
+    inp = nhwc2nchw(node.inputs[0].betensor.double())
+    inp = torch.nn.functional.pad(inp, (pad, pad, pad, pad), value=-zerop)
+    w = nhwc2nchw(node.constants['weights'].betensor.double())
+    r = _exact_fp32_splits(inp, w, group, node.constants['biases'].betensor.double())
+    assert (len(r) if r is not None else 0) == splits
+
+
+def test_conv_float():
+    torch.manual_seed(0)
+    node = conv_node(8, 8, (16, 24), 1, 3, 1, 1, 1, 0, quantized=False)
+    assert torch.equal(_conv2d_torch_impl(node), loop_conv2d_torch_impl(node))
+
+
+def test_conv_quant_non_integer():
+    # the float32 path is only taken for integer operands
+    torch.manual_seed(0)
+    node = conv_node(8, 8, (16, 24), 1, 3, 1, 1, 1, 0)
+    node.inputs[0].betensor = node.inputs[0].betensor + 0.3
+    assert torch.equal(_conv2d_torch_impl(node), loop_conv2d_torch_impl(node))
+
+
+@pytest.mark.parametrize("channels, group, kernel, stride, dilation", [((16, 24), 1, 3, 1, 1),
+                                                                      ((16, 16), 16, 3, 2, 1),
+                                                                      ((32, 8), 4, 5, 2, 2),
+                                                                      ((64, 32), 1, 1, 1, 1)])
+@pytest.mark.parametrize("budget", [1, 8 * 1024, 64 * 1024])
+def test_tiled_conv2d(channels, group, kernel, stride, dilation, budget):
+    torch.manual_seed(0)
+    cin, cout = channels
+    x = torch.randint(-128, 128, (2, cin, 23, 19)).double()
+    w = torch.randint(-128, 128, (cout, cin // group, kernel, kernel)).double()
+    b = torch.randint(-2 ** 20, 2 ** 20, (cout,)).double()
+    th, tw, cb = _conv2d_tile_shape(x.shape, w.shape, (stride, stride), (dilation, dilation), group, budget)
+    for bias in [b, None]:
+        out = tiled_conv2d(x, w, bias, (stride, stride), (dilation, dilation), group, budget)
+        ref = exact_integer_conv2d(x, w, bias, stride=(stride, stride), dilation=(dilation, dilation), groups=group)
+        assert torch.equal(out, ref)
+    if budget == 1:
+        assert (th, tw, cb) == (1, 1, 1)
+    elif budget == 64 * 1024:
+        assert th < ref.shape[2]
+
+
+@pytest.mark.parametrize("height, kernel, stride, dilation, pad", [(13, 3, 1, 1, 1),
+                                                                   (14, 3, 2, 1, 1),
+                                                                   (17, 3, 1, 2, 2),
+                                                                   (18, 5, 2, 2, 2),
+                                                                   (9, 3, 3, 1, 1)])
+def test_tiled_conv_row_splits(height, kernel, stride, dilation, pad):
+    # the receptive fields of the rows around each split overlap, and the padded rows are in the first and last tiles
+    torch.manual_seed(0)
+    node = conv_node(8, 8, (8, 8), 1, kernel, stride, dilation, pad, 128)
+    node.inputs[0].betensor = torch.randint(0, 256, (2, height, 7, 8)).float()
+    untiled = _conv2d_torch_impl(node)
+    assert torch.equal(untiled, loop_conv2d_torch_impl(node))
+    padded = [2, 8, height + 2 * pad, 7 + 2 * pad]
+    oh = untiled.shape[1]
+    rows = set()
+    for budget in [2 ** k for k in range(4, 20)]:
+        th, tw, cb = _conv2d_tile_shape(padded, [8, 8, kernel, kernel], (stride, stride), (dilation, dilation), 1, budget)
+        if th >= oh or (th, tw, cb) in rows:
+            continue
+        rows.add((th, tw, cb))
+        node.attrs['conv_tiling_memory_budget'] = budget / 2 ** 20
+        assert torch.equal(_conv2d_torch_impl(node), untiled)
+    # a partial last tile, a split at every row and down to single output elements
+    assert any(oh % th for th, _, _ in rows) and any(th == 1 for th, _, _ in rows) and (1, 1, 1) in rows
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+def test_conv_tiling_budget(quantized, monkeypatch):
+    # a 1x1 convolution on a big featuremap with a small budget, only the quantized one is tiled
+    import AIPUBuilder.Optimizer.ops.conv as conv_module
+    torch.manual_seed(0)
+    node = conv_node(8, 8, (16, 8), 1, 1, 1, 1, 0, 128, quantized=quantized)
+    x = torch.randint(0, 256, (1, 300, 200, 16)).float() if quantized else torch.randn(1, 300, 200, 16)
+    node.inputs[0].betensor = x
+    node.attrs['conv_tiling_memory_budget'] = 1
+    assert _conv2d_tile_shape([1, 16, 300, 200], [8, 16, 1, 1], (1, 1), (1, 1), 1, 1024 * 1024)[0] < 300
+    tiled = []
+    monkeypatch.setattr(conv_module, 'tiled_conv2d',
+                        lambda *args: tiled.append(args) or tiled_conv2d(*args))
+    assert torch.equal(_conv2d_torch_impl(node), loop_conv2d_torch_impl(node))
+    assert len(tiled) == int(quantized)
@@ -0,0 +1,186 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import torch.nn as nn
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.convwinograd import *  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+# the tile by tile implementation (input reverse of method3 and HeavyFootprintMode) which must be reproduced exactly
+
+def loop_winograd_conv_1D_HP(self, inp, weights, bias, m=2, r=3):
+    # prepare params
+    Batch, _Cin, _Hin, _Win = inp.shape
+    _, _Hout, _Wout,  _Cout = self.outputs[0].ir_shape
+    _PadLeft, _PadRight, _PadTop, _PadBottom = (int(self.get_param('pad_left')),
+                                                int(self.get_param('pad_right')),
+                                                int(self.get_param('pad_top')),
+                                                int(self.get_param('pad_bottom')))
+    if self.quantized:
+        _StrideX, _StrideY = (int(self.get_param("stride_y")), int(self.get_param("stride_y")))
+        _KernelHeight, _KernelWidth = weights.shape[2], weights.shape[2]
+    else:
+        _StrideX, _StrideY = (int(self.get_param("stride_x")), int(self.get_param("stride_y")))
+        _, _, _KernelHeight, _KernelWidth = weights.shape
+
+    # F(2,3)
+    BT, G, AT = ArcReactor.run(m, r)
+    BT = torch.tensor(BT, dtype=torch.float32, device=inp.device)
+    G = torch.tensor(G,  dtype=torch.float32, device=inp.device)
+    AT = torch.tensor(AT, dtype=torch.float32, device=inp.device)
+    TileInWidth = m + r - 1
+
+    WinogradPadRight = _PadRight + (align(_PadLeft + _Win + _PadRight - 4, 2) - (_PadLeft + _Win + _PadRight - 4))
+    winogradPadBottom = _PadBottom
+    WinogradPadTop = _PadTop
+    WinogradPadLeft = _PadLeft
+
+    WinogradWout = (_PadLeft + _Win + WinogradPadRight - _KernelWidth) // _StrideX + 1
+    WinogradHout = (_PadTop + _Hin + winogradPadBottom - _KernelHeight) // _StrideY + 1
+
+    LoopWidth = WinogradWout // (_KernelWidth - _StrideX)
+    LoopHeight = WinogradHout
+
+    tmp = inp.clone()  # NCHW
+    WinogradPaddingFunc = nn.ConstantPad2d((WinogradPadLeft, WinogradPadRight, WinogradPadTop,
+                                            winogradPadBottom), value=self.inputs[0].zerop[0])
+    PaddingInp = WinogradPaddingFunc(tmp)
+
+    if 'WinogradWeights' not in self.attrs.keys() and not self.get_param('with_winograd', optional=True, default_value=False):
+        # generate G*g
+        WinogradWeights = torch.zeros((_Cout, _Cin, _KernelHeight, TileInWidth),
+                                      device=inp.device, dtype=torch.float32)  # 64,64,3,4
+        weithts1D = torch.reshape(weights.type(torch.float32), (_Cout * _Cin * _KernelHeight, _KernelWidth))
+        WinogradWeights = torch.matmul(weithts1D, G.permute(1, 0))  # [*, 3] matmul [3, 4]
+        WinogradWeights = WinogradWeights.view(_Cout, _Cin, _KernelHeight, TileInWidth)
+        self.attrs['WinogradWeights'] = WinogradWeights.permute((0, 2, 3, 1))
+
+    if self.quantized:
+        Gg_weights = weights.float()
+    else:
+        Gg_weights = self.attrs['WinogradWeights'].permute((0, 3, 1, 2)).float()
+
+    w_slice = torch.split(PaddingInp, 2, dim=3)  # [1,64,58,58] --> (29*[1,64,58,2])
+    double_part = list(w_slice[1:-1])  # tuple(tensor) 29-->27
+    double_part2d = [[d]*2 for d in double_part]
+    double_part1d = [x for d2 in double_part2d for x in d2]
+    totalW_part = [w_slice[0]] + double_part1d + [w_slice[-1]]
+    expanded_W = torch.cat(totalW_part, dim=3)
+
+    h_sclice = torch.split(expanded_W, 1, dim=2)
+    tmp = []
+    for i, _slice in enumerate(h_sclice):
+        if i < 2:
+            continue
+        H3Wtotal = torch.cat((h_sclice[i-2], h_sclice[i-1], h_sclice[i]),
+                             dim=2)  # [B,C_in,3,W_expanded]: [1,64,3,112]
+        H3W4_tuple = torch.split(H3Wtotal, 4, dim=3)  # tuple(28*[1,64,3,4])
+        Wstack_H3W4 = torch.stack(H3W4_tuple, dim=2)  # [1, 64, 28, 3, 4]
+        tmp.append(Wstack_H3W4)
+    DataReverse = torch.stack(tmp, dim=2).float()
+
+    WinogradOut = torch.zeros((Batch, _Cout, LoopHeight, int(LoopWidth * 2)), device=inp.device, dtype=torch.float32)
+    for b in range(Batch):
+        # compute AT * (G * g + BT * d)
+        data_tmp = torch.matmul(DataReverse[b], BT.permute(1, 0))
+        BT_out = data_tmp.repeat((_Cout, 1, 1, 1, 1, 1))
+        winograd_weights_new = torch.reshape(Gg_weights, (_Cout, _Cin, 1, 1, _KernelHeight, TileInWidth))
+        winograd_weights_new = winograd_weights_new.repeat((1, 1, LoopHeight, LoopWidth, 1, 1))
+        BT_out = BT_out * winograd_weights_new
+        BT_out = torch.sum(BT_out, dim=1)
+        BT_out = torch.sum(BT_out, dim=3)
+        AT_out_1 = torch.matmul(BT_out, AT.permute(1, 0))  # 64,56,28,2
+        WinogradOut[b] = torch.reshape(AT_out_1, (_Cout, LoopHeight, int(LoopWidth * 2)))  # 64,56,28,2
+
+    if WinogradWout != _Wout or WinogradHout != _Hout:
+        WinogradOut = WinogradOut[:, :, :_Hout, :_Wout]
+
+    out = WinogradOut.add(bias.view(1, _Cout, 1, 1).repeat(1, 1, _Hout, _Wout))
+    return out
+
+
+def winograd_node(batch, cin, cout, h, w, pad, quantized=False, budget=None):
+    pad_left, pad_right, pad_top, pad_bottom = pad
+    node = PyNode('conv', OpType.Convolution)
+    node.attrs['layer_id'] = '0'
+    node.quantized = quantized
+    if budget is not None:
+        node.attrs['conv_tiling_memory_budget'] = budget
+    inp = PyTensor('x')
+    inp.zerop = torch.tensor([3])
+    node.add_input(inp)
+    out = PyTensor('y')
+    out.ir_shape = TensorShape([batch, h + pad_top + pad_bottom - 2, w + pad_left + pad_right - 2, cout])
+    node.add_output(out)
+    for k, v in {'pad_left': pad_left, 'pad_right': pad_right, 'pad_top': pad_top, 'pad_bottom': pad_bottom,
+                 'stride_x': 1, 'stride_y': 1, 'dilation_x': 1, 'dilation_y': 1, 'group': 1,
+                 'kernel_x': 3, 'kernel_y': 3}.items():
+        node.params[k] = v
+    if quantized:
+        node.params['with_winograd'] = True
+    return node
+
+
+@pytest.mark.parametrize("batch, cin, cout, h, w, pad", [
+    (1, 8, 4, 9, 9, (1, 1, 1, 1)),
+    (3, 16, 8, 14, 11, (1, 1, 1, 1)),
+    (2, 33, 7, 10, 13, (1, 1, 0, 2)),
+    (2, 64, 32, 20, 18, (0, 1, 1, 0)),
+    (1, 5, 3, 9, 12, (0, 0, 0, 0)),
+])
+@pytest.mark.parametrize("quantized", [False, True])
+@pytest.mark.parametrize("budget", [None, 0])
+def test_winograd_conv_1D_HP(batch, cin, cout, h, w, pad, quantized, budget):
+    torch.manual_seed(0)
+    if quantized:
+        # the quantized weights are G*g already
+        x = torch.randint(-128, 128, (batch, cin, h, w)).float()
+        weights = torch.randint(-512, 512, (cout, cin, 3, 4)).float()
+        bias = torch.randint(-2 ** 16, 2 ** 16, (cout,)).float()
+    else:
+        x = torch.randn(batch, cin, h, w)
+        weights = torch.randn(cout, cin, 3, 3)
+        bias = torch.randn(cout)
+    node = winograd_node(batch, cin, cout, h, w, pad, quantized, budget)
+    ref_node = winograd_node(batch, cin, cout, h, w, pad, quantized)
+    out = winograd_conv_1D_HP(node, x, weights, bias, DEBUG=False)
+    ref = loop_winograd_conv_1D_HP(ref_node, x, weights, bias)
+    assert out.shape == ref.shape
+    assert torch.equal(out, ref)
+    if quantized:
+        assert node.params['with_winograd'] and node.params['kernel_x'] == 4 and node.params['stride_x'] == 2
+    else:
+        assert torch.equal(node.attrs['WinogradWeights'], ref_node.attrs['WinogradWeights'])
+        assert node.constants['WinogradWeights'].betensor is node.attrs['WinogradWeights']
+        # the transformed weights are cached per node
+        cached = node.attrs['WinogradWeights']
+        assert torch.equal(winograd_conv_1D_HP(node, x, weights, bias, DEBUG=False), ref)
+        assert node.attrs['WinogradWeights'] is cached
+
+
+@pytest.mark.parametrize("batch, cout, budget", [(3, 8, 1 << 30), (3, 8, 0), (3, 8, 3 * 5 * 4 * 12 * 4), (1, 7, 1000)])
+def test_winograd_1D_multiply(batch, cout, budget):
+    torch.manual_seed(0)
+    BTd = torch.randn(batch, 5, 4, 3, 3, 4)
+    Gg = torch.randn(cout, 5, 3, 4)
+    ref = torch.stack([torch.sum(torch.sum(BTd[b].unsqueeze(0) * Gg.reshape(cout, 5, 1, 1, 3, 4), dim=1), dim=3)
+                       for b in range(batch)])
+    assert torch.equal(winograd_1D_multiply(BTd, Gg, budget), ref)
+
+
+def test_winograd_tiles():
+    x = torch.arange(2 * 3 * 6 * 8).reshape(2, 3, 6, 8)
+    tiles = winograd_tiles(x, 3, 4, 1, 2)
+    assert list(tiles.shape) == [2, 3, 4, 3, 3, 4]
+    for h in range(4):
+        for w in range(3):
+            assert torch.equal(tiles[:, :, h, w], x[:, :, h:h + 3, 2 * w:2 * w + 4])
@@ -0,0 +1,96 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.ctcgreedydecoder import ctcgreedydecoder  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils.dtype_utils import *  # noqa
+from AIPUBuilder.Optimizer.logger import OPT_WARN  # noqa
+
+
+def remove_blank(indexes, blanks=[0]):
+    # remove blank
+    no_blank_index = indexes
+    for blank in blanks:
+        no_blank_index = no_blank_index[torch.where(no_blank_index != blank)]
+    return no_blank_index
+
+
+def merge_repeated(indexes):
+    '''
+        index = [1,2,3,3,3,4,4,7,8,8]
+        index_pad = [1,2,3,3,3,4,4,7,8,8,-1]
+        pad_index = [-1,1,2,3,3,3,4,4,7,8,8]
+        diff = index_pad - pad_index
+        diff = [2,1,1,0,0,1,0,1,0,-9]
+        diff = diff[:-1]
+        according to the nonzero element idx of diff, gather from index, then get merged_repeated result
+    '''
+    dev = indexes.device
+    raw_shape = indexes.shape
+    pad_shape = [*raw_shape[:-1], 1]
+    pad_index = torch.full(pad_shape, -1, device=dev, dtype=torch.int32)
+
+    indexes_pad = torch.cat([indexes, pad_index], dim=-1)
+    pad_indexes = torch.cat([pad_index, indexes], dim=-1)
+
+    diff = indexes_pad - pad_indexes
+    diff_no_pad = diff[..., :-1]
+    merge_index = indexes[torch.where(diff_no_pad != 0)]
+    return merge_index
+
+
+def loop_ctcgreedydecoder(self, *args):
+    """
+    :param self:
+    :param args: input0: [batch_size, num_time_steps, num_classes], input1: [act_seq_len]
+    :return:
+    """
+    inps = self.inputs[0].betensor
+    seq_lens = self.inputs[1].betensor
+    is_merge_repeated = self.get_param('merge_repeated')
+    batch = inps.shape[0]
+    tout = torch.full([batch] + [*self.outputs[0].ir_shape][1:], dtype2range(self.outputs[0].dtype)[1])
+    for b in range(batch):
+        inp = inps[b]
+        seq_len = seq_lens[b].int().item()
+        if seq_len <= 0:
+            OPT_WARN('id=%s, type=%s, please check the input1: seq_len=%d' % (
+                self.attrs['layer_id'], str(self.type), seq_len))
+            seq_len = inp.shape[0]
+        act_inp = inp[:seq_len, :]
+        num_classes = inp.shape[1]
+        max_idx = torch.argmax(act_inp, dim=-1)
+        if is_merge_repeated:
+            out = merge_repeated(max_idx)
+        else:
+            out = max_idx
+        out = remove_blank(out, blanks=[num_classes - 1])
+        out = out.reshape([*out.shape, 1, 1])
+        tout[b, :out.shape[0], :, :] = out
+    self.outputs[0].betensor = tout
+    return tout
+
+
+@pytest.mark.parametrize("merge_repeated", [True, False])
+@pytest.mark.parametrize("seq_lens", [[50, 50, 50], [50, 17, 0], [1, 80, 33]])
+def test_ctcgreedydecoder(merge_repeated, seq_lens):
+    torch.manual_seed(0)
+    node = PyNode('ctc', OpType.CTCGreedyDecoder)
+    node.attrs['layer_id'] = '0'
+    node.params['merge_repeated'] = merge_repeated
+    # few classes so that there are many repeated and blank classes
+    node.add_input(PyTensor('inp', torch.randn(3, 50, 4).numpy()))
+    node.add_input(PyTensor('seq_len', torch.tensor(seq_lens).int().numpy()))
+    out = PyTensor('out')
+    out.ir_shape = TensorShape([3, 64, 1, 1])
+    out.dtype = Dtype.INT32
+    node.add_output(out)
+    assert torch.equal(ctcgreedydecoder(node), loop_ctcgreedydecoder(node))
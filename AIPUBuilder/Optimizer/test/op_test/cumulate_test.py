@@ -0,0 +1,148 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.cumulate import cumulate, convert_less_mbit  # noqa
+from AIPUBuilder.Optimizer.ops.cast import forward_with_clip  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def loop_cumulate(self):
+    input_data = self.inputs[0].betensor
+    input_data = input_data + (torch.tensor(0, device=input_data.device)
+                               if not self.quantized else torch.tensor(self.inputs[0].zerop, device=input_data.device))
+    method = self.get_param('method').upper()
+    axis = [int(self.get_param('axis'))]
+    exclusive = self.get_param('exclusive')
+    reverse = self.get_param('reverse')
+    dev = input_data.device
+
+    input_shape = list(input_data.shape)
+    dim = input_data.dim()
+    dim_list = [ax for ax in range(dim)]
+    axis = [ax if ax >= 0 else ax+dim for ax in axis]
+    step = 1
+    axis_num = len(axis)
+    pre_transpose_dim = []
+    for ax in dim_list:
+        if ax in axis:
+            step *= input_shape[ax]
+        else:
+            pre_transpose_dim.append(ax)
+    pre_transpose_dim = pre_transpose_dim + axis
+    pre_in_shape = [input_shape[pre_transpose_dim[ax]] for ax in range(dim-axis_num)] + [step]
+    post_transpose_dim = [pre_transpose_dim.index(ax) for ax in range(dim)]
+    outer_step = input_data.numel() // step
+    outp = torch.zeros([outer_step, step], device=input_data.device)
+
+    input_transpose = input_data.permute(pre_transpose_dim).reshape([outer_step, step])
+    if reverse:
+        input_transpose = torch.flip(input_transpose, dims=[1])
+    if method == 'SUM':
+        if exclusive:
+            input_transpose = torch.cat([torch.zeros([outer_step, 1], device=dev), input_transpose[:, :step-1]], dim=1)
+        tmp_data = torch.zeros([outer_step], device=input_data.device)
+        if self.quantized:
+            scale = self.params['scale_value']
+            shift = self.params['shift_value']
+        for s in range(step):
+            data_step = input_transpose[:, s]
+            tmp_data = tmp_data + data_step
+            outp[:, s] = tmp_data
+            if self.quantized:
+                outp[:, s] = linear_requantize(outp[:, s], scale, shift, self.outputs[0].zerop,
+                                               self.outputs[0].qmin, self.outputs[0].qmax)
+    elif method == 'PROD':
+        if exclusive:
+            input_transpose = torch.cat([torch.ones([outer_step, 1], device=dev), input_transpose[:, :step-1]], dim=1)
+        tmp_data = torch.ones([outer_step], device=input_data.device)
+        left_shifts = torch.zeros([outer_step], device=input_data.device)
+        if self.quantized:
+            scale = self.constants["scale"].betensor
+            shift = self.constants["shift"].betensor
+            threshold_min, threshold_max = bits2range(16, is_signed(self.inputs[0].dtype))
+
+            for s in range(step):
+                data_step = input_transpose[:, s]
+                tmp_data = tmp_data * data_step
+                tmp_data, data_left_shift = convert_less_mbit(tmp_data.long(), threshold_min, threshold_max)
+                left_shifts += data_left_shift
+                outp[:, s] = linear_requantize(tmp_data, scale[s], (shift[s]-left_shifts),
+                                               self.outputs[0].zerop, self.outputs[0].qmin, self.outputs[0].qmax)
+        else:
+            for s in range(step):
+                data_step = input_transpose[:, s]
+                tmp_data = tmp_data * data_step
+                outp[:, s] = tmp_data
+    else:
+        OPT_FATAL("unsupported method: %s for Cumulate in node:%s" % (method, self.name))
+
+    if reverse:
+        outp = torch.flip(outp, dims=[1])
+    outp = torch.reshape(outp, pre_in_shape).permute(post_transpose_dim)
+
+    if not self.quantized:
+        outp = forward_with_clip(outp, self.outputs[0].dtype, 'TRUNCATION')
+    self.outputs[0].betensor = outp
+    return outp
+
+
+def cumulate_node(method, axis, exclusive, reverse, dtype=None):
+    quantized = dtype is not None
+    node = PyNode('cumulate', OpType.Cumulate)
+    shape = (3, 17, 5)
+    if quantized:
+        qmin, qmax = bits2range(dtype2bits(dtype), True)
+        data = torch.randint(qmin, qmax + 1, shape).float()
+    else:
+        data = torch.rand(shape) + 0.5 if method == 'PROD' else torch.randn(shape)
+    node.add_input(PyTensor('data', data, dtype if quantized else Dtype.FP32))
+    node.add_output(PyTensor('out', TensorShape(list(shape)), dtype if quantized else Dtype.FP32))
+    node.params['method'] = method
+    node.params['axis'] = axis
+    node.params['exclusive'] = exclusive
+    node.params['reverse'] = reverse
+    node.quantized = quantized
+    if quantized:
+        out = node.outputs[0]
+        out.qmin, out.qmax = bits2range(dtype2bits(dtype), True)
+        out.zerop = 1
+        node.inputs[0].zerop = -2
+        node.params['scale_value'] = 20000
+        node.params['shift_value'] = 19
+    return node
+
+
+@pytest.mark.parametrize("method", ['SUM', 'PROD'])
+@pytest.mark.parametrize("axis", [1, -1])
+@pytest.mark.parametrize("exclusive", [False, True])
+@pytest.mark.parametrize("reverse", [False, True])
+def test_cumulate_float(method, axis, exclusive, reverse):
+    torch.manual_seed(0)
+    node = cumulate_node(method, axis, exclusive, reverse)
+    out = cumulate(node).clone()
+    ref = loop_cumulate(node)
+    # cumsum and cumprod accumulate in double, the loop in float
+    assert out.dtype == ref.dtype
+    assert torch.allclose(out, ref, rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize("dtype", [Dtype.INT8, Dtype.INT16])
+@pytest.mark.parametrize("axis", [0, 1, -1])
+@pytest.mark.parametrize("exclusive", [False, True])
+@pytest.mark.parametrize("reverse", [False, True])
+def test_cumulate_quant_sum(dtype, axis, exclusive, reverse):
+    torch.manual_seed(0)
+    node = cumulate_node('SUM', axis, exclusive, reverse, dtype)
+    out = cumulate(node).clone()
+    ref = loop_cumulate(node)
+    assert out.dtype == ref.dtype
+    assert torch.equal(out, ref)
@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.decodebox import get_roi_one_batch  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils.dtype_utils import construct_torch_tensor as torch_tensor  # noqa
+from AIPUBuilder.Optimizer.logger import *  # noqa
+
+
+def loop_get_roi_one_batch(dec_boxes, class_score, roi_boxes, roi_scores, score_threshold, max_box_num, max_class_num, real_class_num):
+
+    # exclude the backgroud if have
+    bg = class_score.shape[1] - real_class_num
+    cls_score = class_score[:, bg:]
+    if score_threshold is None or score_threshold == 0:
+        # TODO return top1
+        OPT_WARN('Donot support score_threshold = None or =0 temporally in decodebox_ssd')
+        return None
+    else:
+        prop_index = torch.where(cls_score[:, 0:] > score_threshold)
+        box_ids, class_ids = prop_index[0], prop_index[1]
+
+        prop_num = box_ids.shape[0]
+        if prop_num > max_box_num:
+            prop_score = cls_score[:, 0:][prop_index]
+            score_sort_idx = torch.argsort(prop_score, dim=-1)
+            first_max_num_score = score_sort_idx[:max_box_num]
+            box_ids = box_ids[first_max_num_score]
+            class_ids = class_ids[first_max_num_score]
+
+        label_perclass, box_num_perclass = torch.unique(class_ids, return_counts=True)
+        total_class_num = label_perclass.numel()
+        start_ps = torch.cumsum(box_num_perclass, dim=0) - box_num_perclass
+        end_ps = torch.cumsum(box_num_perclass, dim=0)
+        for t in range(total_class_num):
+            idx = torch.where(class_ids == label_perclass[t])
+            cls_idx = class_ids[idx]
+            box_idx = box_ids[idx]
+            roi_boxes[start_ps[t]:end_ps[t], :] = dec_boxes[box_idx, :]
+            roi_scores[start_ps[t]:end_ps[t]] = cls_score[box_idx, cls_idx]
+
+        label_perclass_all = torch.zeros(max_class_num)
+        box_num_perclass_all = torch.zeros(max_class_num)
+        label_perclass_all[:label_perclass.shape[0]] = label_perclass
+        box_num_perclass_all[:box_num_perclass.shape[0]] = box_num_perclass
+
+        return roi_boxes, roi_scores, box_num_perclass_all, label_perclass_all, torch_tensor(total_class_num, device=roi_boxes.device)
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+@pytest.mark.parametrize("thresh, max_box_num", [(0.6, 5000), (0.6, 30), (1.1, 5000)])
+def test_get_roi_one_batch(quantized, thresh, max_box_num):
+    torch.manual_seed(0)
+    class_score = torch.rand(100, 6)
+    dec_boxes = torch.rand(100, 4)
+    if quantized:
+        class_score, dec_boxes, thresh = (class_score * 255).round(), (dec_boxes * 2 ** 15).round(), int(thresh * 255)
+    outs = []
+    for fn in [get_roi_one_batch, loop_get_roi_one_batch]:
+        roi_boxes = torch.zeros([max_box_num, 4])
+        roi_scores = torch.zeros([max_box_num])
+        outs.append(fn(dec_boxes, class_score, roi_boxes, roi_scores, thresh, max_box_num, 6, 5))
+    for o, r in zip(*outs):
+        assert torch.equal(o, r)
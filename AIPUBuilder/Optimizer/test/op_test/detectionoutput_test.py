@@ -0,0 +1,61 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.detectionoutput import _get_box_score  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+
+
+def loop_get_box_score(class_score, box_encoding, score_thresh, max_detection_num, max_class_num):
+    class_num = class_score.shape[-1]
+    crop_box_num = class_score.shape[0]
+    box = torch.zeros((max_detection_num, 4), dtype=torch.float32, device=class_score.device)
+    score = torch.zeros((max_detection_num), dtype=torch.float32, device=class_score.device)
+    box_num_perClass = torch.zeros([max_class_num], dtype=torch.float32, device=class_score.device)
+
+    outbox_idx = 0
+    box_num_perClass_list = []
+    class_label = []
+    for class_idx in range(class_num):
+        # if class_idx == 0:
+        #     continue
+        box_num_curClass = 0
+        for box_idx in range(crop_box_num):
+            if class_score[box_idx][class_idx] > score_thresh:
+                if outbox_idx >= max_detection_num:
+                    break
+                if class_idx not in class_label:
+                    class_label.append(class_idx)
+                box[outbox_idx, :] = box_encoding[box_idx * class_num + class_idx, :]
+                score[outbox_idx] = class_score[box_idx, class_idx]
+                outbox_idx += 1
+                box_num_curClass += 1
+        if box_num_curClass != 0:
+            box_num_perClass_list.append(box_num_curClass)
+    box_num_perClass[:len(box_num_perClass_list)] = torch.tensor(box_num_perClass_list, device=class_score.device)
+    total_class_num = len(class_label)
+    class_label.extend((max_class_num - total_class_num) * [0])
+    return box, score, box_num_perClass, \
+        torch.tensor(class_label, device=class_score.device), \
+        torch.tensor(total_class_num, device=class_score.device)
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+@pytest.mark.parametrize("thresh, max_detection_num", [(0.5, 1000), (0.5, 40), (0.97, 1000), (1.1, 1000)])
+def test_get_box_score(quantized, thresh, max_detection_num):
+    torch.manual_seed(0)
+    class_score = torch.rand(50, 9)
+    box_encoding = torch.rand(50 * 9, 4) * 600
+    if quantized:
+        class_score, box_encoding, thresh = (class_score * 255).int(), box_encoding.int(), int(thresh * 255)
+    out = _get_box_score(class_score, box_encoding, thresh, max_detection_num, 12)
+    ref = loop_get_box_score(class_score, box_encoding, thresh, max_detection_num, 12)
+    for o, r in zip(out, ref):
+        assert torch.equal(o, r)
@@ -0,0 +1,45 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.utils import *  # noqa
+from AIPUBuilder.Optimizer.utils.math_utils import _exact_fp32_splits  # noqa
+
+
+@pytest.mark.parametrize("in_bits, w_bits, shape, in_features, out_features, splits", [
+    (8, 8, [4], 64, 10, 1),
+    (8, 8, [3, 5], 1000, 16, 1),
+    (8, 8, [4], 4096, 32, 4),
+    (16, 8, [4], 256, 8, 0),
+    (8, 8, [2], 20000, 4, 0),
+])
+@pytest.mark.parametrize("with_bias", [True, False])
+def test_fc_exact_integer_linear(in_bits, w_bits, shape, in_features, out_features, splits, with_bias):
+    torch.manual_seed(0)
+    x_qmin, x_qmax = bits2range(in_bits, True)
+    w_qmin, w_qmax = bits2range(w_bits, True)
+    # the input zerop has been absorbed, the weights zerop is added to the weights
+    x = torch.randint(x_qmin, x_qmax + 1, shape + [in_features]).double()
+    w = torch.randint(w_qmin, w_qmax + 1, (out_features, in_features)).double() + 3
+    bias = torch.randint(-2 ** 24, 2 ** 24, (out_features,)).double() if with_bias else None
+    out = exact_integer_linear(x, w, bias)
+    ref = torch.nn.functional.linear(x, w, bias)
+    assert out.dtype == ref.dtype
+    assert torch.equal(out, ref)
+    r = _exact_fp32_splits(x, w, 1, bias)
+    assert (len(r) if r is not None else 0) == splits
+
+
+def test_fc_exact_integer_linear_non_integer():
+    torch.manual_seed(0)
+    x = torch.randint(-128, 128, (4, 1000)).double() + 0.5
+    w = torch.randint(-128, 128, (16, 1000)).double()
+    assert _exact_fp32_splits(x, w) is None
+    assert torch.equal(exact_integer_linear(x, w), torch.nn.functional.linear(x, w))
@@ -0,0 +1,95 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.gather_nd import gatherND  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def loop_singleGatherNd(inp_betensors, inp_indice):
+    inp_indice = inp_indice.clone()
+    newshape = inp_indice.shape[:-1]+inp_betensors.shape[inp_indice.shape[-1]:]
+    out = torch.zeros(newshape)
+    if out.ndim == 1:
+        out = out.unsqueeze(-1)
+    if inp_indice.ndim > 2:
+        m = 1
+        for i in range(inp_indice.ndim-1):
+            m = m*inp_indice.shape[i]
+        inp_indice = inp_indice.reshape(m, inp_indice.shape[-1])
+        newshape = (m,)+inp_betensors.shape[inp_indice.shape[-1]:]
+        out = torch.zeros(newshape)
+
+    last_dims = inp_indice.shape[-1]
+    for dim in range(last_dims):
+        inp_indice[..., dim] = torch.minimum(torch.tensor(inp_betensors.shape[dim]-1), inp_indice[..., dim])
+    if inp_betensors.ndim == inp_indice.shape[-1]:
+        inp_betensors = inp_betensors.unsqueeze(-1)
+    for seq in range(newshape[0]):
+        out[seq, ...] = inp_betensors[tuple(inp_indice[seq, :])]
+    return out
+
+
+def loop_gatherND(inp_betensors, inp_indice, batch_dims):
+    if batch_dims == 0:
+        if inp_indice.ndim == 1:
+            inp_indice = inp_indice.unsqueeze(0)
+        return loop_singleGatherNd(inp_betensors, inp_indice)
+    index_depth = inp_indice.shape[-1]
+    batch_shape = inp_indice.shape[:batch_dims]
+    batchnum = int(torch.prod(torch.tensor(batch_shape)))
+    outer_shape = inp_indice.shape[batch_dims:-1]
+    inner_shape = inp_betensors.shape[batch_dims + index_depth:]
+    out = torch.zeros(batch_shape + outer_shape + inner_shape)
+    if out.ndim == 1:
+        out = out.unsqueeze(0)
+    new_indice = inp_indice.reshape((batchnum,)+inp_indice.shape[batch_dims:])
+    new_inp = inp_betensors.reshape((batchnum,)+inp_betensors.shape[batch_dims:])
+    out = out.reshape((batchnum,)+out.shape[batch_dims:])
+    for batch in range(batchnum):
+        indice_batch = new_indice[batch, ...]
+        if indice_batch.ndim == 1:
+            indice_batch = indice_batch.unsqueeze(0)
+        out[batch, ...] = loop_singleGatherNd(new_inp[batch, ...], indice_batch).reshape(out[batch, ...].shape)
+    return out
+
+
+def random_indice(data_shape, indice_shape):
+    # some indice are out of range, which are clipped to the last element
+    indice = [torch.randint(-1, s + 2, indice_shape[:-1] + (1,)) for s in data_shape[:indice_shape[-1]]]
+    return torch.cat(indice, dim=-1)
+
+
+@pytest.mark.parametrize("data_shape, indice_shape, batch_dims", [
+    ((1000, 81, 4), (1000, 2), 0),
+    ((2, 45, 27, 1), (96, 3), 0),
+    ((4, 5, 6), (3, 7, 3), 0),
+    ((4, 5, 6), (9, 1), 0),
+    ((4, 5, 6), (2,), 0),
+    ((3, 5, 6, 2), (3, 4, 2), 1),
+    ((2, 3, 5, 6, 7), (2, 3, 4, 2), 2),
+])
+def test_gather_nd(data_shape, indice_shape, batch_dims):
+    torch.manual_seed(0)
+    data = torch.randn(data_shape)
+    indice = random_indice(data_shape[batch_dims:], indice_shape)
+    ref = loop_gatherND(data, indice.clone(), batch_dims)
+
+    node = PyNode('gather_nd', OpType.GatherND)
+    node.add_input(PyTensor('data', data, Dtype.FP32))
+    node.add_input(PyTensor('indice', indice, Dtype.INT32))
+    node.add_output(PyTensor('out', TensorShape(list(ref.shape)), Dtype.FP32))
+    node.params['batch_dims'] = batch_dims
+    node.outputs[0].ir_shape = TensorShape(list(ref.shape))
+    out = gatherND(node)
+    assert out.dtype == ref.dtype
+    assert torch.equal(out, ref)
+    assert torch.equal(node.inputs[1].betensor, indice)
@@ -0,0 +1,110 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.generateproposal import NMS_F, NMS_Q  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+
+
+def loop_NMS_F(boxes, scores, iou_thresh):
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = boxes[:, 2]
+    y2 = boxes[:, 3]
+
+    areas = (x2 - x1+1) * (y2 - y1+1)
+    order = torch.argsort(torch.flatten(scores), descending=True)
+    keep = []
+    while order.shape[0] > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = torch.maximum(x1[i], x1[order[1:]])
+        yy1 = torch.maximum(y1[i], y1[order[1:]])
+        xx2 = torch.minimum(x2[i], x2[order[1:]])
+        yy2 = torch.minimum(y2[i], y2[order[1:]])
+        w = torch.maximum(torch.tensor([0], device=boxes.device), xx2 - xx1+1)
+        h = torch.maximum(torch.tensor([0], device=boxes.device), yy2 - yy1+1)
+
+        inter = w * h
+        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+        inds = torch.where(ovr <= iou_thresh)[0]
+        order = order[inds + 1]
+    return keep
+
+
+def loop_NMS_Q(box, score, iou_threshold=None):
+    iou_thresh_shift = 11
+    # currently area_shift is consistent with lib, and  will write to quantIR and will be modified
+    area_shift = 15
+
+    x0 = box[:, 0]
+    y0 = box[:, 1]
+    x1 = box[:, 2]
+    y1 = box[:, 3]
+    areas = (y1 - y0).type(torch.int32) * (x1 - x0).type(torch.int32)
+    areas = areas >> area_shift
+    # order = score.ravel().argsort()[::-1]
+
+    # order = torch.argsort(torch.flatten(score), descending=True)
+    order = torch.linspace(0, len(torch.flatten(score))-1, steps=len(torch.flatten(score)), device=score.device).long()
+    keep = []
+    while order.shape[0] > 0:
+        i = order[0]
+        keep.append(i)
+
+        xx0 = torch.maximum(x0[i], x0[order[1:]])
+        yy0 = torch.maximum(y0[i], y0[order[1:]])
+        xx1 = torch.minimum(x1[i], x1[order[1:]])
+        yy1 = torch.minimum(y1[i], y1[order[1:]])
+        w = torch.maximum(torch.tensor([0], device=box.device), xx1 - xx0)
+        h = torch.maximum(torch.tensor([0], device=box.device), yy1 - yy0)
+
+        inter = (w * h).type(torch.int32) >> area_shift
+        union = areas[i] + areas[order[1:]] - inter
+        inter_area_thresh = union * iou_threshold >> int(iou_thresh_shift)
+
+        inds = torch.where(inter <= inter_area_thresh)[0]
+        order = order[inds + 1]
+
+    return keep
+
+
+def clustered_boxes(box_num, size, quantized):
+    # [box_num, 4] boxes of [x0, y0, x1, y1] around a few centers, so that many of them overlap
+    centers = torch.rand(6, 2) * size
+    c = centers[torch.randint(0, 6, (box_num,))] + torch.randn(box_num, 2) * size * 0.03
+    hw = (0.05 + torch.rand(box_num, 2) * 0.15) * size
+    boxes = torch.cat([c - hw / 2, c + hw / 2], dim=1)
+    if quantized:
+        boxes = torch.round(boxes).int()
+    return boxes
+
+
+@pytest.mark.parametrize("box_num", [1, 300, 700])
+@pytest.mark.parametrize("iou_thresh", [0.3, 0.7])
+def test_nms_f(box_num, iou_thresh):
+    torch.manual_seed(0)
+    boxes = clustered_boxes(box_num, 600., False)
+    scores = torch.rand(box_num)
+    ref = loop_NMS_F(boxes, scores, iou_thresh)
+    assert torch.equal(NMS_F(boxes, scores, iou_thresh), torch.tensor(ref, dtype=torch.long))
+    assert torch.equal(NMS_F(boxes, scores, iou_thresh, 10), torch.tensor(ref[:10], dtype=torch.long))
+
+
+@pytest.mark.parametrize("box_num", [1, 300, 700])
+@pytest.mark.parametrize("iou_thresh", [0.3, 0.7])
+def test_nms_q(box_num, iou_thresh):
+    torch.manual_seed(0)
+    boxes = clustered_boxes(box_num, 2 ** 14, True)
+    scores = torch.randint(0, 256, (box_num,))
+    ref = loop_NMS_Q(boxes, scores, int(iou_thresh * 2048))
+    out = NMS_Q(boxes, scores, int(iou_thresh * 2048))
+    assert torch.equal(out, torch.tensor(ref, dtype=torch.long))
+    assert torch.equal(NMS_Q(boxes, scores, int(iou_thresh * 2048), 10), out[:10])
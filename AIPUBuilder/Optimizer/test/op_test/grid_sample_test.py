@@ -0,0 +1,553 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import numpy as np
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.grid_sample import *  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+# the per-batch implementations which the vectorized ones must reproduce exactly
+
+def loop_PixelAtGrid(feature, n, c, y, x, h, w, resize_height, resize_width, padding_mode, feature_zp):
+    # default border
+    y_less0_mask = y < 0
+    y_greater_mask = y > (h - 1)
+    x_less0_mask = x < 0
+    x_greater_mask = x > (w - 1)
+    y_c = y.clone().long()
+    x_c = x.clone().long()
+    y_c[y_less0_mask] = 0
+    y_c[y_greater_mask] = h - 1
+    x_c[x_less0_mask] = 0
+    x_c[x_greater_mask] = w - 1
+    out = feature[n, y_c, x_c, :]
+    if padding_mode == "border":
+        out = out.reshape(resize_height, resize_width, c)
+    if padding_mode == "zeros":
+        out = out.reshape(resize_height * resize_width, c)
+        out[y_less0_mask, :] = -feature_zp
+        out[y_greater_mask, :] = -feature_zp
+        out[x_less0_mask, :] = -feature_zp
+        out[x_greater_mask, :] = -feature_zp
+        out = out.reshape(resize_height, resize_width, c)
+    return out
+
+
+def loop_PixelAtGrid3D(feature, n, c, z, y, x, z_in, h_in, w_in, resize_z, resize_height, resize_width, padding_mode,
+                  feature_zp):
+    # default border
+    y_less0_mask = y < 0
+    y_greater_mask = y > (h_in - 1)
+    x_less0_mask = x < 0
+    x_greater_mask = x > (w_in - 1)
+    z_less0_mask = z < 0
+    z_greater_mask = z > (z_in - 1)
+    y_c = y.clone()
+    x_c = x.clone()
+    z_c = z.clone()
+    y_c[y_less0_mask] = 0
+    y_c[y_greater_mask] = h_in - 1
+    x_c[x_less0_mask] = 0
+    x_c[x_greater_mask] = w_in - 1
+    z_c[z_less0_mask] = 0
+    z_c[z_greater_mask] = z_in - 1
+    out = feature[n, z_c, y_c, x_c, :]
+    if padding_mode == "border":
+        out = out.reshape(resize_z, resize_height, resize_width, c)
+    if padding_mode == "zeros":
+        out = out.reshape(resize_z * resize_height * resize_width, c)
+        out[z_less0_mask, :] = -feature_zp
+        out[z_greater_mask, :] = -feature_zp
+        out[y_less0_mask, :] = -feature_zp
+        out[y_greater_mask, :] = -feature_zp
+        out[x_less0_mask, :] = -feature_zp
+        out[x_greater_mask, :] = -feature_zp
+        out = out.reshape(resize_z, resize_height, resize_width, c)
+    return out
+
+
+def loop_quant_grid_sample(self, inp0, inp1, method, padding_mode, align_corners, do_scale, shifts):
+    feature = inp0.betensor.int()
+    grid = inp1.betensor.int()
+    feature_batch = feature.shape[0]
+    feature_height = feature.shape[1]
+    feature_width = feature.shape[2]
+    feature_channel = feature.shape[3]
+    resize_height = grid.shape[1]
+    resize_width = grid.shape[2]
+    offset_w = (feature_width - 1)
+    offset_h = (feature_height - 1)
+
+    grid += int(inp1.zerop)
+    feature_zp = int(inp0.zerop)
+    q16_qmin, q16_qmax = -2 ** 15, 2 ** 15 - 1
+    do_scale0, do_scale1 = do_scale
+    do_shift0, do_shift1 = shifts
+    gridx_shift = self.params['coordinate_x_shift']
+    gridy_shift = self.params['coordinate_y_shift']
+
+    if align_corners:
+        x_min = 0
+        x_max = offset_w * (2 ** gridx_shift)
+        y_min = 0
+        y_max = offset_h * (2 ** gridy_shift)
+    else:
+        x_min = -2 ** (gridx_shift - 1)
+        x_max = feature_width * (2 ** gridx_shift) - 2 ** (gridx_shift - 1)
+        y_min = -2 ** (gridy_shift - 1)
+        y_max = feature_height * (2 ** gridy_shift) - 2 ** (gridy_shift - 1)
+
+    quant_output = torch.zeros((feature_batch, resize_height, resize_width,
+                                feature_channel), device=inp0.betensor.device)
+    for n in range(feature_batch):
+        qgrid_x = grid[n, :, :, 0].reshape(-1, )
+        qgrid_y = grid[n, :, :, 1].reshape(-1, )
+
+        q_ix = (qgrid_x * do_scale0 >> do_shift0) + offset_w * (2 ** (gridx_shift - 1))
+        q_iy = (qgrid_y * do_scale1 >> do_shift1) + offset_h * (2 ** (gridy_shift - 1))
+        q_ix = torch.clamp(q_ix, q16_qmin, q16_qmax)
+        q_iy = torch.clamp(q_iy, q16_qmin, q16_qmax)
+        if method == 'nearest':
+            q_ix += 2 ** (gridx_shift - 1)
+            q_iy += 2 ** (gridy_shift - 1)
+            q_ix = torch.clamp(q_ix, q16_qmin, q16_qmax)
+            q_iy = torch.clamp(q_iy, q16_qmin, q16_qmax)
+            left_x = (q_ix >> gridx_shift).long()
+            top_y = (q_iy >> gridy_shift).long()
+            quant_output[n, :, :, :] = loop_PixelAtGrid(feature, n, feature_channel, top_y, left_x,
+                                                   feature_height, feature_width, resize_height, resize_width,
+                                                   padding_mode, feature_zp)
+        else:
+            # if padding_mode == 'border':
+            #     q_ix = grid_clamp(q_ix, x_min, x_max, 0, offset_w * (2**gridx_shift))
+            #     q_iy = grid_clamp(q_iy, y_min, y_max, 0, offset_h * (2**gridy_shift))
+            left_x = (q_ix.long() >> gridx_shift).long()
+            top_y = (q_iy.long() >> gridy_shift).long()
+            right_x = left_x + 1
+            bottom_y = top_y + 1
+            x_terp = q_ix - left_x * 2 ** (gridx_shift)
+            y_terp = q_iy - top_y * 2 ** (gridy_shift)
+            x_terp = x_terp.reshape(resize_height, resize_width, 1)
+            y_terp = y_terp.reshape(resize_height, resize_width, 1)
+
+            top_left = loop_PixelAtGrid(feature, n, feature_channel, top_y, left_x, feature_height,
+                                   feature_width, resize_height, resize_width, padding_mode, feature_zp)
+            top_right = loop_PixelAtGrid(feature, n, feature_channel, top_y, right_x, feature_height,
+                                    feature_width, resize_height, resize_width, padding_mode, feature_zp)
+            bottom_left = loop_PixelAtGrid(feature, n, feature_channel, bottom_y, left_x, feature_height,
+                                      feature_width, resize_height, resize_width, padding_mode, feature_zp)
+            bottom_right = loop_PixelAtGrid(feature, n, feature_channel, bottom_y, right_x, feature_height,
+                                       feature_width, resize_height, resize_width, padding_mode, feature_zp)
+
+            top = top_left + (((top_right - top_left) * x_terp).long() >> (gridx_shift))
+            bottom = bottom_left + (((bottom_right - bottom_left) * x_terp).long() >> gridx_shift)
+            quant_output[n, :, :, :] = (top + (((bottom - top) * y_terp).long() >> gridy_shift))
+    return quant_output
+
+
+def loop_quant_grid_sample_5d(self, inp0, inp1, method, padding_mode, align_corners, do_scale, shifts):
+    feature = inp0.betensor.int()
+    grid = inp1.betensor.int()
+    feature_batch = feature.shape[0]
+    feature_z = feature.shape[1]
+    feature_height = feature.shape[2]
+    feature_width = feature.shape[3]
+    feature_channel = feature.shape[4]
+    resize_z = grid.shape[1]
+    resize_height = grid.shape[2]
+    resize_width = grid.shape[3]
+    offset_z = (feature_z - 1)
+    offset_w = (feature_width - 1)
+    offset_h = (feature_height - 1)
+
+    grid += int(inp1.zerop)
+    feature_zp = int(inp0.zerop)
+    q16_qmin, q16_qmax = -2 ** 15, 2 ** 15 - 1
+    do_scale0, do_scale1, do_scale2 = do_scale
+    do_shift0, do_shift1, do_shift2 = shifts
+    gridx_shift = self.params['coordinate_x_shift']
+    gridy_shift = self.params['coordinate_y_shift']
+    gridz_shift = self.params['coordinate_z_shift']
+
+    quant_output = torch.zeros((feature_batch, resize_z, resize_height, resize_width,
+                                feature_channel), device=inp0.betensor.device).long()
+    horizontal_output = torch.zeros((feature_batch, resize_z, resize_height, resize_width,
+                                     feature_channel), device=inp0.betensor.device).long()
+    for n in range(feature_batch):
+        qgrid_x = grid[n, :, :, :, 0].reshape(-1, )  # [2,3,4]
+        qgrid_y = grid[n, :, :, :, 1].reshape(-1, )
+        qgrid_z = grid[n, :, :, :, 2].reshape(-1, )
+        q_ix = ((qgrid_x * do_scale0) >> do_shift0) + offset_w * (2 ** (gridx_shift - 1))
+        q_iy = ((qgrid_y * do_scale1) >> do_shift1) + offset_h * (2 ** (gridy_shift - 1))
+        q_iz = ((qgrid_z * do_scale2) >> do_shift2) + offset_z * (2 ** (gridz_shift - 1))
+        q_ix = torch.clamp(q_ix, q16_qmin, q16_qmax)
+        q_iy = torch.clamp(q_iy, q16_qmin, q16_qmax)
+        q_iz = torch.clamp(q_iz, q16_qmin, q16_qmax)
+        if method == 'nearest':
+            q_ix += 2 ** (gridx_shift - 1)
+            q_iy += 2 ** (gridy_shift - 1)
+            q_iz += 2 ** (gridz_shift - 1)
+            q_ix = torch.clamp(q_ix, q16_qmin, q16_qmax)
+            q_iy = torch.clamp(q_iy, q16_qmin, q16_qmax)
+            q_iz = torch.clamp(q_iz, q16_qmin, q16_qmax)
+            x = (q_ix >> gridx_shift).long()
+            y = (q_iy >> gridy_shift).long()
+            z = (q_iz >> gridz_shift).long()
+            quant_output[n, :, :, :, :] = loop_PixelAtGrid3D(feature, n, feature_channel, z, y, x,
+                                                        feature_z, feature_height, feature_width, resize_z,
+                                                        resize_height, resize_width, padding_mode, feature_zp)
+        else:
+            # if padding_mode == 'border':
+            #     q_ix = grid_clamp(q_ix, x_min, x_max, 0, offset_w * (2**gridx_shift))
+            #     q_iy = grid_clamp(q_iy, y_min, y_max, 0, offset_h * (2**gridy_shift))
+            left_x = (q_ix.long() >> gridx_shift).long()
+            top_y = (q_iy.long() >> gridy_shift).long()
+            z1 = (q_iz.long() >> gridz_shift).long()
+            right_x = left_x + 1
+            bottom_y = top_y + 1
+            z2 = z1 + 1
+            x_terp = q_ix - left_x * 2 ** (gridx_shift)
+            y_terp = q_iy - top_y * 2 ** (gridy_shift)
+            z_terp = q_iz - z1 * 2 ** (gridz_shift)
+            x_terp = x_terp.reshape(resize_z, resize_height, resize_width, 1)
+            y_terp = y_terp.reshape(resize_z, resize_height, resize_width, 1)
+            z_terp = z_terp.reshape(resize_z, resize_height, resize_width, 1)
+
+            #
+            z1_top_left = loop_PixelAtGrid3D(feature, n, feature_channel, z1, top_y, left_x, feature_z, feature_height,
+                                        feature_width, resize_z, resize_height, resize_width, padding_mode, feature_zp)
+            z1_top_right = loop_PixelAtGrid3D(feature, n, feature_channel, z1, top_y, right_x, feature_z, feature_height,
+                                         feature_width, resize_z, resize_height, resize_width, padding_mode, feature_zp)
+            z1_bottom_left = loop_PixelAtGrid3D(feature, n, feature_channel, z1, bottom_y, left_x, feature_z, feature_height,
+                                           feature_width, resize_z, resize_height, resize_width, padding_mode,
+                                           feature_zp)
+            z1_bottom_right = loop_PixelAtGrid3D(feature, n, feature_channel, z1, bottom_y, right_x, feature_z,
+                                            feature_height,
+                                            feature_width, resize_z, resize_height, resize_width, padding_mode,
+                                            feature_zp)
+
+            top = z1_top_left + (((z1_top_right - z1_top_left) * x_terp).long() >> (gridx_shift))
+            bottom = z1_bottom_left + (((z1_bottom_right - z1_bottom_left) * x_terp).long() >> gridx_shift)
+            horizontal_output[n, :, :, :, :] = (top + (((bottom - top) * y_terp).long() >> gridy_shift))
+
+            z2_top_left = loop_PixelAtGrid3D(feature, n, feature_channel, z2, top_y, left_x, feature_z, feature_height,
+                                        feature_width, resize_z, resize_height, resize_width, padding_mode, feature_zp)
+            z2_top_right = loop_PixelAtGrid3D(feature, n, feature_channel, z2, top_y, right_x, feature_z, feature_height,
+                                         feature_width, resize_z, resize_height, resize_width, padding_mode, feature_zp)
+            z2_bottom_left = loop_PixelAtGrid3D(feature, n, feature_channel, z2, bottom_y, left_x, feature_z, feature_height,
+                                           feature_width, resize_z, resize_height, resize_width, padding_mode,
+                                           feature_zp)
+            z2_bottom_right = loop_PixelAtGrid3D(feature, n, feature_channel, z2, bottom_y, right_x, feature_z,
+                                            feature_height,
+                                            feature_width, resize_z, resize_height, resize_width, padding_mode,
+                                            feature_zp)
+
+            top = z2_top_left + (((z2_top_right - z2_top_left) * x_terp).long() >> (gridx_shift))
+            bottom = z2_bottom_left + (((z2_bottom_right - z2_bottom_left) * x_terp).long() >> gridx_shift)
+            quant_output[n, :, :, :, :] = (top + (((bottom - top) * y_terp).long() >> gridy_shift))
+
+            quant_output[n, :, :, :, :] = horizontal_output[n, :, :, :, :] + (((quant_output[n, :, :, :,
+                                                                                :] - horizontal_output[n, :, :, :,
+                                                                                                       :]) * z_terp).long() >> gridz_shift)
+    return quant_output
+
+
+def loop_quant_grid_sample_lookup(self, inp0, inp1, method, padding_mode, align_corners, do_scale, shifts):
+    feature = inp0.betensor.int()
+    grid = inp1.betensor.int()
+    feature_batch = feature.shape[0]
+    feature_height = feature.shape[1]
+    feature_width = feature.shape[2]
+    feature_channel = feature.shape[3]
+    resize_height = grid.shape[1]
+    resize_width = grid.shape[2]
+    offset_w = (feature_width - 1)
+    offset_h = (feature_height - 1)
+    feature_zp = int(inp0.zerop)
+
+    act_qmin, act_qmax = -2 ** 31, 2 ** 31 - 1
+    luty = self.constants["luty"].betensor
+    lutx = self.constants["lutx"].betensor
+    gridx_shift = self.params['coordinate_x_shift']
+    gridy_shift = self.params['coordinate_y_shift']
+
+    quant_output = torch.zeros((feature_batch, resize_height, resize_width,
+                                feature_channel), device=inp0.betensor.device)
+    for n in range(feature_batch):
+        qgrid_x = grid[n, :, :, 0].reshape(-1, )
+        qgrid_y = grid[n, :, :, 1].reshape(-1, )
+
+        lut_in_bits = 8
+        in_is_signed = True
+        out_is_signed = True
+        q_ix = lookup_lut_powerof2(qgrid_x, lutx, lut_in_bits, in_is_signed,
+                                   dtype2bits(self.constants["lutx"].dtype), out_is_signed)
+        q_iy = lookup_lut_powerof2(qgrid_y, luty, lut_in_bits, in_is_signed,
+                                   dtype2bits(self.constants["luty"].dtype), out_is_signed)
+        if method == 'nearest':
+            quant_output[n, :, :, :] = loop_PixelAtGrid(feature, n, feature_channel, q_iy.int(), q_ix.int(),
+                                                   feature_height, feature_width, resize_height, resize_width,
+                                                   padding_mode, feature_zp)
+        else:
+            x_terp_lut = self.constants["x_terp"].betensor
+            y_terp_lut = self.constants["y_terp"].betensor
+            left_x = q_ix
+            top_y = q_iy
+            right_x = left_x + 1
+            bottom_y = top_y + 1
+            x_terp = lookup_lut_powerof2(qgrid_x, x_terp_lut, lut_in_bits, in_is_signed,
+                                         dtype2bits(self.constants["x_terp"].dtype), False)
+            y_terp = lookup_lut_powerof2(qgrid_y, y_terp_lut, lut_in_bits, in_is_signed,
+                                         dtype2bits(self.constants["y_terp"].dtype), False)
+
+            x_terp = x_terp.reshape(resize_height, resize_width, 1)
+            y_terp = y_terp.reshape(resize_height, resize_width, 1)
+
+            top_left = loop_PixelAtGrid(feature, n, feature_channel, top_y, left_x, feature_height,
+                                   feature_width, resize_height, resize_width, padding_mode, feature_zp)
+            top_right = loop_PixelAtGrid(feature, n, feature_channel, top_y, right_x, feature_height,
+                                    feature_width, resize_height, resize_width, padding_mode, feature_zp)
+            bottom_left = loop_PixelAtGrid(feature, n, feature_channel, bottom_y, left_x, feature_height,
+                                      feature_width, resize_height, resize_width, padding_mode, feature_zp)
+            bottom_right = loop_PixelAtGrid(feature, n, feature_channel, bottom_y, right_x, feature_height,
+                                       feature_width, resize_height, resize_width, padding_mode, feature_zp)
+
+            top = top_left + (((top_right - top_left) * x_terp) >> (gridx_shift))
+            bottom = bottom_left + (((bottom_right - bottom_left) * x_terp) >> gridx_shift)
+            quant_output[n, :, :, :] = (top + (((bottom - top) * y_terp) >> gridy_shift))
+    return quant_output
+
+
+def loop_float_grid_sample_4d(inp0, inp1, method, padding_mode, align_corners):
+    feature = inp0
+    grid = inp1
+    feature_batch = feature.shape[0]
+    feature_height = feature.shape[1]
+    feature_width = feature.shape[2]
+    feature_channel = feature.shape[3]
+    resize_height = grid.shape[1]
+    resize_width = grid.shape[2]
+    offset_w = (feature_width - 1)
+    offset_h = (feature_height - 1)
+
+    float_output = torch.zeros((feature_batch, resize_height, resize_width,
+                                feature_channel), device=inp0.device)
+    for n in range(feature_batch):
+        q_ix = GsDenormalize(grid[n, :, :, 0].reshape(-1, ), feature_width, align_corners)
+        q_iy = GsDenormalize(grid[n, :, :, 1].reshape(-1, ), feature_height, align_corners)
+        if method == 'nearest':
+            x = torch.round(q_ix).int()
+            y = torch.round(q_iy).int()
+            float_output[n, :, :, :] = loop_PixelAtGrid(feature, n, feature_channel, y, x,
+                                                   feature_height, feature_width, resize_height, resize_width,
+                                                   padding_mode, 0)
+        else:
+            left_x = torch.floor(q_ix).int()
+            top_y = torch.floor(q_iy).int()
+            right_x = left_x + 1
+            bottom_y = top_y + 1
+            x_terp = q_ix - left_x
+            y_terp = q_iy - top_y
+            x_terp = x_terp.reshape(resize_height, resize_width, 1)
+            y_terp = y_terp.reshape(resize_height, resize_width, 1)
+            #
+            top_left = loop_PixelAtGrid(feature, n, feature_channel, top_y, left_x, feature_height,
+                                   feature_width, resize_height, resize_width, padding_mode, 0)
+            top_right = loop_PixelAtGrid(feature, n, feature_channel, top_y, right_x, feature_height,
+                                    feature_width, resize_height, resize_width, padding_mode, 0)
+            bottom_left = loop_PixelAtGrid(feature, n, feature_channel, bottom_y, left_x, feature_height,
+                                      feature_width, resize_height, resize_width, padding_mode, 0)
+            bottom_right = loop_PixelAtGrid(feature, n, feature_channel, bottom_y, right_x, feature_height,
+                                       feature_width, resize_height, resize_width, padding_mode, 0)
+
+            top = top_left + (top_right - top_left) * x_terp
+            bottom = bottom_left + (bottom_right - bottom_left) * x_terp
+            float_output[n, :, :, :] = top + (bottom - top) * y_terp
+    return float_output
+
+
+def loop_float_grid_sample_5d(inp0, inp1, method, padding_mode, align_corners):
+    feature = inp0
+    grid = inp1
+    feature_batch = feature.shape[0]
+    feature_z = feature.shape[1]
+    feature_height = feature.shape[2]
+    feature_width = feature.shape[3]
+    feature_channel = feature.shape[4]
+    resize_z = grid.shape[1]
+    resize_height = grid.shape[2]
+    resize_width = grid.shape[3]
+    offset_z = (feature_z - 1)
+    offset_w = (feature_width - 1)
+    offset_h = (feature_height - 1)
+
+    horizontal_output = torch.zeros((feature_batch, resize_z, resize_height, resize_width,
+                                     feature_channel), device=inp0.device)
+    quant_output = torch.zeros((feature_batch, resize_z, resize_height, resize_width,
+                                feature_channel), device=inp0.device)
+    for n in range(feature_batch):
+        q_ix = GsDenormalize(grid[n, :, :, :, 0].reshape(-1, ), feature_width, align_corners)
+        q_iy = GsDenormalize(grid[n, :, :, :, 1].reshape(-1, ), feature_height, align_corners)
+        q_iz = GsDenormalize(grid[n, :, :, :, 2].reshape(-1, ), feature_z, align_corners)
+        if method == 'nearest':
+            x = torch.round(q_ix).int()
+            y = torch.round(q_iy).int()
+            z = torch.round(q_iz).int()
+            quant_output[n, :, :, :, :] = loop_PixelAtGrid3D(feature, n, feature_channel, z, y, x,
+                                                        feature_z, feature_height, feature_width, resize_z,
+                                                        resize_height, resize_width, padding_mode, 0)
+        else:
+            left_x = torch.floor(q_ix).int()
+            top_y = torch.floor(q_iy).int()
+            z1 = torch.floor(q_iz).int()
+            right_x = left_x + 1
+            bottom_y = top_y + 1
+            z2 = z1 + 1
+            x_terp = q_ix - left_x
+            y_terp = q_iy - top_y
+            z_terp = q_iz - z1
+            x_terp = x_terp.reshape(resize_z, resize_height, resize_width, 1)
+            y_terp = y_terp.reshape(resize_z, resize_height, resize_width, 1)
+            z_terp = z_terp.reshape(resize_z, resize_height, resize_width, 1)
+            #
+            z1_top_left = loop_PixelAtGrid3D(feature, n, feature_channel, z1, top_y, left_x, feature_z, feature_height,
+                                        feature_width, resize_z, resize_height, resize_width, padding_mode, 0)
+            z1_top_right = loop_PixelAtGrid3D(feature, n, feature_channel, z1, top_y, right_x, feature_z, feature_height,
+                                         feature_width, resize_z, resize_height, resize_width, padding_mode, 0)
+            z1_bottom_left = loop_PixelAtGrid3D(feature, n, feature_channel, z1, bottom_y, left_x, feature_z, feature_height,
+                                           feature_width, resize_z, resize_height, resize_width, padding_mode, 0)
+            z1_bottom_right = loop_PixelAtGrid3D(feature, n, feature_channel, z1, bottom_y, right_x, feature_z,
+                                            feature_height,
+                                            feature_width, resize_z, resize_height, resize_width, padding_mode, 0)
+
+            top = z1_top_left + (z1_top_right - z1_top_left) * x_terp
+            bottom = z1_bottom_left + (z1_bottom_right - z1_bottom_left) * x_terp
+            horizontal_output[n, :, :, :, :] = top + (bottom - top) * y_terp
+
+            z2_top_left = loop_PixelAtGrid3D(feature, n, feature_channel, z2, top_y, left_x, feature_z, feature_height,
+                                        feature_width, resize_z, resize_height, resize_width, padding_mode, 0)
+            z2_top_right = loop_PixelAtGrid3D(feature, n, feature_channel, z2, top_y, right_x, feature_z, feature_height,
+                                         feature_width, resize_z, resize_height, resize_width, padding_mode, 0)
+            z2_bottom_left = loop_PixelAtGrid3D(feature, n, feature_channel, z2, bottom_y, left_x, feature_z, feature_height,
+                                           feature_width, resize_z, resize_height, resize_width, padding_mode, 0)
+            z2_bottom_right = loop_PixelAtGrid3D(feature, n, feature_channel, z2, bottom_y, right_x, feature_z,
+                                            feature_height,
+                                            feature_width, resize_z, resize_height, resize_width, padding_mode, 0)
+
+            top = z2_top_left + (z2_top_right - z2_top_left) * x_terp
+            bottom = z2_bottom_left + (z2_bottom_right - z2_bottom_left) * x_terp
+            quant_output[n, :, :, :, :] = top + (bottom - top) * y_terp
+
+            quant_output[n, :, :, :, :] = horizontal_output[n, :, :, :, :] + (
+                quant_output[n, :, :, :, :] - horizontal_output[n, :, :, :, :]) * z_terp
+    return quant_output
+
+
+def grid_node(feature, grid):
+    node = PyNode('grid_sample', OpType.GridSample)
+    node.add_input(PyTensor('feature', feature, Dtype.FP32))
+    node.add_input(PyTensor('grid', grid, Dtype.FP32))
+    node.add_output(PyTensor('out', TensorShape([1]), Dtype.FP32))
+    return node
+
+
+def random_grid(shape, dims):
+    # normalized coordinates partially out of [-1, 1], with a few exactly on the borders
+    grid = torch.rand(list(shape) + [dims]) * 2.6 - 1.3
+    grid.view(-1)[:4] = torch.tensor([-1., 1., 0., -1.])
+    return grid
+
+
+@pytest.mark.parametrize("method", ['nearest', 'bilinear'])
+@pytest.mark.parametrize("padding_mode", ['zeros', 'border'])
+@pytest.mark.parametrize("align_corners", [True, False])
+def test_float_grid_sample_4d(method, padding_mode, align_corners):
+    torch.manual_seed(0)
+    feature = torch.randn(3, 7, 9, 5)
+    grid = random_grid([3, 6, 11], 2)
+    out = float_grid_sample_4d(feature, grid, method, padding_mode, align_corners)
+    ref = loop_float_grid_sample_4d(feature, grid, method, padding_mode, align_corners)
+    assert torch.equal(out, ref)
+
+
+@pytest.mark.parametrize("method", ['nearest', 'bilinear'])
+@pytest.mark.parametrize("padding_mode", ['zeros', 'border'])
+@pytest.mark.parametrize("align_corners", [True, False])
+def test_float_grid_sample_5d(method, padding_mode, align_corners):
+    torch.manual_seed(0)
+    feature = torch.randn(2, 4, 7, 9, 3)
+    grid = random_grid([2, 3, 6, 5], 3)
+    out = float_grid_sample_5d(feature, grid, method, padding_mode, align_corners)
+    ref = loop_float_grid_sample_5d(feature, grid, method, padding_mode, align_corners)
+    assert torch.equal(out, ref)
+
+
+def quant_grid_node(spatial, batch, resize, zps):
+    # int16 grid coordinates, the scales map [-1, 1] a little beyond the feature to sample out of it
+    feature = torch.randint(-128, 128, [batch] + spatial + [4]).float()
+    grid = torch.randint(-2 ** 15 - zps[1], 2 ** 15 - zps[1], [batch] + resize + [len(spatial)]).float()
+    node = grid_node(feature, grid)
+    node.inputs[0].zerop = zps[0]
+    node.inputs[1].zerop = zps[1]
+    do_scale, do_shift = [], []
+    for axis, name in zip(range(len(spatial)), ['x', 'y', 'z']):
+        size = spatial[::-1][axis]
+        node.params[f'coordinate_{name}_shift'] = 9
+        do_scale.append(int(1.2 * (size - 1) * 2 ** 9 / 2 ** 16 * 2 ** 12))
+        do_shift.append(12)
+    return node, do_scale, do_shift
+
+
+@pytest.mark.parametrize("method", ['nearest', 'bilinear'])
+@pytest.mark.parametrize("padding_mode", ['zeros', 'border'])
+def test_quant_grid_sample_4d(method, padding_mode):
+    torch.manual_seed(0)
+    node, do_scale, do_shift = quant_grid_node([7, 9], 3, [6, 11], [-3, 100])
+    args = (node.inputs[0], node.inputs[1], method, padding_mode, True, do_scale, do_shift)
+    out = quant_grid_sample(node, *args)
+    ref = loop_quant_grid_sample(node, *args)
+    assert torch.equal(out, ref)
+
+
+@pytest.mark.parametrize("method", ['nearest', 'bilinear'])
+@pytest.mark.parametrize("padding_mode", ['zeros', 'border'])
+def test_quant_grid_sample_5d(method, padding_mode):
+    torch.manual_seed(0)
+    node, do_scale, do_shift = quant_grid_node([4, 7, 9], 2, [3, 6, 5], [5, -20])
+    args = (node.inputs[0], node.inputs[1], method, padding_mode, False, do_scale, do_shift)
+    out = quant_grid_sample_5d(node, *args)
+    ref = loop_quant_grid_sample_5d(node, *args)
+    assert torch.equal(out, ref)
+
+
+@pytest.mark.parametrize("method", ['nearest', 'bilinear'])
+@pytest.mark.parametrize("padding_mode", ['zeros', 'border'])
+def test_quant_grid_sample_lookup(method, padding_mode):
+    torch.manual_seed(0)
+    feature = torch.randint(-128, 128, [3, 7, 9, 4]).float()
+    grid = torch.randint(-128, 128, [3, 6, 11, 2]).float()
+    node = grid_node(feature, grid)
+    node.inputs[0].zerop = 7
+    node.params['coordinate_x_shift'] = 10
+    node.params['coordinate_y_shift'] = 10
+    # the coordinates tables of the 8bits grid, with some locations out of the feature
+    for name, size in [('lutx', 9), ('luty', 7)]:
+        lut = torch.linspace(-2, size + 1, 256).floor().short()
+        node.constants[name] = PyTensor(name, lut.numpy(), Dtype.INT16)
+        node.constants[name].dtype = Dtype.INT16
+    for name in ['x_terp', 'y_terp']:
+        node.constants[name] = PyTensor(name, torch.randint(0, 1024, (256,)).numpy(), Dtype.UINT16)
+        node.constants[name].dtype = Dtype.UINT16
+    args = (node.inputs[0], node.inputs[1], method, padding_mode, False, [1, 1], [0, 0])
+    out = quant_grid_sample_lookup(node, *args)
+    ref = loop_quant_grid_sample_lookup(node, *args)
+    assert torch.equal(out, ref)
@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import numpy as np
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.gruv3 import gruv3  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+BATCH, INITIAL_BATCH, TIME_STEP, INPUT_SIZE, CELL_SIZE = 5, 3, 6, 7, 8
+
+
+def gru_node(version, direction, out_sequence, dtype=None):
+    quantized = dtype is not None
+    bits = dtype2bits(dtype) if quantized else 8
+    qmin, qmax = bits2range(bits, True)
+    node = PyNode('gruv3', OpType.GRUv3)
+    if quantized:
+        x = torch.randint(qmin, qmax + 1, (BATCH, TIME_STEP, INPUT_SIZE)).float()
+        h = torch.randint(qmin, qmax + 1, (INITIAL_BATCH, CELL_SIZE)).float()
+    else:
+        x = torch.randn(BATCH, TIME_STEP, INPUT_SIZE)
+        h = torch.randn(INITIAL_BATCH, CELL_SIZE)
+    node.add_input(PyTensor('x', x, dtype if quantized else Dtype.FP32))
+    node.add_input(PyTensor('h', h, dtype if quantized else Dtype.FP32))
+    for name in out_sequence:
+        node.add_output(PyTensor(name, TensorShape([1]), dtype if quantized else Dtype.FP32))
+    node.params['time_steps'] = TIME_STEP
+    node.params['input_size'] = INPUT_SIZE
+    node.params['cell_size'] = CELL_SIZE
+    node.params['direction'] = direction
+    node.params['out_sequence'] = out_sequence
+    node.params['version'] = version
+    node.quantized = quantized
+    bias_num = 4 if version == 'GRUV1' else 3
+    if not quantized:
+        node.constants['weights'] = PyTensor('weights', torch.randn(3 * CELL_SIZE, INPUT_SIZE + CELL_SIZE))
+        node.constants['biases'] = PyTensor('biases', torch.randn(bias_num * CELL_SIZE))
+        node.params['threshold'] = 2.5
+        return node
+
+    node.inputs[0].qbits = bits
+    node.outputs[0].qbits = bits
+    node.constants['weights'] = PyTensor('weights', torch.randint(qmin, qmax + 1, (3 * CELL_SIZE, INPUT_SIZE + CELL_SIZE)))
+    node.constants['biases'] = PyTensor('biases', torch.randint(-2 ** (bits + 6), 2 ** (bits + 6), (bias_num * CELL_SIZE,)))
+    lut_size = 256 if bits <= 8 else 512
+    for name in ['lut_rt', 'lut_zt', 'lut_ht']:
+        node.constants[name] = PyTensor(name, torch.randint(qmin, qmax + 1, (lut_size,)))
+    # the int16 shifts are larger than remain_shift, so that the accumulators are shifted before rescaling
+    node.params['scale_value'] = torch.randint(2 ** 14, 2 ** 15, (6,)).tolist()
+    node.params['shift_value'] = torch.randint(bits + 12, bits + 15, (6,)).tolist()
+    node.params['shift_value'][0] = node.params['shift_value'][2] = 15
+    node.params['hidden_scale_value'] = 2 ** 14 + 1
+    node.params['hidden_shift_value'] = bits + 14
+    return node
+
+
+def forward_per_sample(node, batch_idx):
+    # run the samples of the batch one by one, each one picks the same initial state as in the whole batch
+    x = node.inputs[0].betensor
+    outputs = []
+    for b in range(x.shape[0]):
+        node.inputs[0].betensor = x[b:b + 1]
+        node.current_batch_idx = batch_idx * x.shape[0] + b
+        gruv3(node)
+        outputs.append([o.betensor.clone() for o in node.outputs])
+    node.inputs[0].betensor = x
+    return [torch.cat(o, dim=0) for o in zip(*outputs)]
+
+
+def forward_batch(node, batch_idx):
+    node.current_batch_idx = batch_idx
+    gruv3(node)
+    return [o.betensor.clone() for o in node.outputs]
+
+
+@pytest.mark.parametrize("version", ['GRUV1', 'GRUV3'])
+@pytest.mark.parametrize("direction", ['forward', 'reverse'])
+@pytest.mark.parametrize("out_sequence", [['H'], ['Hn'], ['H', 'Hn']])
+def test_gruv3_float(version, direction, out_sequence):
+    torch.manual_seed(0)
+    node = gru_node(version, direction, out_sequence)
+    outs = forward_batch(node, 1)
+    placeholders = [p.betensor.clone() for p in node.placeholders]
+    refs = forward_per_sample(node, 1)
+    for out, ref in zip(outs, refs):
+        # the batched matmul may accumulate in another order than the one row matmul
+        assert out.dtype == ref.dtype
+        assert torch.allclose(out, ref, rtol=1e-5, atol=1e-6)
+    assert len(placeholders) == 6
+    assert placeholders[0].shape == (BATCH, TIME_STEP, CELL_SIZE)
+
+
+@pytest.mark.parametrize("dtype", [Dtype.INT8, Dtype.INT16])
+@pytest.mark.parametrize("version", ['GRUV1', 'GRUV3'])
+@pytest.mark.parametrize("direction", ['forward', 'reverse'])
+@pytest.mark.parametrize("out_sequence", [['H'], ['H', 'Hn']])
+def test_gruv3_quant(dtype, version, direction, out_sequence):
+    torch.manual_seed(0)
+    node = gru_node(version, direction, out_sequence, dtype)
+    outs = forward_batch(node, 1)
+    refs = forward_per_sample(node, 1)
+    for out, ref in zip(outs, refs):
+        assert torch.equal(out, ref)
+    assert outs[0].unique().numel() > 2
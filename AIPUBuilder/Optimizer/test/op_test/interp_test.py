@@ -0,0 +1,241 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import math
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.interp import *  # noqa
+from AIPUBuilder.Optimizer.ops.interp import _scaler  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+MODES = ['half_pixel', 'align_corners', 'pytorch_half_pixel', 'asymmetric', 'half_pixel_symmetric']
+
+
+def loop_compute_weight_coefficients(input_size, output_size, rscale, mode, exclude_outside, dev):
+    def filter(x):
+        if x < 0.0:
+            x = -x
+        if x < 1.0:
+            return 1.0 - x
+        return 0.0
+
+    scale = 1 / rscale if rscale is not None else (input_size / output_size)
+    support = scale if (scale >= 1.0) else 1.0
+    windowsize = int(math.ceil(support)) * 2 + 1
+    inv_scale = 1 / (scale) if scale >= 1.0 else 1.0
+    bound_w_min = []
+    bound_w_max = []
+    scale_buffer = torch.zeros([windowsize * output_size], device=dev)
+    for coord in range(output_size):
+        center = 0.5 + _scaler(torch.tensor(coord), rscale, mode, input_size, output_size)
+        total_weight = 0.0
+        fmin = math.floor(center - support + 0.5)
+        fmax = math.floor(center + support + 0.5)
+        xmin_real = int(fmin)
+        xmax_real = int(fmax)
+        xmin_cut = max(0, xmin_real)
+        xmax_cut = min(input_size, xmax_real)
+        bound_w_min.append(xmin_cut)
+        bound_w_max.append(xmax_cut)
+        xmin = xmin_cut if exclude_outside else xmin_real
+        xmax = xmax_cut if exclude_outside else xmax_real
+        terp = xmax - xmin
+        offset = coord * windowsize
+        for x in range(terp):
+            weight = filter((x + xmin - center + 0.5) * inv_scale)
+            scale_buffer[offset + x] = weight
+            total_weight += weight
+        xmax -= xmin
+        if not exclude_outside:
+            neg_xsize = -xmin if xmin < 0 else 0
+            for i in range(neg_xsize):
+                scale_buffer[offset + neg_xsize] += scale_buffer[offset + i]
+            bound_xsize = (xmax + xmin - input_size) if (xmax + xmin > input_size) else 0
+            for x in range(xmax - bound_xsize, xmax):
+                scale_buffer[offset + xmax - bound_xsize - 1] += scale_buffer[offset + x]
+            x = 0
+            while (neg_xsize | bound_xsize) > 0 and (x < xmax_cut - xmin_cut):
+                scale_buffer[offset + x] = scale_buffer[offset + x + neg_xsize]
+                x += 1
+        total_weight_inv = 1.0 if total_weight == 0.0 else 1.0 / total_weight
+        for x in range(xmax_cut - xmin_cut):
+            scale_buffer[offset + x] *= total_weight_inv
+    return scale_buffer, torch.tensor(bound_w_min, device=dev), torch.tensor(bound_w_max, device=dev)
+
+
+def loop_resize_bilinear_antialias(input_data, params, qmin, qmax):
+    output_shape = params['output_shape']
+    coordination_shift = params['coordination_shift']
+    input_height, input_width = input_data.shape[1:3]
+    batch_size, output_height, output_width, channel = output_shape
+    coef_x, bound_x_min, bound_x_max = loop_compute_weight_coefficients(
+        input_width, output_width, params['ratio_x'], params['mode'], params['exclude_outside'], input_data.device)
+    coef_y, bound_y_min, bound_y_max = loop_compute_weight_coefficients(
+        input_height, output_height, params['ratio_y'], params['mode'], params['exclude_outside'], input_data.device)
+    windowsize_w = coef_x.shape[0] // output_width
+    windowsize_h = coef_y.shape[0] // output_height
+    image_temp_buffer = torch.zeros([batch_size, input_height, output_width, channel])
+    output_data = torch.zeros(output_shape)
+    for w in range(output_width):
+        xmin = bound_x_min[w]
+        xmax = bound_x_max[w]
+        tmp_data = input_data[:, :, xmin:xmax, :] * \
+            coef_x[w * windowsize_w: w * windowsize_w + xmax - xmin].reshape([1, 1, -1, 1])
+        image_temp_buffer[:, :, w, :] = torch.sum(tmp_data, dim=2, keepdim=False)
+    if coordination_shift:
+        image_temp_buffer = linear_requantize(image_temp_buffer, 1, coordination_shift, 0, qmin, qmax)
+    for h in range(output_height):
+        xmin = bound_y_min[h]
+        xmax = bound_y_max[h]
+        tmp_data = image_temp_buffer[:, xmin:xmax, :, :] * \
+            coef_y[h * windowsize_h: h * windowsize_h + xmax - xmin].reshape([1, -1, 1, 1])
+        output_data[:, h, :, :] = torch.sum(tmp_data, dim=1, keepdim=False)
+    if coordination_shift:
+        output_data = linear_requantize(output_data, 1, coordination_shift, 0, qmin, qmax)
+    return output_data
+
+
+def loop_accelerate_resize_bilinear(in_data, output_shape, mode, ratio_x, ratio_y, coordination_shift):
+    batch, out_h, out_w, out_c = output_shape
+    in_h, in_w = in_data.shape[1:3]
+    scale_num = 2 ** coordination_shift
+    quantized = False if coordination_shift == 0 else True
+    y = _scaler(torch.arange(out_h, device=in_data.device), ratio_y, mode, in_h, out_h)
+    x = _scaler(torch.arange(out_w, device=in_data.device), ratio_x, mode, in_w, out_w)
+
+    y_floor = torch.floor(y).int()
+    y_ceil = torch.ceil(y).int()
+    x_floor = torch.floor(x).int()
+    x_ceil = torch.ceil(x).int()
+
+    y0 = torch.maximum(y_floor, torch.tensor(0, device=in_data.device))
+    y1 = torch.minimum(y_ceil, torch.tensor(in_h - 1, device=in_data.device))
+    x0 = torch.maximum(x_floor, torch.tensor(0, device=in_data.device))
+    x1 = torch.minimum(x_ceil, torch.tensor(in_w - 1, device=in_data.device))
+
+    y0_x0 = torch.cartesian_prod(y0, x0).long()
+    y0_x1 = torch.cartesian_prod(y0, x1).long()
+    y1_x0 = torch.cartesian_prod(y1, x0).long()
+    y1_x1 = torch.cartesian_prod(y1, x1).long()
+
+    f00 = in_data[:, y0_x0[:, 0], y0_x0[:, 1], :]
+    f01 = in_data[:, y0_x1[:, 0], y0_x1[:, 1], :]
+    f10 = in_data[:, y1_x0[:, 0], y1_x0[:, 1], :]
+    f11 = in_data[:, y1_x1[:, 0], y1_x1[:, 1], :]
+
+    y0_lerp = y - y0
+    x0_lerp = x - x0
+    y1_lerp = 1 - y0_lerp
+    x1_lerp = 1 - x0_lerp
+
+    y0l_x0l = torch.cartesian_prod(y0_lerp, x0_lerp)
+    y0l_x1l = torch.cartesian_prod(y0_lerp, x1_lerp)
+    y1l_x0l = torch.cartesian_prod(y1_lerp, x0_lerp)
+    y1l_x1l = torch.cartesian_prod(y1_lerp, x1_lerp)
+
+    Q00 = y1l_x1l[:, 0] * y1l_x1l[:, 1] * scale_num
+    Q10 = y0l_x1l[:, 0] * y0l_x1l[:, 1] * scale_num
+    Q01 = y1l_x0l[:, 0] * y1l_x0l[:, 1] * scale_num
+    Q11 = y0l_x0l[:, 0] * y0l_x0l[:, 1] * scale_num
+    if quantized:
+        Q00 = torch.floor(Q00 + 0.5)
+        Q10 = torch.floor(Q10 + 0.5)
+        Q01 = torch.floor(Q01 + 0.5)
+        Q11 = torch.floor(Q11 + 0.5)
+
+    Q00 = Q00.reshape([-1, 1]).repeat(batch, 1, out_c)
+    Q01 = Q01.reshape([-1, 1]).repeat(batch, 1, out_c)
+    Q10 = Q10.reshape([-1, 1]).repeat(batch, 1, out_c)
+    Q11 = Q11.reshape([-1, 1]).repeat(batch, 1, out_c)
+    bilinear_out = (f00 * Q00 + f01 * Q01 + f10 * Q10 + f11 * Q11) / scale_num
+    bilinear_out = torch.round(bilinear_out) if quantized else bilinear_out
+    outt = bilinear_out.reshape(*output_shape)
+    return outt
+
+
+def loop_TF1_compatible_resize(inp, output_shape, mode):
+    batch, inp_h, inp_w = inp.shape[0], inp.shape[2], inp.shape[3]
+    out_h, out_w, out_c = output_shape[1:]
+    if mode == 'align_corners':
+        factor_h = max((out_h - 1), 1) / max((inp_h - 1), 1)
+        factor_w = max((out_w - 1), 1) / max((inp_w - 1), 1)
+    else:
+        factor_h = max(out_h, 1) / max(inp_h, 1)
+        factor_w = max(out_w, 1) / max(inp_w, 1)
+    out_t = torch.zeros([batch, out_c, out_h, out_w])
+    for h in range(out_h):
+        for w in range(out_w):
+            map_inp_h = min(int(round(h / factor_h) if mode == 'align_corners' else math.floor(h / factor_h)),
+                            inp_h - 1)
+            map_inp_w = min(int(round(w / factor_w) if mode == 'align_corners' else math.floor(w / factor_w)),
+                            inp_w - 1)
+            out_t[:, :, h, w] = inp[:, :, map_inp_h, map_inp_w]
+    return out_t
+
+
+def interp_node():
+    node = PyNode('interp', OpType.Interp)
+    node.add_input(PyTensor('x', TensorShape([1]), Dtype.INT8))
+    node.inputs[0].qmin, node.inputs[0].qmax = -128, 127
+    return node
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("exclude_outside", [True, False])
+@pytest.mark.parametrize("use_ratio", [True, False])
+def test_weight_coefficients(mode, exclude_outside, use_ratio):
+    for input_size, output_size in [(1, 5), (7, 1), (7, 5), (33, 5), (7, 40), (33, 40)]:
+        rscale = output_size / input_size if use_ratio else None
+        outs = compute_weight_coefficients(input_size, output_size, rscale, mode, exclude_outside, 'cpu')
+        refs = loop_compute_weight_coefficients(input_size, output_size, rscale, mode, exclude_outside, 'cpu')
+        for out, ref in zip(outs, refs):
+            assert out.dtype == ref.dtype
+            assert torch.equal(out, ref)
+
+
+@pytest.mark.parametrize("output_hw", [(3, 4), (70, 45)])
+@pytest.mark.parametrize("mode", ['half_pixel', 'align_corners'])
+@pytest.mark.parametrize("exclude_outside", [True, False])
+@pytest.mark.parametrize("coordination_shift", [0, 8])
+def test_resize_bilinear_antialias(output_hw, mode, exclude_outside, coordination_shift):
+    torch.manual_seed(0)
+    x = torch.randint(-128, 128, (2, 32, 20, 3)).float()
+    params = {'mode': mode, 'output_shape': [2, *output_hw, 3], 'exclude_outside': exclude_outside,
+              'coordination_shift': coordination_shift, 'ratio_x': None, 'ratio_y': None}
+    node = interp_node()
+    out = resize_bilinear_antialias(node, x, params)
+    ref = loop_resize_bilinear_antialias(x, params, -128, 127)
+    assert torch.equal(out, ref)
+    # the second run reads the cached coefficients
+    assert torch.equal(resize_bilinear_antialias(node, x, params), ref)
+
+
+@pytest.mark.parametrize("output_hw", [(3, 4), (16, 45)])
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("coordination_shift", [0, 10])
+def test_accelerate_resize_bilinear(output_hw, mode, coordination_shift):
+    torch.manual_seed(0)
+    x = torch.randint(-128, 128, (2, 7, 9, 3)).float()
+    output_shape = [2, *output_hw, 3]
+    out = accelerate_resize_bilinear(x, output_shape, mode, None, None, coordination_shift)
+    ref = loop_accelerate_resize_bilinear(x, output_shape, mode, None, None, coordination_shift)
+    assert out.dtype == ref.dtype
+    assert torch.equal(out, ref)
+
+
+@pytest.mark.parametrize("output_hw", [(3, 4), (16, 45)])
+@pytest.mark.parametrize("mode", ['align_corners', 'asymmetric'])
+def test_TF1_compatible_resize(output_hw, mode):
+    torch.manual_seed(0)
+    x = torch.randn(2, 3, 7, 9)
+    out = TF1_compatible_resize(x, [2, *output_hw, 3], mode)
+    ref = loop_TF1_compatible_resize(x, [2, *output_hw, 3], mode)
+    assert torch.equal(out, ref)
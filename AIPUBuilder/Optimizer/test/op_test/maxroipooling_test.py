@@ -0,0 +1,168 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.maxroipooling import maxroipooling  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def loop_maxroipooling(self, *args):
+    out = self.outputs[0].betensor
+    feature = self.inputs[0].betensor
+    rois_box = self.inputs[1].betensor
+
+    resize_height = self.outputs[0].ir_shape[1]
+    resize_width = self.outputs[0].ir_shape[2]
+    channel = self.outputs[0].ir_shape[3]
+    height, width = feature.shape[1:3]
+    # to match some IR shape,no batch dimension
+    if rois_box.ndim == 2:
+        rois_box = rois_box.unsqueeze(0)
+    rois = rois_box[..., 1:]  # [:,0] stand for batch index
+
+    if feature.shape[0] != rois_box.shape[0]:
+        OPT_WARN("MaxRoiPool batch dim is not correct")
+    spatial_scale_value = [self.get_param('spatial')[0], self.get_param('spatial')[1]]  # [spatial_y, spatial_x] in IR
+    dev = feature.device
+    if not self.quantized:
+        top_data = torch.zeros((rois.shape[0], rois.shape[1], resize_height, resize_width, channel), device=dev)
+        for i in range(rois_box.shape[0]):
+            batch_index = rois_box[i, :, 0]
+            for boxidx in range(rois.shape[1]):
+                batch_idx = batch_index[boxidx].int()
+                roi_start_w = (torch.floor(rois[i, boxidx, 1] * spatial_scale_value[1] + 0.5)).int()
+                roi_end_w = (torch.floor(rois[i, boxidx, 3] * spatial_scale_value[1] + 0.5)).int()
+                roi_start_h = (torch.floor(rois[i, boxidx, 0] * spatial_scale_value[0] + 0.5)).int()
+                roi_end_h = (torch.floor(rois[i, boxidx, 2] * spatial_scale_value[0] + 0.5)).int()
+
+                roi_height = max(roi_end_h - roi_start_h + 1, 1)
+                roi_width = max(roi_end_w - roi_start_w + 1, 1)
+                bin_size_h = roi_height / resize_height
+                bin_size_w = roi_width / resize_width
+
+                hstart = torch.floor((torch.arange(0, resize_height, device=out.device)) *
+                                     bin_size_h)  # have pooled size h,such as case, vector len is 7
+                wstart = torch.floor((torch.arange(0, resize_width, device=out.device)) * bin_size_w)
+                hend = torch.ceil((torch.arange(1, resize_height + 1, device=out.device)) * bin_size_h)
+                wend = torch.ceil((torch.arange(1, resize_width + 1, device=out.device)) * bin_size_w)
+
+                # have pooled size h,such as case, vector len is 7
+                hstart = (torch.clamp(hstart + roi_start_h, 0, height)).int()
+                hend = (torch.clamp(hend + roi_start_h, 0, height)).int()
+                wstart = (torch.clamp(wstart + roi_start_w, 0, width)).int()
+                wend = (torch.clamp(wend + roi_start_w, 0, width)).int()
+
+                for ph in range(resize_height):
+                    for pw in range(resize_width):
+                        if hstart[ph] >= hend[ph] or wstart[pw] >= wend[pw]:
+                            continue
+                        else:
+                            top_data[i, boxidx, ph, pw, :] = torch.max(
+                                torch.max(feature[batch_idx, hstart[ph]:hend[ph], wstart[pw]:wend[pw], :], 0)[0], 0)[0]
+    else:
+        top_data = torch.zeros((rois.shape[0], rois.shape[1], resize_height, resize_width, channel), device=dev)
+        # here is unreasonable, but lib remove a parameter which indicate box scale, lib maybe match specific case
+        # but opt need match general cases test, so workaround like this
+        spatial_scale_int16 = [spatial_scale_value[0], spatial_scale_value[1]]
+        half_value = 1 << 15
+        rois = rois.long() + self.inputs[1].zerop
+        for i in range(rois_box.shape[0]):
+            batch_index = rois_box[i, :, 0] + self.inputs[1].zerop
+            for boxidx in range(rois.shape[1]):
+                batch_idx = batch_index[boxidx].int()
+                # rois is origin size, feature map size is reduced by 1/16, origin size=224, feature size=224/16/=14
+                expand_start_w = rois[i, boxidx, 1] * spatial_scale_int16[1]
+                expand_end_w = rois[i, boxidx, 3] * spatial_scale_int16[1]
+                expand_start_h = rois[i, boxidx, 0] * spatial_scale_int16[0]
+                expand_end_h = rois[i, boxidx, 2] * spatial_scale_int16[0]
+
+                roi_start_w_q = (expand_start_w // 65536).int().item()
+                roi_end_w_q = (expand_end_w // 65536).int().item()
+                roi_start_h_q = (expand_start_h // 65536).int().item()
+                roi_end_h_q = (expand_end_h // 65536).int().item()
+
+                roi_start_w_q += (1 if (expand_start_w % 65536) >= half_value else 0)
+                roi_end_w_q += (1 if (expand_end_w % 65536) >= half_value else 0)
+                roi_start_h_q += (1 if (expand_start_h % 65536) >= half_value else 0)
+                roi_end_h_q += (1 if (expand_end_h % 65536) >= half_value else 0)
+
+                roi_height_q = max(roi_end_h_q - roi_start_h_q + 1, 1)
+                roi_width_q = max(roi_end_w_q - roi_start_w_q + 1, 1)
+                bin_size_h_q = (roi_height_q // resize_height)
+                bin_size_w_q = (roi_width_q // resize_width)
+                bin_size_h_q_mod = roi_height_q % resize_height
+                bin_size_w_q_mod = roi_width_q % resize_width
+
+                # have pooled size h,such as case, vector len is 7
+                hstart_q = ((torch.arange(0, resize_height)) * bin_size_h_q) + \
+                    (bin_size_h_q_mod * torch.arange(0, resize_height)) // resize_height  # >> 8
+                wstart_q = ((torch.arange(0, resize_width)) * bin_size_w_q) + \
+                    (bin_size_w_q_mod * torch.arange(0, resize_width)) // resize_width  # >> 8
+
+                hend_q = ((torch.arange(1, resize_height+1)) * bin_size_h_q) + \
+                    (bin_size_h_q_mod * torch.arange(1, resize_height+1)) // resize_height
+                mask = ((bin_size_h_q_mod * torch.arange(1, resize_height+1)) % resize_height) > 0
+                hend_q[mask] += 1
+
+                wend_q = ((torch.arange(1, resize_width+1)) * bin_size_w_q) + \
+                    (bin_size_w_q_mod * torch.arange(1, resize_width+1)) // resize_width
+                mask = ((bin_size_w_q_mod * torch.arange(1, resize_width+1)) % resize_width) > 0
+                wend_q[mask] += 1
+
+                hstart_q = torch.clamp(hstart_q + roi_start_h_q, 0, height)
+                hend_q = torch.clamp(hend_q + roi_start_h_q, 0, height)
+                wstart_q = torch.clamp(wstart_q + roi_start_w_q, 0, width)
+                wend_q = torch.clamp(wend_q + roi_start_w_q, 0, width)
+                for ph in range(resize_height):
+                    for pw in range(resize_width):
+                        if hstart_q[ph] >= hend_q[ph] or wstart_q[pw] >= wend_q[pw]:
+                            continue
+                        else:
+                            top_data[i, boxidx, ph, pw, :] = torch.max(
+                                torch.max(feature[batch_idx, hstart_q[ph]:hend_q[ph], wstart_q[pw]:wend_q[pw], :], 0)[
+                                    0], 0)[0]
+
+    self.outputs[0].betensor = top_data.reshape(self.outputs[0].ir_shape)
+    return top_data
+
+
+def maxroipool_node(quantized, roi_num, pooled, channel, seed):
+    g = torch.Generator().manual_seed(seed)
+    node = PyNode('roi_pool', OpType.MaxRoiPool)
+    node.quantized = quantized
+    feature = torch.randn([2, 19, 23, channel], generator=g)
+    # [x, y] corners in image coordinates, some of them outside of the image or inverted
+    corners = torch.rand([2, roi_num, 4], generator=g) * 420 - 30
+    if quantized:
+        feature = torch.randint(-128, 128, [2, 19, 23, channel], generator=g).float()
+        corners = corners.round()
+        node.params['spatial'] = [4096, 4096]
+    else:
+        node.params['spatial'] = [0.0625, 0.0625]
+    batch_index = torch.randint(0, 2, [2, roi_num, 1], generator=g).float()
+    inp0 = PyTensor('feature', feature.numpy())
+    inp1 = PyTensor('rois', torch.cat([batch_index, corners], dim=-1).numpy())
+    out = PyTensor('out', torch.zeros([2 * roi_num, pooled[0], pooled[1], channel]).numpy())
+    out.ir_shape = TensorShape([2 * roi_num, pooled[0], pooled[1], channel])
+    node.add_input(inp0)
+    node.add_input(inp1)
+    node.add_output(out)
+    return node
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+@pytest.mark.parametrize("pooled", [[7, 7], [3, 5], [1, 1]])
+@pytest.mark.parametrize("roi_num", [1, 40])
+def test_maxroipooling(quantized, pooled, roi_num):
+    node = maxroipool_node(quantized, roi_num, pooled, 6, 0)
+    out = maxroipooling(node)
+    ref = loop_maxroipooling(node)
+    assert torch.equal(out, ref)
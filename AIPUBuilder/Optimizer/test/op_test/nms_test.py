@@ -0,0 +1,253 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import numpy as np
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.nms import single_nms, single_softnms, iou, del_tensor_from_index, generate_gussi_lut  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+# the sequential implementations which the vectorized ones must reproduce exactly
+
+def loop_single_softnms(self, box, score, max_nms_box_num_per_class):
+    nms_box = torch.zeros((max_nms_box_num_per_class, 4))
+    nms_score = torch.zeros((max_nms_box_num_per_class))
+    keep = torch.zeros((max_nms_box_num_per_class))
+    device = box.device
+
+    score_threshold = float(self.get_param('score_threshold'))
+    iou_threshold = self.get_param('iou_threshold')
+    areas_shift = self.params['areas_shift'] if self.quantized else 0
+
+    y0 = box[:, 0]
+    x0 = box[:, 1]
+    y1 = box[:, 2]
+    x1 = box[:, 3]
+
+    if self.quantized:
+        areas = torch.abs((y1 - y0) * (x1 - x0)).long()
+        areas = areas >> areas_shift
+        iou_thresh_shift = self.params['iou_thresh_shift']
+    else:
+        areas = torch.abs((y1 - y0) * (x1 - x0))
+        iou_thresh_shift = 0
+
+    current_box_num = box.shape[0]
+    greater_score_thres_mask = score.float() > score_threshold
+    box_index = torch.arange(current_box_num, device=score.device)[greater_score_thres_mask]
+    suppress_begin_index = torch.zeros_like(box_index, device=score.device)
+    score_cand = score[greater_score_thres_mask].double().clone()
+    selected_boxes_index = []
+
+    keep_idx = 0
+    while (keep_idx < max_nms_box_num_per_class and score_cand.numel() > 0):
+        argmax_idx = torch.argmax(score_cand, dim=-1)
+        box_id = box_index[argmax_idx]
+        score_value = score_cand[argmax_idx]
+        origin_score = score_value.clone()
+
+        for j in range(suppress_begin_index[argmax_idx], len(selected_boxes_index)):
+            bid = selected_boxes_index[j]
+            w, h = iou(x0, y0, x1, y1, box_id, bid)
+            inter = w * h
+            if self.quantized:
+                scale_lut = self.constants['gaussian_scale_lut'].betensor
+                shift_lut = self.constants['gaussian_shift_lut'].betensor
+                soft_nms_sigma_in_shift = self.params["soft_nms_sigma_in_shift"]
+                inter = (inter).int()
+                inter = inter >> areas_shift
+                union = areas[box_id] + areas[bid] - inter
+                offset = 2 ** soft_nms_sigma_in_shift - 1
+                inter[union == 0] = 0
+                union[union == 0] = 1
+                ious = (inter * offset // union).long()
+                score_value = (score_value * scale_lut[ious]).long() >> shift_lut[ious].int()
+            else:
+                union = areas[box_id] + areas[bid] - inter
+                soft_nms_sigma = -0.5 / self.get_param('soft_nms_sigma')
+                ious = inter / union
+                if union == 0:
+                    ious = torch.tensor(0, device=score.device)
+                score_value = score_value * torch.exp(soft_nms_sigma * ious * ious)
+
+            if score_value.float() <= score_threshold:
+                break
+
+        suppress_begin_index[argmax_idx] = len(selected_boxes_index)
+        if origin_score == score_value:
+            keep[keep_idx] = box_id
+            nms_box[keep_idx, :] = box[box_id, :]
+            nms_score[keep_idx] = score_value
+            selected_boxes_index.append(box_id.item())
+            keep_idx += 1
+            score_cand = del_tensor_from_index(score_cand, argmax_idx)
+            box_index = del_tensor_from_index(box_index, argmax_idx)
+            suppress_begin_index = del_tensor_from_index(suppress_begin_index, argmax_idx)
+            continue
+        if score_value <= score_threshold:
+            score_cand = del_tensor_from_index(score_cand, argmax_idx)
+            box_index = del_tensor_from_index(box_index, argmax_idx)
+            suppress_begin_index = del_tensor_from_index(suppress_begin_index, argmax_idx)
+        else:
+            score_cand[argmax_idx] = score_value
+
+    boxNum_perclass = keep_idx
+    if self.quantized:
+        box_scale = self.params['scale_value']
+        box_shift = self.params['shift_value']
+        nms_box = nms_box.int() * box_scale >> box_shift
+    nms_box = nms_box[0:boxNum_perclass, :]
+    nms_score = nms_score[0:boxNum_perclass]
+    keep = keep[0:boxNum_perclass]
+
+    return nms_box, nms_score, boxNum_perclass, keep
+
+
+def loop_single_nms(self, box, score, max_nms_box_num):
+    # keep = torchvision.ops.nms(box,score,iou_threshold)
+    # outputs
+    # iou_threshold =  self.params['iou_threshold']
+    nms_box = torch.zeros((max_nms_box_num, 4))
+    nms_score = torch.zeros((max_nms_box_num))
+    keep = torch.zeros((max_nms_box_num))
+
+    y0 = box[:, 0]
+    x0 = box[:, 1]
+    y1 = box[:, 2]
+    x1 = box[:, 3]
+
+    # it will set optional to False when parser add 'score_threshold' in future
+    score_threshold = float(self.get_param('score_threshold', optional=True, default_value='-inf'))
+    areas_shift = self.params['areas_shift'] if self.quantized else 0
+
+    if self.quantized:
+        iou_threshold = self.params['iou_threshold']
+        iou_thresh_shift = self.params['iou_thresh_shift']
+        box_scale = self.params['scale_value']
+        box_shift = self.params['shift_value']
+        areas = torch.abs((y1 - y0) * (x1 - x0)).int()
+        areas = areas >> areas_shift
+    else:
+        iou_threshold = self.get_param('iou_threshold')
+        areas = torch.abs((y1 - y0) * (x1 - x0))
+
+    order = score[:].argsort(dim=-1, descending=True)  # descending order
+    keep_idx = 0
+    boxNum_perclass_single = 0
+    device = x0[0].device
+    while order.size()[0] > 0:
+        i = order[0]
+        if score[i].float() <= score_threshold:
+            break
+        boxNum_perclass_single += 1
+
+        keep[keep_idx] = i
+        nms_box[keep_idx, :] = box[i, :]
+        nms_score[keep_idx] = score[i]
+
+        keep_idx += 1
+        if keep_idx >= max_nms_box_num:
+            break
+
+        # xx0 = torch.max(x0[i], x0[order[1:]])
+        # yy0 = torch.max(y0[i], y0[order[1:]])
+        # xx1 = torch.min(x1[i], x1[order[1:]])
+        # yy1 = torch.min(y1[i], y1[order[1:]])
+        # w = torch.max(torch.tensor(0.0).to(device), xx1 - xx0)
+        # h = torch.max(torch.tensor(0.0).to(device), yy1 - yy0)
+        w, h = iou(x0, y0, x1, y1, i, order[1:])
+        inter = w * h
+        if self.quantized:
+            inter = (inter).int()
+            inter = inter >> areas_shift
+
+        union = areas[i] + areas[order[1:]] - inter
+
+        inter_area_thresh = union * iou_threshold
+        if self.quantized:
+            inter_area_thresh = union * iou_threshold >> int(iou_thresh_shift)
+
+        inds = torch.where(inter <= inter_area_thresh)[0]
+        order = order[inds + 1]
+
+    boxNum_perclass = boxNum_perclass_single
+    if self.quantized:
+        nms_box = nms_box.int() * box_scale >> box_shift
+        pass
+    nms_box = nms_box[0:boxNum_perclass, :]
+    nms_score = nms_score[0:boxNum_perclass]
+    keep = keep[0:boxNum_perclass]
+    return nms_box, nms_score, boxNum_perclass, keep
+
+
+def clustered_boxes(box_num, size, quantized):
+    # [box_num, 4] boxes of [y0, x0, y1, x1] around a few centers, so that many of them overlap
+    centers = torch.rand(6, 2) * size
+    c = centers[torch.randint(0, 6, (box_num,))] + torch.randn(box_num, 2) * size * 0.03
+    hw = (0.05 + torch.rand(box_num, 2) * 0.15) * size
+    boxes = torch.cat([c - hw / 2, c + hw / 2], dim=1)
+    if quantized:
+        boxes = torch.round(boxes).int()
+    if box_num > 2:
+        boxes[1] = boxes[0]  # a duplicated box
+        boxes[2, 2:] = boxes[2, :2]  # an empty box
+    return boxes
+
+
+def nms_node(quantized, method):
+    node = PyNode('nms', OpType.NMS)
+    node.quantized = quantized
+    if quantized:
+        node.params['iou_threshold'] = int(0.5 * 256)
+        node.params['iou_thresh_shift'] = 8
+        node.params['areas_shift'] = 13
+        node.params['scale_value'] = 16384
+        node.params['shift_value'] = 15
+        node.params['score_threshold'] = 20
+        if method == 'GAUSSIAN':
+            do_scale, do_shift = generate_gussi_lut(0, 2 ** 8 - 1, -0.5 / 0.5)
+            node.constants['gaussian_scale_lut'] = PyTensor('scale_lut', do_scale.cpu().numpy().astype(np.uint16))
+            node.constants['gaussian_shift_lut'] = PyTensor('shift_lut', do_shift.cpu().numpy().astype(np.uint8))
+            node.params['soft_nms_sigma_in_shift'] = 8
+    else:
+        node.params['iou_threshold'] = 0.5
+        node.params['score_threshold'] = 0.1
+    node.params['soft_nms_sigma'] = 0.5
+    return node
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+@pytest.mark.parametrize("box_num, max_num", [(700, 1000), (700, 20), (1, 5)])
+def test_hard_nms(quantized, box_num, max_num):
+    torch.manual_seed(0)
+    node = nms_node(quantized, 'HARD')
+    boxes = clustered_boxes(box_num, 2 ** 14 if quantized else 1.0, quantized)
+    # quantized scores have many ties
+    scores = torch.randint(0, 256, (box_num,)).float() if quantized else torch.rand(box_num)
+    out = single_nms(node, boxes, scores, max_num)
+    ref = loop_single_nms(node, boxes, scores, max_num)
+    assert out[2] == ref[2]
+    for o, r in zip([out[0], out[1], out[3]], [ref[0], ref[1], ref[3]]):
+        assert torch.equal(o, r)
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+@pytest.mark.parametrize("box_num, max_num", [(200, 300), (200, 15)])
+def test_soft_nms(quantized, box_num, max_num):
+    torch.manual_seed(0)
+    node = nms_node(quantized, 'GAUSSIAN')
+    boxes = clustered_boxes(box_num, 2 ** 14 if quantized else 1.0, quantized)
+    scores = torch.randint(0, 256, (box_num,)).float() if quantized else torch.rand(box_num)
+    out = single_softnms(node, boxes, scores, max_num)
+    ref = loop_single_softnms(node, boxes, scores, max_num)
+    assert out[2] == ref[2]
+    for o, r in zip([out[0], out[1], out[3]], [ref[0], ref[1], ref[3]]):
+        assert torch.equal(o, r)
@@ -0,0 +1,69 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.proposal import get_box_score  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+
+
+def loop__get_box_score(node, class_score, box_encoding, score_thresh):
+    max_prop_num = node.outputs[0].ir_shape[1]
+    arg_score = torch.where(class_score > score_thresh)[0].long()
+    box = box_encoding[arg_score, :][:max_prop_num, :]
+    if node.quantized:
+        box = torch.round(box).int()
+    score = class_score[arg_score][:max_prop_num]
+    outbox_idx = box.shape[0]
+    return box, score, outbox_idx
+
+
+def loop_get_box_score(node, batch_class_score, batch_box_encoding):
+    if not node.quantized:
+        score_thresh = node.get_param('score_threshold')
+        batch_class_score = batch_class_score.float()
+    else:
+        score_thresh = node.get_param('score_threshold_value')
+    max_prop_num = node.outputs[0].ir_shape[1]
+    dev = node.outputs[0].betensor.device
+    box = torch.zeros((batch_class_score.shape[0], max_prop_num, batch_box_encoding.shape[2]), device=dev)
+    score = torch.zeros((batch_class_score.shape[0], max_prop_num), device=dev)
+    box_num_perClass = torch.zeros((batch_class_score.shape[0], 1), device=dev)
+
+    for i in range(batch_class_score.shape[0]):
+        _box, _score, box_num_perClass[i][0] = loop__get_box_score(
+            node, batch_class_score[i], batch_box_encoding[i], score_thresh)
+        box[i][:_box.shape[0], :], score[i][:_score.shape[0]] = _box, _score
+
+    return box, score, box_num_perClass
+
+
+def proposal_node(quantized, thresh, max_prop_num):
+    node = PyNode('proposal', OpType.Proposal)
+    node.quantized = quantized
+    node.params['score_threshold_value' if quantized else 'score_threshold'] = thresh
+    out = PyTensor('proposal_score', torch.zeros([1, max_prop_num]).numpy())
+    out.ir_shape = TensorShape([1, max_prop_num])
+    node.add_output(out)
+    return node
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+@pytest.mark.parametrize("thresh, max_prop_num", [(0.5, 1000), (0.5, 30), (1.1, 1000)])
+def test_get_box_score(quantized, thresh, max_prop_num):
+    torch.manual_seed(0)
+    score = torch.rand(3, 200)
+    box = torch.rand(3, 200, 4) * 600
+    if quantized:
+        score, thresh = (score * 255).round(), int(thresh * 255)
+    node = proposal_node(quantized, thresh, max_prop_num)
+    out = get_box_score(node, score, box)
+    ref = loop_get_box_score(node, score, box)
+    for o, r in zip(out, ref):
+        assert torch.equal(o, r)
@@ -0,0 +1,193 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.region import get_roi_one_batch, get_roi_one_batch_quant, check_and_pick_max_box_num  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def loop_get_roi_one_batch(region,
+                      threshold,
+                      coords_and_conf_num,  # 5
+                      anchors_t,
+                      grid_height,
+                      grid_width,
+                      max_box_num,
+                      roi_boxes,
+                      roi_scores,
+                      grid_compensate=False):
+
+    proposal = torch.where(region[..., coords_and_conf_num:] > threshold)
+    proposal = check_and_pick_max_box_num(region, proposal, max_box_num, coords_and_conf_num)
+    gh_idxs, gw_idxs, box_idxs, cls_idxs = proposal[0],\
+        proposal[1],\
+        proposal[2],\
+        proposal[3]
+    proposal_class, num_proposal_class = torch.unique(cls_idxs, return_counts=True)
+    total_class_num = proposal_class.numel()
+    start_ps = torch.cumsum(num_proposal_class, dim=0) - num_proposal_class
+    end_ps = torch.cumsum(num_proposal_class, dim=0)
+    for t in range(total_class_num):
+        idx = torch.where(cls_idxs == proposal_class[t])
+        tx = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 0]
+        ty = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 1]
+        tw = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 2]
+        th = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 3]
+
+        if grid_compensate and grid_height % 2 == 0 and grid_width % 2 == 0:
+            x = (gw_idxs[idx] - 0.5 + torch.sigmoid(tx)) / grid_width
+            y = (gh_idxs[idx] - 0.5 + torch.sigmoid(ty)) / grid_height
+
+        else:
+            x = (gw_idxs[idx] + torch.sigmoid(tx)) / grid_width
+            y = (gh_idxs[idx] + torch.sigmoid(ty)) / grid_height
+        w = anchors_t[2*box_idxs[idx] + 0] * torch.exp(tw) / grid_width
+        h = anchors_t[2*box_idxs[idx] + 1] * torch.exp(th) / grid_height
+
+        ymin = torch.clamp(y - h / 2., 0., 1.)
+        xmin = torch.clamp(x - w / 2., 0., 1.)
+        ymax = torch.clamp(y + h / 2., 0., 1.)
+        xmax = torch.clamp(x + w / 2., 0., 1.)
+
+        roi_box = torch.stack([ymin, xmin, ymax, xmax], axis=-1)
+        roi_boxes[start_ps[t]:end_ps[t], :] = roi_box
+        roi_scores[start_ps[t]:end_ps[t]] = region[gh_idxs[idx],
+                                                   gw_idxs[idx], box_idxs[idx], coords_and_conf_num+cls_idxs[idx]]
+
+    return roi_boxes, roi_scores, num_proposal_class, proposal_class, total_class_num
+
+
+def loop_get_roi_one_batch_quant(self, region,
+                            threshold,
+                            coords_and_conf_num,  # 5
+                            anchors_t,
+                            xy_sigmoid_t,
+                            wh_exp_t,
+                            grid_col_shift,
+                            grid_row_shift,
+                            grid_h_scale,
+                            grid_h_shift,
+                            grid_w_scale,
+                            grid_w_shift,
+                            anchor_exp_h_shift,
+                            anchor_exp_w_shift,
+                            max_box_num,
+                            roi_boxes,
+                            roi_scores,
+                            xy_in_bits=8,
+                            wh_in_bits=8):
+    xy_sigmoid_lut = xy_sigmoid_t.betensor
+    xy_in_is_signed = True
+    xy_out_is_signed = is_signed(xy_sigmoid_t.dtype)
+    xy_out_bits = dtype2bits(xy_sigmoid_t.dtype)
+
+    wh_exp_lut = wh_exp_t.betensor
+    wh_in_is_signed = True
+    wh_out_is_signed = is_signed(wh_exp_t.dtype)
+    wh_out_bits = dtype2bits(wh_exp_t.dtype)
+
+    proposal = torch.where(region[..., coords_and_conf_num:] > threshold)
+    proposal = check_and_pick_max_box_num(region, proposal, max_box_num, coords_and_conf_num)
+    gh_idxs, gw_idxs, box_idxs, cls_idxs = proposal[0], \
+        proposal[1], \
+        proposal[2], \
+        proposal[3]
+
+    proposal_class, num_proposal_class = torch.unique(cls_idxs, return_counts=True)
+    total_class_num = proposal_class.numel()
+    start_ps = torch.cumsum(num_proposal_class, dim=0) - num_proposal_class
+    end_ps = torch.cumsum(num_proposal_class, dim=0)
+    for t in range(total_class_num):
+        idx = torch.where(cls_idxs == proposal_class[t])
+        tx = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 0]
+        ty = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 1]
+        tw = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 2]
+        th = region[gh_idxs[idx], gw_idxs[idx], box_idxs[idx], 3]
+
+        x_lut = lookup_lut_powerof2(tx, xy_sigmoid_lut, xy_in_bits, xy_in_is_signed,
+                                    xy_out_bits, xy_out_is_signed).int()
+        y_lut = lookup_lut_powerof2(ty, xy_sigmoid_lut, xy_in_bits, xy_in_is_signed,
+                                    xy_out_bits, xy_out_is_signed).int()
+        w_lut = lookup_lut_powerof2(tw, wh_exp_lut, wh_in_bits, wh_in_is_signed, wh_out_bits, wh_out_is_signed).int()
+        h_lut = lookup_lut_powerof2(th, wh_exp_lut, wh_in_bits, wh_in_is_signed, wh_out_bits, wh_out_is_signed).int()
+
+        x = (gw_idxs[idx] << grid_col_shift).int() + x_lut.int()
+        x = (x * grid_w_scale).int() >> grid_w_shift
+        y = (gh_idxs[idx] << grid_row_shift).int() + y_lut.int()
+        y = (y * grid_h_scale).int() >> grid_h_shift
+
+        wh_exp_h_shift = self.get_param('wh_exp_shift')
+        wh_exp_h_scale = self.get_param('wh_exp_scale')
+        w1 = (anchors_t[(2*box_idxs[idx].long() + 0)] * grid_w_scale).int() >> grid_w_shift
+        # w2 = wh_exp_lut[tw.long() + 128].int()*wh_exp_h_scale>>wh_exp_h_shift
+        w2 = w_lut*wh_exp_h_scale >> wh_exp_h_shift
+        w = (w1 * w2).int() >> anchor_exp_w_shift
+
+        h1 = (anchors_t[(2*box_idxs[idx].long() + 1)] * grid_h_scale).int() >> grid_h_shift
+        # h2 = wh_exp_lut[th.long() + 128].int()*wh_exp_h_scale>>wh_exp_h_shift
+        h2 = h_lut * wh_exp_h_scale >> wh_exp_h_shift
+        h = (h1 * h2).int() >> anchor_exp_h_shift
+
+        ymin = torch.clamp(y - (h >> 1), 0, 2**grid_row_shift)
+        xmin = torch.clamp(x - (w >> 1), 0, 2**grid_col_shift)
+        ymax = torch.clamp(y + (h >> 1), 0, 2**grid_row_shift)
+        xmax = torch.clamp(x + (w >> 1), 0, 2**grid_col_shift)
+        roi_box = torch.stack([ymin, xmin, ymax, xmax], axis=-1)
+        roi_boxes[start_ps[t]:end_ps[t], :] = roi_box
+        roi_scores[start_ps[t]:end_ps[t]] = region[gh_idxs[idx], gw_idxs[idx],
+                                                   box_idxs[idx], coords_and_conf_num+cls_idxs[idx]].int()
+    return roi_boxes, roi_scores, num_proposal_class, proposal_class, total_class_num
+
+
+ANCHORS = [1.3221, 1.73145, 3.19275, 4.00944, 5.05587, 8.09892, 9.47112, 4.84053, 11.2364, 10.0071]
+
+
+@pytest.mark.parametrize("thresh, max_box_num", [(0.6, 5000), (0.2, 5000), (1.1, 5000)])
+@pytest.mark.parametrize("grid_compensate", [False, True])
+def test_get_roi_one_batch(thresh, max_box_num, grid_compensate):
+    torch.manual_seed(0)
+    region = torch.randn(8, 8, 5, 25)
+    region[..., 5:] = torch.rand(8, 8, 5, 20)
+    anchors_t = torch.tensor(ANCHORS)
+    outs = []
+    for fn in [get_roi_one_batch, loop_get_roi_one_batch]:
+        roi_boxes = torch.zeros([max_box_num, 4])
+        roi_scores = torch.zeros([max_box_num])
+        outs.append(fn(region, thresh, 5, anchors_t, 8, 8, max_box_num, roi_boxes, roi_scores, grid_compensate))
+    # exp and sigmoid of different lengths may differ in the last bit
+    assert torch.allclose(outs[0][0], outs[1][0], rtol=0, atol=1e-6)
+    for o, r in zip(outs[0][1:4], outs[1][1:4]):
+        assert torch.equal(o, r)
+    assert outs[0][4] == outs[1][4]
+
+
+@pytest.mark.parametrize("thresh, max_box_num", [(150, 5000), (40, 5000), (300, 5000)])
+def test_get_roi_one_batch_quant(thresh, max_box_num):
+    torch.manual_seed(0)
+    node = PyNode('region', OpType.Region)
+    node.params['wh_exp_shift'] = 12
+    node.params['wh_exp_scale'] = 4100
+    xy_sigmoid_t = PyTensor('xy_sigmoid_lut', torch.randint(0, 2 ** 15, (256,)).sort()[0].numpy())
+    xy_sigmoid_t.dtype = Dtype.INT16
+    wh_exp_t = PyTensor('wh_exp_lut', torch.randint(0, 2 ** 15, (256,)).sort()[0].numpy())
+    wh_exp_t.dtype = Dtype.INT16
+    region = torch.randint(-128, 128, (8, 8, 5, 25))
+    region[..., 5:] = torch.randint(0, 256, (8, 8, 5, 20))
+    anchors_t = (torch.tensor(ANCHORS) * 256).round()
+    outs = []
+    for fn in [get_roi_one_batch_quant, loop_get_roi_one_batch_quant]:
+        roi_boxes = torch.zeros([max_box_num, 4])
+        roi_scores = torch.zeros([max_box_num])
+        outs.append(fn(node, region, thresh, 5, anchors_t, xy_sigmoid_t, wh_exp_t, 15, 15,
+                       5041, 12, 5041, 12, 13, 13, max_box_num, roi_boxes, roi_scores))
+    for o, r in zip(outs[0][:4], outs[1][:4]):
+        assert torch.equal(o, r)
+    assert outs[0][4] == outs[1][4]
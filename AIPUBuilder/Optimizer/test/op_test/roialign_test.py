@@ -0,0 +1,514 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import math
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.roialign import local_float_roi_align, quant_roi_align, quant_roi_align_with_zero_sample  # noqa
+from AIPUBuilder.Optimizer.logger import OPT_ERROR, OPT_WARN  # noqa
+
+
+# the per-roi loop implementations which the vectorized ones must reproduce exactly
+
+def loop_float_roi_align(fm, rois, params):
+    out_height, out_width = params['output_size']
+    spatial_y, spatial_x = params['spatial_scale']
+    h_sample_ratio, w_sample_ratio = params['sample_ratio']
+    method = params['method'].lower()
+    is_half_pixel = params['is_half_pixel']
+
+    # nhwc
+    in_height, in_width, in_depth = fm.shape[1:]
+    roi_num = rois.shape[0]
+    dev = fm.device
+    output_shape = [roi_num, out_height, out_width, fm.shape[-1]]
+    out = torch.zeros(*output_shape)
+    half_pixel_offset = 0.5 if is_half_pixel else 0.
+    for r in range(roi_num):
+        batch_idx = rois[r, 0]
+        if batch_idx < 0:
+            OPT_WARN(f"RoiAlign layer: the batch_index of box_id={r} is {batch_idx} < 0.")
+            continue
+        if batch_idx > fm.shape[0] - 1:
+            OPT_ERROR(f"RoiAlign layer: batch_index={batch_idx} should be < the featuremap batch_size={fm.shape[0]}")
+            continue
+
+        batch_base = torch.flatten(fm[batch_idx.long()])
+        w_roi_start = rois[r, 2] * spatial_x - half_pixel_offset
+        w_roi_end = rois[r, 4] * spatial_x - half_pixel_offset
+        h_roi_start = rois[r, 1] * spatial_y - half_pixel_offset
+        h_roi_end = rois[r, 3] * spatial_y - half_pixel_offset
+
+        roi_width = w_roi_end - w_roi_start
+        roi_height = h_roi_end - h_roi_start
+        if not is_half_pixel:
+            roi_width = torch.maximum((roi_width), torch.tensor(1.0, device=dev))
+            roi_height = torch.maximum((roi_height), torch.tensor(1.0, device=dev))
+
+        w_step_size = roi_width / out_width
+        h_step_size = roi_height / out_height
+
+        # if sampling_ratio=0, use adaptive value of ceil(roi_width/out_width), same for height
+        w_sampling_ratio = w_sample_ratio if w_sample_ratio > 0 else int(math.ceil(w_step_size))
+        h_sampling_ratio = h_sample_ratio if h_sample_ratio > 0 else int(math.ceil(h_step_size))
+
+        w_bin_size = w_step_size / w_sampling_ratio
+        h_bin_size = h_step_size / h_sampling_ratio
+
+        for i in range(out_height):
+            for j in range(out_width):
+                w_start = w_step_size * j + w_roi_start
+                w_end = w_step_size * (j + 1) + w_roi_start
+                h_start = h_step_size * i + h_roi_start
+                h_end = h_step_size * (i + 1) + h_roi_start
+
+                if method == 'avg':
+                    out_k = torch.zeros(in_depth, device=dev)
+                else:  # method == max
+                    out_k = torch.full([in_depth], torch.finfo(torch.float32).min)
+                for y_ind in range(h_sampling_ratio):
+                    y = h_start + h_bin_size / 2 + h_bin_size * y_ind
+                    for x_ind in range(w_sampling_ratio):
+
+                        x = w_start + w_bin_size / 2 + w_bin_size * x_ind
+
+                        if y < -1.0 or y > in_height or x < -1.0 or x > in_width:
+                            ws = [0., 0., 0., 0.]
+                            offset = [0, 0, 0, 0]
+                        else:
+                            y = torch.minimum(torch.maximum(y, torch.tensor(0., device=dev)),
+                                              torch.tensor(in_height - 1, dtype=torch.float32, device=dev))
+                            x = torch.minimum(torch.maximum(x, torch.tensor(0., device=dev)),
+                                              torch.tensor(in_width - 1, dtype=torch.float32, device=dev))
+                            x_low = torch.floor(x)
+                            y_low = torch.floor(y)
+                            x_high = torch.minimum((x_low + 1), torch.tensor(in_width - 1, device=dev))
+                            y_high = torch.minimum((y_low + 1), torch.tensor(in_height - 1, device=dev))
+                            dx1 = x - x_low
+                            dy1 = y - y_low
+                            dx2 = 1. - dx1
+                            dy2 = 1. - dy1
+
+                            ws = [dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1]
+                            offset = [y_low * in_width * in_depth + x_low * in_depth,
+                                      y_low * in_width * in_depth + x_high * in_depth,
+                                      y_high * in_width * in_depth + x_low * in_depth,
+                                      y_high * in_width * in_depth + x_high * in_depth
+                                      ]
+                            offset = [o.long() for o in offset]
+                        for k in range(in_depth):
+                            if method == 'avg':
+                                interpolation = 0
+                                for c in range(4):
+                                    interpolation += ws[c] * batch_base[offset[c] + k]
+                                out_k[k] += interpolation
+                            else:  # max
+                                max_4points = torch.max(torch.tensor([ws[0] * batch_base[offset[0] + k],
+                                                                      ws[1] * batch_base[offset[1] + k],
+                                                                      ws[2] * batch_base[offset[2] + k],
+                                                                      ws[3] * batch_base[offset[3] + k],
+                                                                      ]))
+                                out_k[k] = torch.maximum(out_k[k], max_4points)
+
+                if method == 'avg':
+                    out_k = out_k / (w_sampling_ratio * h_sampling_ratio)
+                else:  # max
+                    pass
+                out[r, i, j, :] = out_k
+    return out.to(dev)
+
+
+def loop_quant_roi_align_with_zero_sample(fm, rois, method, is_half_pixel, pooled_shape, sample, spatial, spatial_shift,
+                                     scale_shift_pairs, o_qmin, o_qmax):
+    out_h, out_w = pooled_shape
+    h_sample, w_sample = sample
+    spatial_y, spatial_x = spatial
+    roi_num = rois.shape[0]
+    _, fm_height, fm_width, fm_channel = fm.shape[:]
+    do_scale, do_shift = scale_shift_pairs['total_scale_shift']
+    input1_scale, input1_shift = scale_shift_pairs['roi_scale_shift']
+    total_shift = do_shift + spatial_shift
+    half_pixel_offset = 2 ** (spatial_shift - 1) if is_half_pixel else 0  # 0.5 * 2 ** spatial_shift
+    dev = fm.device
+
+    out = torch.zeros([roi_num, out_h, out_w, fm_channel], device=dev)
+    for box_idx in range(roi_num):
+        batch_idx = rois[box_idx, 0]
+        if batch_idx < 0:
+            OPT_WARN(f"RoiAlign layer: the batch_index of box_id={box_idx} is {batch_idx} < 0.")
+            continue
+
+        if batch_idx > fm.shape[0] - 1:
+            OPT_ERROR(f"RoiAlign layer: batch_index={batch_idx} should be < the featuremap batch_size={fm.shape[0]}")
+            continue
+
+        y_start = (rois[box_idx, 1] * spatial_y * input1_scale * (0.5 ** input1_shift)).int() - half_pixel_offset
+        x_start = (rois[box_idx, 2] * spatial_x * input1_scale * (0.5 ** input1_shift)).int() - half_pixel_offset
+        y_end = (rois[box_idx, 3] * spatial_y * input1_scale * (0.5 ** input1_shift)).int() - half_pixel_offset
+        x_end = (rois[box_idx, 4] * spatial_x * input1_scale * (0.5 ** input1_shift)).int() - half_pixel_offset
+        data = fm[batch_idx.long()].reshape(-1).double()
+        # 2. Region out of bound:   || x1|x2 > inWidth || y1|y2 > inHeight
+        if (x_end < x_start) | (y_end < y_start):
+            continue
+        if ((x_end.item() > (fm_width * (2 ** spatial_shift))) or (y_end.item() > (fm_height * (2 ** spatial_shift)))):
+            continue
+        if is_half_pixel:
+            roi_width = x_end - x_start
+            roi_height = y_end - y_start
+        else:
+            roi_width = torch.maximum(x_end - x_start, torch.tensor(2 ** spatial_shift, device=dev))
+            roi_height = torch.maximum(y_end - y_start, torch.tensor(2 ** spatial_shift, device=dev))
+        w_step_size = torch.div(roi_width, out_w * (2 ** spatial_shift), rounding_mode='trunc').long()
+        h_step_size = torch.div(roi_height, out_h * (2 ** spatial_shift), rounding_mode='trunc').long()
+        w_step_size_mod = roi_width - w_step_size * (out_w * 2 ** spatial_shift)
+        h_step_size_mod = roi_height - h_step_size * (out_h * 2 ** spatial_shift)
+        if w_sample > 0:
+            w_sample_ratio = w_sample
+        else:
+            if w_step_size_mod > 0:
+                w_sample_ratio = w_step_size + 1
+            else:
+                w_sample_ratio = w_step_size
+        if h_sample > 0:
+            h_sample_ratio = h_sample
+        else:
+            if h_step_size_mod > 0:
+                h_sample_ratio = h_step_size + 1
+            else:
+                h_sample_ratio = h_step_size
+        num_sample_points = w_sample_ratio * h_sample_ratio
+
+        w_bin_size = torch.div(w_step_size * out_w * (2 ** spatial_shift) + w_step_size_mod,
+                               w_sample_ratio * out_w * (2 ** spatial_shift), rounding_mode='trunc').int()
+        h_bin_size = torch.div(h_step_size * out_h * (2 ** spatial_shift) + h_step_size_mod,
+                               h_sample_ratio * out_h * (2 ** spatial_shift), rounding_mode='trunc').int()
+        w_bin_size_mod = w_step_size * out_w * (2 ** spatial_shift) + \
+            w_step_size_mod - w_bin_size * w_sample_ratio * out_w * (2 ** spatial_shift)
+        h_bin_size_mod = h_step_size * out_h * (2 ** spatial_shift) + \
+            h_step_size_mod - h_bin_size * h_sample_ratio * out_h * (2 ** spatial_shift)
+
+        for i in range(out_h):
+            for j in range(out_w):
+                w_start = w_step_size * j
+                w_start_mod = w_step_size_mod * j + x_start * out_w
+                h_start = h_step_size * i
+                h_start_mod = h_step_size_mod * i + y_start * out_h
+                if method == 'avg':
+                    outdata_batch = [0] * fm_channel
+                else:
+                    outdata_batch = [-2 ** 31] * fm_channel
+                xscale1 = out_w * w_sample_ratio * (2 ** (spatial_shift + 1))
+                xscale2 = 2 * w_sample_ratio
+                xscale3 = out_w * w_sample_ratio * (2 ** spatial_shift)
+                yscale1 = out_h * h_sample_ratio * (2 ** (spatial_shift + 1))
+                yscale2 = 2 * h_sample_ratio
+                yscale3 = out_h * h_sample_ratio * (2 ** spatial_shift)
+                for yInd in range(h_sample_ratio):
+                    for xInd in range(w_sample_ratio):
+                        x = w_start + w_bin_size * xInd
+                        x_tmp1 = xscale2 * w_start_mod + xscale3 * w_bin_size + w_bin_size_mod + 2 * w_bin_size_mod * xInd
+                        x_tmp2 = torch.div(x_tmp1, xscale1, rounding_mode='trunc')
+                        x1 = int(x + x_tmp2)
+                        x2 = x1 + 1
+                        dx1 = x_tmp1 - x_tmp2 * xscale1  # xscale1
+                        y = h_start + h_bin_size * yInd
+                        y_tmp1 = yscale2 * h_start_mod + yscale3 * h_bin_size + h_bin_size_mod + 2 * h_bin_size_mod * yInd
+                        y_tmp2 = torch.div(y_tmp1, yscale1, rounding_mode='trunc')
+                        y1 = int(y + y_tmp2)
+                        y2 = y1 + 1
+                        dy1 = y_tmp1 - y_tmp2 * yscale1  # yscale1
+
+                        if x1 >= fm_width - 1:
+                            x1 = x2 = fm_width - 1
+                            dx1 = 0
+                        dx2 = xscale1 - dx1
+
+                        if y1 >= fm_height - 1:
+                            y1 = y2 = fm_height - 1
+                            dy1 = 0
+                        dy2 = yscale1 - dy1
+                        if y1 < -1 or y1 > fm_height or x1 < -1 or x1 > fm_width:
+                            ws = [0, 0, 0, 0]
+                            offsets = [0, 0, 0, 0]
+                        else:
+                            if x1 <= 0:
+                                x1, x2 = 0, 1
+                            if y1 <= 0:
+                                y1, y2 = 0, 1
+
+                            # y1 = min(max(y1, 0), fm_height - 1)
+                            # x1 = min(max(x1, 0), fm_width - 1)
+                            # if x1 >= fm_width - 1:
+                            #     x1 = x2 = fm_width - 1
+                            #     dx1 = 0
+                            # dx2 = xscale1 - dx1
+                            # if y1 >= fm_height - 1:
+                            #     y1 = y2 = fm_height - 1
+                            #     dy1 = 0
+                            # dy2 = yscale1 - dy1
+                            dx1 = torch.div(dx1, 2, rounding_mode='trunc')
+                            dx2 = torch.div(dx2, 2, rounding_mode='trunc')
+                            dy1 = torch.div(dy1, 2, rounding_mode='trunc')
+                            dy2 = torch.div(dy2, 2, rounding_mode='trunc')
+                            ws = (dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1)
+                            ws = [(wss * (0.5 ** spatial_shift)).round() for wss in ws]
+                            offsets = (y1 * fm_width * fm_channel + x1 * fm_channel,
+                                       y1 * fm_width * fm_channel + x2 * fm_channel,
+                                       y2 * fm_width * fm_channel + x1 * fm_channel,
+                                       y2 * fm_width * fm_channel + x2 * fm_channel)
+                        for kk in range(fm_channel):
+                            if method == 'avg':
+                                interpolation = 0
+                                for num in range(0, 4):
+                                    interpolation += ws[num] * data[offsets[num] + kk]
+                                outdata_batch[kk] += interpolation
+                            else:  # max
+                                max_4points = max([ws[0] * data[offsets[0] + kk],
+                                                   ws[1] * data[offsets[1] + kk],
+                                                   ws[2] * data[offsets[2] + kk],
+                                                   ws[3] * data[offsets[3] + kk],
+                                                   ])
+                                max_4points = (max_4points * do_scale * (0.5 ** total_shift) / (
+                                    num_sample_points * out_h * out_w)).round()
+                                outdata_batch[kk] = max([outdata_batch[kk], max_4points])
+                if method == 'avg':
+                    for kk in range(fm_channel):
+                        outdata_batch[kk] = (outdata_batch[kk] * do_scale * (0.5 ** total_shift) / (
+                            num_sample_points * num_sample_points * out_h * out_w)).round()
+                else:  # method == 'max'
+                    pass
+                out[box_idx, i, j, :] = torch.round(torch.tensor(outdata_batch))
+    return out.to(fm.device)
+
+
+def loop_quant_roi_align(fm, rois, method, is_half_pixel, pooled_shape, sample, spatial, spatial_shift, scale_shift_pairs,
+                    o_qmin, o_qmax):
+    do_scale, do_shift = scale_shift_pairs['total_scale_shift']
+    out_h_scale, out_h_shift = scale_shift_pairs['out_h_scale_shift']
+    out_w_scale, out_w_shift = scale_shift_pairs['out_w_scale_shift']
+    sample_h_scale_shift = scale_shift_pairs['sample_h_scale_shift']
+    sample_w_scale_shift = scale_shift_pairs['sample_w_scale_shift']
+    roi_scale, roi_shift = scale_shift_pairs['roi_scale_shift']
+
+    half_pixel_offset = 2 ** (spatial_shift - 1) if is_half_pixel else 0  # 0.5 * 2 ** spatial_shift
+    out_h, out_w = pooled_shape
+    sample_h_ratio, sample_w_ratio = sample
+    spatial_y, spatial_x = spatial
+    roi_num = rois.shape[0]
+    _, fm_height, fm_width, fm_channel = fm.shape[:]
+    total_shift = do_shift + spatial_shift
+    dev = fm.device
+    out = torch.zeros([roi_num, out_h, out_w, fm_channel], device=dev)
+    for box_idx in range(roi_num):
+        batch_idx = rois[box_idx, 0]
+        if batch_idx < 0:
+            OPT_WARN(f"RoiAlign layer: the batch_index of box_id={box_idx} is {batch_idx} < 0.")
+            continue
+        if batch_idx > fm.shape[0] - 1:
+            OPT_ERROR(f"RoiAlign layer: batch_index={batch_idx} should be < the featuremap batch_size={fm.shape[0]}")
+            continue
+        # opt impl
+        # y_start = ((rois[box_idx, 1] * spatial_y * roi_scale) >> roi_shift).int() - half_pixel_offset
+        # x_start = ((rois[box_idx, 2] * spatial_x * roi_scale) >> roi_shift).int() - half_pixel_offset
+        # y_end = ((rois[box_idx, 3] * spatial_y * roi_scale) >> roi_shift).int() - half_pixel_offset
+        # x_end = ((rois[box_idx, 4] * spatial_x * roi_scale) >> roi_shift).int() - half_pixel_offset
+        # lib impl
+        y_start = ((rois[box_idx, 1] * roi_scale * 0.5 ** roi_shift).long() * spatial_y) - half_pixel_offset
+        x_start = ((rois[box_idx, 2] * roi_scale * 0.5 ** roi_shift).long() * spatial_x) - half_pixel_offset
+        y_end = ((rois[box_idx, 3] * roi_scale * 0.5 ** roi_shift).long() * spatial_y) - half_pixel_offset
+        x_end = ((rois[box_idx, 4] * roi_scale * 0.5 ** roi_shift).long() * spatial_x) - half_pixel_offset
+
+        if ((x_end < x_start) or (y_end < y_start)):
+            continue
+        if ((x_end.item() > (fm_width * (2 ** spatial_shift))) or (y_end.item() > (fm_height * (2 ** spatial_shift)))):
+            continue
+        data = fm[batch_idx.long()].reshape(-1).double()
+
+        roi_width = x_end - x_start
+        roi_height = y_end - y_start
+        if not is_half_pixel:
+            roi_width = torch.maximum(roi_width, torch.tensor(2 ** spatial_shift, device=dev))
+            roi_height = torch.maximum(roi_height, torch.tensor(2 ** spatial_shift, device=dev))
+        step_size_qw = int(roi_width * out_w_scale / (2 ** out_w_shift))
+        step_size_qh = int(roi_height * out_h_scale / (2 ** out_h_shift))
+        # step_size_w = step_size_qw / spatial_shift
+        # step_size_h = step_size_qh / spatial_shift
+
+        new_sample_h = sample_h_ratio
+        new_sample_w = sample_w_ratio
+        sample_h_scale, sample_h_shift = sample_h_scale_shift
+        real_sample_h_scale = 1
+        real_sample_h_shift = 0
+        sample_w_scale, sample_w_shift = sample_w_scale_shift
+        real_sample_w_scale = 1
+        real_sample_w_shift = 0
+        if sample_h_ratio <= 0:
+            OPT_ERROR(f"optimizer quant forward now does not support sample_h <=0")
+        if sample_w_ratio <= 0:
+            OPT_ERROR(f"optimizer quant forward now does not support sample_w <=0")
+
+        # lib impl
+        wBinSize = int(step_size_qw * sample_w_scale / 2 ** sample_w_shift)
+        hBinSize = int(step_size_qh * sample_h_scale / 2 ** sample_h_shift)
+        for i in range(out_h):
+            for j in range(out_w):
+                h_start = step_size_qh * i + y_start
+                w_start = step_size_qw * j + x_start
+                if method == 'avg':
+                    outdata_batch = [0] * fm_channel
+                else:
+                    outdata_batch = [-2 ** 31] * fm_channel
+
+                for yInd in range(new_sample_h):
+                    for xInd in range(new_sample_w):
+                        # y = h_start + (((2 * yInd + 1) * step_size_qh * sample_h_scale) >> sample_h_shift)
+                        # x = w_start + (((2 * xInd + 1) * step_size_qw * sample_w_scale) >> sample_w_shift)
+                        # lib impl
+                        y = h_start + hBinSize * (2 * yInd + 1)
+                        x = w_start + wBinSize * (2 * xInd + 1)
+
+                        y1 = y >> spatial_shift
+                        y2 = y1 + 1
+                        dy1 = y - (y1 << spatial_shift)
+                        x1 = x >> spatial_shift
+                        x2 = x1 + 1
+                        dx1 = x - (x1 << spatial_shift)
+
+                        if y1 < -1 or y1 > fm_height or x1 < -1 or x1 > fm_width:
+                            ws = [0, 0, 0, 0]
+                            offsets = [0, 0, 0, 0]
+                        else:
+                            y1 = min(max(y1, 0), fm_height - 1)
+                            x1 = min(max(x1, 0), fm_width - 1)
+
+                            if x1 >= fm_width - 1:
+                                x1 = x2 = torch.tensor(fm_width - 1, device=fm.device)
+                                dx1 = torch.tensor(0, device=fm.device)
+                            dx2 = 2 ** spatial_shift - dx1
+
+                            if y1 >= fm_height - 1:
+                                y1 = y2 = torch.tensor(fm_height - 1, device=fm.device)
+                                dy1 = torch.tensor(0, device=fm.device)
+                            dy2 = 2 ** spatial_shift - dy1
+
+                            ws = (dx2 * dy2, dx1 * dy2, dx2 * dy1, dx1 * dy1)
+                            ws = [wss >> spatial_shift for wss in ws]
+                            offsets = (y1 * fm_width * fm_channel + x1 * fm_channel,
+                                       y1 * fm_width * fm_channel + x2 * fm_channel,
+                                       y2 * fm_width * fm_channel + x1 * fm_channel,
+                                       y2 * fm_width * fm_channel + x2 * fm_channel)
+                        for kk in range(fm_channel):
+                            if method == 'avg':
+                                interpolation = 0
+                                for num in range(0, 4):
+                                    interpolation += ws[num] * data[offsets[num] + kk]
+                                outdata_batch[kk] += interpolation
+                            else:  # max
+                                max_4points = max([ws[0] * data[offsets[0] + kk],
+                                                   ws[1] * data[offsets[1] + kk],
+                                                   ws[2] * data[offsets[2] + kk],
+                                                   ws[3] * data[offsets[3] + kk],
+                                                   ])
+                                max_4points = torch.round(max_4points * do_scale / 2 ** total_shift)
+                                outdata_batch[kk] = max([outdata_batch[kk], max_4points])
+                if method == 'avg':
+                    '''
+                    outdata =  outdata / (sample_h * sample_w)
+                    if sample_h and sample_w all > 0:
+                        1/(sample_h*sample_w) has included in do_scale/do_shift
+                    elif sample_h <= 0 and sample_w > 0:
+                        1. /sample_h is from the lut and now use the real_sample_h_scale/real_sample_h_shift. 1./sample_w has included in do_scale/do_shift
+                    elif sample_w <= 0 and sample_h > 0:
+                        1. /sample_w is from the lut and now use the real_sample_w_scale/real_sample_w_shift. 1./sample_h has included in do_scale/do_shift
+                    else: # sample_w <=0 and sample_h <= 0:
+                        all 1./sample_w and 1./sample_h are from the lut, so we use the real_sample_h_scale/real_sample_h_shift, real_sample_w_scale/real_sample_w_shfit
+                    '''
+                    all_shift = do_shift + spatial_shift + real_sample_h_shift + real_sample_w_shift
+                    all_scale = do_scale * real_sample_h_scale * real_sample_w_scale
+                    for kk in range(fm_channel):
+                        outdata_batch[kk] = torch.round((outdata_batch[kk] * all_scale) * 0.5 ** all_shift)
+                else:  # method == 'max'
+                    pass
+
+                # out[box_idx, i, j, :] = torch.clamp(torch.tensor(outdata_batch), o_qmin, o_qmax)
+                out[box_idx, i, j, :] = torch.tensor(outdata_batch)
+    return out.to(fm.device)
+
+
+def random_rois(roi_num, batch, height, width, scale):
+    # boxes of [batch_idx, y0, x0, y1, x1] in the image coordinates, some of them are empty or out of the featuremap
+    y = torch.rand(roi_num, 2) * (height + 2) * scale
+    x = torch.rand(roi_num, 2) * (width + 2) * scale
+    b = torch.randint(0, batch, (roi_num, 1)).float()
+    b[0] = batch  # an invalid batch index
+    return torch.cat([b, y.min(1, keepdim=True)[0], x.min(1, keepdim=True)[0],
+                      y.max(1, keepdim=True)[0], x.max(1, keepdim=True)[0]], dim=1)
+
+
+@pytest.mark.parametrize("method", ['avg', 'max'])
+@pytest.mark.parametrize("is_half_pixel", [True, False])
+@pytest.mark.parametrize("sample_ratio", [[2, 2], [1, 3], [0, 0]])
+@pytest.mark.parametrize("shape", [[2, 9, 13, 5], [1, 1, 6, 3]])
+def test_float_roi_align(method, is_half_pixel, sample_ratio, shape):
+    torch.manual_seed(0)
+    fm = torch.randn(shape)
+    rois = random_rois(17, shape[0], shape[1], shape[2], 4.0)
+    params = {'output_size': [3, 4], 'spatial_scale': [0.25, 0.25], 'sample_ratio': sample_ratio,
+              'method': method, 'is_half_pixel': is_half_pixel}
+    assert torch.equal(local_float_roi_align(fm, rois, params), loop_float_roi_align(fm, rois, params))
+
+
+def quant_params(pooled_shape, sample, spatial_shift):
+    out_h, out_w = pooled_shape
+    sample_h, sample_w = sample
+    return {'total_scale_shift': [23117, 20],
+            'roi_scale_shift': [16384, 18],
+            'out_h_scale_shift': [int(2 ** 15 / out_h), 15],
+            'out_w_scale_shift': [int(2 ** 15 / out_w), 15],
+            'sample_h_scale_shift': [int(2 ** 15 / (2 * max(1, sample_h))), 15],
+            'sample_w_scale_shift': [int(2 ** 15 / (2 * max(1, sample_w))), 15]}
+
+
+@pytest.mark.parametrize("method", ['avg', 'max'])
+@pytest.mark.parametrize("is_half_pixel", [True, False])
+@pytest.mark.parametrize("sample", [[2, 2], [1, 3]])
+@pytest.mark.parametrize("shape", [[2, 9, 13, 5], [1, 2, 6, 3]])
+def test_quant_roi_align(method, is_half_pixel, sample, shape):
+    torch.manual_seed(0)
+    pooled_shape = [3, 4]
+    spatial_shift = 10
+    fm = torch.randint(-128, 128, shape).float()
+    # quantized rois, rois * 16384 / 2**18 are in the image coordinates
+    rois = torch.round(random_rois(17, shape[0], shape[1], shape[2], 4.0 * 16))
+    rois[:, 0] = torch.round(rois[:, 0] / 16)
+    spatial = [256, 256]  # 0.25 * 2**spatial_shift
+    args = (method, is_half_pixel, pooled_shape, sample, spatial, spatial_shift,
+            quant_params(pooled_shape, sample, spatial_shift), -128, 127)
+    assert torch.equal(quant_roi_align(fm, rois, *args), loop_quant_roi_align(fm, rois, *args))
+
+
+@pytest.mark.parametrize("method", ['avg', 'max'])
+@pytest.mark.parametrize("is_half_pixel", [True, False])
+@pytest.mark.parametrize("sample", [[0, 0], [2, 0], [2, 3]])
+@pytest.mark.parametrize("shape", [[2, 9, 13, 5], [1, 2, 6, 3]])
+def test_quant_roi_align_with_zero_sample(method, is_half_pixel, sample, shape):
+    torch.manual_seed(0)
+    pooled_shape = [3, 4]
+    spatial_shift = 10
+    fm = torch.randint(-128, 128, shape).float()
+    rois = torch.round(random_rois(17, shape[0], shape[1], shape[2], 4.0 * 16))
+    rois[:, 0] = torch.round(rois[:, 0] / 16)
+    # the loop implementation can not handle the rois without sample points
+    rois[:, 3] = torch.maximum(rois[:, 3], rois[:, 1] + 64)
+    rois[:, 4] = torch.maximum(rois[:, 4], rois[:, 2] + 64)
+    spatial = [256, 256]
+    args = (method, is_half_pixel, pooled_shape, sample, spatial, spatial_shift,
+            quant_params(pooled_shape, sample, spatial_shift), -128, 127)
+    assert torch.equal(quant_roi_align_with_zero_sample(fm, rois, *args),
+                       loop_quant_roi_align_with_zero_sample(fm, rois, *args))
@@ -0,0 +1,88 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.roipooling import roipooling  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def loop_roipooling(self, *args):
+    out = self.outputs[0].betensor
+    feature = self.inputs[0].betensor
+    nor_box = self.inputs[1].betensor
+
+    resize_height_ = out.shape[1]
+    resize_width_ = out.shape[2]
+    channel_ = out.shape[3]
+    feature_height_, feature_width_ = feature.shape[1:3]
+
+    if not self.quantized:
+        resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_), device=feature.device)
+        # this nor_box has normalized to (0,1)
+        # for batchidx in range(feature.shape[0]):
+        batch_idx = 0
+        for j in range(nor_box.shape[1]):
+            y0 = nor_box[batch_idx, j, 0]*feature_height_/resize_height_
+            y1 = nor_box[batch_idx, j, 2]*feature_height_/resize_height_
+            x0 = nor_box[batch_idx, j, 1]*feature_width_/resize_width_
+            x1 = nor_box[batch_idx, j, 3]*feature_width_/resize_width_
+
+            x = ((resize_width_ * x0 + torch.arange(0, resize_width_, device=out.device) * (x1+1 - x0))).int()
+            y = ((resize_height_ * y0 + torch.arange(0, resize_height_, device=out.device) * (y1+1 - y0))).int()
+            y = torch.clamp(y, 0, feature_height_ - 1)
+            x = torch.clamp(x, 0, feature_width_ - 1)
+            for idxh in range(resize_height_):
+                resize_feature[j, idxh, :, :] = feature[batch_idx, y[idxh].item(), x.long(), :]
+    else:
+        resize_feature = torch.zeros((nor_box.shape[1], resize_height_, resize_width_, channel_))
+        x_index_scale_ = self.get_param('x_index_scale')
+        y_index_scale_ = self.get_param('y_index_scale')
+        x_index_shift_ = self.get_param('x_index_shift')
+        y_index_shift_ = self.get_param('y_index_shift')
+        # for batchidx in range(feature.shape[0]):
+        batch_idx = 0
+        nor_box = torch.clamp(torch.round(nor_box * 255.0) >> 15, 0, 255)
+
+        for j in range(nor_box.shape[1]):
+            y0 = nor_box[batch_idx, j, 0]
+            y1 = nor_box[batch_idx, j, 2]
+            x0 = nor_box[batch_idx, j, 1]
+            x1 = nor_box[batch_idx, j, 3]
+
+            x = ((resize_width_ * x0 + torch.arange(0, resize_width_, device=out.device)
+                 * (x1 - x0 + 1)).int() * (x_index_scale_)) >> x_index_shift_
+            y = ((resize_height_ * y0 + torch.arange(0, resize_height_, device=out.device)
+                 * (y1 - y0 + 1)).int() * (y_index_scale_)) >> y_index_shift_
+            y = torch.clamp(y, 0, feature_height_ - 1)
+            x = torch.clamp(x, 0, feature_width_ - 1)
+            for idxh in range(resize_height_):
+                resize_feature[j, idxh, :, :] = feature[batch_idx, y[idxh].long(), x.long(), :]
+
+    self.outputs[0].betensor = resize_feature
+    return resize_feature
+
+
+def roipool_node(box_num, resize, channel, seed):
+    g = torch.Generator().manual_seed(seed)
+    node = PyNode('roi_pool', OpType.ROIPooling)
+    node.add_input(PyTensor('feature', torch.randn([1, 19, 23, channel], generator=g).numpy()))
+    node.add_input(PyTensor('nor_box', torch.rand([1, box_num, 4], generator=g).numpy()))
+    node.add_output(PyTensor('out', torch.zeros([box_num, resize[0], resize[1], channel]).numpy()))
+    return node
+
+
+@pytest.mark.parametrize("resize", [[14, 14], [3, 5]])
+@pytest.mark.parametrize("box_num", [1, 40])
+def test_roipooling(resize, box_num):
+    node = roipool_node(box_num, resize, 6, 0)
+    out = roipooling(node)
+    ref = loop_roipooling(node)
+    assert torch.equal(out, ref)
@@ -0,0 +1,149 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.scatter_elements import *  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def loop_ScatterElements(self):
+    data = self.inputs[0].betensor  # .reshape(list(self.inputs[0].ir_shape))  # data
+    indices = self.inputs[1].betensor.to(torch.long)  # .reshape(list(self.inputs[1].ir_shape))  # indx
+    updates = self.inputs[2].betensor  # .reshape(list(self.inputs[2].ir_shape))  # update
+    out = self.outputs[0]
+    reduce_method = self.get_param('reduction', optional=False, default_value='NONE').upper()  # NONE/ADD/MUL
+    if reduce_method not in ['NONE', 'ADD', 'MUL', 'MIN', 'MAX']:
+        OPT_ERROR('Scatter_Elements dont support method:%s' % reduce_method)
+
+    axis = self.get_param('axis', optional=False, default_value=0)  # [-s, s-1]
+    if not -len(self.inputs[0].ir_shape) <= axis <= len(self.inputs[0].ir_shape)-1:
+        OPT_ERROR('Scatter_Elements dont support axis:%s' % axis)
+
+    # to adjust negative index
+    max_idx = self.inputs[0].ir_shape[axis]
+    indices = torch.where(indices < 0, indices + max_idx, indices)
+    indices = torch.clamp(indices, 0, max_idx - 1)
+
+    if len(self.placeholders) < 1:
+        ph0 = PyTensor(self.name+"/tmp_s", torch.tensor(0.).cpu().numpy().astype(dtype2nptype(Dtype.FP32)))
+        self.placeholders.append(ph0)
+
+    if self.quantized:
+        if reduce_method == 'MUL':
+            scale = self.params['scale_value']
+            shift = self.params['shift_value']
+            output_signed = is_signed(self.outputs[0].dtype)
+            qmin, qmax = bits2range(16, output_signed)
+            data = linear_requantize(data + self.inputs[0].zerop, scale[0], shift[0], 0, qmin, qmax).int()
+            updates += self.inputs[2].zerop
+            idx, updates_idx = get_src_indices_and_update_indices(indices.cpu().numpy(), axis)
+
+            scattered = data.clone().int()
+            idx_dict = {}
+            for iter, idx_set in enumerate(idx):
+                scattered[idx_set] *= (updates[updates_idx[iter]].int())
+                scattered[idx_set], left_shift = convert_less_mbit(scattered[idx_set], qmin, qmax)
+                scattered[idx_set] = (scattered[idx_set] * scale[1]) >> (shift[1] - left_shift)
+            #     if idx_set not in idx_dict.keys():
+            #         idx_dict[idx_set] = shift[1] - left_shift
+            #     else:
+            #         idx_dict[idx_set] += (shift[1] - left_shift)
+            # for key in idx_dict.keys():
+            #     scattered[key] = linear_requantize(scattered[key], 1, idx_dict[key], 0, qmin, qmax)#(scattered[idx_set] * scale[1]) >> (shift[1] - left_shift)
+            output = torch.clamp(scattered, self.outputs[0].qmin, self.outputs[0].qmax)
+
+        else:
+            shift, shift0, shift1 = self.params['shift_value'], 0, 0
+            scale, scale0, scale1 = self.params["scale_value"]
+            if is_signed(self.outputs[0].dtype):
+                inner_min = -2 ** (self.inputs[0].qbits + self.inputs[2].qbits-1)
+                inner_max = 2 ** (self.inputs[0].qbits + self.inputs[2].qbits-1) - 1
+            else:
+                inner_min = 0
+                inner_max = 2 ** (self.inputs[0].qbits + self.inputs[2].qbits) - 1
+
+            data = linear_requantize(data + self.inputs[0].zerop, scale0, shift0, 0, inner_min, inner_max)
+            updates = linear_requantize(updates + self.inputs[2].zerop, scale1, shift1, 0, inner_min, inner_max)
+            data = data.to(updates.dtype)
+
+            if reduce_method == 'ADD':
+                output = data.clone().scatter_(axis, indices, updates, reduce='add')
+
+            elif reduce_method == 'NONE':
+                output = data.clone().scatter_(axis, indices, updates)
+
+            elif reduce_method in ['MIN', 'MAX']:
+                output = data.clone().scatter_reduce(axis, indices, updates, reduce='a'+reduce_method.lower(), include_self=True)
+
+            output = linear_requantize(output, scale, shift, out.zerop, out.qmin, out.qmax)
+
+    else:
+        data = data.to(updates.dtype)
+        if reduce_method == 'ADD':
+            output = data.clone().scatter_(axis, indices, updates, reduce='add')
+        elif reduce_method == 'MUL':
+            output = data.clone().scatter_(axis, indices, updates, reduce='multiply')
+        elif reduce_method == 'NONE':
+            output = data.clone().scatter_(axis, indices, updates)  # NONE dont need param 'reduce'
+        elif reduce_method in ['MIN', 'MAX']:
+            output = data.clone().scatter_reduce(axis, indices, updates, reduce='a'+reduce_method.lower(), include_self=True)
+
+    out.betensor = output
+    return out.betensor
+
+
+def scatter_elements_node(data_shape, indice_shape, axis, reduction, dtype=None):
+    quantized = dtype is not None
+    indice = torch.randint(-data_shape[axis], data_shape[axis], indice_shape)
+    if quantized:
+        qmin, qmax = bits2range(dtype2bits(dtype), True)
+        data = torch.randint(qmin, qmax + 1, data_shape).float()
+        updates = torch.randint(qmin, qmax + 1, indice_shape).float()
+    else:
+        data = torch.randn(data_shape)
+        updates = torch.randn(indice_shape)
+    node = PyNode('scatter_elements', OpType.ScatterElements)
+    node.add_input(PyTensor('data', data, dtype if quantized else Dtype.FP32))
+    node.add_input(PyTensor('indice', indice, Dtype.INT32))
+    node.add_input(PyTensor('updates', updates, dtype if quantized else Dtype.FP32))
+    node.add_output(PyTensor('out', TensorShape(list(data_shape)), dtype if quantized else Dtype.FP32))
+    node.params['reduction'] = reduction
+    node.params['axis'] = axis
+    node.quantized = quantized
+    if quantized:
+        out = node.outputs[0]
+        out.qbits = dtype2bits(dtype)
+        out.qmin, out.qmax = bits2range(out.qbits, True)
+        out.zerop = 2
+        node.inputs[0].zerop = -3
+        node.inputs[2].zerop = 5
+        node.params['scale_value'] = [12345, 9876]
+        node.params['shift_value'] = [14, 13]
+    return node
+
+
+@pytest.mark.parametrize("data_shape, indice_shape, axis", [
+    ((16, 17), (16, 17), 0),
+    ((4, 4, 4), (2, 4, 3), 1),
+    ((4, 5, 6), (4, 5, 9), 2),
+])
+@pytest.mark.parametrize("dtype", [None, Dtype.INT8, Dtype.INT16])
+def test_scatter_elements_mul(data_shape, indice_shape, axis, dtype):
+    torch.manual_seed(0)
+    node = scatter_elements_node(data_shape, indice_shape, axis, 'MUL', dtype)
+    inputs = [inp.betensor.clone() for inp in node.inputs]
+    out = ScatterElements(node).clone()
+    for inp, ref_inp in zip(node.inputs, inputs):
+        assert torch.equal(inp.betensor, ref_inp)
+    ref = loop_ScatterElements(node)
+    assert out.dtype == ref.dtype
+    assert torch.equal(out, ref)
+    assert out.unique().numel() > 2
@@ -0,0 +1,148 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.scatter_nd import ScatterND  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def loop_ScatterND(self):
+    dev = self.inputs[0].betensor.device
+    data = self.inputs[0].betensor.cpu()
+    indices = self.inputs[1].betensor.to(torch.long).cpu()
+    updates = self.inputs[2].betensor.cpu()
+    out = self.outputs[0]
+    reduce_method = self.get_param('reduction', optional=False, default_value='NONE').upper()  # NONE/ADD/MUL
+    qbits = self.outputs[0].qbits
+    if self.quantized:
+        scale, scale0, scale1 = self.params["scale_value"]
+
+        if is_signed(self.outputs[0].dtype):
+            inner_min, inner_max = -2 ** 31, 2**31 - 1
+        else:
+            inner_min, inner_max = 0, 2**32 - 1
+
+        if reduce_method == 'MUL':
+            shift, _, shift_ = self.params['shift_value']
+        else:
+            shift = self.params['shift_value']
+        data = (data + self.inputs[0].zerop.to(data.device)) * scale0
+        updates = (updates + self.inputs[2].zerop.to(updates.device)) * scale1
+
+    output = torch.clone(data)
+    c = [torch.arange(s) for s in indices.shape[:-1]]
+    idxs = torch.cartesian_prod(*c) if len(indices.shape) > 1 else [()]
+
+    if len(self.placeholders) < 1:
+        ph0 = PyTensor(self.name+"/tmp_s", torch.tensor(0.).cpu().numpy().astype(dtype2nptype(Dtype.FP32)))
+        self.placeholders.append(ph0)
+
+    #  scatternd allow add/mul index duplicate
+    method = {
+        "ADD": lambda a, b: a + b,
+        "MAX": lambda a, b: torch.max(a, b),
+        "MIN": lambda a, b: torch.min(a, b),
+        'NONE': lambda a, b: b,
+    }
+
+    def get_valid_idxx(indices, idx, shape):
+        idxx = indices[idx]
+        max_idxx = torch.tensor(shape, device=indices.device)[:idxx.numel()]
+        invalid_idxx = idxx >= max_idxx
+        idxx[invalid_idxx] = max_idxx[invalid_idxx] - 1
+        idxx = list(idxx)
+        return idxx
+
+    if reduce_method in ['ADD', 'MIN', 'MAX', 'NONE']:
+        for idx in idxs:
+            if idx != ():
+                idx = list(idx) if len(idx.shape) >= 1 else int(idx)
+            idxx = get_valid_idxx(indices, idx, output.shape)
+            output[idxx] = method[reduce_method](output[idxx], updates[idx])
+            if self.quantized:
+                output[idxx] = torch.clamp(output[idxx].long(), inner_min, inner_max)
+    if reduce_method == 'MUL':
+        if self.quantized:
+            for idx in idxs:
+                if idx != ():
+                    idx = list(idx) if len(idx.shape) >= 1 else int(idx)
+                idxx = get_valid_idxx(indices, idx, output.shape)
+                if qbits <= 8:
+                    output[idxx] = linear_requantize(output[idxx] * updates[idx], 1, shift_, 0, inner_min, inner_max)
+                else:  # rounding at 16+bit is much slower than shift
+                    output[idxx] = linear_requantize_floor(
+                        output[idxx] * updates[idx], 1, shift_, 0, inner_min, inner_max)
+        else:
+            for idx in idxs:
+                if idx != ():
+                    idx = list(idx) if len(idx.shape) >= 1 else int(idx)
+                idxx = get_valid_idxx(indices, idx, output.shape)
+                output[idxx] = output[idxx] * updates[idx]
+    if self.quantized:
+        if qbits <= 8:
+            output = linear_requantize(output, scale, shift, out.zerop.to(output.device), out.qmin, out.qmax)
+        else:  # rounding at 16+bit is much slower than shift
+            output = linear_requantize_floor(output, scale, shift, out.zerop.to(output.device), out.qmin, out.qmax)
+    out.betensor = output.to(dev)
+    return out.betensor
+
+
+def scatter_nd_node(data_shape, indice_shape, reduction, dtype=None):
+    quantized = dtype is not None
+    index_depth = indice_shape[-1]
+    updates_shape = indice_shape[:-1] + data_shape[index_depth:]
+    # few distinct indice, so that there are many duplicated indice, some of them are out of range
+    indice = [torch.randint(-1, min(s, 3) + 1, indice_shape[:-1] + (1,)) for s in data_shape[:index_depth]]
+    indice = torch.cat(indice, dim=-1)
+    if quantized:
+        qmin, qmax = bits2range(dtype2bits(dtype), True)
+        data = torch.randint(qmin, qmax + 1, data_shape).float()
+        updates = torch.randint(qmin, qmax + 1, updates_shape).float()
+    else:
+        data = torch.randn(data_shape)
+        updates = torch.rand(updates_shape) + 0.5
+    node = PyNode('scatter_nd', OpType.ScatterND)
+    node.add_input(PyTensor('data', data, dtype if quantized else Dtype.FP32))
+    node.add_input(PyTensor('indice', indice, Dtype.INT32))
+    node.add_input(PyTensor('updates', updates, dtype if quantized else Dtype.FP32))
+    node.add_output(PyTensor('out', TensorShape(list(data_shape)), dtype if quantized else Dtype.FP32))
+    node.params['reduction'] = reduction
+    node.quantized = quantized
+    if quantized:
+        out = node.outputs[0]
+        out.qbits = dtype2bits(dtype)
+        out.qmin, out.qmax = bits2range(out.qbits, True)
+        out.zerop = 2
+        node.inputs[0].zerop = -3
+        node.inputs[2].zerop = 5
+        node.params['scale_value'] = [181, 97, 113]
+        node.params['shift_value'] = [13, 0, 7] if reduction == 'MUL' else 14
+    return node
+
+
+@pytest.mark.parametrize("data_shape, indice_shape", [
+    ((4, 4, 10, 10), (2, 1)),
+    ((4, 4, 10), (6, 5, 2)),
+    ((5, 3, 4), (40, 3)),
+    ((5, 3), (2,)),
+])
+@pytest.mark.parametrize("reduction", ['NONE', 'ADD', 'MUL', 'MIN', 'MAX'])
+@pytest.mark.parametrize("dtype", [None, Dtype.INT8, Dtype.INT16])
+def test_scatter_nd(data_shape, indice_shape, reduction, dtype):
+    torch.manual_seed(0)
+    node = scatter_nd_node(data_shape, indice_shape, reduction, dtype)
+    inputs = [inp.betensor.clone() for inp in node.inputs]
+    out = ScatterND(node).clone()
+    for inp, ref_inp in zip(node.inputs, inputs):
+        assert torch.equal(inp.betensor, ref_inp)
+    ref = loop_ScatterND(node)
+    assert out.dtype == ref.dtype
+    assert torch.equal(out, ref)
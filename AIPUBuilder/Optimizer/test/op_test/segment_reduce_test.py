@@ -0,0 +1,111 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.segment_reduce import segmentreduce  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def loop_segmentreduce(self):
+    inp0 = self.inputs[0]
+    inp1 = self.inputs[1]
+    method = self.get_param('method').upper()
+    if method not in {"SUM"}:
+        OPT_FATAL("unsupported method: %s for segmentReduce in node:%s" % (method, self.name))
+    input_data = inp0.betensor
+    segment_index = inp1.betensor
+    if self.quantized:
+        input_data = (input_data + inp0.zerop).long()
+        segment_index += inp1.zerop
+    segment_index = segment_index.reshape(-1,).int()
+    index_size = segment_index.numel()
+    # segment_index first dim must equal to input_data first dim currently
+    # so currently set axis is 0, read from floatIR in furture
+    axis = 0
+    input_data_dim = input_data.shape
+    data_dim_axis = input_data.shape[axis]
+    if index_size > data_dim_axis:
+        segment_index = segment_index[:data_dim_axis]
+        OPT_WARN('layer_id=%s, type=%s, index size is more than data %s-th dimension, so intercept the preceding dimensions of index'
+                 % (self.attrs['layer_id'], str(self.type), str(axis)))
+    elif index_size < data_dim_axis:
+        segment_index = torch.nn.functional.pad(
+            segment_index, (0, data_dim_axis-index_size), value=segment_index[-1].item())
+        OPT_WARN('layer_id=%s, type=%s, index size is less than data %s-th dimension, so pad the dimensions of index'
+                 % (self.attrs['layer_id'], str(self.type), str(axis)))
+
+    method_d = {
+        "SUM": torch.sum,
+    }
+    op = method_d[method]
+
+    index_range = (segment_index[-1] + 1).item()
+    zero_dim = list(input_data_dim)
+    zero_dim[axis] = 1
+    zero_value = 0
+    output = None
+    if method == 'SUM':
+        for j in range(index_range):
+            if j in segment_index:
+                j_index = torch.eq(segment_index, j)
+                j_index_range = torch.nonzero(j_index)
+                tmp_data = torch.index_select(input_data, axis, torch.squeeze(j_index_range))
+                tmp_data = op(tmp_data, axis, keepdim=True)
+            else:
+                tmp_data = torch.full((zero_dim), zero_value, device=inp0.betensor.device)
+            output = tmp_data if output == None else torch.cat((output, tmp_data), dim=axis)
+
+    if self.quantized:
+        do_shift = self.params["shift_value"]
+        do_scale = self.params["scale_value"]
+        output = linear_requantize(output, do_scale, do_shift,
+                                   self.outputs[0].zerop, self.outputs[0].qmin, self.outputs[0].qmax)
+
+    self.outputs[0].betensor = output
+    return self.outputs[0].betensor
+
+
+def segment_node(data_shape, segment_index, quantized):
+    node = PyNode('segment_reduce', OpType.SegmentReduce)
+    if quantized:
+        data = torch.randint(-128, 128, data_shape).float()
+    else:
+        data = torch.randn(data_shape)
+    node.add_input(PyTensor('data', data, Dtype.INT8 if quantized else Dtype.FP32))
+    node.add_input(PyTensor('segment_ids', segment_index, Dtype.INT32))
+    node.add_output(PyTensor('out', TensorShape(list(data_shape)), Dtype.INT8 if quantized else Dtype.FP32))
+    node.params['method'] = 'SUM'
+    node.attrs['layer_id'] = '0'
+    node.quantized = quantized
+    if quantized:
+        node.inputs[0].zerop = 3
+        node.outputs[0].zerop = -1
+        node.outputs[0].qmin, node.outputs[0].qmax = -128, 127
+        node.params['scale_value'] = 23456
+        node.params['shift_value'] = 18
+    return node
+
+
+@pytest.mark.parametrize("data_shape, segment_index", [
+    ((9,), [0, 0, 0, 2, 4, 7, 8, 9, 10]),
+    ((5, 1, 2, 3), [0, 0, 1, 1, 1]),
+    ((40, 7, 3), sorted(torch.randint(0, 12, (40,)).tolist())),
+    ((40, 6), torch.randint(0, 7, (40,)).tolist()),
+    ((12, 5), [0, 1, 1, 3, 3, 3, 3, 3, 3, 6]),
+])
+@pytest.mark.parametrize("quantized", [False, True])
+def test_segment_reduce(data_shape, segment_index, quantized):
+    torch.manual_seed(0)
+    node = segment_node(data_shape, torch.tensor(segment_index), quantized)
+    out = segmentreduce(node).clone()
+    ref = loop_segmentreduce(node)
+    assert out.dtype == ref.dtype
+    assert torch.equal(out, ref)
@@ -0,0 +1,108 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import pytest
+
+import sys
+import os
+PKG_DIR = os.path.join(os.path.dirname(__file__), "../../../../")
+sys.path.insert(0, PKG_DIR)
+
+from AIPUBuilder.Optimizer.ops.unique import unique_forward  # noqa
+from AIPUBuilder.Optimizer.framework import *  # noqa
+from AIPUBuilder.Optimizer.utils import *  # noqa
+
+
+def find_index(candidate_y, f_value):
+    if isinstance(f_value, torch.Tensor):
+        for idx, ele in enumerate(candidate_y):
+            if (f_value == ele).all():
+                return idx
+        return -1
+    else:
+        return candidate_y.index(f_value) if f_value in candidate_y else -1
+
+
+def loop_unique_forward(self, *args):
+    need_sort = self.get_param('sorted', optional=True, default_value=True)
+    axis = self.get_param('axis', optional=True, default_value=None)
+    if isinstance(axis, str):
+        if axis.upper() != 'NONE':
+            OPT_WARN(f"{self}: axis only support int or None, please check! Now we set axis is None")
+        axis = None
+    inp = self.inputs[0].betensor
+    if need_sort:
+        y, inverse_indices, counts = torch.unique(inp, sorted=True, return_inverse=True, return_counts=True, dim=axis)
+        inverse_indices = inverse_indices.flatten()
+        if axis is None:
+            count = y.numel()
+        else:
+            count = y.shape[axis]
+        indices = []
+        for i in range(count):
+            index = torch.nonzero(inverse_indices == i)[0].item()
+            indices.append(index)
+        indices = torch.tensor(indices, device=inp.device)
+    else:
+        from collections import defaultdict
+        y = []
+        indices = []
+        inverse_indices = []
+        counts_dict = defaultdict(int)
+        if axis is None:
+            input_chunk = torch.flatten(inp).tolist()
+        else:
+            input_chunk = []
+            for idx in range(inp.shape[axis]):
+                t = torch.index_select(inp, axis, torch.tensor(idx, device=inp.device))
+                input_chunk.append(t)
+        for idx, ele in enumerate(input_chunk):
+            f_index = find_index(y, ele)
+            if f_index == -1:
+                y.append(ele)
+                indices.append(idx)
+                f_index = len(y) - 1
+            counts_dict[f_index] += 1
+            inverse_indices.append(f_index)
+
+        counts = [counts_dict[idx] for idx in range(len(y))]
+        if axis is not None:
+            y = torch.cat(y, dim=axis)
+        else:
+            y = torch.tensor(y, device=inp.device)
+        indices = torch.tensor(indices, device=inp.device)
+        inverse_indices = torch.tensor(inverse_indices, device=inp.device)
+        counts = torch.tensor(counts, device=inp.device)
+
+    self.outputs[0].betensor = PyTensor('y', y, self.outputs[0].dtype).betensor
+    self.outputs[1].betensor = PyTensor('indices', indices, self.outputs[1].dtype).betensor
+    self.outputs[2].betensor = PyTensor('inverse_indices', inverse_indices, self.outputs[2].dtype).betensor
+    self.outputs[3].betensor = PyTensor('counts', counts, self.outputs[3].dtype).betensor
+    return [o.betensor for o in self.outputs]
+
+
+def unique_node(inp, need_sort, axis):
+    node = PyNode('unique', OpType.Unique)
+    node.params['sorted'] = need_sort
+    node.params['axis'] = axis
+    node.add_input(PyTensor('inp', inp.numpy()))
+    for name, dtype in zip(['y', 'indices', 'inverse_indices', 'counts'], [Dtype.FP32, Dtype.INT32, Dtype.INT32, Dtype.INT32]):
+        out = PyTensor(name)
+        out.dtype = dtype
+        node.add_output(out)
+    return node
+
+
+@pytest.mark.parametrize("need_sort", [True, False])
+@pytest.mark.parametrize("axis", ['NONE', 0, 1])
+@pytest.mark.parametrize("shape", [[12, 5], [1, 3]])
+def test_unique(need_sort, axis, shape):
+    torch.manual_seed(0)
+    inp = torch.randint(0, 3, shape).float()
+    inp[-1] = inp[0]
+    node = unique_node(inp, need_sort, axis)
+    out = [o.clone() for o in unique_forward(node)]
+    ref = loop_unique_forward(node)
+    for o, r in zip(out, ref):
+        assert torch.equal(o, r)
@@ -7,3 +7,4 @@ from AIPUBuilder.Optimizer.utils.files_utils import *
 from AIPUBuilder.Optimizer.utils.math_utils import *
 from AIPUBuilder.Optimizer.utils.string_utils import *
 from AIPUBuilder.Optimizer.utils.random_utils import *
+from AIPUBuilder.Optimizer.utils.tensor_cache import *
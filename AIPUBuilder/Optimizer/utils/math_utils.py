@@ -332,3 +332,90 @@ def x3_aiff_softmax_approximation(vx: torch.Tensor, axis, pow2_f_lut: torch.Tens
     # convert f32 softmax result to fp16 output
     f16 = score.half()
     return f16.reshape(vx.shape)
+
+
+def _fp32_is_ieee(device, conv=False):
+    # tf32/bf16 reduced precision float32 kernels round the products, so they can not be used for exact integer math
+    if device.type == 'cuda':
+        return not (torch.backends.cudnn.allow_tf32 if conv else torch.backends.cuda.matmul.allow_tf32)
+    return torch.get_float32_matmul_precision() == 'highest'
+
+
+def _exact_fp32_splits(x, w, groups=1, bias=None, max_splits=8):
+    """split the reduction dimension (dim 1 of w) into ranges whose float32 partial sums stay exact integers.
+    :param x: integer valued input of the conv/linear
+    :param w: integer valued weights of shape [out_channels, reduction, ...]
+    :param groups: the reduction can only be split when groups == 1
+    :param bias: integer valued bias which will be added to the result in double
+    :return: list of [start, end) ranges of the reduction dimension, or None if float32 can not reproduce the double result
+    """
+    import math
+    fp32_exact_bound = 2 ** 24
+    if x.numel() == 0 or w.numel() == 0:
+        return None
+    xmin, xmax = torch.aminmax(x)
+    x_absmax = max(-xmin.item(), xmax.item())
+    if not math.isfinite(x_absmax) or not torch.equal(x, torch.round(x)) or not torch.equal(w, torch.round(w)):
+        return None
+    # |partial sum| <= max|x| * sum|w| of one output channel
+    w_abs = w.abs().reshape(w.shape[0], w.shape[1], -1).sum(dim=-1).double()
+    bound = x_absmax * w_abs.sum(dim=1).max().item()
+    bias_absmax = bias.abs().max().item() if bias is not None and bias.numel() > 0 else 0
+    if not bound + bias_absmax < 2 ** 53:
+        # the double result may be rounded itself
+        return None
+    if bound <= fp32_exact_bound:
+        return [(0, w.shape[1])]
+    if groups != 1:
+        return None
+    splits = []
+    start = 0
+    acc = 0
+    for i, c in enumerate((w_abs.max(dim=0).values * x_absmax).tolist()):
+        if c > fp32_exact_bound:
+            return None
+        if acc + c > fp32_exact_bound:
+            splits.append((start, i))
+            start, acc = i, 0
+        acc += c
+    splits.append((start, w.shape[1]))
+    return splits if len(splits) <= max_splits else None
+
+
+def exact_integer_conv2d(x, w, bias=None, stride=1, dilation=1, groups=1):
+    """torch.nn.functional.conv2d (without padding) of integer valued double tensors, with the same double result.
+    The convolution runs in float32 (on ranges of the input channels) when all the partial sums are provably
+    exact integers, otherwise in double.
+    """
+    splits = _exact_fp32_splits(x, w, groups, bias) if _fp32_is_ieee(x.device, conv=True) else None
+    if splits is None:
+        return torch.nn.functional.conv2d(x, w, bias, stride=stride, padding=0, dilation=dilation, groups=groups)
+    x32, w32 = x.float(), w.float()
+    parts = [(x32, w32)] if len(splits) == 1 else [(x32[:, s:e], w32[:, s:e]) for s, e in splits]
+    y = None
+    for xp, wp in parts:
+        part = torch.nn.functional.conv2d(xp, wp, None, stride=stride, padding=0,
+                                          dilation=dilation, groups=groups).double()
+        y = part if y is None else y.add_(part)
+    if bias is not None:
+        y += bias.reshape(1, -1, 1, 1)
+    return y
+
+
+def exact_integer_linear(x, w, bias=None):
+    """torch.nn.functional.linear of integer valued double tensors, with the same double result.
+    The matmul runs in float32 (on ranges of the in_features) when all the partial sums are provably exact
+    integers, otherwise in double.
+    """
+    splits = _exact_fp32_splits(x, w, 1, bias) if _fp32_is_ieee(x.device) else None
+    if splits is None:
+        return torch.nn.functional.linear(x, w, bias)
+    x32, w32 = x.float(), w.float()
+    parts = [(x32, w32)] if len(splits) == 1 else [(x32[..., s:e], w32[:, s:e]) for s, e in splits]
+    y = None
+    for xp, wp in parts:
+        part = torch.nn.functional.linear(xp, wp).double()
+        y = part if y is None else y.add_(part)
+    if bias is not None:
+        y += bias
+    return y
@@ -0,0 +1,77 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import os
+import torch
+from AIPUBuilder.Optimizer.logger import OPT_DEBUG
+
+__all__ = ['TensorCache']
+
+
+class TensorCache(object):
+    '''
+    Tensors kept on cpu memory until `max_bytes` is reached, the rest are spilled to a temporary directory
+    and loaded back when being read.
+    '''
+
+    def __init__(self, max_bytes, prefix='opt_tensor_cache_'):
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.mem_bytes = 0
+        self.items = {}
+        self.spill_dir = None
+        self.spill_count = 0
+
+    def _spill_path(self, key):
+        import tempfile
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.TemporaryDirectory(prefix=self.prefix)
+            OPT_DEBUG(f"tensor cache exceeds {self.max_bytes} bytes, spill the rest to {self.spill_dir.name}")
+        self.spill_count += 1
+        return os.path.join(self.spill_dir.name, f"{self.spill_count}.pt")
+
+    def put(self, key, t):
+        self.pop(key)
+        # always copy, the graph may change its tensors in place later
+        t = t.detach().to('cpu', copy=True)
+        nbytes = t.numel() * t.element_size()
+        if self.mem_bytes + nbytes <= self.max_bytes:
+            self.items[key] = t
+            self.mem_bytes += nbytes
+        else:
+            fpath = self._spill_path(key)
+            torch.save(t, fpath)
+            self.items[key] = fpath
+
+    def get(self, key):
+        t = self.items[key]
+        if isinstance(t, str):
+            t = torch.load(t)
+        return t
+
+    def update(self, key, t):
+        # put again, the size may change and the tensor may move between memory and the spill directory
+        if key not in self.items:
+            raise KeyError(key)
+        self.put(key, t)
+
+    def pop(self, key):
+        if key in self.items:
+            v = self.items.pop(key)
+            if isinstance(v, str):
+                os.remove(v)
+            else:
+                self.mem_bytes -= v.numel() * v.element_size()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def keys(self):
+        return list(self.items.keys())
+
+    def clear(self):
+        self.items.clear()
+        self.mem_bytes = 0
+        if self.spill_dir is not None:
+            self.spill_dir.cleanup()
+            self.spill_dir = None